@@ -0,0 +1,15 @@
+""" 命令行客户端入口
+
+执行该文件以启动命令行客户端，不依赖 PyQt
+
+示例：
+    python cli_launch.py -s 127.0.0.1:9000 -u user -p 123 ls -r /
+    python cli_launch.py get -r -j 8 '/lab/data_*' ./data
+"""
+
+import sys
+from src.client.cli import main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,6 +17,9 @@ import socket
 
 from   src.server.ipbroadcast import Th_broadcast
 from   src.server import Master, UserInfo, ServerConfig
+from   src.server.profiler import profiler
+from   src.server.metrics import registry
+from   src.server.asynclog import log_pipeline, RotatingLogFile, BatchStreamHandler
 
 
 def load_userlist(filepath:str) -> list:
@@ -70,14 +73,14 @@ def init_logger(cfg:dict) -> logging.Logger:
     formatter = logging.Formatter(fmt='[%(asctime)s] <%(levelname)s> %(message)s')
 
     # 这里实例化两个 handler，一个用来向文件输出，另一个向标准错误输出
-    file_handle = logging.FileHandler(filename=cfg['logPath'], mode='a', encoding='utf-8')  # 如果编码报错，尝试更换成 'utf-8' 或者 'gbk' 编码
+    # 两者都由日志写入线程调用，不占用请求处理的时间
+    file_handle = RotatingLogFile.from_config(cfg['logPath'])
     file_handle.setFormatter(formatter)
     file_handle.setLevel(logging.INFO)
-    console_handle = logging.StreamHandler()
+    console_handle = BatchStreamHandler()
     console_handle.setFormatter(formatter)
     console_handle.setLevel(logging.INFO)
-    logger.addHandler(file_handle)
-    logger.addHandler(console_handle)
+    log_pipeline.attach(logger, [file_handle, console_handle])
     logger.info(f'Logger 初始化完成')
     return logger
 
@@ -108,13 +111,93 @@ def gen_default_config_file():
         "allUserDownloadFile": true,
         "allUserUploadFile": false
     },
+    // 带宽限制(KiB/s)，0 表示不限制
+    "bandwidth": {
+        "global": 0,
+        "perUser": 0,
+        "perTransfer": 0
+    },
+    // 准入控制，超过限制时返回服务器忙，0 表示不限制
+    "admission": {
+        "maxTransfers": 64,
+        "maxUserTransfers": 8,
+        "maxPendingMiB": 0,
+        "maxUserPendingMiB": 0,
+        "queueSize": 32,
+        "queueTimeout": 1.0
+    },
+    // 下载时使用的块缓存，多人同时下载同一文件时只读取一次硬盘
+    "cache": {
+        "sizeMiB": 256,
+        "readAhead": 4
+    },
+    // 组播分发，多个客户端同时下载同一文件时服务端只发送一次
+    "multicast": {
+        "group": "239.255.17.1",
+        "port": 17000,
+        "rateKiB": 8192,
+        "ttl": 1,
+        "startDelay": 2.0
+    },
+    // 哈希索引，在后台计算共享文件的哈希并保存，供校验、同步和群集下载使用
+    "index": {
+        "enable": true,
+        "path": "./hashindex.db",
+        "workers": 2,
+        "scanInterval": 300
+    },
+    // 运行指标，port 不为 0 时在该端口以 Prometheus 文本格式提供 /metrics
+    "metrics": {
+        "host": "127.0.0.1",
+        "port": 0
+    },
+    // 慢请求日志，从收到请求到发出响应超过 thresholdMs 毫秒的请求以 json 写入 path，0 表示不记录
+    "slowLog": {
+        "thresholdMs": 1000,
+        "path": "./slow.log"
+    },
+    // 采样性能分析，由管理员或服务端控制台开启，结果写入 dir 目录
+    "profiler": {
+        "rate": 100,
+        "dir": "./profiles"
+    },
+    // 管理员用户，可以获取运行指标和开启性能采样
+    "adminUsers": [],
     // 共享文件夹路径
     "shareDir": "./public",
     // 用户列表文件路径(.csv文件)
     "userlistFile": "./userlist.csv",
 
+    // 控制连接的保护：数据包长度上限(MiB)、每个连接等待发送的数据上限(KiB)、发送超时(秒)、保留的未读消息数，
+    // 发送队列已满时的处理 slowConsumer："shed" 响应改为服务器忙，"disconnect" 断开连接
+    "control": {
+        "maxFrameMiB": 64,
+        "sendQueueKiB": 4096,
+        "sendTimeout": 30,
+        "msgbufSize": 1000,
+        "slowConsumer": "shed"
+    },
+
+    // 空闲连接的回收：控制连接超过 idleTimeout 秒没有收到任何数据包、或者连接后 loginTimeout 秒没有登录时断开，
+    // 文件传输超过 transferTimeout 秒没有进展时断开，0 表示不断开；tcpIdle/tcpInterval/tcpCount 为 TCP keepalive 的
+    // 空闲时间(秒)、探测间隔(秒)和探测次数，用于发现对方断电或断网的连接，tcpIdle 为 0 时不开启
+    "keepalive": {
+        "idleTimeout": 120,
+        "loginTimeout": 30,
+        "transferTimeout": 60,
+        "tcpIdle": 60,
+        "tcpInterval": 10,
+        "tcpCount": 6
+    },
+
     // 日志输出路径
     "logPath": "./server.log",
+    // 日志轮转，超过 maxMiB 或者每隔 intervalHours 小时轮转一次，保留 backupCount 个旧文件，0 表示不按该条件轮转
+    "logRotate": {
+        "maxMiB": 64,
+        "intervalHours": 24,
+        "backupCount": 7
+    },
 
     // 开启服务器IP地址广播
     "ipBroadcast": true
@@ -142,9 +225,61 @@ def configurate_server(cfg:dict):
     """
     ServerConfig.SHARE_DIR = Path(cfg['shareDir']).absolute()
     ServerConfig.PERMISSION.update(cfg['permission'])
+    ServerConfig.BANDWIDTH.update(cfg.get('bandwidth', {}))
+    ServerConfig.ADMISSION.update(cfg.get('admission', {}))
+    ServerConfig.CACHE.update(cfg.get('cache', {}))
+    ServerConfig.MULTICAST.update(cfg.get('multicast', {}))
+    ServerConfig.INDEX.update(cfg.get('index', {}))
+    ServerConfig.METRICS.update(cfg.get('metrics', {}))
+    ServerConfig.SLOW_LOG.update(cfg.get('slowLog', {}))
+    ServerConfig.PROFILER.update(cfg.get('profiler', {}))
+    ServerConfig.LOG_ROTATE.update(cfg.get('logRotate', {}))
+    ServerConfig.CONTROL.update(cfg.get('control', {}))
+    ServerConfig.KEEPALIVE.update(cfg.get('keepalive', {}))
+    ServerConfig.ADMIN_USERS = list(cfg.get('adminUsers', []))
     return
 
 
+CONSOLE_HELP = '''控制台命令:
+    profile [秒] [频率]     开启性能采样，默认 30 秒
+    profile stop           提前结束性能采样
+    stats [前缀]            显示运行指标
+    help                   显示本帮助'''
+
+
+def console():
+    """服务端控制台
+
+    从标准输入读取命令并执行，标准输入关闭时（例如作为后台服务运行）返回
+    """
+    while True:
+        try:
+            line = input()
+        except (EOFError, OSError):
+            return
+        words = line.split()
+        if not words:
+            continue
+        try:
+            if words[0] == 'profile' and words[1:2] == ['stop']:
+                profiler.stop()
+            elif words[0] == 'profile':
+                path = profiler.start(*(float(i) for i in words[1:3]))
+                if path is None:
+                    print(f'正在进行性能采样，剩余 {profiler.remaining():.0f} 秒')
+                else:
+                    print(f'结果将写入 {path}')
+            elif words[0] == 'stats':
+                prefix = words[1] if len(words) > 1 else ''
+                for name, value in registry.snapshot().items():
+                    if name.startswith(prefix):
+                        print(f'{name} {value:g}')
+            else:
+                print(CONSOLE_HELP)
+        except ValueError:
+            print(CONSOLE_HELP)
+
+
 def start_server(cfg:dict, userlist:list):
     """启动服务器
 
@@ -161,6 +296,7 @@ def start_server(cfg:dict, userlist:list):
     if cfg['ipBroadcast']:
         broadcast = Th_broadcast(cfg['name'], socket.gethostbyname(socket.gethostname()), m.s.getsockname()[1])
         broadcast.start()
+    console()
     while True:
         time.sleep(100)
 
@@ -168,6 +304,7 @@ def start_server(cfg:dict, userlist:list):
 
 
 
+
 def main():
     if not Path('./config.jsonc').exists():
         with open('./readme.tmp.txt', 'w') as f:
@@ -194,9 +331,8 @@ def main():
         print('共享文件夹不存在')
         return
 
-    ServerConfig.log = init_logger(cfg)
-
     configurate_server(cfg)
+    ServerConfig.log = init_logger(cfg)
     start_server(cfg, userlist)
 
 if __name__ == '__main__':
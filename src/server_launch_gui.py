@@ -23,15 +23,18 @@ import logging
 
 from PyQt5.QtWidgets    import  QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTabWidget, QTextBrowser, \
                                 QGroupBox, QLabel, QPushButton, QLineEdit, QCheckBox, QRadioButton, \
-                                QTextEdit, QSizePolicy, \
+                                QTextEdit, QSizePolicy, QSpinBox, \
                                 QFileDialog
 from PyQt5.QtGui        import  QCloseEvent, QTextCursor, QIcon
-from PyQt5.QtCore       import  pyqtSignal
+from PyQt5.QtCore       import  pyqtSignal, QTimer
 
 from src.server.serverconfig   import ServerConfig
 from src.server.userinfo       import UserInfo
 from src.server.ipbroadcast    import Th_broadcast
 from src.server.master         import Master
+from src.server.blockcache     import cache
+from src.server.profiler       import profiler
+from src.server.asynclog       import log_pipeline, RotatingLogFile, BatchStreamHandler
 
 
 
@@ -74,6 +77,11 @@ class GUI_Server_UI(QMainWindow):
         self.config_on = QPushButton('开启')
         layout_state.addWidget(QLabel('当前状态'), 1)
         layout_state.addWidget(self.config_state,5)
+        self.config_cacheStat = QLabel()
+        layout_state.addWidget(self.config_cacheStat,5)
+        self.config_profile = QPushButton('性能采样 30 秒')
+        self.config_profile.setEnabled(False)
+        layout_state.addWidget(self.config_profile,2)
         layout_state.addWidget(self.config_on,3)
 
 
@@ -154,6 +162,28 @@ class GUI_Server_UI(QMainWindow):
         layout.addWidget(group_file)
         # ------------ END <FILE> ---------------
 
+        # --------- BEGIN <BANDWIDTH> -----------
+        group_bandwidth = QGroupBox()
+        layout_bandwidth = QHBoxLayout()
+        self.config_bwGlobal = QSpinBox()
+        self.config_bwUser = QSpinBox()
+        self.config_bwTransfer = QSpinBox()
+        for i in (self.config_bwGlobal, self.config_bwUser, self.config_bwTransfer):
+            i.setRange(0, 10**7)
+            i.setSuffix(' KiB/s')
+            i.setSpecialValueText('不限制')
+        layout_bandwidth.addWidget(QLabel('全局'), 0)
+        layout_bandwidth.addWidget(self.config_bwGlobal, 1)
+        layout_bandwidth.addWidget(QLabel('每个用户'), 0)
+        layout_bandwidth.addWidget(self.config_bwUser, 1)
+        layout_bandwidth.addWidget(QLabel('每个传输'), 0)
+        layout_bandwidth.addWidget(self.config_bwTransfer, 1)
+
+        group_bandwidth.setLayout(layout_bandwidth)
+        group_bandwidth.setTitle('带宽限制')
+        layout.addWidget(group_bandwidth)
+        # ---------- END <BANDWIDTH> ------------
+
         # ----------- BEGIN <LOG> -------------
         group_log = QGroupBox()
         layout_log = QHBoxLayout()
@@ -230,6 +260,9 @@ class GUI_Server(GUI_Server_UI):
         self.config_msgServerOnly.setChecked(True)
         self.config_fileFreeDL.setChecked(True)
         self.config_fileFreeUL.setChecked(False)
+        self.config_bwGlobal.setValue(ServerConfig.BANDWIDTH['global'])
+        self.config_bwUser.setValue(ServerConfig.BANDWIDTH['perUser'])
+        self.config_bwTransfer.setValue(ServerConfig.BANDWIDTH['perTransfer'])
         return 
     
     def init_signals(self) -> None:
@@ -241,6 +274,8 @@ class GUI_Server(GUI_Server_UI):
         self.config_fileFolder_btn.clicked.connect(self.on_shareDir_btn_clicked)
         # 启动按钮
         self.config_on.clicked.connect(self.on_server_started)
+        # 性能采样按钮
+        self.config_profile.clicked.connect(self.on_profile_clicked)
 
         # 权限配置按钮
         self.config_msgFreeDL.toggled.connect(lambda: ServerConfig.PERMISSION.update({'allUserGetMessage':self.config_msgFreeDL.isChecked()}))
@@ -249,6 +284,11 @@ class GUI_Server(GUI_Server_UI):
         self.config_fileFreeDL.toggled.connect(lambda: ServerConfig.PERMISSION.update({'allUserDownloadFile':self.config_fileFreeDL.isChecked()}))
         self.config_fileFreeUL.toggled.connect(lambda: ServerConfig.PERMISSION.update({'allUserUploadFile':self.config_fileFreeUL.isChecked()}))
 
+        # 带宽限制，服务器运行时也可以修改，立即生效
+        self.config_bwGlobal.valueChanged.connect(lambda v: ServerConfig.BANDWIDTH.update({'global':v}))
+        self.config_bwUser.valueChanged.connect(lambda v: ServerConfig.BANDWIDTH.update({'perUser':v}))
+        self.config_bwTransfer.valueChanged.connect(lambda v: ServerConfig.BANDWIDTH.update({'perTransfer':v}))
+
         # 消息发送按钮
         self.string_send.clicked.connect(self.on_msg_submitted)
         # 获取新消息
@@ -274,7 +314,8 @@ class GUI_Server(GUI_Server_UI):
         formatter = logging.Formatter(fmt='[%(asctime)s] <%(levelname)s> %(message)s')
 
         # file_handle 用于输出到文件，console_handle用于输出到界面
-        file_handle = logging.FileHandler(logPath, mode='a', encoding='utf-8')  # 如果编码报错，尝试更换成 'utf-8' 或者 'gbk' 编码
+        # 两者都由日志写入线程调用，界面每批日志只刷新一次
+        file_handle = RotatingLogFile.from_config(logPath)
         file_handle.setFormatter(formatter)
         file_handle.setLevel(logging.INFO)
         # ***********************************************************************************#
@@ -283,12 +324,11 @@ class GUI_Server(GUI_Server_UI):
         # self 实现了一个 write 方法，该方法可以将参数显示在 GUI 上                              #
         # 当 self 实现了这一方法后，self 即是 IO stream 的子类型 :: 详见 Python - duck_type     #
         # 这样便实现了 logger 的输出重定向                                                     #
-        console_handle = logging.StreamHandler(self)                                         #
+        console_handle = BatchStreamHandler(self)                                            #
         # ***********************************************************************************#
         console_handle.setFormatter(formatter)
         console_handle.setLevel(logging.INFO)
-        logger.addHandler(file_handle)
-        logger.addHandler(console_handle)
+        log_pipeline.attach(logger, [file_handle, console_handle])
         logger.info(f'Logger 初始化完成')
         return logger
     
@@ -339,10 +379,35 @@ class GUI_Server(GUI_Server_UI):
 
         self.__set_config_enable(False)
         self.config_on.setChecked(False)
+        self.config_profile.setEnabled(True)
         self.start_getMsg()
+
+        # 定时刷新块缓存的命中率
+        self.cache_timer = QTimer(self)
+        self.cache_timer.timeout.connect(self.on_cache_timer)
+        self.cache_timer.start(2000)
         return
     
 
+    def on_cache_timer(self) -> None:
+        """显示块缓存的统计数据
+        """
+        st = cache.stats()
+        self.config_cacheStat.setText(
+            f'缓存命中率 {st["hitRate"]*100:.1f}%  '
+            f'已用 {st["size"]/2**20:.0f}/{st["capacity"]/2**20:.0f} MiB  '
+            f'硬盘读取 {st["diskBytes"]/2**20:.0f} MiB')
+        return
+
+    def on_profile_clicked(self) -> None:
+        """性能采样按钮点击槽函数
+
+        开启 30 秒的采样，结束后结果文件的路径显示在日志中
+        """
+        if profiler.start(30) is None:
+            ServerConfig.log.warning(f'正在进行性能采样，剩余{profiler.remaining():.0f}秒')
+        return
+
     def on_userlist_btn_clicked(self) -> None:
         """打开一个对话框选择文件
         """
@@ -411,8 +476,9 @@ class GUI_Server(GUI_Server_UI):
         该函数不光会将log显示在GUI上，同时可以将关键字染色
 
         Args:
-            s (str): log 字符串
+            s (str): log 字符串，可能包含多行
         """
+        s = s.rstrip('\n').replace('\n', '<br>')
         s = s.replace('<INFO>', '<font color=blue><b>&lt;INFO&gt;</b></font><font color=black></font>')
         s = s.replace('<WARNING>', '<font color=orange><b>&lt;WARNING&gt;</b></font><font color=black></font>')
         s = s.replace('<ERROR>', '<font color=red><b>&lt;ERROR&gt;</b></font><font color=black></font>')
@@ -0,0 +1,24 @@
+""" 性能测试包
+
+在当前进程中启动一个只监听回环地址的服务端，用客户端核心驱动，测量控制通路和数据通路的性能。
+结果为 json，包含每个测试用例的指标、墙钟时间、CPU 时间和内存峰值
+
+在 `src` 的上级目录中运行：
+
+    python -m src.bench                     # 运行全部场景，结果输出到标准输出
+    python -m src.bench -q login download   # 快速模式，只运行指定场景
+    python -m src.bench --isolate -o result.json   # 每个场景在单独的子进程中运行，内存峰值互不影响
+
+Modules:
+    env: 进程内的测试服务端
+    loadgen: 模拟大量客户端的负载生成器，`python -m src.bench.loadgen`
+    regress: 与保存的基线比较的性能回归检测，`python -m src.bench.regress`
+    measure: 测量工具
+    scenarios: 测试场景
+
+"""
+
+from .env import BenchServer
+from .measure import Recorder, summarize, median, mad
+from .scenarios import SCENARIOS
+from .runner import run, run_isolated
@@ -0,0 +1,41 @@
+""" 性能测试入口
+
+    python -m src.bench [-q] [--isolate] [-o 文件] [场景 ...]
+
+不指定场景时运行全部场景，结果为 json，默认输出到标准输出
+"""
+
+import argparse
+import json
+import sys
+import os
+
+from .scenarios import SCENARIOS
+from .runner import run, run_isolated
+
+
+def main(argv:list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.bench', description='文件传输系统性能测试')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario', help=f'场景：{", ".join(SCENARIOS)}，默认全部')
+    parser.add_argument('-q', '--quick', action='store_true', help='快速模式，减少样本数和文件大小')
+    parser.add_argument('--isolate', action='store_true', help='每个场景在单独的子进程中运行')
+    parser.add_argument('-o', '--output', help='结果文件，默认输出到标准输出')
+    args = parser.parse_args(argv)
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f'未知的场景: {", ".join(unknown)}')
+    result = (run_isolated if args.isolate else run)(names, args.quick)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text, flush=True)
+    return 1 if any('error' in r for r in result['results']) else 0
+
+
+if __name__ == '__main__':
+    code = main()
+    sys.stdout.flush()
+    os._exit(code)          # 不等待测试中残留的非守护线程
@@ -0,0 +1,97 @@
+""" 测试环境模块
+
+在当前进程中启动一个只监听回环地址的服务端，共享文件夹为临时目录，测试结束后删除
+
+Classes:
+    BenchServer(object): 进程内的测试服务端
+
+"""
+
+from pathlib import Path
+import tempfile
+import logging
+import shutil
+import os
+
+from ..server import Master, UserInfo, ServerConfig
+from ..client.core import ClientCore
+
+
+PASSWORD = 'bench'
+
+
+class BenchServer:
+    """进程内的测试服务端
+
+    创建 `users` 个拥有全部权限的用户 `bench0`、`bench1`……，密码均为 `PASSWORD`。
+    同一用户重复登录会使之前的连接下线，同时连接多个客户端时需要使用不同的用户
+
+    用法：
+
+        with BenchServer(users=8) as env:
+            cc = env.client(0)
+    """
+    def __init__(self, users:int = 32) -> None:
+        self.users = users
+        self.share:Path|None = None
+        self.master:Master|None = None
+        self.clients:list[ClientCore] = []
+        return
+
+    def __enter__(self) -> 'BenchServer':
+        self.share = Path(tempfile.mkdtemp(prefix='fts-bench-'))
+        if ServerConfig.log is None:
+            ServerConfig.log = logging.getLogger('bench')
+            ServerConfig.log.addHandler(logging.NullHandler())
+            ServerConfig.log.propagate = False
+        ServerConfig.SHARE_DIR = self.share.absolute()
+        ServerConfig.PERMISSION.update(allUserUploadFile=True, allUserPutMessage=True)
+        ServerConfig.INDEX['enable'] = False    # 后台建立索引会干扰测量
+        users = [UserInfo(f'bench{i}', PASSWORD, (True, True, True, True)) for i in range(self.users)]
+        self.master = Master(('127.0.0.1', 0), users)
+        self.master.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for cc in self.clients:
+            cc.close()
+        self.master.stop()
+        self.master.join(5)
+        shutil.rmtree(self.share, ignore_errors=True)
+        return
+
+    @property
+    def addr(self) -> tuple[str, int]:
+        return ('127.0.0.1', self.master.s.getsockname()[1])
+
+    def client(self, user:int = 0) -> ClientCore:
+        """连接并登录一个客户端，测试结束时自动关闭
+
+        Args:
+            user (int, optional): 用户序号. Defaults to 0.
+
+        Returns:
+            ClientCore: 已登录的客户端核心，不压缩传输
+        """
+        cc = ClientCore()
+        if not cc.connect(self.addr):
+            raise ConnectionError(f'cannot connect to {self.addr}')
+        code, _ = cc.login(f'bench{user}', PASSWORD)
+        if code:
+            raise ConnectionError(f'login failed: {code}')
+        cc.codecs = []          # 测量原始数据通路
+        self.clients.append(cc)
+        return cc
+
+    def make_file(self, rel:str, size:int) -> Path:
+        """在共享文件夹中创建随机内容的文件
+        """
+        p = self.share.joinpath(rel)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        with open(p, 'wb') as f:
+            remain = size
+            while remain > 0:
+                n = min(remain, 1024 * 1024)
+                f.write(os.urandom(n))
+                remain -= n
+        return p
@@ -0,0 +1,567 @@
+""" 负载生成模块
+
+用 asyncio 在一个进程中模拟大量协议层的客户端，不依赖 PyQt，按配置的行为组合向运行中的服务端发起请求，
+统计每个命令的吞吐量、延迟分位数和按状态码分类的错误数，并按时间记录服务端进程的资源占用
+
+在 `src` 的上级目录中运行：
+
+    python -m src.bench.loadgen 127.0.0.1:8080 -n 2000 --ramp 0 -t 60
+    python -m src.bench.loadgen 127.0.0.1:8080 --mix lab=9 --mix download=1 --pid 12345 -o load.json
+    python -m src.bench.loadgen --make-userlist users.csv -n 2000     # 生成测试用户列表
+
+同一用户重复登录会使之前的连接下线，第 i 个模拟客户端的用户名为 `--user` 中的 {} 替换为 i，服务端需要有这些用户
+
+Classes:
+    Mix(object): 客户端的行为组合
+    Connection(object): 异步的控制连接
+    Stats(object): 请求的统计
+    ProcessMonitor(object): 服务端进程的资源占用
+    LoadGenerator(object): 负载生成器
+
+Functions:
+    code_name: 状态码的名称
+    write_userlist: 生成测试用户列表
+
+Attributes:
+    MIXES (dict): 预置的行为组合
+
+"""
+
+from collections import defaultdict, Counter
+from pathlib import Path
+import itertools
+import argparse
+import asyncio
+import random
+import json
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:         # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from ..globals import Package
+from ..client.core.errcode import ErrCode
+from .measure import summarize, machine
+from .runner import FORMAT_VERSION, git_revision
+
+
+RECV_SIZE = 256 * 1024
+MONITOR_ERRORS = (OSError, ValueError, IndexError) + ((psutil.Error,) if psutil is not None else ())
+
+
+class Mix:
+    """客户端的行为组合
+
+    间隔为 None 时不执行该行为，周期性的行为第一次执行的时间在一个间隔内随机分布
+
+    Args:
+        name (str): 名称
+        weight (float, optional): 按权重把客户端分配到各个组合. Defaults to 1.
+        message (float|None, optional): 轮询 `getMessage` 的间隔（秒）. Defaults to 0.2.
+        filelist (float|None, optional): 刷新文件列表的间隔（秒）. Defaults to 2.0.
+        path (str, optional): 刷新的目录. Defaults to '/'.
+        download (float|None, optional): 突发下载的平均间隔（秒，指数分布）. Defaults to None.
+        burst (int, optional): 每次突发同时下载的文件数. Defaults to 3.
+        files (list[str]|None, optional): 下载的文件，为空时从最近一次的文件列表中随机选择. Defaults to None.
+        relogin (float|None, optional): 断开后重新登录的间隔（秒），用于模拟登录风暴. Defaults to None.
+    """
+    def __init__(self, name:str, weight:float = 1, message:float|None = 0.2, filelist:float|None = 2.0, path:str = '/',
+                 download:float|None = None, burst:int = 3, files:list[str]|None = None, relogin:float|None = None) -> None:
+        self.name = name
+        self.weight = weight
+        self.message = message
+        self.filelist = filelist
+        self.path = path if path.endswith('/') else path + '/'
+        self.download = download
+        self.burst = burst
+        self.files = files or []
+        self.relogin = relogin
+        return
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+# 预置的行为组合
+#   lab: 图形界面客户端空闲时的行为
+#   download: 在空闲行为上增加突发下载
+#   storm: 不断重新登录
+MIXES = {
+    'lab': dict(),
+    'download': dict(download=10.0),
+    'storm': dict(message=None, filelist=None, relogin=1.0),
+    }
+
+
+def code_name(code) -> str:
+    """状态码的名称，未定义的状态码返回其字符串形式
+    """
+    for cls in ErrCode.__mro__:
+        for k, v in vars(cls).items():
+            if k.isupper() and v == code:
+                return k
+    return str(code)
+
+
+def write_userlist(path:str, users:int, user:str = 'load{}', password:str = 'load') -> None:
+    """生成测试用户列表，所有用户拥有全部权限
+
+    Args:
+        path (str): 文件路径
+        users (int): 用户数
+        user (str, optional): 用户名格式. Defaults to 'load{}'.
+        password (str, optional): 密码. Defaults to 'load'.
+    """
+    with open(path, 'w', encoding='gbk') as f:
+        f.write('用户名, 密码, 获取消息权限, 推送消息权限, 下载文件权限, 上传文件权限\n')
+        for i in range(users):
+            f.write(f'{user.format(i)},{password},1,1,1,1\n')
+    return
+
+
+# ---------------------------- 连接 ------------------------------
+
+class Connection:
+    """异步的控制连接
+
+    与 `ClientCore` 使用相同的数据包格式，同一连接上的多个请求可以同时进行，按数据包 id 匹配返回
+    """
+    def __init__(self) -> None:
+        self.reader:asyncio.StreamReader|None = None
+        self.writer:asyncio.StreamWriter|None = None
+        self.ids = itertools.count(1)
+        self.waiting:dict[int, asyncio.Future] = {}
+        self.recv_task:asyncio.Task|None = None
+        return
+
+    async def open(self, addr:tuple[str, int], timeout:float) -> None:
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(*addr), timeout)
+        self.recv_task = asyncio.create_task(self.__recv())
+        return
+
+    async def __recv(self) -> None:
+        try:
+            while True:
+                length = int.from_bytes(await self.reader.readexactly(4))
+                pkg = Package.from_bytes(await self.reader.readexactly(length))
+                fut = self.waiting.pop(pkg.id, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(pkg.args)
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        # 连接断开，等待中的请求全部失败
+        for fut in self.waiting.values():
+            if not fut.done():
+                fut.set_exception(ConnectionResetError('connection closed'))
+        self.waiting.clear()
+        return
+
+    async def request(self, cmd:str, args:list, timeout:float) -> tuple:
+        """发送请求并等待返回
+
+        Returns:
+            tuple: 状态码和附加数据，超时返回 ERR_TIME_OUT
+        """
+        pkg = Package(next(self.ids), cmd, args)
+        fut = asyncio.get_running_loop().create_future()
+        self.waiting[pkg.id] = fut
+        self.writer.write(pkg.to_bytes())
+        try:
+            await self.writer.drain()
+            code, addon = await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return (ErrCode.ERR_TIME_OUT, None)
+        finally:
+            self.waiting.pop(pkg.id, None)
+        return (code, addon)
+
+    def close(self) -> None:
+        if self.recv_task is not None:
+            self.recv_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+        return
+
+
+# ---------------------------- 统计 ------------------------------
+
+class Stats:
+    """请求的统计
+
+    记录全部样本用于最终的报告，同时按采样间隔记录窗口内的请求数和延迟用于时间序列
+    """
+    def __init__(self) -> None:
+        self.latency:dict[str, list[float]] = defaultdict(list)
+        self.codes:dict[str, Counter] = defaultdict(Counter)
+        self.window:dict[str, list[float]] = defaultdict(list)
+        self.window_errors = 0
+        self.bytes = 0
+        self.online = 0
+        return
+
+    def record(self, cmd:str, code, seconds:float) -> None:
+        """记录一次请求
+
+        Args:
+            cmd (str): 命令
+            code (int|str): 状态码，发生异常时为异常类型名
+            seconds (float): 延迟
+        """
+        self.codes[cmd][code_name(code) if isinstance(code, int) else code] += 1
+        if code == ErrCode.SUCCESS:
+            self.latency[cmd].append(seconds)
+            self.window[cmd].append(seconds)
+        else:
+            self.window_errors += 1
+        return
+
+    def take_window(self) -> dict:
+        """取出并清空当前窗口的统计
+        """
+        retval = {
+            'online': self.online,
+            'requests': {cmd: len(s) for cmd, s in self.window.items()},
+            'p99_ms': {cmd: summarize(s)['p99_ms'] for cmd, s in self.window.items()},
+            'errors': self.window_errors,
+            }
+        self.window = defaultdict(list)
+        self.window_errors = 0
+        return retval
+
+    def report(self, duration:float) -> dict:
+        retval = {}
+        for cmd in sorted(self.codes):
+            total = sum(self.codes[cmd].values())
+            retval[cmd] = {
+                'count': total,
+                'per_s': round(len(self.latency[cmd]) / duration, 3) if duration > 0 else 0.0,
+                'latency': summarize(self.latency[cmd]),
+                'codes': dict(self.codes[cmd]),
+                }
+        return retval
+
+
+class ProcessMonitor:
+    """服务端进程的资源占用，只能监视本机的进程
+
+    优先使用 psutil，没有安装时在 Linux 上读取 /proc，都不可用时不记录
+    """
+    def __init__(self, pid:int) -> None:
+        self.pid = pid
+        self.proc = psutil.Process(pid) if psutil is not None else None
+        self.last:tuple[float, float]|None = None
+        return
+
+    def __cpu_rss_threads_fds(self) -> tuple[float, int, int, int|None]:
+        if self.proc is not None:
+            with self.proc.oneshot():
+                t = self.proc.cpu_times()
+                fds = self.proc.num_fds() if hasattr(self.proc, 'num_fds') else self.proc.num_handles()
+                return (t.user + t.system, self.proc.memory_info().rss, self.proc.num_threads(), fds)
+        proc = Path('/proc', str(self.pid))
+        stat = proc.joinpath('stat').read_text().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        cpu = (int(stat[11]) + int(stat[12])) / ticks          # utime + stime
+        rss = int(stat[21]) * os.sysconf('SC_PAGE_SIZE')
+        return (cpu, rss, int(stat[17]), len(os.listdir(proc.joinpath('fd'))))
+
+    def sample(self) -> dict|None:
+        """采样一次
+
+        Returns:
+            dict|None: CPU 占用率（两次采样之间的平均值，单核为 100）、常驻内存、线程数和文件描述符数，
+                进程不存在或无法读取时为 None
+        """
+        try:
+            cpu, rss, threads, fds = self.__cpu_rss_threads_fds()
+        except MONITOR_ERRORS:
+            return None
+        now = time.monotonic()
+        percent = None
+        if self.last is not None and now > self.last[0]:
+            percent = round((cpu - self.last[1]) / (now - self.last[0]) * 100, 1)
+        self.last = (now, cpu)
+        return {'cpu_percent': percent, 'rss': rss, 'threads': threads, 'fds': fds}
+
+
+# ---------------------------- 负载生成 ------------------------------
+
+class LoadGenerator:
+    """负载生成器
+
+    Args:
+        addr (tuple[str, int]): 服务端地址
+        clients (int): 模拟的客户端数
+        mixes (list[Mix]): 行为组合，按权重分配客户端
+        duration (float): 运行时间（秒），从第一个客户端开始登录时计算
+        ramp (float, optional): 在这段时间内均匀地开始登录，为 0 时全部同时登录. Defaults to 0.
+        user (str, optional): 用户名格式. Defaults to 'load{}'.
+        password (str, optional): 密码. Defaults to 'load'.
+        timeout (float, optional): 请求的超时时间. Defaults to 5.
+        interval (float, optional): 时间序列的采样间隔. Defaults to 1.
+        pid (int|None, optional): 服务端进程号，用于记录资源占用. Defaults to None.
+    """
+    def __init__(self, addr:tuple[str, int], clients:int, mixes:list[Mix], duration:float, ramp:float = 0,
+                 user:str = 'load{}', password:str = 'load', timeout:float = 5, interval:float = 1,
+                 pid:int|None = None) -> None:
+        self.addr = addr
+        self.clients = clients
+        self.mixes = mixes
+        self.duration = duration
+        self.ramp = ramp
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.interval = interval
+        self.monitor = ProcessMonitor(pid) if pid is not None else None
+        self.stats = Stats()
+        self.timeline:list[dict] = []
+        self.deadline = 0.0
+        return
+
+    def assign(self) -> list[Mix]:
+        """按权重把客户端分配到各个组合，结果与客户端的序号无关
+        """
+        total = sum(m.weight for m in self.mixes)
+        retval = []
+        for m in self.mixes:
+            retval.extend([m] * round(self.clients * m.weight / total))
+        while len(retval) < self.clients:
+            retval.append(self.mixes[-1])
+        retval = retval[:self.clients]
+        random.shuffle(retval)
+        return retval
+
+    async def timed(self, cmd:str, coro) -> tuple:
+        t = time.perf_counter()
+        try:
+            code, addon = await coro
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.stats.record(cmd, type(e).__name__, 0)
+            raise ConnectionError(e)
+        self.stats.record(cmd, code, time.perf_counter() - t)
+        return (code, addon)
+
+    async def download(self, conn:Connection, path:str) -> None:
+        """下载一个文件并丢弃数据，传输的延迟记为 `transfer`
+        """
+        code, addon = await self.timed('getFile', conn.request('getFile', [path, 0, [], None], self.timeout))
+        if code:
+            return
+        port, size = addon[0], addon[1]
+        t = time.perf_counter()
+        got = 0
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.addr[0], port), self.timeout)
+            try:
+                # 服务端发送完后等待客户端关闭连接，不能读到 EOF 为止
+                while got < size:
+                    b = await asyncio.wait_for(reader.read(min(RECV_SIZE, size - got)), self.timeout)
+                    if not b:
+                        raise ConnectionResetError('transfer closed')
+                    got += len(b)
+            finally:
+                writer.close()
+        except (OSError, asyncio.TimeoutError) as e:
+            self.stats.record('transfer', type(e).__name__, 0)
+        else:
+            self.stats.record('transfer', ErrCode.SUCCESS, time.perf_counter() - t)
+        self.stats.bytes += got
+        return
+
+    async def periodic(self, interval:float, action) -> None:
+        await asyncio.sleep(random.uniform(0, interval))
+        while True:
+            t = time.monotonic()
+            await action()
+            await asyncio.sleep(max(0, interval - (time.monotonic() - t)))
+
+    async def session(self, i:int, mix:Mix) -> None:
+        """一个客户端的一次连接，直到运行结束或需要重新登录时返回
+        """
+        conn = Connection()
+        t = time.perf_counter()
+        try:
+            await conn.open(self.addr, self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.stats.record('connect', type(e).__name__, 0)
+            await asyncio.sleep(1)
+            return
+        self.stats.record('connect', ErrCode.SUCCESS, time.perf_counter() - t)
+        tasks = []
+        online = False
+        try:
+            code, _ = await self.timed('login', conn.request('login', [self.user.format(i), self.password], self.timeout))
+            if code:
+                await asyncio.sleep(1)
+                return
+            online = True
+            self.stats.online += 1
+            files = list(mix.files)
+
+            async def message():
+                await self.timed('getMessage', conn.request('getMessage', [], self.timeout))
+
+            async def filelist():
+                code, addon = await self.timed('getFileList', conn.request('getFileList', [mix.path], self.timeout))
+                if not code and not mix.files:
+                    files[:] = [mix.path + f[0] for f in addon[1]]
+
+            async def burst():
+                await asyncio.sleep(random.expovariate(1 / mix.download))
+                if not files:
+                    await filelist()
+                if files:
+                    await asyncio.gather(*(self.download(conn, random.choice(files)) for _ in range(mix.burst)))
+
+            if mix.message is not None:
+                tasks.append(asyncio.create_task(self.periodic(mix.message, message)))
+            if mix.filelist is not None:
+                tasks.append(asyncio.create_task(self.periodic(mix.filelist, filelist)))
+            if mix.download is not None:
+                tasks.append(asyncio.create_task(self.periodic(0, burst)))
+            end = self.deadline - time.monotonic()
+            if mix.relogin is not None:
+                end = min(end, random.uniform(0.5, 1.5) * mix.relogin)
+            if tasks:
+                # 任一行为因连接断开而结束时重新连接
+                await asyncio.wait(tasks, timeout=max(0, end), return_when=asyncio.FIRST_EXCEPTION)
+            else:
+                await asyncio.sleep(max(0, end))
+        except ConnectionError:
+            pass
+        finally:
+            if online:
+                self.stats.online -= 1
+            for task in tasks:
+                task.cancel()
+            conn.close()
+        return
+
+    async def client(self, i:int, mix:Mix) -> None:
+        if self.ramp > 0:
+            await asyncio.sleep(self.ramp * i / self.clients)
+        while time.monotonic() < self.deadline:
+            await self.session(i, mix)
+        return
+
+    async def sampler(self) -> None:
+        start = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            entry = {'t': round(time.monotonic() - start, 3)}
+            entry.update(self.stats.take_window())
+            if self.monitor is not None:
+                entry['server'] = self.monitor.sample()
+            self.timeline.append(entry)
+
+    async def run(self) -> dict:
+        """运行负载并返回报告
+        """
+        start = time.monotonic()
+        self.deadline = start + self.duration
+        if self.monitor is not None:
+            self.monitor.sample()
+        sampler = asyncio.create_task(self.sampler())
+        await asyncio.gather(*(self.client(i, m) for i, m in enumerate(self.assign())))
+        sampler.cancel()
+        elapsed = time.monotonic() - start
+        return {
+            'format': FORMAT_VERSION,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'machine': machine(),
+            'addr': list(self.addr),
+            'clients': self.clients,
+            'ramp': self.ramp,
+            'duration': round(elapsed, 3),
+            'mixes': [m.to_dict() for m in self.mixes],
+            'commands': self.stats.report(elapsed),
+            'transfer_mib_s': round(self.stats.bytes / 1024 / 1024 / elapsed, 3) if elapsed > 0 else 0.0,
+            'timeline': self.timeline,
+            }
+
+
+def raise_fd_limit() -> None:
+    """把打开文件数的软限制提高到硬限制，每个模拟客户端占用一个文件描述符
+    """
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+    return
+
+
+def parse_mix(text:str) -> list[Mix]:
+    """解析 `--mix` 参数：预置组合名，可以带权重 `name=weight`，或者 json 文件（对象或对象的列表）
+    """
+    name, _, weight = text.partition('=')
+    if name in MIXES:
+        return [Mix(name, float(weight or 1), **MIXES[name])]
+    with open(text, encoding='utf-8') as f:
+        cfg = json.load(f)
+    return [Mix(**c) for c in (cfg if isinstance(cfg, list) else [cfg])]
+
+
+def print_summary(report:dict) -> None:
+    out = sys.stderr
+    out.write(f'{report["clients"]} clients, {report["duration"]}s, transfer {report["transfer_mib_s"]} MiB/s\n')
+    out.write(f'{"command":<14}{"count":>9}{"ok/s":>10}{"p50 ms":>10}{"p99 ms":>10}  errors\n')
+    for cmd, r in report['commands'].items():
+        errors = ', '.join(f'{k}={v}' for k, v in r['codes'].items() if k != 'SUCCESS')
+        out.write(f'{cmd:<14}{r["count"]:>9}{r["per_s"]:>10}{r["latency"]["p50_ms"]:>10}{r["latency"]["p99_ms"]:>10}  {errors}\n')
+    return
+
+
+def main(argv:list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.bench.loadgen', description='模拟大量客户端的负载生成器')
+    parser.add_argument('addr', nargs='?', help='服务端地址 host:port')
+    parser.add_argument('-n', '--clients', type=int, default=100, help='模拟的客户端数，默认 100')
+    parser.add_argument('-t', '--duration', type=float, default=30, help='运行时间（秒），默认 30')
+    parser.add_argument('--ramp', type=float, default=0, help='在这段时间内均匀地开始登录，默认 0 即全部同时登录')
+    parser.add_argument('--mix', action='append', default=[],
+                        help=f'行为组合，可重复：{", ".join(MIXES)}，可以带权重如 lab=9，或者 json 文件；默认 lab')
+    parser.add_argument('--user', default='load{}', help='用户名格式，{} 替换为客户端序号，默认 load{}')
+    parser.add_argument('--password', default='load', help='密码，默认 load')
+    parser.add_argument('--timeout', type=float, default=5, help='请求的超时时间（秒），默认 5')
+    parser.add_argument('--interval', type=float, default=1, help='时间序列的采样间隔（秒），默认 1')
+    parser.add_argument('--pid', type=int, help='服务端进程号，记录其资源占用（只限本机）')
+    parser.add_argument('-o', '--output', help='结果文件，默认输出到标准输出')
+    parser.add_argument('--make-userlist', metavar='FILE', help='生成包含 -n 个用户的用户列表文件后退出')
+    args = parser.parse_args(argv)
+    if args.make_userlist:
+        write_userlist(args.make_userlist, args.clients, args.user, args.password)
+        return 0
+    if not args.addr:
+        parser.error('需要服务端地址')
+    host, _, port = args.addr.rpartition(':')
+    mixes = [m for text in (args.mix or ['lab']) for m in parse_mix(text)]
+    raise_fd_limit()
+    gen = LoadGenerator((host or '127.0.0.1', int(port)), args.clients, mixes, args.duration, args.ramp,
+                        args.user, args.password, args.timeout, args.interval, args.pid)
+    report = asyncio.run(gen.run())
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text, flush=True)
+    print_summary(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
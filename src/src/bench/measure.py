@@ -0,0 +1,131 @@
+""" 测量工具模块
+
+记录每个测试用例的墙钟时间、CPU 时间和内存峰值，并提供延迟样本的统计方法
+
+CPU 时间和内存峰值是整个进程的数值，服务端和客户端运行在同一进程中，两者都计算在内。
+内存峰值是进程启动以来的最大值，需要单独测量某个场景时使用 `--isolate` 让每个场景在单独的子进程中运行
+
+Classes:
+    Recorder(object): 记录测试用例的结果
+
+Functions:
+    peak_rss: 进程的内存峰值
+    median: 中位数
+    mad: 中位数绝对偏差
+    percentile: 已排序样本的百分位数
+    summarize: 统计延迟样本
+    machine: 运行环境的描述
+
+"""
+
+from contextlib import contextmanager
+import statistics
+import platform
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:         # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def peak_rss() -> int|None:
+    """进程的内存峰值（字节），无法获取时为 None
+    """
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024     # Linux 上单位为 KiB
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    return None
+
+
+def median(samples:list[float]) -> float:
+    return statistics.median(samples) if samples else 0.0
+
+
+def mad(samples:list[float]) -> float:
+    """中位数绝对偏差，对离群值不敏感的离散程度
+    """
+    if not samples:
+        return 0.0
+    m = statistics.median(samples)
+    return statistics.median(abs(x - m) for x in samples)
+
+
+def percentile(sorted_samples:list[float], p:float) -> float:
+    if not sorted_samples:
+        return 0.0
+    k = min(len(sorted_samples) - 1, max(0, round(p / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[k]
+
+
+def summarize(samples:list[float]) -> dict:
+    """统计延迟样本
+
+    Args:
+        samples (list[float]): 延迟（秒）
+
+    Returns:
+        dict: 样本数和以毫秒为单位的平均值、最小值、p50、p90、p99、最大值
+    """
+    s = sorted(samples)
+    ms = lambda x: round(x * 1000, 4)
+    return {
+        'n': len(s),
+        'mean_ms': ms(statistics.fmean(s)) if s else 0.0,
+        'min_ms': ms(s[0]) if s else 0.0,
+        'p50_ms': ms(percentile(s, 50)),
+        'p90_ms': ms(percentile(s, 90)),
+        'p99_ms': ms(percentile(s, 99)),
+        'max_ms': ms(s[-1]) if s else 0.0,
+        }
+
+
+def machine() -> dict:
+    """运行环境的描述，写入结果文件
+    """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        }
+
+
+class Recorder:
+    """记录测试用例的结果
+
+    用法：
+
+        with recorder.case('download', size=1024) as m:
+            ...             # 只有这里的代码计入时间
+            m['mib_s'] = ...
+    """
+    def __init__(self) -> None:
+        self.results:list[dict] = []
+        return
+
+    @contextmanager
+    def case(self, scenario:str, **params):
+        metrics = {}
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        yield metrics
+        self.results.append({
+            'scenario': scenario,
+            'params': params,
+            'metrics': metrics,
+            'wall_s': round(time.perf_counter() - wall, 6),
+            'cpu_s': round(time.process_time() - cpu, 6),
+            'peak_rss': peak_rss(),
+            })
+        return
@@ -0,0 +1,273 @@
+""" 性能回归检测模块
+
+多次运行测试场景，以每个指标的中位数和中位数绝对偏差（MAD）作为基线保存，
+之后的运行与基线比较，超出容差的吞吐量下降、延迟分位数上升和内存峰值上升标记为回归。
+全部在本机回环地址上运行，不需要网络
+
+在 `src` 的上级目录中运行：
+
+    python -m src.bench.regress save -q -n 5                        # 保存基线到 bench-baselines/<提交>.json
+    python -m src.bench.regress check bench-baselines/1a2b3c4.json  # 运行并与基线比较，有回归时返回 1
+    python -m src.bench.regress compare old.json new.json           # 比较两个已保存的结果
+
+Functions:
+    flatten: 把一次运行的结果展开为指标
+    aggregate: 多次运行的指标汇总为中位数和 MAD
+    collect: 多次运行场景并汇总
+    compare: 比较基线和新结果
+    is_regression: 判断是否为回归
+
+Attributes:
+    BASELINE_VERSION (int): 基线文件的格式版本
+
+"""
+
+from pathlib import Path
+import argparse
+import datetime
+import json
+import sys
+import os
+
+from .measure import median, mad, machine
+from .runner import FORMAT_VERSION, git_revision, run, run_isolated
+from .scenarios import SCENARIOS
+
+
+BASELINE_VERSION = 1
+DEFAULT_DIR = 'bench-baselines'
+MAD_SCALE = 1.4826          # 正态分布时 MAD 与标准差的比例
+
+# 参与比较的指标（按指标名的最后一段）及其方向，1 表示越大越好，-1 表示越小越好
+DIRECTIONS = {
+    'mib_s': 1,
+    'total_mib_s': 1,
+    'p50_ms': -1,
+    'p90_ms': -1,
+    'p99_ms': -1,
+    'peak_rss': -1,
+    }
+
+
+def case_key(result:dict) -> str:
+    params = ','.join(f'{k}={v}' for k, v in result.get('params', {}).items())
+    return f'{result["scenario"]}[{params}]'
+
+
+def flatten(result:dict) -> dict[str, float]:
+    """把一次运行的结果展开为指标
+
+    Args:
+        result (dict): `run` 的返回值
+
+    Returns:
+        dict[str, float]: 指标名（用例名加上指标路径，如 `download[size=65536,repeats=50] latency.p50_ms`）-> 数值，
+            只包含 `DIRECTIONS` 中的指标
+    """
+    retval = {}
+    def walk(prefix:str, d:dict) -> None:
+        for k, v in d.items():
+            name = f'{prefix}{k}' if prefix.endswith(' ') else f'{prefix}.{k}'
+            if isinstance(v, dict):
+                walk(name, v)
+            elif k in DIRECTIONS and isinstance(v, (int, float)):
+                retval[name] = float(v)
+        return
+    for r in result['results']:
+        if 'error' in r:
+            continue
+        key = case_key(r) + ' '
+        walk(key, r['metrics'])
+        if r.get('peak_rss') is not None:
+            retval[key + 'peak_rss'] = float(r['peak_rss'])
+    return retval
+
+
+def aggregate(runs:list[dict]) -> dict[str, dict]:
+    """多次运行的指标汇总为中位数和 MAD
+
+    Args:
+        runs (list[dict]): 每次 `run` 的返回值
+
+    Returns:
+        dict[str, dict]: 指标名 -> {'median', 'mad', 'samples'}
+    """
+    samples:dict[str, list[float]] = {}
+    for r in runs:
+        for k, v in flatten(r).items():
+            samples.setdefault(k, []).append(v)
+    return {k: {'median': median(s), 'mad': mad(s), 'samples': s} for k, s in samples.items()}
+
+
+def collect(names:list[str], trials:int, quick:bool, isolate:bool) -> dict:
+    """多次运行场景并汇总
+
+    Returns:
+        dict: 基线文件的内容
+    """
+    runs = []
+    errors = []
+    for i in range(trials):
+        sys.stderr.write(f'trial {i + 1}/{trials}\n')
+        r = (run_isolated if isolate else run)(names, quick)
+        errors.extend(f'{x["scenario"]}: {x["error"]}' for x in r['results'] if 'error' in x)
+        runs.append(r)
+    return {
+        'baseline': BASELINE_VERSION,
+        'format': FORMAT_VERSION,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'machine': machine(),
+        'quick': quick,
+        'isolate': isolate,
+        'trials': trials,
+        'scenarios': names,
+        'errors': errors,
+        'metrics': aggregate(runs),
+        }
+
+
+def load(path:str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('baseline') != BASELINE_VERSION:
+        raise ValueError(f'{path}: unsupported baseline version {data.get("baseline")}')
+    return data
+
+
+def is_regression(base:dict, new:dict, direction:int, tolerance:float, k:float) -> int:
+    """判断是否为回归
+
+    两次中位数之差超过相对容差，并且超过两者噪声（MAD 换算为标准差）的 k 倍时才认为有变化
+
+    Args:
+        base (dict): 基线的指标
+        new (dict): 新结果的指标
+        direction (int): 1 表示越大越好，-1 表示越小越好
+        tolerance (float): 相对容差
+        k (float): 噪声的倍数
+
+    Returns:
+        int: -1 回归，1 改进，0 无显著变化
+    """
+    delta = new['median'] - base['median']
+    noise = k * MAD_SCALE * (base['mad'] ** 2 + new['mad'] ** 2) ** 0.5
+    if abs(delta) <= max(tolerance * abs(base['median']), noise):
+        return 0
+    return 1 if delta * direction > 0 else -1
+
+
+def compare(base:dict, new:dict, tolerance:float = 0.1, k:float = 3) -> list[dict]:
+    """比较基线和新结果
+
+    Args:
+        base (dict): 基线文件的内容
+        new (dict): 新结果，格式与基线相同
+        tolerance (float, optional): 相对容差. Defaults to 0.1.
+        k (float, optional): 噪声的倍数. Defaults to 3.
+
+    Returns:
+        list[dict]: 每个指标的比较结果，状态为 regressed、improved、ok、new 或 missing
+    """
+    retval = []
+    for name in sorted(base['metrics'].keys() | new['metrics'].keys()):
+        b, n = base['metrics'].get(name), new['metrics'].get(name)
+        item = {'metric': name}
+        if b is None or n is None:
+            item['status'] = 'new' if b is None else 'missing'
+        else:
+            direction = DIRECTIONS[name.rsplit('.', 1)[-1].rsplit(' ', 1)[-1]]
+            change = is_regression(b, n, direction, tolerance, k)
+            item['status'] = {-1: 'regressed', 0: 'ok', 1: 'improved'}[change]
+            item['base'] = b['median']
+            item['new'] = n['median']
+            item['change'] = round((n['median'] - b['median']) / b['median'], 4) if b['median'] else None
+        retval.append(item)
+    return retval
+
+
+def print_report(base:dict, new:dict, report:list[dict], verbose:bool) -> None:
+    out = sys.stderr
+    out.write(f'baseline {base.get("revision")} ({base.get("time")}) -> {new.get("revision")} ({new.get("time")})\n')
+    if base.get('machine') != new.get('machine'):
+        out.write('warning: results come from different machines\n')
+    if base.get('quick') != new.get('quick') or base.get('isolate') != new.get('isolate'):
+        out.write('warning: results use different modes (--quick/--isolate)\n')
+    for e in new.get('errors', []):
+        out.write(f'error: {e}\n')
+    for item in report:
+        if not verbose and item['status'] == 'ok':
+            continue
+        if 'change' in item:
+            change = f'{item["change"]:+.1%}' if item['change'] is not None else ''
+            out.write(f'{item["status"]:<10}{item["metric"]:<64}{item["base"]:>14.4g}{item["new"]:>14.4g}{change:>9}\n')
+        else:
+            out.write(f'{item["status"]:<10}{item["metric"]}\n')
+    counts = {s: sum(1 for i in report if i['status'] == s) for s in ('regressed', 'improved', 'ok', 'new', 'missing')}
+    out.write(', '.join(f'{v} {k}' for k, v in counts.items()) + '\n')
+    return
+
+
+def main(argv:list[str]|None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.bench.regress', description='性能回归检测')
+    sub = parser.add_subparsers(dest='action', required=True)
+    def add_run_args(p:argparse.ArgumentParser) -> None:
+        p.add_argument('scenarios', nargs='*', metavar='scenario', help=f'场景：{", ".join(SCENARIOS)}，默认全部')
+        p.add_argument('-n', '--trials', type=int, default=5, help='重复运行的次数，默认 5')
+        p.add_argument('-q', '--quick', action='store_true', help='快速模式')
+        p.add_argument('--isolate', action='store_true', help='每个场景在单独的子进程中运行，内存峰值互不影响')
+        return
+    cmp_args = argparse.ArgumentParser(add_help=False)
+    cmp_args.add_argument('--tolerance', type=float, default=0.1, help='相对容差，默认 0.1')
+    cmp_args.add_argument('-k', type=float, default=3, help='噪声（MAD 换算的标准差）的倍数，默认 3')
+    cmp_args.add_argument('-v', '--verbose', action='store_true', help='显示没有变化的指标')
+    cmp_args.add_argument('-o', '--output', help='把比较结果保存为 json')
+    p = sub.add_parser('save', help='运行并保存基线')
+    add_run_args(p)
+    p.add_argument('-d', '--dir', default=DEFAULT_DIR, help=f'基线目录，默认 {DEFAULT_DIR}')
+    p.add_argument('--name', help='基线名，默认为当前的 git 提交')
+    p = sub.add_parser('check', parents=[cmp_args], help='运行并与基线比较')
+    p.add_argument('baseline', help='基线文件')
+    add_run_args(p)
+    p.add_argument('--save', metavar='FILE', help='同时保存本次的结果')
+    p = sub.add_parser('compare', parents=[cmp_args], help='比较两个已保存的结果')
+    p.add_argument('baseline', help='基线文件')
+    p.add_argument('current', help='新结果文件')
+    args = parser.parse_args(argv)
+
+    if args.action in ('save', 'check'):
+        names = args.scenarios or list(SCENARIOS)
+        unknown = [n for n in names if n not in SCENARIOS]
+        if unknown:
+            parser.error(f'未知的场景: {", ".join(unknown)}')
+        if args.trials < 1:
+            parser.error('--trials 至少为 1')
+    if args.action == 'save':
+        result = collect(names, args.trials, args.quick, args.isolate)
+        name = args.name or result['revision'] or datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = Path(args.dir, f'{name}.json')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(result, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+        sys.stderr.write(f'saved {path}\n')
+        return 1 if result['errors'] else 0
+
+    base = load(args.baseline)
+    if args.action == 'check':
+        new = collect(names, args.trials, args.quick, args.isolate)
+        if args.save:
+            Path(args.save).write_text(json.dumps(new, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+    else:
+        new = load(args.current)
+    report = compare(base, new, args.tolerance, args.k)
+    print_report(base, new, report, args.verbose)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'baseline': args.baseline, 'revision': new['revision'], 'metrics': report}, f, ensure_ascii=False, indent=2)
+    return 1 if new['errors'] or any(i['status'] == 'regressed' for i in report) else 0
+
+
+if __name__ == '__main__':
+    code = main()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)          # 不等待测试中残留的非守护线程
@@ -0,0 +1,91 @@
+""" 运行测试场景
+
+每个场景使用一个新的测试服务端，场景之间互不影响
+
+Functions:
+    run: 在当前进程中运行场景
+    run_isolated: 每个场景在单独的子进程中运行
+
+"""
+
+from pathlib import Path
+import subprocess
+import traceback
+import datetime
+import json
+import sys
+
+from .env import BenchServer
+from .measure import Recorder, machine
+from .scenarios import SCENARIOS
+
+
+FORMAT_VERSION = 1          # 结果文件的格式版本
+
+
+def git_revision() -> str|None:
+    """当前代码的 git 提交，不在 git 仓库中时为 None
+    """
+    try:
+        r = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                           capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return r.stdout.strip() or None
+
+
+def header(quick:bool) -> dict:
+    return {
+        'format': FORMAT_VERSION,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'quick': quick,
+        'machine': machine(),
+        'results': [],
+        }
+
+
+def run(names:list[str], quick:bool = False) -> dict:
+    """在当前进程中运行场景
+
+    Args:
+        names (list[str]): 场景名
+        quick (bool, optional): 快速模式，减少样本数和文件大小. Defaults to False.
+
+    Returns:
+        dict: 结果，场景出错时该场景的结果中包含 'error'
+    """
+    retval = header(quick)
+    for name in names:
+        rec = Recorder()
+        try:
+            with BenchServer() as env:
+                SCENARIOS[name](env, rec, quick)
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            rec.results.append({'scenario': name, 'error': f'{type(e).__name__}: {e}'})
+        retval['results'].extend(rec.results)
+    return retval
+
+
+def run_isolated(names:list[str], quick:bool = False) -> dict:
+    """每个场景在单独的子进程中运行，内存峰值只反映该场景
+
+    Args:
+        names (list[str]): 场景名
+        quick (bool, optional): 快速模式. Defaults to False.
+
+    Returns:
+        dict: 合并后的结果
+    """
+    retval = header(quick)
+    root = Path(__file__).parents[2]        # src 包所在的目录
+    for name in names:
+        cmd = [sys.executable, '-m', 'src.bench', name] + (['--quick'] if quick else [])
+        r = subprocess.run(cmd, cwd=root, capture_output=True, text=True)
+        try:
+            retval['results'].extend(json.loads(r.stdout)['results'])
+        except (ValueError, KeyError):
+            sys.stderr.write(r.stderr)
+            retval['results'].append({'scenario': name, 'error': f'subprocess exited with {r.returncode}'})
+    return retval
@@ -0,0 +1,227 @@
+""" 测试场景模块
+
+每个场景是一个函数，参数为测试服务端、结果记录器和是否快速模式，
+在 `recorder.case` 中执行需要测量的部分，准备工作（创建文件、登录）不计入时间
+
+- login: 连接并登录的延迟
+- filelist: `getFileList` 的延迟与目录中文件数的关系
+- message: `getMessage` 的往返延迟，以及 `putMessage` 到其他客户端收到消息的延迟
+- download / upload: 单个传输的吞吐量与文件大小的关系
+- concurrency: 多个客户端同时下载时的总吞吐量
+
+传输直接使用客户端核心返回的 socket，不经过传输管理器，测量的是服务端的数据通路
+
+Functions:
+    download: 下载一个文件并丢弃数据
+    upload: 上传一段数据
+
+Attributes:
+    SCENARIOS (dict): 场景名 -> 场景函数
+
+"""
+
+from threading import Thread, Barrier
+import time
+
+from ..client.core import ClientCore
+from .env import BenchServer, PASSWORD
+from .measure import Recorder, summarize, median
+
+
+KiB = 1024
+MiB = 1024 * 1024
+RECV_SIZE = 256 * KiB
+
+
+def download(cc:ClientCore, path:str) -> int:
+    """下载一个文件并丢弃数据
+
+    Returns:
+        int: 收到的字节数
+    """
+    err, addon = cc.getFile(path, 0)
+    if err:
+        raise RuntimeError(f'getFile {path} failed: {err}')
+    s, size = addon[0], addon[1]
+    got = 0
+    with s:
+        # 服务端发送完后等待客户端关闭连接，不能读到 EOF 为止
+        while got < size:
+            n = len(s.recv(min(RECV_SIZE, size - got)))
+            if n == 0:
+                raise ConnectionError(f'transfer closed at {got}/{size}')
+            got += n
+    return got
+
+
+def upload(cc:ClientCore, path:str, data:bytes) -> None:
+    """上传一段数据，等待服务端写入硬盘并返回 Merkle 根
+    """
+    err, addon = cc.putFile(path, len(data), True)
+    if err:
+        raise RuntimeError(f'putFile {path} failed: {err}')
+    s = addon[0]
+    with s:
+        s.sendall(data)
+        root = b''
+        while len(root) < 32:
+            r = s.recv(32 - len(root))
+            if not r:
+                raise ConnectionError('no merkle root')
+            root += r
+    return
+
+
+def mib_s(size:int, seconds:float) -> float:
+    return round(size / MiB / seconds, 3) if seconds > 0 else 0.0
+
+
+# ---------------------------- 控制通路 ------------------------------
+
+def bench_login(env:BenchServer, rec:Recorder, quick:bool) -> None:
+    n = 50 if quick else 300
+    connect, logins = [], []
+    with rec.case('login', n=n) as m:
+        for i in range(n):
+            cc = ClientCore()
+            t0 = time.perf_counter()
+            cc.connect(env.addr)
+            t1 = time.perf_counter()
+            code, _ = cc.login('bench0', PASSWORD)
+            t2 = time.perf_counter()
+            cc.close()
+            if code:
+                raise RuntimeError(f'login failed: {code}')
+            connect.append(t1 - t0)
+            logins.append(t2 - t1)
+        m['connect'] = summarize(connect)
+        m['login'] = summarize(logins)
+    return
+
+
+def bench_filelist(env:BenchServer, rec:Recorder, quick:bool) -> None:
+    cc = env.client(0)
+    n = 20 if quick else 100
+    for files in ((10, 100, 1000) if quick else (10, 100, 1000, 10000)):
+        d = env.share.joinpath(f'list{files}')
+        d.mkdir()
+        for i in range(files):
+            d.joinpath(f'file{i:05}.txt').touch()
+        samples = []
+        with rec.case('filelist', files=files, n=n) as m:
+            for _ in range(n):
+                t = time.perf_counter()
+                code, _ = cc.getFileList(f'/list{files}/')
+                samples.append(time.perf_counter() - t)
+                if code:
+                    raise RuntimeError(f'getFileList failed: {code}')
+            m.update(summarize(samples))
+    return
+
+
+def bench_message(env:BenchServer, rec:Recorder, quick:bool) -> None:
+    sender, receiver = env.client(0), env.client(1)
+    n = 100 if quick else 500
+    samples = []
+    with rec.case('message', kind='getMessage', n=n) as m:
+        for _ in range(n):
+            t = time.perf_counter()
+            sender.getMessage()
+            samples.append(time.perf_counter() - t)
+        m.update(summarize(samples))
+    # 推送一条消息后接收方不断轮询，直到收到为止
+    n = 20 if quick else 100
+    samples = []
+    with rec.case('message', kind='delivery', n=n) as m:
+        for i in range(n):
+            text = f'bench-{i}-{time.perf_counter()}'
+            t = time.perf_counter()
+            sender.putMessage(text)
+            while not any(msg[2] == text for msg in receiver.getMessage()[1] or []):
+                pass
+            samples.append(time.perf_counter() - t)
+        m.update(summarize(samples))
+    return
+
+
+# ---------------------------- 数据通路 ------------------------------
+
+def sizes(quick:bool) -> tuple[int, ...]:
+    return (64 * KiB, 1 * MiB, 16 * MiB) if quick else (64 * KiB, 1 * MiB, 16 * MiB, 128 * MiB)
+
+
+def repeats(size:int, quick:bool) -> int:
+    return max(3, min(50, (32 if quick else 256) * MiB // size))
+
+
+def bench_download(env:BenchServer, rec:Recorder, quick:bool) -> None:
+    cc = env.client(0)
+    for size in sizes(quick):
+        env.make_file(f'down{size}.bin', size)
+        download(cc, f'/down{size}.bin')         # 预热块缓存
+        r = repeats(size, quick)
+        samples = []
+        with rec.case('download', size=size, repeats=r) as m:
+            for _ in range(r):
+                t = time.perf_counter()
+                download(cc, f'/down{size}.bin')
+                samples.append(time.perf_counter() - t)
+            m['mib_s'] = mib_s(size, median(samples))
+            m['latency'] = summarize(samples)
+    return
+
+
+def bench_upload(env:BenchServer, rec:Recorder, quick:bool) -> None:
+    cc = env.client(0)
+    for size in sizes(quick):
+        data = env.make_file(f'src{size}.bin', size).read_bytes()
+        r = repeats(size, quick)
+        samples = []
+        with rec.case('upload', size=size, repeats=r) as m:
+            for _ in range(r):
+                t = time.perf_counter()
+                upload(cc, f'/up{size}.bin', data)
+                samples.append(time.perf_counter() - t)
+            m['mib_s'] = mib_s(size, median(samples))
+            m['latency'] = summarize(samples)
+    return
+
+
+def bench_concurrency(env:BenchServer, rec:Recorder, quick:bool) -> None:
+    size = 8 * MiB if quick else 32 * MiB
+    env.make_file('conc.bin', size)
+    for clients in ((1, 2, 4, 8) if quick else (1, 2, 4, 8, 16, 32)):
+        ccs = [env.client(i) for i in range(clients)]
+        download(ccs[0], '/conc.bin')
+        barrier = Barrier(clients + 1)
+        samples = [0.0] * clients
+        def worker(i:int) -> None:
+            barrier.wait()
+            t = time.perf_counter()
+            download(ccs[i], '/conc.bin')
+            samples[i] = time.perf_counter() - t
+            return
+        threads = [Thread(target=worker, args=(i,), daemon=True) for i in range(clients)]
+        for th in threads:
+            th.start()
+        with rec.case('concurrency', clients=clients, size=size) as m:
+            barrier.wait()
+            t = time.perf_counter()
+            for th in threads:
+                th.join()
+            m['total_mib_s'] = mib_s(size * clients, time.perf_counter() - t)
+            m['per_transfer'] = summarize(samples)
+        for cc in ccs:
+            cc.close()
+        env.clients.clear()
+    return
+
+
+SCENARIOS = {
+    'login': bench_login,
+    'filelist': bench_filelist,
+    'message': bench_message,
+    'download': bench_download,
+    'upload': bench_upload,
+    'concurrency': bench_concurrency,
+    }
@@ -0,0 +1,610 @@
+""" 命令行客户端模块
+
+不依赖 PyQt 的客户端，基于客户端核心实现，适合在脚本中批量传输文件
+
+支持的子命令：
+    ls      列出服务端文件，支持通配符和递归
+    get     下载文件，支持通配符、递归、并发和批量传输
+    put     上传文件，支持通配符、递归、并发和批量传输
+    mirror  将服务端目录镜像到本地
+    sync    双向同步服务端目录和本地目录
+    cp      在服务端复制文件或目录
+    mv      在服务端移动文件或目录
+    rm      删除服务端的文件或目录
+    mkdir   在服务端创建目录
+    search  搜索局域网内的服务器
+    msg     获取或推送消息
+
+使用 `--json` 参数时，每行输出一个 json 对象，便于其他程序解析
+
+Functions:
+    remote_walk: 递归遍历服务端目录
+    remote_glob: 展开服务端路径中的通配符
+    search_servers: 搜索局域网内的服务器
+    main: 命令行入口
+
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import fnmatch
+import argparse
+from   pathlib  import Path
+
+from   .core    import ClientCore, ErrCode, TransferManager, Syncer, multicast_download, swarm_download, batch_download, batch_upload, file_op
+
+
+MAGIC = '*?['        # 通配符
+
+
+def has_magic(s:str) -> bool:
+    return any(c in s for c in MAGIC)
+
+
+class CliError(Exception):
+    """命令行客户端的错误，携带错误代码
+    """
+    def __init__(self, code:int, msg:str) -> None:
+        super().__init__(msg)
+        self.code = code
+
+
+def remote_walk(cc:ClientCore, dir_path:str) -> list[tuple[str, int, float]]:
+    """递归遍历服务端目录
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        dir_path (str): 服务端目录路径，以 / 结尾
+
+    Returns:
+        list[tuple[str, int, float]]: 目录下全部文件的 (路径, 大小, 修改时间)
+    """
+    retval = []
+    stack = [dir_path]
+    while stack:
+        d = stack.pop()
+        code, lst = cc.getFileList(d)
+        if code:
+            raise CliError(code, f'无法获取文件列表 {d}')
+        for name in lst[0]:
+            stack.append(d + name + '/')
+        for f in lst[1]:
+            retval.append((d + f[0], f[2], f[3]))
+    retval.sort()
+    return retval
+
+
+def remote_glob(cc:ClientCore, pattern:str) -> tuple[list[str], list[tuple[str, int, float]]]:
+    """展开服务端路径中的通配符
+
+    通配符只在单个路径段内生效，例如 `/lab/*/data_??.csv`
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        pattern (str): 服务端路径，可以包含通配符
+
+    Returns:
+        tuple[list[str], list[tuple[str, int, float]]]: 匹配的目录（以 / 结尾）和文件 (路径, 大小, 修改时间)
+    """
+    parts = [p for p in pattern.split('/') if p]
+    if not parts:
+        return ['/'], []
+    dirs = ['/']
+    for n, part in enumerate(parts):
+        last = n == len(parts) - 1
+        new_dirs = []
+        files = []
+        for d in dirs:
+            code, lst = cc.getFileList(d)
+            if code:
+                continue
+            for name in lst[0]:
+                if fnmatch.fnmatchcase(name, part):
+                    new_dirs.append(d + name + '/')
+            if last:
+                for f in lst[1]:
+                    if fnmatch.fnmatchcase(f[0], part):
+                        files.append((d + f[0], f[2], f[3]))
+        dirs = new_dirs
+    return dirs, files
+
+
+def search_servers(timeout:float = 1.0) -> list[tuple[str, str, int]]:
+    """搜索局域网内的服务器
+
+    向广播地址发送请求，收集服务器的响应，协议与 `Th_broadcast` 相同
+
+    Args:
+        timeout (float, optional): 等待响应的时间. Defaults to 1.0.
+
+    Returns:
+        list[tuple[str, str, int]]: 服务器的 (名称, IP, 端口)
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    s.settimeout(0.2)
+    s.sendto(b'REQUIRE_SERVER', ('255.255.255.255', 57777))
+    servers = {}
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            buf, _ = s.recvfrom(1024)
+        except TimeoutError:
+            continue
+        msg = buf.decode(errors='replace')
+        if not msg.startswith('RESPONSE_SERVER_<') or '>_' not in msg:
+            continue
+        name, addr = msg[len('RESPONSE_SERVER_<'):].split('>_', 1)
+        ip, _, port = addr.partition('_')
+        if port.isdigit():
+            servers[name] = (name, ip, int(port))
+    s.close()
+    return sorted(servers.values())
+
+
+class Cli:
+    """命令行客户端
+
+    每个子命令对应一个 `cmd_` 开头的方法
+    """
+    def __init__(self, args:argparse.Namespace) -> None:
+        self.args = args
+        self.cc:ClientCore|None = None
+        return
+
+    # ---------------------------- 工具 ------------------------------
+
+    def out(self, obj:dict, text:str) -> None:
+        """输出一条结果
+
+        Args:
+            obj (dict): json 模式下输出的对象
+            text (str): 文本模式下输出的字符串
+        """
+        if self.args.json:
+            print(json.dumps(obj, ensure_ascii=False), flush=True)
+        else:
+            print(text, flush=True)
+        return
+
+    def connect(self) -> ClientCore:
+        """连接服务器并登录
+        """
+        server = self.args.server or os.environ.get('FTS_SERVER', '127.0.0.1:9000')
+        user = self.args.user or os.environ.get('FTS_USER', '')
+        passwd = self.args.password or os.environ.get('FTS_PASSWORD', '')
+        host, _, port = server.rpartition(':')
+        cc = ClientCore()
+        if self.args.no_compress:
+            cc.codecs = []
+        if not cc.connect((host, int(port))):
+            raise CliError(1, f'服务器连接失败 {server}')
+        code, _ = cc.login(user, passwd)
+        if code:
+            cc.close()
+            raise CliError(code, f'登录失败 {user}')
+        self.cc = cc
+        return cc
+
+    def transfer(self, tm:TransferManager) -> int:
+        """执行队列中的全部传输并输出结果
+
+        Returns:
+            int: 失败的任务数
+        """
+        tm.start()
+        tm.wait()
+        tm.stop()
+        failed = 0
+        for i in tm.snapshot():
+            if i.state != 'done':
+                failed += 1
+            self.out({'op': i.opt, 'remote': i.remote, 'local': i.local, 'size': i.size, 'state': i.state, 'code': i.err},
+                     f'{i.state:<8} {i.opt:<8} {i.remote} <-> {i.local}')
+        return failed
+
+    def expand(self, patterns:list[str]) -> tuple[list[str], list[tuple[str, int, float]]]:
+        """展开多个服务端路径，递归时目录展开为其中的全部文件
+        """
+        dirs, files = [], []
+        for p in patterns:
+            d, f = remote_glob(self.cc, p)
+            if not d and not f:
+                raise CliError(ErrCode.ERR_FILE_NOT_EXIST, f'没有匹配的文件 {p}')
+            dirs.extend(d)
+            files.extend(f)
+        return dirs, files
+
+    # ---------------------------- 子命令 ------------------------------
+
+    def cmd_ls(self) -> int:
+        self.connect()
+        dirs, files = self.expand(self.args.paths or ['/'])
+        for d in dirs:
+            if self.args.recursive:
+                for path, size, mtime in remote_walk(self.cc, d):
+                    self.out({'path': path, 'size': size, 'mtime': mtime}, f'{size:>14} {path}')
+                continue
+            # 非递归时列出目录内容
+            code, lst = self.cc.getFileList(d)
+            if code:
+                raise CliError(code, f'无法获取文件列表 {d}')
+            for name in lst[0]:
+                self.out({'path': d + name + '/', 'dir': True}, f'{"<DIR>":>14} {d}{name}/')
+            for f in lst[1]:
+                self.out({'path': d + f[0], 'size': f[2], 'mtime': f[3]}, f'{f[2]:>14} {d}{f[0]}')
+        for path, size, mtime in files:
+            self.out({'path': path, 'size': size, 'mtime': mtime}, f'{size:>14} {path}')
+        return 0
+
+    def cmd_get(self) -> int:
+        self.connect()
+        dst = Path(self.args.dst)
+        dirs, files = self.expand(self.args.src)
+        if dirs and not self.args.recursive:
+            raise CliError(1, f'{dirs[0]} 是目录，请使用 -r 参数')
+        if self.args.batch:
+            dst.mkdir(parents=True, exist_ok=True)
+            return self.batch('get', batch_download, [p for p, _, _ in files] + dirs, str(dst))
+        pairs = []
+        for path, _, _ in files:
+            dst.mkdir(parents=True, exist_ok=True)
+            pairs.append((path, str(dst / path.rsplit('/', 1)[1])))
+        for d in dirs:
+            base = d.rstrip('/').rsplit('/', 1)[-1]
+            for path, _, _ in remote_walk(self.cc, d):
+                local = dst / base / path[len(d):]
+                local.parent.mkdir(parents=True, exist_ok=True)
+                pairs.append((path, str(local)))
+        if self.args.multicast:
+            return self.each_get(pairs, 'multicast', multicast_download)
+        if self.args.swarm:
+            return self.each_get(pairs, 'swarm', lambda cc, r, l: swarm_download(cc, r, l, self.args.jobs, self.args.seed))
+        tm = TransferManager(self.cc, self.args.jobs)
+        for remote, local in pairs:
+            tm.add_download(remote, local)
+        return 1 if self.transfer(tm) else 0
+
+    def each_get(self, pairs:list[tuple[str, str]], op:str, download) -> int:
+        """通过组播或群集依次下载多个文件
+
+        Args:
+            pairs (list[tuple[str, str]]): [(服务端路径, 本地路径)]
+            op (str): 输出中的操作名
+            download (Callable): 下载函数，参数为 (客户端核心, 服务端路径, 本地路径)，返回 (错误代码, 统计数据)
+
+        Returns:
+            int: 有失败的任务时为1
+        """
+        failed = 0
+        for remote, local in pairs:
+            code, stats = download(self.cc, remote, local)
+            state = 'failed' if code else 'done'
+            failed += bool(code)
+            self.out({'op': op, 'remote': remote, 'local': local, 'state': state, 'code': code, **stats},
+                     f'{state:<8} {op:<8} {remote} <-> {local} {stats}')
+        return 1 if failed else 0
+
+    def batch(self, op:str, func, srcs:list[str], dst:str) -> int:
+        """把全部文件打包成一个数据流传输
+
+        Args:
+            op (str): 输出中的操作名
+            func (Callable): `batch_download` 或 `batch_upload`
+            srcs (list[str]): 源文件和目录
+            dst (str): 目标目录
+
+        Returns:
+            int: 失败时为1
+        """
+        code, stats = func(self.cc, srcs, dst)
+        state = 'failed' if code else 'done'
+        self.out({'op': 'batch-' + op, 'dst': dst, 'state': state, 'code': code, **stats},
+                 f'{state:<8} batch-{op} {len(srcs)} -> {dst} {stats}')
+        return 1 if code else 0
+
+    def cmd_put(self) -> int:
+        self.connect()
+        dst = self.args.dst if self.args.dst.endswith('/') else self.args.dst + '/'
+        tm = TransferManager(self.cc, self.args.jobs)
+        batch = []
+        for pattern in self.args.src:
+            matches = [Path(p) for p in sorted(Path().glob(pattern))] if has_magic(pattern) else [Path(pattern)]
+            for src in matches:
+                if self.args.batch and (src.is_file() or src.is_dir() and self.args.recursive):
+                    batch.append(str(src))
+                elif src.is_file():
+                    tm.add_upload(str(src), dst + src.name)
+                elif src.is_dir() and self.args.recursive:
+                    for f in sorted(src.rglob('*')):
+                        if f.is_file():
+                            tm.add_upload(str(f), dst + src.name + '/' + f.relative_to(src).as_posix())
+                elif src.is_dir():
+                    raise CliError(1, f'{src} 是目录，请使用 -r 参数')
+                else:
+                    raise CliError(ErrCode.ERR_FILE_NOT_EXIST, f'文件不存在 {src}')
+        if batch:
+            return self.batch('put', batch_upload, batch, dst)
+        return 1 if self.transfer(tm) else 0
+
+    def cmd_mirror(self) -> int:
+        """将服务端目录镜像到本地
+
+        只下载本地不存在或大小、修改时间不同的文件，下载后将本地文件的修改时间设为服务端的修改时间
+        """
+        self.connect()
+        src = self.args.src if self.args.src.endswith('/') else self.args.src + '/'
+        dst = Path(self.args.dst)
+        remote = remote_walk(self.cc, src)
+        tm = TransferManager(self.cc, self.args.jobs)
+        for path, size, mtime in remote:
+            local = dst / path[len(src):]
+            if local.is_file():
+                st = local.stat()
+                if st.st_size == size and int(st.st_mtime) == int(mtime):
+                    continue
+            local.parent.mkdir(parents=True, exist_ok=True)
+            tm.add_download(path, str(local), mtime=mtime)
+        failed = self.transfer(tm)
+        if self.args.delete and dst.is_dir():
+            keep = {str(dst / p[len(src):]) for p, _, _ in remote}
+            for f in dst.rglob('*'):
+                if f.is_file() and str(f) not in keep:
+                    f.unlink()
+                    self.out({'op': 'delete', 'local': str(f)}, f'{"deleted":<8} {f}')
+        return 1 if failed else 0
+
+    def cmd_sync(self) -> int:
+        """双向同步服务端目录和本地目录
+
+        只传输新增或修改的文件，未改变的目录只需要一次清单比较
+        """
+        self.connect()
+        syncer = Syncer(self.cc, self.args.remote, self.args.local, self.args.jobs,
+                        self.args.direction, self.args.conflict, self.args.delete, self.args.hash)
+        code, actions = syncer.run()
+        if code:
+            raise CliError(code, f'无法获取文件清单 {self.args.remote}')
+        failed = 0
+        for a in actions:
+            ok = a.ok or a.op == 'conflict'
+            failed += not ok
+            self.out({'op': a.op, 'path': a.path, 'ok': a.ok},
+                     f'{"ok" if a.ok else "skipped" if a.op == "conflict" else "failed":<8} {a.op:<10} {a.path}')
+        return 1 if failed else 0
+
+    def file_op(self, op:str, *args) -> int:
+        """执行一个服务端文件操作，文本模式下显示进度
+
+        Returns:
+            int: 失败时为1
+        """
+        def progress(st:list) -> None:
+            if st[0] == 'running' and not self.args.json:
+                print(f'\r{op} {st[1]}/{st[2]} 个文件 {st[3]}/{st[4]} 字节', end='', file=sys.stderr, flush=True)
+            return
+        code, st = file_op(self.cc, op, *args, progress=progress)
+        if st and st[2] > 1 and not self.args.json:
+            print(file=sys.stderr)
+        state = 'failed' if code else 'done'
+        obj = {'op': op, 'args': list(args), 'state': state, 'code': code}
+        if st:
+            obj.update(files=st[1], bytes=st[3], error=st[5])
+        self.out(obj, f'{state:<8} {op:<8} {" -> ".join(map(str, args[:2]))}' + (f' {st[5]}' if st and st[5] else ''))
+        return 1 if code else 0
+
+    def cmd_cp(self) -> int:
+        self.connect()
+        return self.file_op('copy', self.args.src, self.args.dst, self.args.force)
+
+    def cmd_mv(self) -> int:
+        self.connect()
+        return self.file_op('move', self.args.src, self.args.dst, self.args.force)
+
+    def cmd_rm(self) -> int:
+        self.connect()
+        failed = 0
+        for path in self.args.paths:
+            failed += self.file_op('delete', path)
+        return 1 if failed else 0
+
+    def cmd_mkdir(self) -> int:
+        self.connect()
+        failed = 0
+        for path in self.args.paths:
+            code, _ = self.cc.mkdir(path)
+            failed += bool(code)
+            state = 'failed' if code else 'done'
+            self.out({'op': 'mkdir', 'path': path, 'state': state, 'code': code}, f'{state:<8} mkdir    {path}')
+        return 1 if failed else 0
+
+    def cmd_search(self) -> int:
+        for name, ip, port in search_servers(self.args.timeout):
+            self.out({'name': name, 'ip': ip, 'port': port}, f'{name:<20} {ip}:{port}')
+        return 0
+
+    def cmd_stats(self) -> int:
+        self.connect()
+        code, samples = self.cc.stats()
+        if code:
+            raise CliError(code, '获取运行指标失败')
+        prefix = self.args.prefix
+        for name, value in samples.items():
+            if name.startswith(prefix):
+                self.out({'name': name, 'value': value}, f'{name} {value:g}')
+        return 0
+
+    def cmd_profile(self) -> int:
+        self.connect()
+        code, addon = self.cc.profile(self.args.time, self.args.rate)
+        if code == ErrCode.ERR_SERVER_BUSY:
+            raise CliError(code, f'服务端正在进行性能采样，剩余 {addon[0]:.0f} 秒')
+        if code:
+            raise CliError(code, '开启性能采样失败')
+        self.out({'path': addon[0], 'seconds': self.args.time}, f'{self.args.time:g} 秒后结果将写入服务端的 {addon[0]}')
+        return 0
+
+    def cmd_memory(self) -> int:
+        self.connect()
+        a = self.args
+        if a.action == 'start':
+            args = [a.frames]
+        elif a.action == 'top':
+            args = [a.limit, a.group]
+        elif a.action == 'diff':
+            if not a.ids:
+                raise CliError(ErrCode.ERR_INVALID_ARGS, 'diff 需要快照编号')
+            args = [a.ids[0], a.ids[1] if len(a.ids) > 1 else None, a.limit, a.group]
+        else:
+            args = []
+        code, addon = self.cc.memory(a.action, *args)
+        if code == ErrCode.ERR_NOT_STARTED:
+            raise CliError(code, 'tracemalloc 未开启，先执行 memory start')
+        if code == ErrCode.ERR_INVALID_ARGS:
+            raise CliError(code, '参数错误或快照不存在')
+        if code:
+            raise CliError(code, '内存诊断失败')
+        if a.action in ('status', 'start', 'stop'):
+            lines = [f'rss {addon["rss"]}']
+            lines.extend(f'{k} {v}' for k, v in sorted(addon['subsystems'].items()))
+            if addon['tracing']:
+                lines.append(f'tracemalloc {addon["traced"]} (peak {addon["peak"]}), snapshots {addon["snapshots"]}')
+            else:
+                lines.append('tracemalloc off')
+            self.out(addon, '\n'.join(lines))
+        elif a.action == 'snapshot':
+            self.out({'snapshot': addon[0]}, f'snapshot {addon[0]}')
+        else:
+            for row in addon:
+                diff = f' {row["size_diff"]:+d} B {row["count_diff"]:+d}' if 'size_diff' in row else ''
+                self.out(row, f'{row["size"]:>12} B {row["count"]:>8}{diff}  ' + ' <- '.join(row['site']))
+        return 0
+
+    def cmd_msg(self) -> int:
+        self.connect()
+        if self.args.text:
+            code, _ = self.cc.putMessage(' '.join(self.args.text))
+            if code:
+                raise CliError(code, '发送消息失败')
+            return 0
+        end = time.monotonic() + self.args.wait
+        while True:
+            code, lst = self.cc.getMessage()
+            if code:
+                raise CliError(code, '获取消息失败')
+            for user, t, text in lst:
+                stime = f'{t[0]:4}-{t[1]:02}-{t[2]:02} {t[3]:02}:{t[4]:02}:{t[5]:02}'
+                self.out({'user': user, 'time': stime, 'text': text}, f'[{stime}]  {user}\n{text}')
+            if time.monotonic() >= end:
+                return 0
+            time.sleep(0.2)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器
+    """
+    parser = argparse.ArgumentParser(prog='fts', description='文件传输系统命令行客户端')
+    parser.add_argument('-s', '--server', help='服务器地址 ip:port，默认读取环境变量 FTS_SERVER')
+    parser.add_argument('-u', '--user', help='用户名，默认读取环境变量 FTS_USER')
+    parser.add_argument('-p', '--password', help='密码，默认读取环境变量 FTS_PASSWORD')
+    parser.add_argument('--json', action='store_true', help='每行输出一个 json 对象')
+    parser.add_argument('--no-compress', action='store_true', help='传输文件时不压缩')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('ls', help='列出服务端文件')
+    p.add_argument('paths', nargs='*', help='服务端路径，支持通配符')
+    p.add_argument('-r', '--recursive', action='store_true', help='递归列出子目录')
+
+    p = sub.add_parser('get', help='下载文件')
+    p.add_argument('src', nargs='+', help='服务端路径，支持通配符')
+    p.add_argument('dst', help='本地目录')
+    p.add_argument('-r', '--recursive', action='store_true', help='递归下载目录')
+    p.add_argument('-j', '--jobs', type=int, default=4, help='同时传输的文件数')
+    g = p.add_mutually_exclusive_group()
+    g.add_argument('--multicast', action='store_true', help='通过组播下载，适合很多客户端同时下载同一批文件')
+    g.add_argument('--swarm', action='store_true', help='群集下载，客户端之间互相传输已下载的块')
+    g.add_argument('--batch', action='store_true', help='打包成一个数据流下载，适合大量小文件')
+    p.add_argument('--seed', type=float, default=10.0, help='群集下载完成后继续做种的时间（秒）')
+
+    p = sub.add_parser('put', help='上传文件')
+    p.add_argument('src', nargs='+', help='本地路径，支持通配符')
+    p.add_argument('dst', help='服务端目录')
+    p.add_argument('-r', '--recursive', action='store_true', help='递归上传目录')
+    p.add_argument('-j', '--jobs', type=int, default=4, help='同时传输的文件数')
+    p.add_argument('--batch', action='store_true', help='打包成一个数据流上传，适合大量小文件')
+
+    p = sub.add_parser('mirror', help='将服务端目录镜像到本地')
+    p.add_argument('src', help='服务端目录')
+    p.add_argument('dst', help='本地目录')
+    p.add_argument('-j', '--jobs', type=int, default=4, help='同时传输的文件数')
+    p.add_argument('--delete', action='store_true', help='删除本地多余的文件')
+
+    p = sub.add_parser('sync', help='同步服务端目录和本地目录')
+    p.add_argument('remote', help='服务端目录')
+    p.add_argument('local', help='本地目录')
+    p.add_argument('-j', '--jobs', type=int, default=4, help='同时传输的文件数')
+    p.add_argument('-d', '--direction', choices=('both', 'pull', 'push'), default='both', help='同步方向')
+    p.add_argument('-c', '--conflict', choices=('newer', 'local', 'remote', 'skip'), default='newer', help='两侧都修改时的处理策略')
+    p.add_argument('--delete', action='store_true', help='同步删除操作')
+    p.add_argument('--hash', action='store_true', help='大小相同但修改时间不同时比较哈希值')
+
+    p = sub.add_parser('cp', help='在服务端复制文件或目录')
+    p.add_argument('src', help='服务端源路径')
+    p.add_argument('dst', help='服务端目标路径')
+    p.add_argument('-f', '--force', action='store_true', help='覆盖已存在的目标')
+
+    p = sub.add_parser('mv', help='在服务端移动文件或目录')
+    p.add_argument('src', help='服务端源路径')
+    p.add_argument('dst', help='服务端目标路径')
+    p.add_argument('-f', '--force', action='store_true', help='覆盖已存在的目标')
+
+    p = sub.add_parser('rm', help='删除服务端的文件或目录')
+    p.add_argument('paths', nargs='+', help='服务端路径')
+
+    p = sub.add_parser('mkdir', help='在服务端创建目录')
+    p.add_argument('paths', nargs='+', help='服务端路径')
+
+    p = sub.add_parser('search', help='搜索局域网内的服务器')
+    p.add_argument('-t', '--timeout', type=float, default=1.0, help='等待响应的时间（秒）')
+
+    p = sub.add_parser('stats', help='查看服务端的运行指标（需要管理员权限）')
+    p.add_argument('prefix', nargs='?', default='', help='只显示以此开头的指标')
+
+    p = sub.add_parser('profile', help='在服务端开启性能采样（需要管理员权限）')
+    p.add_argument('-t', '--time', type=float, default=30, help='采样时间（秒），默认 30')
+    p.add_argument('-r', '--rate', type=float, help='采样频率（次/秒），默认使用服务端的配置')
+
+    p = sub.add_parser('memory', help='服务端的内存诊断（需要管理员权限）')
+    p.add_argument('action', nargs='?', default='status', choices=('status', 'start', 'stop', 'snapshot', 'top', 'diff'),
+                   help='status 查看内存占用，start/stop 开启/关闭 tracemalloc，snapshot 保存快照，'
+                        'top 分配最多的位置，diff 比较快照')
+    p.add_argument('ids', nargs='*', type=int, help='diff 的快照编号：较早的和较晚的，省略较晚的时与当前比较')
+    p.add_argument('-f', '--frames', type=int, default=10, help='start 时每次分配记录的调用栈层数，默认 10')
+    p.add_argument('-n', '--limit', type=int, default=20, help='top 和 diff 显示的条数，默认 20')
+    p.add_argument('-g', '--group', default='lineno', choices=('lineno', 'filename', 'traceback'), help='top 和 diff 的分组方式')
+
+    p = sub.add_parser('msg', help='获取消息，带参数时推送消息')
+    p.add_argument('text', nargs='*', help='要推送的消息')
+    p.add_argument('-w', '--wait', type=float, default=0, help='持续获取消息的时间（秒）')
+    return parser
+
+
+def main(argv:list[str]|None = None) -> int:
+    """命令行入口
+
+    Returns:
+        int: 退出码，0 为成功
+    """
+    args = build_parser().parse_args(argv)
+    cli = Cli(args)
+    try:
+        return getattr(cli, 'cmd_' + args.cmd)()
+    except CliError as e:
+        cli.out({'error': str(e), 'code': e.code}, f'错误: {e} (错误代码:{e.code})')
+        return 1
+    finally:
+        if cli.cc is not None:
+            cli.cc.close()
@@ -9,14 +9,14 @@ Classes:
 
 from typing             import override
 import time
-from threading          import Thread, Lock, Event
+from threading          import Thread, Event
 from pathlib            import Path
 
 from PyQt5.QtCore       import pyqtSignal
 from PyQt5.QtWidgets    import QWidget, QApplication, QMessageBox, QFileDialog, QSystemTrayIcon
 
-from .gui               import Login, Msg, Filelist, Filedialog, GUI_Tray
-from ..client.core      import ErrCode, ClientCore
+from .gui               import Login, Msg, Filelist, Transferlist, GUI_Tray
+from ..client.core      import ErrCode, ClientCore, TransferManager
 
 
 class Client(QWidget):
@@ -43,6 +43,7 @@ class Client(QWidget):
         self.logined = False
 
         self.cc = ClientCore()      # 核心逻辑
+        self.tm = TransferManager(self.cc, 3, './transfer_queue.json', self.on_transfer_updated)    # 传输管理
         self.w_login = Login()      # 登录界面
         self.tray = GUI_Tray()      # 系统托盘
 
@@ -81,6 +82,7 @@ class Client(QWidget):
         self.tray.actions['登录'].setText(f'登录')
         self.tray.actions['消息'].setEnabled(False)
         self.tray.actions['文件'].setEnabled(False)
+        self.tray.actions['传输'].setEnabled(False)
         return
     
 
@@ -149,41 +151,17 @@ class Client(QWidget):
         Args:
             dst (str): 上传的目标路径
 
-        这个信号槽函数是阻塞的
+        选择文件后将上传任务加入传输队列，由传输管理器调度
         """
-
-        # 使用列表来保存 dialog 窗口
-        if not hasattr(self, 'dialogs'):
-            self.dialogs_lock = Lock()
-            self.dialogs:list[QFileDialog] = []
         src, _ = QFileDialog.getOpenFileName(None, '保存文件', '', None, None, QFileDialog.Options())
         if src == '':       # 文件选择取消后会返回空字符串，此时取消上传
             return
         
-        # 获取必要的信息
-        src= Path(src)
-        file_size = src.stat().st_size
-        file_name = src.name
-
-        # 调用核心API
         # 注意这里自动将文件重命名，便于标识上传者和上传时间
-        err, addon = self.cc.putFile(dst+f'{self.user_id+time.strftime('%Y%m%d%H%M%S')}_'+file_name, file_size)
-        if err:
-            self.showMsg(f'文件上传失败\n错误代码:{err}')
-            return
-        # 将得到的socket传给文件对话界面
-        dialog = Filedialog(dst+f'{self.user_id+time.strftime('%Y%m%d%H%M%S')}_'+file_name, 'upload', 0, addon[0], src)
-        # 清理已关闭的 dialogs
-        with self.dialogs_lock:
-            dead_map = []
-            for i in self.dialogs:
-                if i.isHidden():
-                    dead_map.append(i)
-            for i in dead_map:
-                self.dialogs.remove(i)
-        
-        self.dialogs.append(dialog)     # 添加新的 dialog 到列表
-        dialog.show()                   # 启动 dialog
+        file_name = Path(src).name
+        remote = dst+f'{self.user_id+time.strftime('%Y%m%d%H%M%S')}_'+file_name
+        self.tm.add_upload(src, remote)
+        self.w_transfer.show()
         return
 
     def on_wFileList_downloadRequired(self, src:str) -> None:
@@ -192,34 +170,36 @@ class Client(QWidget):
         Args:
             src (str): 下载的目标文件路径
 
-        这个信号槽函数是阻塞的
+        选择保存位置后将下载任务加入传输队列，由传输管理器调度
         """
-
-        # 使用列表来保存 dialog 窗口
-        if not hasattr(self, 'dialogs'):
-            self.dialogs_lock = Lock()
-            self.dialogs:list[QFileDialog] = []
         dst, _ = QFileDialog.getSaveFileName(None, '保存文件', src.split('/')[-1], None, None, QFileDialog.Options())
         if dst == '':           # 文件选择取消后会返回空字符串，此时取消下载
             return
-        
-        # 调用核心API，获取socket
-        err, addon = self.cc.getFile(src, 0)
-        if err:
-            self.showMsg(f'文件下载失败\n错误代码:{err}')
-            return
-        # 新建文件对话界面，将socket传入
-        dialog = Filedialog(src, 'download', addon[1], addon[0], dst)
-        # 清理
-        with self.dialogs_lock:
-            dead_map = []
-            for i in self.dialogs:
-                if i.isHidden():
-                    dead_map.append(i)
-            for i in dead_map:
-                self.dialogs.remove(i)
-        self.dialogs.append(dialog)         # 添加到列表
-        dialog.show()                       # 启动
+        self.tm.add_download(src, dst)
+        self.w_transfer.show()
+        return
+
+    def on_wTransfer_priorityRequired(self, ids:list, delta:int) -> None:
+        """传输窗口 priority_required 信号槽
+
+        Args:
+            ids (list): 任务id列表
+            delta (int): 优先级的调整量
+        """
+        items = {i.id: i for i in self.tm.snapshot()}
+        for i in ids:
+            if i in items:
+                self.tm.set_priority(i, items[i].priority + delta)
+        return
+
+    def on_transfer_updated(self, items:list) -> None:
+        """传输管理器的回调，在传输线程中执行
+
+        Args:
+            items (list): 全部传输任务
+        """
+        if hasattr(self, 'w_transfer'):
+            self.w_transfer.update(items)
         return
 
     def on_tray_actived(self, reason:QSystemTrayIcon.ActivationReason) -> None:
@@ -235,6 +215,8 @@ class Client(QWidget):
                 self.w_filelist.show()
             if hasattr(self, 'w_msg'):
                 self.w_msg.show()
+            if hasattr(self, 'w_transfer'):
+                self.w_transfer.show()
         return
         
     
@@ -250,6 +232,7 @@ class Client(QWidget):
         self.logined = True             # 登录状态标记
         self.w_msg = Msg()              # 新建消息窗口
         self.w_filelist = Filelist()    # 新建文件窗口
+        self.w_transfer = Transferlist(self.tm.limit)   # 新建传输窗口
         self.tray.setIconLogin(True)    # 设定托盘为已登录图标
         
         self.w_login.hide()             # 隐藏登录界面
@@ -261,17 +244,27 @@ class Client(QWidget):
         self.tray.actions['登录'].setText(f'已登录：{self.user_id}')
         self.tray.actions['消息'].setEnabled(True)
         self.tray.actions['文件'].setEnabled(True)
+        self.tray.actions['传输'].setEnabled(True)
         self.tray.actions['消息'].triggered.connect(self.w_msg.show)
         self.tray.actions['文件'].triggered.connect(self.w_filelist.show)
+        self.tray.actions['传输'].triggered.connect(self.w_transfer.show)
 
         # 连接新窗口的信号
         self.w_msg.submitted.connect(self.on_wMsg_submitted)
         self.w_filelist.filelist_required.connect(self.on_wFilelist_filelistRequired)
         self.w_filelist.upload_required.connect(self.on_wFilelist_uploadRequired)
         self.w_filelist.download_required.connect(self.on_wFileList_downloadRequired)
+        self.w_transfer.pause_required.connect(lambda ids: [self.tm.pause(i) for i in ids])
+        self.w_transfer.resume_required.connect(lambda ids: [self.tm.resume(i) for i in ids])
+        self.w_transfer.cancel_required.connect(lambda ids: [self.tm.cancel(i) for i in ids])
+        self.w_transfer.priority_required.connect(self.on_wTransfer_priorityRequired)
+        self.w_transfer.limit_changed.connect(self.tm.set_limit)
+        self.w_transfer.clear_required.connect(self.tm.clear_finished)
 
         self.start_getMsg()             # 启动自动获取消息
         self.start_getFilelist()        # 启动自动刷新文件列表
+        self.tm.start()                 # 启动传输调度，继续上次未完成的任务
+        self.w_transfer.update(self.tm.snapshot())
         return
 
     def on_logouted(self) -> None:
@@ -289,6 +282,10 @@ class Client(QWidget):
         self.tray.actions['登录'].setText(f'登录')
         self.tray.actions['消息'].setEnabled(False)
         self.tray.actions['文件'].setEnabled(False)
+        self.tray.actions['传输'].setEnabled(False)
+
+        # 暂停传输调度，未完成的任务保留在队列中
+        self.tm.stop()
 
         # 取消关联信号
         self.w_msg.submitted.disconnect(self.on_wMsg_submitted)
@@ -303,6 +300,9 @@ class Client(QWidget):
         if hasattr(self, 'w_filelist'):
             self.w_filelist.close()
             del self.w_filelist
+        if hasattr(self, 'w_transfer'):
+            self.w_transfer.close()
+            del self.w_transfer
 
         # 停止两个自动刷新的线程
         if hasattr(self, 'stopEvent'):
@@ -372,9 +372,7 @@ class Client(QWidget):
 
         清理所有开启的资源，然后退出事件循环
         """
-        if hasattr(self, 'dialogs'):        # 删除所有文件对话界面
-            for i in self.dialogs:
-                if i.isVisible(): i.activateWindow(); return
+        self.tm.stop()                      # 停止传输，未完成的任务下次启动时继续
         self.cc.close()                     # 关闭核心
         self.stopEvent.set()                # 关闭自动刷新的线程
         QApplication.instance().quit()      # 退出事件循环
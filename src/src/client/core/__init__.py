@@ -1,2 +1,8 @@
 from .core      import ClientCore
-from .errcode   import ErrCode
\ No newline at end of file
+from .errcode   import ErrCode
+from .transfer  import TransferManager, TransferItem
+from .sync      import Syncer
+from .multicast import multicast_download
+from .swarm     import swarm_download
+from .batch     import batch_download, batch_upload
+from .fileops   import file_op
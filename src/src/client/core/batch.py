@@ -0,0 +1,118 @@
+""" src.client.core.batch
+
+批量传输模块
+
+把多个文件或整个目录打包成一个数据流传输，适合大量小文件，数据流格式见 `src.globals.batch`
+
+Functions:
+    batch_download: 批量下载文件和目录
+    batch_upload: 批量上传文件和目录
+
+"""
+
+from typing import Callable
+from pathlib import Path
+import os
+
+from ...globals.batch import BUF_SIZE, END, collect, check_name, pack_header, read_exact, read_header
+from .errcode import ErrCode
+from .transfer import recv_exact, ROOT_TIMEOUT
+
+
+def batch_download(cc, remote_paths:list[str], local_dir:str,
+                   progress:Callable[[int, int], None]|None = None) -> tuple[ErrCode, dict]:
+    """批量下载文件和目录
+
+    服务端文件 `/a/b.txt` 保存为 `本地目录/b.txt`，服务端目录 `/a/c/` 中的文件保存在 `本地目录/c/` 中
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        remote_paths (list[str]): 服务端文件和目录的路径
+        local_dir (str): 本地目录
+        progress (Callable[[int, int], None] | None, optional): 进度回调，参数为 (已接收的字节数, 总字节数). Defaults to None.
+
+    Returns:
+        tuple[ErrCode, dict]: 错误代码和统计数据 {'files': 文件数, 'bytes': 字节数}
+    """
+    stats = {'files': 0, 'bytes': 0}
+    err, addon = cc.getBatch(remote_paths)
+    if err:
+        return (err, stats)
+    s, _, total = addon
+    base = Path(local_dir)
+    with s, s.makefile('rb', buffering=BUF_SIZE) as r:
+        try:
+            while True:
+                head = read_header(r)
+                if head is None:
+                    break
+                name, size, mtime = head
+                if not check_name(name):
+                    return (ErrCode.ERR_TIME_OUT, stats)
+                dst = base.joinpath(name)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                part = dst.with_name(dst.name + '.part')
+                with open(part, 'wb') as f:
+                    remain = size
+                    while remain > 0:
+                        buf = read_exact(r, min(BUF_SIZE, remain))
+                        f.write(buf)
+                        remain -= len(buf)
+                        stats['bytes'] += len(buf)
+                        if progress:
+                            progress(stats['bytes'], total)
+                os.utime(part, (mtime, mtime))
+                os.replace(part, dst)
+                stats['files'] += 1
+        except (OSError, UnicodeDecodeError):
+            return (ErrCode.ERR_TIME_OUT, stats)
+    return (ErrCode.SUCCESS, stats)
+
+
+def batch_upload(cc, local_paths:list[str], remote_dir:str, overwrite:bool = False,
+                 progress:Callable[[int, int], None]|None = None) -> tuple[ErrCode, dict]:
+    """批量上传文件和目录
+
+    本地文件 `b.txt` 保存为 `服务端目录/b.txt`，本地目录 `c/` 中的文件保存在 `服务端目录/c/` 中
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        local_paths (list[str]): 本地文件和目录的路径
+        remote_dir (str): 服务端目录
+        overwrite (bool, optional): 服务端文件已存在时是否覆盖. Defaults to False.
+        progress (Callable[[int, int], None] | None, optional): 进度回调，参数为 (已发送的字节数, 总字节数). Defaults to None.
+
+    Returns:
+        tuple[ErrCode, dict]: 错误代码和统计数据 {'files': 写入的文件数, 'skipped': 已存在而跳过的文件数, 'bytes': 字节数}
+    """
+    stats = {'files': 0, 'skipped': 0, 'bytes': 0}
+    entries = collect([Path(p) for p in local_paths])
+    total = sum(p.stat().st_size for p, _ in entries)
+    err, s = cc.putBatch(remote_dir, total, overwrite)
+    if err:
+        return (err, stats)
+    with s:
+        try:
+            with s.makefile('wb', buffering=BUF_SIZE) as w:
+                for path, name in entries:
+                    with open(path, 'rb') as f:
+                        st = os.fstat(f.fileno())
+                        w.write(pack_header(name, st.st_size, st.st_mtime))
+                        remain = st.st_size
+                        while remain > 0:
+                            buf = f.read(min(BUF_SIZE, remain))
+                            if not buf:     # 文件在上传期间变短，数据流已无法继续
+                                return (ErrCode.ERR_FILE_NOT_EXIST, stats)
+                            w.write(buf)
+                            remain -= len(buf)
+                            stats['bytes'] += len(buf)
+                            if progress:
+                                progress(stats['bytes'], total)
+                w.write(END)
+            s.settimeout(ROOT_TIMEOUT)
+            result = recv_exact(s, 8)
+        except OSError:
+            return (ErrCode.ERR_TIME_OUT, stats)
+    stats['files'] = int.from_bytes(result[:4], 'big')
+    stats['skipped'] = int.from_bytes(result[4:], 'big')
+    return (ErrCode.SUCCESS, stats)
@@ -5,6 +5,7 @@
 Classes:
     Th_send(Thread): 管理socket发送的线程
     Th_receive(Thread): 管理socket接收的线程
+    Th_keepalive(Thread): 连接空闲时发送心跳的线程
     Client(object): 客户端核心逻辑类，提供API供调用
 
 
@@ -12,13 +13,27 @@ Classes:
 
 from typing import override
 from threading import Thread, Event, Lock
-from queue import Queue, Empty
+from queue import Empty
+import random
 import socket
+import time
 
 from ...globals import Package
+from ...globals.compress import available
+from ...globals.frame import MAX_FRAME, FrameTooLarge, SendQueue, set_send_timeout, set_keepalive
 from .errcode import ErrCode
 
 
+BUSY_BACKOFF_MAX = 30       # 服务器忙时单次退避的最长时间（秒）
+HASH_TIMEOUT = 600          # 等待服务端计算文件哈希的最长时间（秒）
+SEND_QUEUE_BYTES = 4 * 1024 * 1024  # 等待发送的请求的上限（字节），超过时请求等待
+SEND_TIMEOUT = 30           # 发送超时（秒），服务端长时间不读取时认为连接断开
+PING_INTERVAL = 30          # 连接空闲超过该时间（秒）时发送心跳，需要小于服务端的 keepalive.idleTimeout
+PING_TIMEOUT = 10           # 心跳的超时时间（秒）
+PING_MISSES = 3             # 连续该次数心跳超时时认为连接已经断开
+TCP_KEEPALIVE = (60, 10, 6) # TCP keepalive 的空闲时间（秒）、探测间隔（秒）和探测次数
+
+
 class Th_send(Thread):
     """Th_send 发送线程
 
@@ -35,7 +50,7 @@ class Th_send(Thread):
         
         """
         super().__init__(None, None, 'Th_send', None, None) # 调用父类初始化方法
-        self.buf = Queue()          # 新建数据包队列，线程发送的数据包从这里取
+        self.buf = SendQueue(SEND_QUEUE_BYTES)  # 新建数据包队列，线程发送的（编码后的）数据包从这里取
         self.s = s                  # 绑定socket
         self.daemon = True          # 设置为“守护线程”，其他线程退出后自动退出
         self.endEvent = endEvent    # 结束事件，用于外部控制线程关闭
@@ -54,14 +69,19 @@ class Th_send(Thread):
                 # 这里使用超时是为了配合停止信号
                 # 如果不设置超时，运行会一直卡在这里，就不会回到循环的开头，进行条件验证
                 # 外部无法控制线程结束
-                pkg:Package = self.buf.get(timeout=0.5)
+                pkg_b, _ = self.buf.get(timeout=0.5)
             except Empty:
                 continue
-            pkg_b = pkg.to_bytes()          # 对得到的数据包编码
             try:
                 self.s.sendall(pkg_b)       # 发送二进制数据
             except:
+                # 发送失败或超时，关闭连接，接收线程随之退出
                 self.abortEvent.set()
+                try:
+                    self.s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return
 
 class Th_receive(Thread):
     """Th_receive 接收线程
@@ -100,10 +120,10 @@ class Th_receive(Thread):
         while not self.endEvent.is_set():
             try:
                 pkg_length = int.from_bytes(self.read_s_by_int(4))  # 获取4字节长度的整型数据
-            except:
+                pkg_b = self.read_s_by_int(pkg_length, MAX_FRAME)   # 获取整个数据包的二进制数据
+            except:             # 连接断开，或者长度超过上限（数据流已经错乱）
                 self.endEvent.set()
                 continue
-            pkg_b = self.read_s_by_int(pkg_length)      # 获取整个数据包的二进制数据
             pkg = Package.from_bytes(pkg_b)             # 解析成数据包
             with self.buf_lock:
                 # 如果已经有相应的注册id，则放入对应位置触发接收事件
@@ -142,11 +162,18 @@ class Th_receive(Thread):
         with self.buf_lock:
             del self.buf[id]
     
-    def read_s_by_int(self, i:int) -> bytearray:
+    def pending(self) -> int:
+        """正在等待响应的请求数
+        """
+        with self.buf_lock:
+            return len(self.buf)
+
+    def read_s_by_int(self, i:int, limit:int = 0) -> bytearray:
         """从socket获取固定字节的数据
 
         Args:
             i (int): 数据长度（字节数）
+            limit (int, optional): 数据长度的上限，超过时抛出 `FrameTooLarge`，0 表示不限制. Defaults to 0.
 
         Returns:
             bytearray: 所需的数据
@@ -155,16 +182,67 @@ class Th_receive(Thread):
 
         原版socket.recv函数无法确定读取的长度，只能限制最大长度
         """
+        if limit and i > limit:     # 在分配内存之前检查
+            raise FrameTooLarge(i, limit)
         buf = bytearray(i)      # 根据数据长度实例化一个字节数组
         readed = 0              # 已接收的字节数量
         while readed < i:
             r = self.s.recv(i - readed)
+            if not r:           # 服务端已关闭连接
+                raise ConnectionError('connection closed')
             buf[readed:readed+len(r)] = r   # 将获取到的bytes合并到buf中
             readed += len(r)                # 更新已接收的长度
         return buf
 
 
 
+class Th_keepalive(Thread):
+    """Th_keepalive 心跳线程
+
+    连接空闲（没有发出请求，也没有请求在等待响应）超过 `PING_INTERVAL` 时发送 `ping`，服务端据此保留连接。
+    连续 `PING_MISSES` 次超时说明服务端已经不在（断电、断网等没有关闭连接的情况），
+    这时触发中断事件并关闭socket，不再等待系统发现连接断开
+    """
+    @override
+    def __init__(self, core:'ClientCore') -> None:
+        """重写初始化函数
+
+        Args:
+            core (ClientCore): 所属的客户端核心
+        """
+        super().__init__(None, None, 'Th_keepalive', None, None)
+        self.core = core
+        self.daemon = True
+        return
+
+    @override
+    def run(self) -> None:
+        core = self.core
+        misses = 0
+        while not core.endEvent.wait(1):
+            if not core.is_connected:
+                return
+            # 有请求在等待响应时服务端仍在处理（工作者线程逐个处理请求，心跳会排在后面），视为活动
+            if core.th_receive.pending():
+                core.last_active = time.monotonic()
+                continue
+            if time.monotonic() - core.last_active < PING_INTERVAL:
+                continue
+            err, _ = core.ping()
+            if err != ErrCode.ERR_TIME_OUT:     # 旧版本的服务端不认识 ping，有响应即可
+                misses = 0
+                continue
+            misses += 1
+            if misses >= PING_MISSES:
+                core.abortEvent.set()
+                try:
+                    core.s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                return
+        return
+
+
 class ClientCore:
     '''
     客户端核心类
@@ -184,6 +262,9 @@ class ClientCore:
         self.is_connected = False
         self.th_send = None
         self.th_receive = None
+        self.th_keepalive = None
+        self.codecs = available()       # 传输文件时向服务端提供的压缩算法，为空时不压缩
+        self.busy_retries = 3           # 服务器忙时的重试次数
     
     def connect(self, addr:tuple) -> bool:
         """连接方法
@@ -208,16 +289,21 @@ class ClientCore:
     def init_connected(self) -> None:
         """连接后初始化
 
-        建立结束事件、中断事件、发送线程和接收线程
+        建立结束事件、中断事件、发送线程、接收线程和心跳线程
 
         开始监控连接状况
         """
         self.endEvent = Event()
         self.abortEvent = Event()
+        self.last_active = time.monotonic()     # 最近一次发出请求的时间，空闲时由心跳线程发送 ping
+        set_send_timeout(self.s, SEND_TIMEOUT)
+        set_keepalive(self.s, *TCP_KEEPALIVE)
         self.th_send = Th_send(self.s, self.endEvent, self.abortEvent)
         self.th_receive = Th_receive(self.s, self.endEvent)
+        self.th_keepalive = Th_keepalive(self)
         self.th_send.start()
         self.th_receive.start()
+        self.th_keepalive.start()
         self.start_connection_moniter()
 
     def start_connection_moniter(self) -> None:
@@ -248,11 +334,15 @@ class ClientCore:
         if not self.is_connected:                   # 判断连接状态，未连接则直接返回错误
             return (ErrCode.ERR_NO_LOGIN, None)
         pkg = Package(Package.get_id(), cmd, args)  # 构造请求数据包
+        self.last_active = time.monotonic()
         finish = Event()                            # 新建完成事件（接收事件）
         retval = []                                 # 返回值容器
         self.th_receive.regist(pkg.id, finish, retval)  # 注册接收表
-        self.th_send.buf.put(pkg)                   # 发送数据包
-        ok = finish.wait(timeout)                   # 等待接收
+        deadline = time.monotonic() + timeout
+        if not self.th_send.buf.offer((pkg.to_bytes(), None), timeout):   # 发送队列已满时等待
+            self.th_receive.deregist(pkg.id)
+            return (ErrCode.ERR_TIME_OUT, None)
+        ok = finish.wait(max(0, deadline - time.monotonic()))   # 等待接收
         if ok:
             # 接收成功后将数据包取出，将数据包中的args返回
             # 无论是否超时，均需要对接收表进行注销
@@ -264,6 +354,48 @@ class ClientCore:
             self.th_receive.deregist(pkg.id)
             return (ErrCode.ERR_TIME_OUT, None)
     
+    def require_transfer(self, cmd:str, args:list) -> tuple:
+        """发起传输请求
+
+        服务器忙时按服务端建议的重试时间指数退避后重试，重试时间加入随机抖动，
+        避免大量客户端同时重试
+
+        Args:
+            cmd (str): API的命令
+            args (list): 命令对应的参数
+
+        Returns:
+            tuple: 返回请求的结果，重试次数用完时仍为 ERR_SERVER_BUSY
+        """
+        for i in range(self.busy_retries + 1):
+            # 服务端会在等待队列中等待许可，超时时间需要长于等待时间
+            err, addon = self.require(cmd, args, timeout=5)
+            if err != ErrCode.ERR_SERVER_BUSY or i == self.busy_retries:
+                break
+            retry_after = addon[0] if addon else 1
+            time.sleep(min(BUSY_BACKOFF_MAX, retry_after * 2**i) * random.uniform(0.5, 1))
+        return (err, addon)
+
+    def require_hashed(self, cmd:str, args:list) -> tuple:
+        """发起需要服务端文件哈希的请求
+
+        服务端没有缓存时在后台计算哈希，计算完成前返回服务器忙，
+        这里按服务端建议的时间重试，最多等待 `HASH_TIMEOUT` 秒
+
+        Args:
+            cmd (str): API的命令
+            args (list): 命令对应的参数
+
+        Returns:
+            tuple: 返回请求的结果，超时时仍为 ERR_SERVER_BUSY
+        """
+        deadline = time.monotonic() + HASH_TIMEOUT
+        while True:
+            err, addon = self.require(cmd, args, timeout=10)
+            if err != ErrCode.ERR_SERVER_BUSY or time.monotonic() >= deadline:
+                return (err, addon)
+            time.sleep(min(BUSY_BACKOFF_MAX, addon[0] if addon else 1))
+
     def close(self) -> None:
         """核心关闭方法
 
@@ -274,7 +406,7 @@ class ClientCore:
         self.s.close()
 
     # --------------------------------------------------------------#
-    # 以下 6 个方法为暴露的 API                                       #
+    # 以下方法为暴露的 API                                            #
     # 这些方法均为 require 方法的包装                                 #
     # 对于文件传输，会将返回的端口号进行连接，返回的是已连接的 socket    #
     # --------------------------------------------------------------#
@@ -291,22 +423,94 @@ class ClientCore:
     def putMessage(self, msg:str) -> tuple[ErrCode, None]:
         return self.require('putMessage', [msg])
     
-    def getFile(self, file_path:str, begin_byte:int) -> tuple[ErrCode, tuple[int, int]]:
-        err, addon = self.require('getFile', [file_path, begin_byte])
+    def getFile(self, file_path:str, begin_byte:int, length:int|None = None) -> tuple[ErrCode, tuple[socket.socket, int, str|None]]:
+        err, addon = self.require_transfer('getFile', [file_path, begin_byte, self.codecs, length])
         if err:
             return(err, addon)
         port = addon[0]
         s = socket.socket()
         s.connect((self.s.getpeername()[0], port))
-        return (err, (s, addon[1]))
+        return (err, (s, addon[1], addon[2] if len(addon) > 2 else None))
     
-    def putFile(self, file_path:str, file_size:int) -> tuple[ErrCode, tuple[int]]:
-        err, addon =  self.require('putFile', [file_path, file_size])
+    def putFile(self, file_path:str, file_size:int, overwrite:bool = False, mtime:float|None = None) -> tuple[ErrCode, tuple[socket.socket, str|None]]:
+        err, addon =  self.require_transfer('putFile', [file_path, file_size, overwrite, mtime, self.codecs])
         if err:
             return(err, addon)
         port = addon[0]
         s = socket.socket()
         s.connect((self.s.getpeername()[0], port))
-        return (err, (s,))
-        
+        return (err, (s, addon[1] if len(addon) > 1 else None))
+
+    def getBatch(self, paths:list[str]) -> tuple[ErrCode, tuple[socket.socket, int, int]]:
+        err, addon = self.require_transfer('getBatch', [paths])
+        if err:
+            return(err, addon)
+        s = socket.socket()
+        s.connect((self.s.getpeername()[0], addon[0]))
+        return (err, (s, addon[1], addon[2]))
+
+    def putBatch(self, dir_path:str, total_size:int, overwrite:bool = False) -> tuple[ErrCode, socket.socket]:
+        err, addon = self.require_transfer('putBatch', [dir_path, total_size, overwrite])
+        if err:
+            return(err, addon)
+        s = socket.socket()
+        s.connect((self.s.getpeername()[0], addon[0]))
+        return (err, s)
+
+    def putFileByHash(self, file_path:str, file_size:int, digest:str, overwrite:bool = False, mtime:float|None = None) -> tuple[ErrCode, None]:
+        return self.require('putFileByHash', [file_path, file_size, digest, overwrite, mtime])
+
+    def putDelta(self, file_path:str, file_size:int, mtime:float|None = None) -> tuple[ErrCode, tuple[socket.socket, int]]:
+        err, addon =  self.require_transfer('putDelta', [file_path, file_size, mtime])
+        if err:
+            return(err, addon)
+        port = addon[0]
+        s = socket.socket()
+        s.connect((self.s.getpeername()[0], port))
+        return (err, (s, addon[1]))
+
+    def getFileHash(self, file_path:str) -> tuple[ErrCode, list]:
+        return self.require_hashed('getFileHash', [file_path])
+
+    def multicastJoin(self, file_path:str) -> tuple[ErrCode, list]:
+        return self.require('multicastJoin', [file_path])
+
+    def swarmJoin(self, file_path:str, port:int) -> tuple[ErrCode, list]:
+        return self.require_hashed('swarmJoin', [file_path, port])
+
+    def swarmPeers(self, file_path:str) -> tuple[ErrCode, list[tuple[str, int]]]:
+        return self.require('swarmPeers', [file_path])
+
+    def swarmLeave(self, file_path:str) -> tuple[ErrCode, None]:
+        return self.require('swarmLeave', [file_path])
+
+    def getManifest(self, dir_path:str, with_hash:bool = False) -> tuple[ErrCode, list[tuple[str, int, float, str|None]]]:
+        # 目录很大时生成清单需要较长时间，因此延长超时时间
+        return self.require('getManifest', [dir_path, with_hash], timeout=60)
+
+    def delete(self, path:str) -> tuple[ErrCode, list]:
+        return self.require('delete', [path], timeout=5)
+
+    def copy(self, src:str, dst:str, overwrite:bool = False) -> tuple[ErrCode, list]:
+        return self.require('copy', [src, dst, overwrite], timeout=5)
+
+    def move(self, src:str, dst:str, overwrite:bool = False) -> tuple[ErrCode, list]:
+        return self.require('move', [src, dst, overwrite], timeout=5)
+
+    def mkdir(self, dir_path:str) -> tuple[ErrCode, None]:
+        return self.require('mkdir', [dir_path])
+
+    def fileOpStatus(self, op_id:int) -> tuple[ErrCode, list]:
+        return self.require('fileOpStatus', [op_id])
+
+    def stats(self) -> tuple[ErrCode, dict[str, float]]:
+        return self.require('stats', [])
+
+    def profile(self, seconds:float = 30, rate:float|None = None) -> tuple[ErrCode, list]:
+        return self.require('profile', [seconds, rate])
+
+    def memory(self, action:str = 'status', *args) -> tuple[ErrCode, dict|list]:
+        return self.require('memory', [action, *args])
 
+    def ping(self) -> tuple[ErrCode, list[float]]:
+        return self.require('ping', [], PING_TIMEOUT)
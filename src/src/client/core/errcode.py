@@ -19,3 +19,5 @@ class ErrCode(StatCode):
     错误代码为整型(int)
     """
     ERR_TIME_OUT = 101
+    ERR_HASH_MISMATCH = 102     # 传输的文件校验失败
+    ERR_TRANSFER_FAILED = 103   # 传输线程中出现意外错误
@@ -0,0 +1,50 @@
+""" src.client.core.fileops
+
+服务端文件管理模块
+
+复制、移动和删除在服务端执行，`copy` / `move` / `delete` 返回 `[操作编号, 进度]`，
+操作没有在服务端的等待时间内完成时，通过 `fileOpStatus` 查询进度直到结束
+
+进度为 `[状态, 已完成文件数, 总文件数, 已完成字节数, 总字节数, 错误信息]`，状态为 'running'、'done' 或 'failed'
+
+Functions:
+    file_op: 执行一个服务端文件操作并等待完成
+
+"""
+
+from typing import Callable, Literal
+import time
+
+from .errcode import ErrCode
+
+
+POLL_INTERVAL = 0.5         # 查询进度的间隔（秒）
+
+
+def file_op(cc, op:Literal['copy', 'move', 'delete'], *args,
+            progress:Callable[[list], None]|None = None) -> tuple[ErrCode, list|None]:
+    """执行一个服务端文件操作并等待完成
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        op (Literal[&#39;copy&#39;, &#39;move&#39;, &#39;delete&#39;]): 操作类型
+        *args: 操作的参数，与客户端核心的同名方法相同
+        progress (Callable[[list], None] | None, optional): 进度回调，参数为进度. Defaults to None.
+
+    Returns:
+        tuple[ErrCode, list | None]: 错误代码和最终的进度，操作失败时错误代码为 `ERR_FILE_NOT_EXIST`
+    """
+    err, addon = getattr(cc, op)(*args)
+    if err:
+        return (err, None)
+    op_id, status = addon
+    while status[0] == 'running':
+        if progress:
+            progress(status)
+        time.sleep(POLL_INTERVAL)
+        err, status = cc.fileOpStatus(op_id)
+        if err:
+            return (err, None)
+    if progress:
+        progress(status)
+    return (ErrCode.SUCCESS if status[0] == 'done' else ErrCode.ERR_FILE_NOT_EXIST, status)
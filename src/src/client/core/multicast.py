@@ -0,0 +1,198 @@
+""" src.client.core.multicast
+
+组播下载模块
+
+加入服务端的组播会话接收文件，会话结束后：
+
+1. 每组只丢失一个数据包时，用该组的校验包恢复
+2. 仍然缺失的部分合并为连续的范围，通过 `getFile` 的范围下载补齐
+3. 与其他传输相同，计算文件的 Merkle 叶子并与服务端比较，不一致的块重新获取。
+   组播数据包没有认证，伪造或损坏的数据包在这一步被发现并修复
+
+数据包格式见 `src.globals.multicast`
+
+Functions:
+    multicast_download: 通过组播下载一个文件
+
+"""
+
+from typing import Callable
+from pathlib import Path
+import socket
+import time
+import os
+
+from ...globals.multicast import HEAD, T_DATA, T_PARITY, T_END
+from ...globals.compress import read_frame
+from ...globals.merkle import file_leaves
+from .errcode import ErrCode
+from .transfer import recv_exact, verify_file, CHUNK_SIZE
+
+
+IDLE_TIMEOUT = 2.0          # 超过该时间没有收到数据包则认为会话已经结束（秒）
+RCVBUF_SIZE = 4 * 1024 * 1024
+
+
+def missing_ranges(got:bytearray) -> list[tuple[int, int]]:
+    """将缺失的数据包合并为连续的范围
+
+    Returns:
+        list[tuple[int, int]]: [(起始包号, 结束包号)]，不包含结束包号
+    """
+    retval = []
+    i = 0
+    n = len(got)
+    while i < n:
+        if got[i]:
+            i += 1
+            continue
+        j = i
+        while j < n and not got[j]:
+            j += 1
+        retval.append((i, j))
+        i = j
+    return retval
+
+
+def fetch_range(cc, remote:str, f, begin:int, end:int, size:int) -> ErrCode:
+    """通过单播下载文件的一个范围并写入本地文件的对应位置
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        remote (str): 服务端文件路径
+        f (BinaryIO): 本地文件
+        begin (int): 起始位置
+        end (int): 结束位置（不包含）
+        size (int): 组播会话中的文件大小，服务端文件大小改变时下载失败
+
+    Returns:
+        ErrCode: 错误代码
+    """
+    err, addon = cc.getFile(remote, begin, end - begin)
+    if err:
+        return err
+    s, remote_size, codec = addon
+    with s:
+        if remote_size != size:
+            return ErrCode.ERR_FILE_NOT_EXIST
+        f.seek(begin)
+        pos = begin
+        while pos < end:
+            if codec:
+                buf = read_frame(lambda n: recv_exact(s, n), codec)
+            else:
+                buf = s.recv(min(CHUNK_SIZE, end - pos))
+            if not buf:
+                return ErrCode.ERR_TIME_OUT
+            f.write(buf)
+            pos += len(buf)
+    return ErrCode.SUCCESS
+
+
+def multicast_download(cc,
+                       remote:str,
+                       local:str,
+                       progress:Callable[[int, int], None]|None = None) -> tuple[ErrCode, dict]:
+    """通过组播下载一个文件
+
+    先写入 `.part` 临时文件，完成后再重命名
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        remote (str): 服务端文件路径
+        local (str): 本地文件路径
+        progress (Callable[[int, int], None] | None, optional): 进度回调，参数为(已接收的字节数, 文件大小). Defaults to None.
+
+    Returns:
+        tuple[ErrCode, dict]: 错误代码和统计数据 {'multicast': 组播接收的字节数, 'fec': 校验恢复的字节数, 'unicast': 单播补齐的字节数}
+    """
+    err, info = cc.multicastJoin(remote)
+    if err:
+        return (err, {})
+    sid, group, port, size, pdata, k, delay = info
+    n = (size + pdata - 1) // pdata
+    got = bytearray(n)
+    parities:dict[int, bytes] = {}
+    stats = {'multicast': 0, 'fec': 0, 'unicast': 0}
+    part = Path(local + '.part')
+
+    # 在本机连接服务端使用的网卡上加入组播组
+    iface = cc.s.getsockname()[0]
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+    s.bind(('', port))
+    s.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(group) + socket.inet_aton(iface))
+
+    with open(part, 'w+b') as f:
+        f.truncate(size)
+        deadline = time.monotonic() + delay + IDLE_TIMEOUT
+        done = 0
+        try:
+            while done < n:
+                remain = deadline - time.monotonic()
+                if remain <= 0:
+                    break
+                s.settimeout(remain)
+                try:
+                    pkt = s.recv(65536)
+                except TimeoutError:
+                    break
+                if len(pkt) < HEAD.size:
+                    continue
+                psid, ptype, seq = HEAD.unpack_from(pkt)
+                if psid != sid:
+                    continue
+                deadline = time.monotonic() + IDLE_TIMEOUT
+                data = pkt[HEAD.size:]
+                if ptype == T_DATA and seq < n and not got[seq]:
+                    f.seek(seq * pdata)
+                    f.write(data[:min(pdata, size - seq * pdata)])
+                    got[seq] = 1
+                    done += 1
+                    stats['multicast'] += len(data)
+                    if progress:
+                        progress(stats['multicast'], size)
+                elif ptype == T_PARITY and len(data) == pdata:
+                    parities[seq] = data
+                elif ptype == T_END:
+                    break
+        finally:
+            s.close()
+
+        # 用校验包恢复每组中唯一丢失的数据包
+        for g, parity in parities.items():
+            group_ids = range(g * k, min(n, (g + 1) * k))
+            lost = [i for i in group_ids if not got[i]]
+            if len(lost) != 1:
+                continue
+            x = int.from_bytes(parity, 'little')
+            for i in group_ids:
+                if got[i]:
+                    f.seek(i * pdata)
+                    x ^= int.from_bytes(f.read(pdata), 'little')
+            i = lost[0]
+            length = min(pdata, size - i * pdata)
+            f.seek(i * pdata)
+            f.write(x.to_bytes(pdata, 'little')[:length])
+            got[i] = 1
+            stats['fec'] += length
+
+        # 单播补齐剩余的部分
+        for a, b in missing_ranges(got):
+            begin, end = a * pdata, min(size, b * pdata)
+            err = fetch_range(cc, remote, f, begin, end, size)
+            if err:
+                return (err, stats)
+            stats['unicast'] += end - begin
+
+    try:
+        leaves = file_leaves(part, size)
+    except OSError:
+        part.unlink(missing_ok=True)
+        return (ErrCode.ERR_HASH_MISMATCH, stats)
+    err = verify_file(cc, remote, part, size, leaves)
+    if err:
+        return (err, stats)
+    os.replace(part, local)
+    return (ErrCode.SUCCESS, stats)
@@ -0,0 +1,367 @@
+""" src.client.core.swarm
+
+群集下载模块
+
+多个客户端同时下载同一个大文件时，客户端（节点）之间互相传输已经下载并校验过的块：
+
+1. 客户端为该文件开启一个节点端口，通过 `swarmJoin` 加入群集，取得块大小、每块的哈希值和其他节点的地址
+2. 若干个下载线程并行工作，每次选择一个尚未下载的块：
+   优先从拥有该块的节点获取，所有节点都没有时才通过 `getFile` 的范围下载从服务端获取。
+   群集中有其他节点时只有 `SERVER_JOBS` 个线程同时从服务端下载，其余线程等待其他节点的块
+3. 每一块都与服务端公布的哈希值比较，不一致时丢弃并从其他来源重新获取
+4. 下载期间和完成后的做种时间内，节点端口向其他节点提供已校验的块。
+   节点端口只在控制连接使用的网卡上监听，并且只为出示了该群集令牌的节点服务
+
+节点间协议见 `src.globals.swarm`
+
+Classes:
+    Swarm(object): 一个文件的群集下载状态
+    Th_swarmServe(Thread): 节点服务线程
+    Fetcher(object): 一个下载线程的状态
+
+Functions:
+    swarm_download: 通过群集下载一个文件
+
+"""
+
+from typing import Callable, override
+from threading import Thread, Lock
+from pathlib import Path
+import random
+import socket
+import hmac
+import time
+import os
+
+from ...globals.swarm import REQ, LEN, OP_BITFIELD, OP_CHUNK, TOKEN_SIZE
+from ...globals.merkle import chunk_hash
+from .errcode import ErrCode
+from .transfer import recv_exact, recv_range
+
+
+VIEW_TTL = 0.1          # 其他节点位图的缓存时间（秒）
+SERVER_JOBS = 1         # 群集中有其他节点时，同时从服务端下载的线程数上限
+PEER_REFRESH = 1.0      # 向服务端刷新节点列表的间隔（秒）
+PEER_TIMEOUT = 5.0      # 节点连接的超时时间（秒）
+
+
+class Swarm:
+    """一个文件的群集下载状态
+
+    下载线程和节点服务线程共享，块的读写和状态修改都需要持有对应的锁
+    """
+    def __init__(self, f, size:int, chunk:int, hashes:list[str], token:bytes) -> None:
+        """初始化
+
+        Args:
+            f (BinaryIO): 以读写模式打开的本地临时文件
+            size (int): 文件大小
+            chunk (int): 块大小
+            hashes (list[str]): 每块的哈希值
+            token (bytes): 群集令牌
+        """
+        self.f = f
+        self.token = token
+        self.io_lock = Lock()
+        self.size = size
+        self.chunk = chunk
+        self.hashes = hashes
+        self.lock = Lock()                              # 保护以下状态
+        self.have = bytearray((len(hashes) + 7) // 8)   # 已校验的块的位图
+        self.needed = set(range(len(hashes)))
+        self.busy:set[int] = set()                      # 正在下载的块
+        self.server_busy = 0                            # 正在从服务端下载的线程数
+        self.peers:list[tuple[str, int]] = []
+        self.err = ErrCode.SUCCESS
+        self.stats = {'server': 0, 'peer': 0, 'served': 0, 'corrupt': 0}
+        return
+
+    def span(self, i:int) -> tuple[int, int]:
+        """第 i 块的 (起始位置, 长度)
+        """
+        begin = i * self.chunk
+        return (begin, min(self.chunk, self.size - begin))
+
+    def read(self, i:int) -> bytes:
+        """读取一个已校验的块
+        """
+        begin, length = self.span(i)
+        with self.io_lock:
+            self.f.seek(begin)
+            return self.f.read(length)
+
+    def store(self, i:int, data:bytes) -> None:
+        """写入一个已校验的块并标记为拥有
+        """
+        with self.io_lock:
+            self.f.seek(i * self.chunk)
+            self.f.write(data)
+        with self.lock:
+            self.have[i >> 3] |= 1 << (i & 7)
+            self.needed.discard(i)
+        return
+
+    def done_bytes(self) -> int:
+        with self.lock:
+            return self.size - sum(self.span(i)[1] for i in self.needed)
+
+
+def has_chunk(bitfield:bytes, i:int) -> bool:
+    return len(bitfield) > i >> 3 and bool(bitfield[i >> 3] & (1 << (i & 7)))
+
+
+class Th_swarmServe(Thread):
+    """节点服务线程
+
+    在节点端口上接受其他节点的连接，每个连接由一个单独的线程处理。
+    创建时即开始监听，加入群集后设置 `swarm` 再启动线程
+    """
+    @override
+    def __init__(self, host:str) -> None:
+        """重写初始化方法
+
+        Args:
+            host (str): 监听的地址，为控制连接的本地地址
+        """
+        super().__init__(None, None, 'Th_swarmServe', daemon=True)
+        self.swarm:Swarm = None
+        self.s = socket.socket()
+        self.s.bind((host, 0))
+        self.s.listen(16)
+        self.port = self.s.getsockname()[1]
+        return
+
+    @override
+    def run(self) -> None:
+        while True:
+            try:
+                c, _ = self.s.accept()
+            except OSError:
+                break
+            Thread(target=self.serve, args=(c,), name='Th_swarmPeer', daemon=True).start()
+        return
+
+    def serve(self, c:socket.socket) -> None:
+        """检查节点的令牌，之后处理该节点的请求，直到连接断开
+        """
+        sw = self.swarm
+        with c:
+            try:
+                c.settimeout(PEER_TIMEOUT)
+                if not hmac.compare_digest(recv_exact(c, TOKEN_SIZE), sw.token):
+                    return
+                c.settimeout(None)      # 节点之间的连接在请求之间保持空闲
+                while True:
+                    op, i = REQ.unpack(recv_exact(c, REQ.size))
+                    if op == OP_BITFIELD:
+                        with sw.lock:
+                            data = bytes(sw.have)
+                    elif op == OP_CHUNK and i < len(sw.hashes) and has_chunk(sw.have, i):
+                        data = sw.read(i)
+                        with sw.lock:
+                            sw.stats['served'] += len(data)
+                    else:
+                        data = b''
+                    c.sendall(LEN.pack(len(data)) + data)
+            except (OSError, ConnectionError):
+                pass
+        return
+
+    def stop(self) -> None:
+        self.s.close()
+        return
+
+
+class Fetcher:
+    """一个下载线程的状态：到其他节点的连接和节点位图的缓存
+    """
+    def __init__(self, swarm:Swarm, cc, remote:str) -> None:
+        self.swarm = swarm
+        self.cc = cc
+        self.remote = remote
+        self.conns:dict[tuple, socket.socket] = {}
+        self.views:dict[tuple, bytes] = {}
+        self.view_time = 0.0
+        self.order = list(range(len(swarm.hashes)))
+        random.shuffle(self.order)      # 各个节点的下载顺序不同，彼此拥有的块也不同
+        return
+
+    def request(self, addr:tuple, op:int, i:int = 0) -> bytes:
+        """向节点发送请求并接收响应，失败时丢弃该连接并抛出 OSError
+        """
+        c = self.conns.get(addr)
+        try:
+            if c is None:
+                c = self.conns[addr] = socket.create_connection(addr, PEER_TIMEOUT)
+                c.sendall(self.swarm.token)
+            c.sendall(REQ.pack(op, i))
+            n, = LEN.unpack(recv_exact(c, LEN.size))
+            return recv_exact(c, n) if n else b''
+        except (OSError, ConnectionError) as e:
+            self.drop(addr)
+            raise OSError(e)
+
+    def drop(self, addr:tuple) -> None:
+        c = self.conns.pop(addr, None)
+        if c is not None:
+            c.close()
+        self.views.pop(addr, None)
+        return
+
+    def refresh(self) -> None:
+        """更新其他节点的位图
+        """
+        now = time.monotonic()
+        if now - self.view_time < VIEW_TTL:
+            return
+        self.view_time = now
+        with self.swarm.lock:
+            peers = list(self.swarm.peers)
+        for addr in list(self.conns):
+            if addr not in peers:
+                self.drop(addr)
+        for addr in peers:
+            try:
+                self.views[addr] = self.request(addr, OP_BITFIELD)
+            except OSError:
+                pass
+        return
+
+    def pick(self) -> tuple[int, tuple|None]|None:
+        """选择下一个要下载的块及来源
+
+        Returns:
+            tuple[int, tuple | None] | None: (块号, 节点地址)，节点地址为 None 时从服务端下载；
+                没有可以下载的块时为 None
+        """
+        sw = self.swarm
+        with sw.lock:
+            fallback = None
+            for i in self.order:
+                if i not in sw.needed or i in sw.busy:
+                    continue
+                owners = [a for a, v in self.views.items() if has_chunk(v, i)]
+                if owners:
+                    sw.busy.add(i)
+                    return (i, random.choice(owners))
+                if fallback is None:
+                    fallback = i
+            if fallback is not None and (not sw.peers or sw.server_busy < SERVER_JOBS):
+                sw.busy.add(fallback)
+                sw.server_busy += 1
+                return (fallback, None)
+            return None
+
+    def from_server(self, i:int) -> bytes|None:
+        """通过范围下载从服务端获取一块
+        """
+        sw = self.swarm
+        err, data = recv_range(self.cc, self.remote, *sw.span(i))
+        if err and err != ErrCode.ERR_TIME_OUT:    # 连接中断时重新获取，其他错误时停止下载
+            with sw.lock:
+                sw.err = err
+        return data
+
+    def run(self) -> None:
+        sw = self.swarm
+        while not sw.err:
+            self.refresh()
+            picked = self.pick()
+            if picked is None:
+                with sw.lock:
+                    if not sw.needed:
+                        break
+                time.sleep(0.02)        # 剩余的块都在下载中，或者等待其他节点
+                continue
+            i, addr = picked
+            data = None
+            try:
+                if addr is None:
+                    data = self.from_server(i)
+                else:
+                    data = self.request(addr, OP_CHUNK, i) or None
+            except (OSError, ConnectionError):
+                data = None
+            if data is not None and chunk_hash(data) != sw.hashes[i]:
+                with sw.lock:
+                    sw.stats['corrupt'] += 1
+                    if addr is None:    # 服务端的数据与哈希列表不一致，说明文件已被修改
+                        sw.err = ErrCode.ERR_FILE_NOT_EXIST
+                if addr is not None:
+                    self.drop(addr)     # 不再信任该节点当前的位图
+                data = None
+            if data is not None:
+                sw.store(i, data)
+                with sw.lock:
+                    sw.stats['server' if addr is None else 'peer'] += len(data)
+            else:
+                self.views.pop(addr, None)
+            with sw.lock:
+                sw.busy.discard(i)
+                if addr is None:
+                    sw.server_busy -= 1
+        for addr in list(self.conns):
+            self.drop(addr)
+        return
+
+
+def swarm_download(cc,
+                   remote:str,
+                   local:str,
+                   jobs:int = 4,
+                   seed:float = 0.0,
+                   progress:Callable[[int, int], None]|None = None) -> tuple[ErrCode, dict]:
+    """通过群集下载一个文件
+
+    先写入 `.part` 临时文件，完成后再重命名
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        remote (str): 服务端文件路径
+        local (str): 本地文件路径
+        jobs (int, optional): 下载线程数. Defaults to 4.
+        seed (float, optional): 下载完成后继续向其他节点提供数据的时间（秒）. Defaults to 0.0.
+        progress (Callable[[int, int], None] | None, optional): 进度回调，参数为(已下载的字节数, 文件大小). Defaults to None.
+
+    Returns:
+        tuple[ErrCode, dict]: 错误代码和统计数据
+            {'server': 从服务端下载的字节数, 'peer': 从其他节点下载的字节数, 'served': 提供给其他节点的字节数, 'corrupt': 校验失败的块数}
+    """
+    server = Th_swarmServe(cc.s.getsockname()[0])
+    err, info = cc.swarmJoin(remote, server.port)
+    if err:
+        server.stop()
+        return (err, {})
+    size, chunk, hashes, peers, token = info
+    part = Path(local + '.part')
+    with open(part, 'w+b') as f:
+        f.truncate(size)
+        sw = Swarm(f, size, chunk, hashes, bytes.fromhex(token))
+        sw.peers = [tuple(a) for a in peers]
+        server.swarm = sw
+        server.start()
+        try:
+            fetchers = [Thread(target=Fetcher(sw, cc, remote).run, name='Th_swarmFetch', daemon=True) for _ in range(jobs)]
+            for t in fetchers:
+                t.start()
+            last = 0.0
+            while any(t.is_alive() for t in fetchers):
+                time.sleep(0.1)
+                if progress:
+                    progress(sw.done_bytes(), size)
+                if time.monotonic() - last >= PEER_REFRESH:
+                    last = time.monotonic()
+                    err, peers = cc.swarmPeers(remote)
+                    if not err:
+                        with sw.lock:
+                            sw.peers = [tuple(a) for a in peers]
+            if not sw.err and seed > 0:
+                time.sleep(seed)
+        finally:
+            cc.swarmLeave(remote)
+            server.stop()
+        stats = dict(sw.stats)
+    if sw.err:
+        return (sw.err, stats)
+    os.replace(part, local)
+    return (ErrCode.SUCCESS, stats)
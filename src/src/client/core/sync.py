@@ -0,0 +1,280 @@
+""" src.client.core.sync
+
+目录同步模块
+
+客户端与服务端交换文件清单 `(相对路径, 大小, 修改时间, 哈希值)`，比较后只传输新增或修改的文件
+
+同步时本地目录中会保存一份上次同步完成时的清单（`.fts_sync.json`），
+用来判断一个文件是在哪一侧被修改或删除的：
+
+- 只有一侧相对上次同步发生了变化，则将该侧的变化同步到另一侧
+- 两侧都发生了变化且结果不同，则为冲突，按冲突策略处理
+
+上传时会把本地的修改时间一同发送给服务端，下载时会把本地的修改时间设为服务端的修改时间，
+因此同步完成后两侧的清单相同，未改变的目录树再次同步只需要一次清单的比较
+
+Classes:
+    SyncAction(object): 同步动作
+    Syncer(object): 目录同步类
+
+Functions:
+    local_manifest: 生成本地目录的文件清单
+    plan: 比较清单生成同步动作
+
+"""
+
+from typing import Literal
+from pathlib import Path
+import hashlib
+import json
+import os
+
+from .errcode import ErrCode
+from .transfer import TransferManager
+from .fileops import file_op
+
+
+STATE_FILE = '.fts_sync.json'       # 保存上次同步结果的文件名
+
+Entry = tuple[int, float]           # 清单项 (大小, 修改时间)
+
+
+def local_manifest(root:Path) -> dict[str, Entry]:
+    """生成本地目录的文件清单
+
+    忽略同步状态文件和未下载完成的 `.part` 文件
+
+    Args:
+        root (Path): 本地目录
+
+    Returns:
+        dict[str, Entry]: 相对路径 -> (大小, 修改时间)
+    """
+    retval = {}
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        try:
+            it = os.scandir(root.joinpath(rel))
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                rpath = rel + e.name
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(rpath + '/')
+                elif e.is_file() and rpath != STATE_FILE and not e.name.endswith('.part'):
+                    st = e.stat()
+                    retval[rpath] = (st.st_size, st.st_mtime)
+    return retval
+
+
+def same(a:Entry|None, b:Entry|None) -> bool:
+    """比较两个清单项是否相同，修改时间精确到秒
+    """
+    if a is None or b is None:
+        return a is b
+    return a[0] == b[0] and int(a[1]) == int(b[1])
+
+
+class SyncAction:
+    """同步动作
+
+    op 可以取以下值：
+        get         下载到本地
+        put         上传到服务端
+        del_local   删除本地文件
+        del_remote  删除服务端文件
+        conflict    冲突，按策略跳过
+    """
+    def __init__(self, op:str, path:str, entry:Entry|None = None) -> None:
+        self.op = op
+        self.path = path
+        self.entry = entry      # 同步后该文件的 (大小, 修改时间)
+        self.ok = False
+        return
+
+
+def plan(local:dict[str, Entry],
+         remote:dict[str, Entry],
+         base:dict[str, Entry],
+         direction:Literal['both', 'pull', 'push'] = 'both',
+         conflict:Literal['newer', 'local', 'remote', 'skip'] = 'newer',
+         delete:bool = False) -> list[SyncAction]:
+    """比较清单生成同步动作
+
+    Args:
+        local (dict[str, Entry]): 本地清单
+        remote (dict[str, Entry]): 服务端清单
+        base (dict[str, Entry]): 上次同步完成时的清单
+        direction (Literal[&#39;both&#39;, &#39;pull&#39;, &#39;push&#39;], optional): 同步方向. Defaults to 'both'.
+        conflict (Literal[&#39;newer&#39;, &#39;local&#39;, &#39;remote&#39;, &#39;skip&#39;], optional): 冲突策略. Defaults to 'newer'.
+        delete (bool, optional): 是否同步删除. Defaults to False.
+
+    Returns:
+        list[SyncAction]: 同步动作，不包含无需处理的文件
+    """
+    actions = []
+    for path in sorted(local.keys() | remote.keys()):
+        L = local.get(path)
+        R = remote.get(path)
+        if same(L, R):
+            continue
+        B = base.get(path)
+        changedL = not same(L, B)
+        changedR = not same(R, B)
+
+        # 只有一侧改变时，改变的一侧为准；两侧都改变时按冲突策略选择
+        if changedL and not changedR:
+            winner = 'local'
+        elif changedR and not changedL:
+            winner = 'remote'
+        elif conflict == 'newer':
+            winner = 'local' if (L[1] if L else -1) >= (R[1] if R else -1) else 'remote'
+        elif conflict in ('local', 'remote'):
+            winner = conflict
+        else:
+            actions.append(SyncAction('conflict', path))
+            continue
+
+        # 单向同步时只处理对应方向
+        if winner == 'local' and direction == 'pull':
+            continue
+        if winner == 'remote' and direction == 'push':
+            continue
+
+        if winner == 'local':
+            if L is not None:
+                actions.append(SyncAction('put', path, L))
+            elif delete:
+                actions.append(SyncAction('del_remote', path))
+        else:
+            if R is not None:
+                actions.append(SyncAction('get', path, R))
+            elif delete:
+                actions.append(SyncAction('del_local', path))
+    return actions
+
+
+class Syncer:
+    """目录同步类
+
+    将服务端的一个目录与本地的一个目录同步，文件的传输交给传输管理器并发执行
+    """
+    def __init__(self,
+                 cc,
+                 remote_dir:str,
+                 local_dir:str,
+                 jobs:int = 4,
+                 direction:Literal['both', 'pull', 'push'] = 'both',
+                 conflict:Literal['newer', 'local', 'remote', 'skip'] = 'newer',
+                 delete:bool = False,
+                 use_hash:bool = False) -> None:
+        """初始化
+
+        Args:
+            cc (ClientCore): 已登录的客户端核心
+            remote_dir (str): 服务端目录
+            local_dir (str): 本地目录
+            jobs (int, optional): 同时传输的文件数. Defaults to 4.
+            direction (Literal[&#39;both&#39;, &#39;pull&#39;, &#39;push&#39;], optional): 同步方向. Defaults to 'both'.
+            conflict (Literal[&#39;newer&#39;, &#39;local&#39;, &#39;remote&#39;, &#39;skip&#39;], optional): 冲突策略. Defaults to 'newer'.
+            delete (bool, optional): 是否同步删除. Defaults to False.
+            use_hash (bool, optional): 大小相同但修改时间不同时比较哈希值. Defaults to False.
+        """
+        self.cc = cc
+        self.remote_dir = remote_dir if remote_dir.endswith('/') else remote_dir + '/'
+        self.local_dir = Path(local_dir)
+        self.jobs = jobs
+        self.direction = direction
+        self.conflict = conflict
+        self.delete = delete
+        self.use_hash = use_hash
+        return
+
+    def load_base(self) -> dict[str, Entry]:
+        """读取上次同步完成时的清单
+        """
+        try:
+            with open(self.local_dir / STATE_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('remote') != self.remote_dir:
+            return {}
+        return {k: tuple(v) for k, v in data['files'].items()}
+
+    def save_base(self, base:dict[str, Entry]) -> None:
+        """保存本次同步完成后的清单
+        """
+        tmp = self.local_dir / (STATE_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'remote': self.remote_dir, 'files': base}, f, ensure_ascii=False)
+        os.replace(tmp, self.local_dir / STATE_FILE)
+        return
+
+    def run(self) -> tuple[ErrCode, list[SyncAction]]:
+        """执行同步
+
+        Returns:
+            tuple[ErrCode, list[SyncAction]]: 错误代码和执行的同步动作
+        """
+        code, lst = self.cc.getManifest(self.remote_dir, self.use_hash)
+        if code:
+            return (code, [])
+        remote = {i[0]: (i[1], i[2]) for i in lst}
+        remote_hash = {i[0]: i[3] for i in lst}
+        self.local_dir.mkdir(parents=True, exist_ok=True)
+        local = local_manifest(self.local_dir)
+        base = self.load_base()
+
+        # 大小相同的文件通过哈希值确认内容是否相同，相同则只修改本地的修改时间
+        if self.use_hash:
+            for path, L in local.items():
+                R = remote.get(path)
+                if R and L[0] == R[0] and not same(L, R) and remote_hash.get(path):
+                    with open(self.local_dir / path, 'rb') as f:
+                        if hashlib.file_digest(f, 'sha256').hexdigest() == remote_hash[path]:
+                            os.utime(self.local_dir / path, (R[1], R[1]))
+                            local[path] = R
+
+        actions = plan(local, remote, base, self.direction, self.conflict, self.delete)
+
+        tm = TransferManager(self.cc, self.jobs)
+        items = {}
+        for a in actions:
+            local_path = self.local_dir / a.path
+            if a.op == 'get':
+                local_path.parent.mkdir(parents=True, exist_ok=True)
+                items[tm.add_download(self.remote_dir + a.path, str(local_path), mtime=a.entry[1]).id] = a
+            elif a.op == 'put':
+                items[tm.add_upload(str(local_path), self.remote_dir + a.path, mtime=a.entry[1], overwrite=True).id] = a
+            elif a.op == 'del_local':
+                local_path.unlink(missing_ok=True)
+                a.ok = True
+            elif a.op == 'del_remote':
+                # 服务端接受删除后操作可能仍在进行，等待最终结果；文件已不存在时也算完成
+                code, status = file_op(self.cc, 'delete', self.remote_dir + a.path)
+                a.ok = code == ErrCode.SUCCESS or (code == ErrCode.ERR_FILE_NOT_EXIST and status is None)
+        tm.start()
+        tm.wait()
+        tm.stop()
+        for i in tm.snapshot():
+            items[i.id].ok = i.state == 'done'
+
+        # 更新同步状态：两侧相同的文件记入清单，失败和冲突的文件保留原来的记录以便下次重新比较
+        new_base = {}
+        for path in local.keys() | remote.keys():
+            if same(local.get(path), remote.get(path)):
+                new_base[path] = local[path]
+            elif path in base:
+                new_base[path] = base[path]
+        for a in actions:
+            if not a.ok:
+                continue
+            if a.op in ('get', 'put'):
+                new_base[a.path] = a.entry
+            else:
+                new_base.pop(a.path, None)
+        self.save_base(new_base)
+        return (ErrCode.SUCCESS, actions)
@@ -0,0 +1,746 @@
+""" src.client.core.transfer
+
+客户端传输管理模块
+
+所有的上传和下载都交给传输管理器统一调度，而不是每个文件单独开启一个连接
+
+Classes:
+    TransferItem(object): 传输任务类
+    Th_transfer(Thread): 执行单个传输任务的线程
+    TransferManager(object): 传输管理器，负责排队、并发控制和持久化
+
+Functions:
+    verify_file: 校验下载的文件，只重新获取不一致的块
+
+"""
+
+from typing import override, Callable, Literal
+from threading import Thread, Event, Condition
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+
+from ...globals.delta import parse_signature, make_delta
+from ...globals.compress import iter_frames, read_frame
+from ...globals.merkle import Hasher, chunk_size_for, chunk_hash, merkle_root
+from .errcode import ErrCode
+
+
+# 传输任务的状态
+ST_QUEUED   = 'queued'      # 排队中
+ST_RUNNING  = 'running'     # 传输中
+ST_PAUSED   = 'paused'      # 已暂停
+ST_DONE     = 'done'        # 已完成
+ST_FAILED   = 'failed'      # 失败
+ST_CANCELED = 'canceled'    # 已取消
+
+CHUNK_SIZE = 64 * 1024      # 每次读写的块大小
+BUSY_RETRY_DELAY = 10       # 服务器忙且客户端核心重试失败后，再次尝试前等待的时间（秒）
+VERIFY_ROUNDS = 3           # 下载校验失败时重新获取不一致的块的最多轮数
+ROOT_TIMEOUT = 60           # 上传完成后等待服务端返回 Merkle 根的时间（秒），服务端需要先写入硬盘
+DEDUP_MIN_SIZE = 64 * 1024  # 不小于该大小的文件上传前先尝试去重上传，更小的文件直接上传
+
+
+def recv_exact(s, size:int) -> bytes:
+    """从socket读取固定字节数，连接提前关闭时抛出 ConnectionError
+    """
+    buf = bytearray()
+    while len(buf) < size:
+        r = s.recv(min(CHUNK_SIZE, size - len(buf)))
+        if not r:
+            raise ConnectionError('connection closed')
+        buf += r
+    return bytes(buf)
+
+
+def recv_range(cc, remote:str, begin:int, length:int) -> tuple[ErrCode, bytes|None]:
+    """通过 `getFile` 的范围下载获取文件的一部分
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        remote (str): 服务端文件路径
+        begin (int): 起始位置
+        length (int): 长度
+
+    Returns:
+        tuple[ErrCode, bytes | None]: 错误代码和数据
+    """
+    err, addon = cc.getFile(remote, begin, length)
+    if err:
+        return (err, None)
+    s, _, codec = addon
+    buf = bytearray()
+    with s:
+        while len(buf) < length:
+            if codec:
+                r = read_frame(lambda n: recv_exact(s, n), codec)
+            else:
+                r = s.recv(min(CHUNK_SIZE, length - len(buf)))
+            if not r:
+                return (ErrCode.ERR_TIME_OUT, None)
+            buf += r
+    return (ErrCode.SUCCESS, bytes(buf))
+
+
+def verify_file(cc, remote:str, part:Path, size:int, leaves:list[str], stop:Event|None = None) -> ErrCode|None:
+    """校验下载的文件
+
+    比较本地与服务端的 Merkle 根，不一致时只重新获取叶子不一致的块。
+    服务端的文件已被修改或多轮修复后仍不一致时删除临时文件
+
+    Args:
+        cc (ClientCore): 已登录的客户端核心
+        remote (str): 服务端文件路径
+        part (Path): 已下载完成的临时文件
+        size (int): 下载的文件大小
+        leaves (list[str]): 本地计算的叶子，修复时随之更新
+        stop (Event | None, optional): 设置时中止修复. Defaults to None.
+
+    Returns:
+        ErrCode | None: 错误代码，校验通过为 `SUCCESS`，被中止时为 None
+    """
+    err, info = cc.getFileHash(remote)
+    if err:
+        return err
+    remote_size, chunk, remote_leaves, root = info
+    if remote_size != size or len(remote_leaves) != len(leaves):
+        part.unlink(missing_ok=True)        # 下载期间服务端的文件被修改，下次从头下载
+        return ErrCode.ERR_HASH_MISMATCH
+    for _ in range(VERIFY_ROUNDS):
+        if merkle_root(leaves) == root:
+            return ErrCode.SUCCESS
+        with open(part, 'r+b') as f:
+            for i in [i for i, h in enumerate(remote_leaves) if leaves[i] != h]:
+                if stop is not None and stop.is_set():
+                    return None
+                begin = i * chunk
+                err, data = recv_range(cc, remote, begin, min(chunk, size - begin))
+                if err:
+                    return err
+                f.seek(begin)
+                f.write(data)
+                leaves[i] = chunk_hash(data)
+    if merkle_root(leaves) == root:
+        return ErrCode.SUCCESS
+    part.unlink(missing_ok=True)
+    return ErrCode.ERR_HASH_MISMATCH
+
+
+class TransferItem:
+    """传输任务类
+
+    记录一个上传/下载任务的全部信息，可以与字典相互转换以便持久化
+    """
+    def __init__(self,
+                 id:int,
+                 opt:Literal['download', 'upload'],
+                 remote:str,
+                 local:str,
+                 size:int = 0,
+                 priority:int = 0,
+                 mtime:float|None = None,
+                 overwrite:bool = False) -> None:
+        """初始化一个传输任务
+
+        Args:
+            id (int): 任务id，在一个传输管理器内唯一
+            opt (Literal[&#39;download&#39;, &#39;upload&#39;]): 上传/下载选项
+            remote (str): 服务端的文件路径
+            local (str): 本地的文件路径
+            size (int, optional): 文件大小. Defaults to 0.
+            priority (int, optional): 优先级，数值越大越先传输. Defaults to 0.
+            mtime (float | None, optional): 传输完成后目标文件的修改时间，为None时不修改. Defaults to None.
+            overwrite (bool, optional): 上传时是否覆盖服务端已存在的文件. Defaults to False.
+        """
+        self.id = id
+        self.opt = opt
+        self.remote = remote
+        self.local = local
+        self.size = size
+        self.done = 0               # 已完成的字节数
+        self.priority = priority
+        self.mtime = mtime
+        self.overwrite = overwrite
+        self.state = ST_QUEUED
+        self.err = ErrCode.SUCCESS  # 最后一次出错的错误代码
+        self.seq = 0                # 入队顺序，优先级相同时先入队的先传输
+        return
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, d:dict) -> 'TransferItem':
+        item = TransferItem(d['id'], d['opt'], d['remote'], d['local'], d['size'], d['priority'])
+        item.__dict__.update(d)
+        return item
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (ST_DONE, ST_FAILED, ST_CANCELED)
+
+
+class Th_transfer(Thread):
+    """传输线程
+
+    执行一个传输任务，数据以块为单位在socket与硬盘之间流动，不会把整个文件读入内存
+
+    下载时先写入 `.part` 临时文件，完成后再重命名，暂停后可从已下载的位置继续
+
+    传输的同时在后台线程中计算文件的 Merkle 叶子（见 `src.globals.merkle`），完成后与服务端比较：
+    下载时只重新获取不一致的块，上传时通过增量上传修复
+    """
+    @override
+    def __init__(self, manager:'TransferManager', item:TransferItem) -> None:
+        """重写初始化方法
+
+        Args:
+            manager (TransferManager): 所属的传输管理器
+            item (TransferItem): 需要执行的传输任务
+        """
+        super().__init__(None, None, f'Th_transfer-{item.id}', daemon=True)
+        self.manager = manager
+        self.item = item
+        self.stopEvent = Event()    # 暂停和取消都通过该事件打断传输
+        return
+
+    @override
+    def run(self) -> None:
+        ok = False
+        try:
+            while True:
+                try:
+                    if self.item.opt == 'download':
+                        ok = self.download()
+                    else:
+                        ok = self.upload()
+                except OSError:
+                    self.item.err = ErrCode.ERR_TIME_OUT
+                    ok = False
+                # 服务器忙时客户端核心已经退避重试过，这里继续等待直到成功或被暂停、取消
+                if ok or self.item.err != ErrCode.ERR_SERVER_BUSY or self.stopEvent.wait(BUSY_RETRY_DELAY):
+                    break
+        except Exception:       # 意外的响应等，任务标记为失败，不能一直占用并发名额
+            self.item.err = ErrCode.ERR_TRANSFER_FAILED
+            ok = False
+        finally:
+            self.manager._on_thread_finished(self, ok)
+        return
+
+    def download(self) -> bool:
+        """下载文件
+
+        Returns:
+            bool: 是否完整下载
+        """
+        item = self.item
+        part = Path(item.local + '.part')
+        if not part.exists():
+            item.done = 0
+        err, addon = self.manager.cc.getFile(item.remote, item.done)
+        if err:
+            item.err = err
+            return False
+        s, item.size, codec = addon
+        hasher = Hasher(chunk_size_for(item.size))
+        if item.done:
+            hasher.update_file(part, 0, item.done)     # 续传时已下载的部分由哈希线程从硬盘读取
+        try:
+            with s, open(part, 'r+b' if item.done else 'wb') as f:
+                f.seek(item.done)
+                while item.done < item.size:
+                    if self.stopEvent.is_set():
+                        return False
+                    if codec:
+                        buf = read_frame(lambda n: recv_exact(s, n), codec)
+                    else:
+                        buf = s.recv(min(CHUNK_SIZE, item.size - item.done))
+                    if not buf:         # 服务端提前关闭连接
+                        item.err = ErrCode.ERR_TIME_OUT
+                        return False
+                    f.write(buf)
+                    hasher.update(buf)
+                    item.done += len(buf)
+                    self.manager._on_progress(item)
+        finally:
+            leaves = hasher.finish()
+        if leaves is None:      # 已下载的部分读取失败
+            item.err = ErrCode.ERR_HASH_MISMATCH
+            return False
+        if not self.verify(part, leaves):
+            return False
+        if item.mtime is not None:
+            os.utime(part, (item.mtime, item.mtime))
+        os.replace(part, item.local)
+        return True
+
+    def verify(self, part:Path, leaves:list[str]) -> bool:
+        """校验下载的文件，见 `verify_file`
+
+        Args:
+            part (Path): 已下载完成的临时文件
+            leaves (list[str]): 本地计算的叶子
+
+        Returns:
+            bool: 校验是否通过
+        """
+        err = verify_file(self.manager.cc, self.item.remote, part, self.item.size, leaves, self.stopEvent)
+        if err:
+            self.item.err = err
+        return err == ErrCode.SUCCESS
+
+    def upload(self) -> bool:
+        """上传文件
+
+        服务端不保存未完成的上传，因此暂停后继续上传会从头开始
+
+        较大的文件先尝试去重上传，服务端已有相同内容的文件时不需要传输数据
+
+        上传完成后比较服务端返回的 Merkle 根，不一致时通过增量上传修复，只发送不一致的块
+
+        Returns:
+            bool: 是否完整上传
+        """
+        item = self.item
+        item.size = os.path.getsize(item.local)
+        item.done = 0
+        self.remote_root = None
+        if item.size >= DEDUP_MIN_SIZE and self.dedup():
+            return True
+        if self.stopEvent.is_set():
+            return False
+        hasher = Hasher(chunk_size_for(item.size))
+        hasher.update_file(item.local, 0, item.size)   # 由哈希线程另外读取一遍，与发送并行
+        try:
+            ok = self.send_file()
+        finally:
+            leaves = hasher.finish()
+        if not ok:
+            return False
+        if leaves is None:      # 上传期间本地文件被删除等，无法校验
+            item.err = ErrCode.ERR_HASH_MISMATCH
+            return False
+        root = bytes.fromhex(merkle_root(leaves))
+        if self.remote_root == root:
+            return True
+        err, addon = self.manager.cc.putDelta(item.remote, item.size, item.mtime)
+        if not err and self.upload_delta(*addon) and self.remote_root == root:
+            return True
+        item.err = err or ErrCode.ERR_HASH_MISMATCH
+        return False
+
+    def dedup(self) -> bool:
+        """去重上传：计算文件的 sha256 并发送给服务端，服务端已有相同内容时直接完成
+
+        Returns:
+            bool: 是否已完成上传，服务端没有相同内容或出错时为 False，之后改用普通上传
+        """
+        item = self.item
+        h = hashlib.sha256()
+        with open(item.local, 'rb') as f:
+            while True:
+                if self.stopEvent.is_set():
+                    return False
+                buf = f.read(1024 * 1024)
+                if not buf:
+                    break
+                h.update(buf)
+        err, _ = self.manager.cc.putFileByHash(item.remote, item.size, h.hexdigest(), item.overwrite, item.mtime)
+        if err:
+            return False
+        item.done = item.size
+        self.manager._on_progress(item)
+        return True
+
+    def recv_root(self, s) -> bytes|None:
+        """等待服务端写入文件后返回的 Merkle 根
+        """
+        s.settimeout(ROOT_TIMEOUT)
+        try:
+            return recv_exact(s, 32)
+        except OSError:
+            return None
+
+    def send_file(self) -> bool:
+        """发送文件
+
+        覆盖服务端已有的文件时优先使用增量上传，服务端没有该文件时改用完整上传
+
+        Returns:
+            bool: 是否完整发送
+        """
+        item = self.item
+        if item.overwrite:
+            err, addon = self.manager.cc.putDelta(item.remote, item.size, item.mtime)
+            if not err:
+                return self.upload_delta(*addon)
+            if err != ErrCode.ERR_FILE_NOT_EXIST:
+                item.err = err
+                return False
+        err, addon = self.manager.cc.putFile(item.remote, item.size, item.overwrite, item.mtime)
+        if err:
+            item.err = err
+            return False
+        s, codec = addon
+        if codec:
+            return self.upload_compressed(s, codec)
+        with s, open(item.local, 'rb') as f:
+            while item.done < item.size:
+                if self.stopEvent.is_set():
+                    return False
+                buf = f.read(CHUNK_SIZE)
+                if not buf:
+                    item.err = ErrCode.ERR_FILE_NOT_EXIST
+                    return False
+                s.sendall(buf)
+                item.done += len(buf)
+                self.manager._on_progress(item)
+            self.remote_root = self.recv_root(s)
+        return True
+
+    def upload_compressed(self, s, codec:str) -> bool:
+        """压缩上传文件
+
+        读取和压缩在后台线程中进行，与发送并行
+
+        Args:
+            s (socket.socket): 已连接到传输端口的socket
+            codec (str): 服务端选择的压缩算法
+
+        Returns:
+            bool: 是否完整上传
+        """
+        item = self.item
+        with s, open(item.local, 'rb') as f:
+            for raw_len, frame in iter_frames(f, codec, item.size):
+                if self.stopEvent.is_set():
+                    return False
+                s.sendall(frame)
+                item.done += raw_len
+                self.manager._on_progress(item)
+            if item.done >= item.size:
+                self.remote_root = self.recv_root(s)
+        if item.done < item.size:
+            item.err = ErrCode.ERR_FILE_NOT_EXIST
+            return False
+        return True
+
+    def upload_delta(self, s, block_size:int) -> bool:
+        """增量上传文件
+
+        接收服务端已有文件的块签名，只发送修改过的数据和相同块的编号，最后接收结果和 Merkle 根
+
+        Args:
+            s (socket.socket): 已连接到传输端口的socket
+            block_size (int): 服务端选择的块大小
+
+        Returns:
+            bool: 服务端是否成功重建文件
+        """
+        item = self.item
+        def progress(done:int) -> None:
+            item.done = done
+            self.manager._on_progress(item)
+        with s, open(item.local, 'rb') as f:
+            table = parse_signature(recv_exact(s, int.from_bytes(recv_exact(s, 4), 'big')))
+            for op in make_delta(f, table, block_size, progress):
+                if self.stopEvent.is_set():
+                    return False
+                s.sendall(op)
+            if recv_exact(s, 1) != b'\x00':
+                item.err = ErrCode.ERR_FILE_NOT_EXIST
+                return False
+            self.remote_root = recv_exact(s, 32)
+        return True
+
+
+class TransferManager:
+    """传输管理器
+
+    统一管理客户端的全部传输任务：
+
+    - 任务按 优先级/入队顺序 排队，同时传输的任务数量不超过并发上限
+    - 支持暂停、继续、取消以及动态修改优先级和并发上限
+    - 队列保存在文件中，客户端重启后未完成的任务可以继续
+
+    任务状态改变或进度更新时调用回调函数 `callback(items)`，回调在传输线程中执行
+    """
+    def __init__(self,
+                 cc,
+                 limit:int = 3,
+                 queue_file:str|None = None,
+                 callback:Callable[[list[TransferItem]], None]|None = None) -> None:
+        """初始化传输管理器
+
+        Args:
+            cc (ClientCore): 客户端核心，传输通过它向服务端发起请求
+            limit (int, optional): 并发上限. Defaults to 3.
+            queue_file (str | None, optional): 队列的持久化文件路径，为None时不保存. Defaults to None.
+            callback (Callable[[list[TransferItem]], None] | None, optional): 状态更新回调. Defaults to None.
+        """
+        self.cc = cc
+        self.limit = max(1, limit)
+        self.queue_file = queue_file
+        self.callback = callback
+        self.cond = Condition()                         # 保护以下所有状态
+        self.items:dict[int, TransferItem] = {}
+        self.threads:dict[int, Th_transfer] = {}
+        self.next_id = 1
+        self.next_seq = 1
+        self.running = False
+        self.last_notify = 0.0                          # 上一次进度回调的时间，用于限制回调频率
+        self.load()
+        return
+
+    # ---------------------------- 调度 ------------------------------
+
+    def start(self) -> None:
+        """启动调度线程
+        """
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.th_schedule = Thread(target=self.__schedule, name='Th_transfer-schedule', daemon=True)
+        self.th_schedule.start()
+        return
+
+    def stop(self) -> None:
+        """停止调度
+
+        正在进行的任务重新回到队列，保存队列后返回，下次启动时继续传输
+        """
+        with self.cond:
+            self.running = False
+            threads = list(self.threads.values())
+            for th in threads:
+                th.item.state = ST_QUEUED
+                th.stopEvent.set()
+            self.cond.notify_all()
+        for th in threads:
+            th.join(1)
+        self.save()
+        return
+
+    def __schedule(self) -> None:
+        """调度线程的主循环
+
+        有空闲的并发名额时，取出优先级最高的排队任务开始传输
+        """
+        with self.cond:
+            while self.running:
+                queued = [i for i in self.items.values() if i.state == ST_QUEUED]
+                if len(self.threads) >= self.limit or not queued:
+                    self.cond.wait()
+                    continue
+                item = min(queued, key=lambda i: (-i.priority, i.seq))
+                item.state = ST_RUNNING
+                item.err = ErrCode.SUCCESS
+                th = Th_transfer(self, item)
+                self.threads[item.id] = th
+                th.start()
+                self.__changed()
+        return
+
+    def _on_thread_finished(self, th:Th_transfer, ok:bool) -> None:
+        """传输线程结束时由传输线程调用
+
+        Args:
+            th (Th_transfer): 结束的线程
+            ok (bool): 是否传输成功
+        """
+        with self.cond:
+            self.threads.pop(th.item.id, None)
+            item = th.item
+            if ok:
+                item.state = ST_DONE
+            elif item.state == ST_RUNNING:      # 不是被暂停或取消的，则为出错
+                item.state = ST_FAILED
+            if item.state == ST_CANCELED and item.opt == 'download':
+                Path(item.local + '.part').unlink(missing_ok=True)
+            self.cond.notify_all()
+            self.__changed()
+        return
+
+    def _on_progress(self, item:TransferItem) -> None:
+        """传输线程报告进度
+
+        进度回调最多每 0.2 秒触发一次，避免大量小块传输时回调过于频繁
+        """
+        now = time.monotonic()
+        if now - self.last_notify < 0.2:
+            return
+        self.last_notify = now
+        if self.callback:
+            self.callback(self.snapshot())
+        return
+
+    def __changed(self) -> None:
+        """任务状态改变后保存队列并通知回调，调用时需要持有锁
+        """
+        self.save()
+        if self.callback:
+            self.callback(self.snapshot())
+        return
+
+    # ---------------------------- API ------------------------------
+
+    def add_download(self, remote:str, local:str, priority:int = 0, mtime:float|None = None) -> TransferItem:
+        """添加下载任务
+
+        Args:
+            remote (str): 服务端文件路径
+            local (str): 本地保存路径
+            priority (int, optional): 优先级. Defaults to 0.
+            mtime (float | None, optional): 下载完成后设置的本地文件修改时间. Defaults to None.
+        """
+        return self.__add('download', remote, local, 0, priority, mtime, False)
+
+    def add_upload(self, local:str, remote:str, priority:int = 0, mtime:float|None = None, overwrite:bool = False) -> TransferItem:
+        """添加上传任务
+
+        Args:
+            local (str): 本地文件路径
+            remote (str): 服务端保存路径
+            priority (int, optional): 优先级. Defaults to 0.
+            mtime (float | None, optional): 上传完成后设置的服务端文件修改时间. Defaults to None.
+            overwrite (bool, optional): 是否覆盖服务端已存在的文件. Defaults to False.
+        """
+        return self.__add('upload', remote, local, os.path.getsize(local), priority, mtime, overwrite)
+
+    def __add(self, opt, remote, local, size, priority, mtime, overwrite) -> TransferItem:
+        with self.cond:
+            item = TransferItem(self.next_id, opt, remote, local, size, priority, mtime, overwrite)
+            item.seq = self.next_seq
+            self.next_id += 1
+            self.next_seq += 1
+            self.items[item.id] = item
+            self.cond.notify_all()
+            self.__changed()
+        return item
+
+    def pause(self, id:int) -> None:
+        """暂停任务，排队或正在传输的任务都可以暂停
+        """
+        with self.cond:
+            item = self.items.get(id)
+            if item is None or item.state not in (ST_QUEUED, ST_RUNNING):
+                return
+            item.state = ST_PAUSED
+            if id in self.threads:
+                self.threads[id].stopEvent.set()
+            self.__changed()
+        return
+
+    def resume(self, id:int) -> None:
+        """继续任务，已暂停或失败的任务重新进入队列
+        """
+        with self.cond:
+            item = self.items.get(id)
+            if item is None or item.state not in (ST_PAUSED, ST_FAILED):
+                return
+            item.state = ST_QUEUED
+            self.cond.notify_all()
+            self.__changed()
+        return
+
+    def cancel(self, id:int) -> None:
+        """取消任务
+        """
+        with self.cond:
+            item = self.items.get(id)
+            if item is None or item.finished:
+                return
+            item.state = ST_CANCELED
+            if id in self.threads:
+                self.threads[id].stopEvent.set()
+            elif item.opt == 'download':
+                Path(item.local + '.part').unlink(missing_ok=True)
+            self.__changed()
+        return
+
+    def set_priority(self, id:int, priority:int) -> None:
+        """修改任务的优先级，只影响还未开始的任务的顺序
+        """
+        with self.cond:
+            if id in self.items:
+                self.items[id].priority = priority
+                self.cond.notify_all()
+                self.__changed()
+        return
+
+    def set_limit(self, limit:int) -> None:
+        """修改并发上限
+
+        调低上限不会打断正在进行的任务，只是不再启动新的任务
+        """
+        with self.cond:
+            self.limit = max(1, limit)
+            self.cond.notify_all()
+        return
+
+    def clear_finished(self) -> None:
+        """从列表中删除已经结束的任务
+        """
+        with self.cond:
+            self.items = {k: v for k, v in self.items.items() if not v.finished}
+            self.__changed()
+        return
+
+    def snapshot(self) -> list[TransferItem]:
+        """获取全部任务的副本，按 id 排序
+        """
+        with self.cond:
+            return [TransferItem.from_dict(i.to_dict()) for i in sorted(self.items.values(), key=lambda i: i.id)]
+
+    def wait(self) -> None:
+        """阻塞直到队列中没有排队或传输中的任务
+        """
+        with self.cond:
+            while any(i.state in (ST_QUEUED, ST_RUNNING) for i in self.items.values()):
+                self.cond.wait()
+        return
+
+    # ---------------------------- 持久化 ------------------------------
+
+    def save(self) -> None:
+        """保存队列
+
+        先写入临时文件再替换，保证文件不会写出一半
+        """
+        if not self.queue_file:
+            return
+        with self.cond:
+            data = {
+                'next_id': self.next_id,
+                'next_seq': self.next_seq,
+                'items': [i.to_dict() for i in self.items.values()]
+            }
+            tmp = self.queue_file + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.queue_file)
+        return
+
+    def load(self) -> None:
+        """加载队列
+
+        上次退出时仍在传输的任务重新进入队列
+        """
+        if not self.queue_file or not Path(self.queue_file).exists():
+            return
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.next_id = data['next_id']
+        self.next_seq = data['next_seq']
+        for d in data['items']:
+            item = TransferItem.from_dict(d)
+            if item.state == ST_RUNNING:
+                item.state = ST_QUEUED
+            self.items[item.id] = item
+        return
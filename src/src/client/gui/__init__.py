@@ -1,5 +1,5 @@
 from .login     import Login
 from .msg       import Msg
 from .filelist  import Filelist
-from .filedialog import Filedialog
+from .transferlist import Transferlist
 from .gui_tray  import GUI_Tray
\ No newline at end of file
@@ -0,0 +1,86 @@
+""" 传输列表界面的UI模块
+
+Classes:
+    GUI_Transferlist(QWidget): 传输列表界面的UI类
+
+"""
+
+from typing             import override
+
+from PyQt5.QtCore       import Qt
+from PyQt5.QtGui        import QIcon
+from PyQt5.QtWidgets    import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, \
+                               QProgressBar, QLabel, QSpinBox
+
+
+
+class GUI_Transferlist(QWidget):
+    """传输列表界面的UI类
+
+    实现UI的绘制，没有任何功能
+    """
+    @override
+    def __init__(self):
+        super().__init__()
+        self.resize(1200, 700)
+        self.setWindowTitle('传输')
+        self.setWindowIcon(QIcon('resource/icon.svg'))
+        layout = QVBoxLayout()
+
+        # 总进度
+        total_layout = QHBoxLayout()
+        self.progressBar = QProgressBar()
+        self.progressBar.setTextVisible(True)
+        self.speed = QLabel('0 Byte/s')
+        self.speed.setFixedWidth(200)
+        total_layout.addWidget(QLabel('总进度'))
+        total_layout.addWidget(self.progressBar)
+        total_layout.addWidget(self.speed)
+
+        # 操作按钮
+        btn_layout = QHBoxLayout()
+        self.btn_pause = QPushButton('暂停')
+        self.btn_resume = QPushButton('继续')
+        self.btn_cancel = QPushButton('取消')
+        self.btn_up = QPushButton('优先')
+        self.btn_down = QPushButton('延后')
+        self.btn_clear = QPushButton('清除已结束')
+        self.limit = QSpinBox()
+        self.limit.setRange(1, 32)
+        btn_layout.addWidget(self.btn_pause)
+        btn_layout.addWidget(self.btn_resume)
+        btn_layout.addWidget(self.btn_cancel)
+        btn_layout.addWidget(self.btn_up)
+        btn_layout.addWidget(self.btn_down)
+        btn_layout.addWidget(self.btn_clear)
+        btn_layout.addStretch(1)
+        btn_layout.addWidget(QLabel('同时传输'))
+        btn_layout.addWidget(self.limit)
+
+        self.list = QTableWidget()
+        self.list.setColumnCount(6)
+        self.list.setHorizontalHeaderLabels(('文件', '方向', '大小', '进度', '状态', '优先级'))
+        self.list.horizontalHeader().setDefaultAlignment(Qt.AlignmentFlag.AlignLeft)
+        self.list.setVerticalScrollMode(QTableWidget.ScrollMode.ScrollPerPixel)
+        self.list.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.list.setSelectionMode(QTableWidget.SelectionMode.ExtendedSelection)
+        self.list.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.list.verticalHeader().setVisible(False)
+        self.list.setColumnWidth(0, 500)
+
+        layout.addLayout(total_layout)
+        layout.addLayout(btn_layout)
+        layout.addWidget(self.list)
+        self.setLayout(layout)
+        return
+
+
+
+# coding时保留的入口，用于显示窗口
+# 运行当前文件可以直接查看窗口样式
+if __name__ == '__main__':
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication([])
+    s = GUI_Transferlist()
+    s.show()
+    app.exec()
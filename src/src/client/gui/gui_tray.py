@@ -23,7 +23,7 @@ class GUI_Tray(QSystemTrayIcon):
         return
 
     def init_menu(self):
-        MENU_ITEM = ('登录', '消息', '文件', '退出')
+        MENU_ITEM = ('登录', '消息', '文件', '传输', '退出')
         self.menu = QMenu()
         self.menu.setMinimumWidth(240)
 
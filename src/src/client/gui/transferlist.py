@@ -0,0 +1,172 @@
+""" 传输列表界面模块
+
+Classes:
+    Transferlist(src.client.gui.gui_transferlist.GUI_Transferlist): 传输列表界面类
+
+"""
+
+
+from   typing           import override
+import time
+
+from   PyQt5.QtCore     import pyqtSignal
+from   PyQt5.QtGui      import QCloseEvent
+from   PyQt5.QtWidgets  import QTableWidgetItem
+from   .gui_transferlist import GUI_Transferlist
+
+
+STATE_TEXT = {
+    'queued': '排队中',
+    'running': '传输中',
+    'paused': '已暂停',
+    'done': '已完成',
+    'failed': '失败',
+    'canceled': '已取消',
+}
+
+
+def sizeFmt(size:int) -> str:
+    """格式化文件大小函数
+
+    Args:
+        size (int): 文件大小(字节)
+
+    Returns:
+        str: 标识大小的字符串
+    """
+    if size < 2**12:
+        return str(size)+' Byte'
+    elif size < 2**20:
+        return '%2.1f kiB'%(size/2**10)
+    elif size < 2**30:
+        return '%2.1f MiB'%(size/2**20)
+    elif size < 2**40:
+        return '%2.1f GiB'%(size/2**30)
+    else:
+        return '%2.1f TiB'%(size/2**40)
+
+
+class Transferlist(GUI_Transferlist):
+    """传输列表界面类
+
+    所有上传和下载任务显示在同一个窗口中，并显示总进度和总速度
+
+    Signals:
+        pause_required: 请求暂停任务，携带([id])
+        resume_required: 请求继续任务，携带([id])
+        cancel_required: 请求取消任务，携带([id])
+        priority_required: 请求调整优先级，携带([id], 调整量)
+        limit_changed: 并发上限改变，携带(limit)
+        clear_required: 请求清除已结束的任务
+    """
+    pause_required      = pyqtSignal(list)
+    resume_required     = pyqtSignal(list)
+    cancel_required     = pyqtSignal(list)
+    priority_required   = pyqtSignal(list, int)
+    limit_changed       = pyqtSignal(int)
+    clear_required      = pyqtSignal()
+    __updated           = pyqtSignal(list)
+
+
+    # --------------------------- 初始化 -------------------------------
+
+    @override
+    def __init__(self, limit:int) -> None:
+        """重写初始化方法
+
+        Args:
+            limit (int): 并发上限的初始值
+        """
+        super().__init__()
+        self.limit.setValue(limit)
+        self.ids:list[int] = []         # 每一行对应的任务id
+        self.last_done = 0              # 上一次更新时已完成的总字节数，用于计算速度
+        self.last_time = time.monotonic()
+        self.init_signals()
+        return
+
+    def init_signals(self) -> None:
+        """信号初始化
+
+        将信号与信号槽连接
+        """
+        self.__updated.connect(self.on_updated)
+        self.btn_pause  .clicked.connect(lambda: self.pause_required.emit(self.selected_ids()))
+        self.btn_resume .clicked.connect(lambda: self.resume_required.emit(self.selected_ids()))
+        self.btn_cancel .clicked.connect(lambda: self.cancel_required.emit(self.selected_ids()))
+        self.btn_up     .clicked.connect(lambda: self.priority_required.emit(self.selected_ids(), 1))
+        self.btn_down   .clicked.connect(lambda: self.priority_required.emit(self.selected_ids(), -1))
+        self.btn_clear  .clicked.connect(self.clear_required.emit)
+        self.limit.valueChanged.connect(self.limit_changed.emit)
+        return
+
+    # ----------------------------- 槽函数 ------------------------------
+
+    def on_updated(self, items:list) -> None:
+        """任务列表更新槽函数
+
+        行数不变时只修改单元格的文字，以保留用户的选择
+
+        Args:
+            items (list): TransferItem 列表
+        """
+        self.ids = [i.id for i in items]
+        self.list.setRowCount(len(items))
+        total_size = 0
+        total_done = 0
+        for row, i in enumerate(items):
+            progress = f'{i.done*100//i.size}%' if i.size else ('100%' if i.state == 'done' else '0%')
+            texts = (i.remote if i.opt == 'download' else i.local,
+                     '下载' if i.opt == 'download' else '上传',
+                     sizeFmt(i.size),
+                     progress,
+                     STATE_TEXT[i.state],
+                     str(i.priority))
+            for col, text in enumerate(texts):
+                cell = self.list.item(row, col)
+                if cell is None:
+                    self.list.setItem(row, col, QTableWidgetItem(text))
+                elif cell.text() != text:
+                    cell.setText(text)
+            if i.state != 'canceled':
+                total_size += i.size
+                total_done += i.done
+
+        # 进度条的最大值为int32，这里使用千分比
+        self.progressBar.setMaximum(1000)
+        self.progressBar.setValue(total_done*1000//total_size if total_size else 0)
+        now = time.monotonic()
+        if now - self.last_time >= 0.5:
+            speed = max(0, total_done - self.last_done) / (now - self.last_time)
+            self.speed.setText(sizeFmt(int(speed))+'/s')
+            self.last_done = total_done
+            self.last_time = now
+        return
+
+
+    # -------------------------------- 接口 --------------------------------------
+    def update(self, items:list) -> None:
+        """更新任务列表的方法，可以在任意线程中调用
+
+        Args:
+            items (list): TransferItem 列表
+        """
+        self.__updated.emit(items)
+        return
+
+    def selected_ids(self) -> list[int]:
+        """获取选中行对应的任务id
+        """
+        rows = {i.row() for i in self.list.selectedIndexes()}
+        return [self.ids[r] for r in sorted(rows) if r < len(self.ids)]
+
+    #---------------------------------------------------------------#
+    # 以下方法为重写的PyQt事件处理器                                  #
+    # 当窗口出现特定行为时，以下方法被自动调用                          #
+    # 重写后窗口关闭事件被拦截，窗口关闭变为隐藏                        #
+    #---------------------------------------------------------------#
+    @override
+    def closeEvent(self, a0: QCloseEvent | None) -> None:
+        self.hide()
+        a0.ignore()
+        return
@@ -0,0 +1,90 @@
+""" 批量传输模块
+
+把多个小文件打包成一个连续的数据流传输，服务端与客户端共用
+
+大量小文件逐个传输时，每个文件都需要一次请求、一个临时端口和一个文件传输线程，时间几乎全部花在握手上。
+批量传输只建立一次连接，数据流由若干条目组成，类似 tar：
+
+    名称长度(2字节) + 文件大小(8字节) + 修改时间(8字节，浮点数) + 名称(utf-8) + 文件数据
+
+名称长度为 0 的条目表示数据流结束。名称为相对路径，使用 / 分隔，接收方按条目逐个写入文件，不需要缓存整个数据流
+
+Functions:
+    collect: 展开文件和目录，生成需要传输的条目
+    check_name: 检查条目名称是否安全
+    pack_header: 生成条目头
+    read_exact: 从缓冲读取器读取固定字节数
+    read_header: 读取条目头
+
+"""
+
+from typing import BinaryIO
+from pathlib import Path
+import struct
+import os
+
+
+HEADER = struct.Struct('!HQd')
+END = HEADER.pack(0, 0, 0.0)    # 数据流结束
+BUF_SIZE = 256 * 1024           # 收发数据流时的缓冲区大小
+
+
+def collect(paths:list[Path]) -> list[tuple[Path, str]]:
+    """展开文件和目录，生成需要传输的条目
+
+    文件的名称为文件名，目录中的文件的名称为 `目录名/相对路径`
+
+    Args:
+        paths (list[Path]): 文件和目录
+
+    Returns:
+        list[tuple[Path, str]]: [(文件路径, 条目名称)]
+    """
+    retval = []
+    for p in paths:
+        if p.is_file():
+            retval.append((p, p.name))
+            continue
+        for root, dirs, files in os.walk(p):
+            dirs.sort()
+            rel = Path(root).relative_to(p.parent).as_posix()
+            for name in sorted(files):
+                retval.append((Path(root, name), f'{rel}/{name}'))
+    return retval
+
+
+def check_name(name:str) -> bool:
+    """检查条目名称是否安全，不能是绝对路径或包含 `..`，避免写到目标目录之外
+    """
+    if not name or name.startswith('/') or '\\' in name or ':' in name:
+        return False
+    return all(part not in ('', '.', '..') for part in name.split('/'))
+
+
+def pack_header(name:str, size:int, mtime:float) -> bytes:
+    b = name.encode()
+    return HEADER.pack(len(b), size, mtime) + b
+
+
+def read_exact(f:BinaryIO, size:int) -> bytes:
+    """从缓冲读取器读取固定字节数，数据流提前结束时抛出 ConnectionError
+    """
+    buf = f.read(size)
+    if len(buf) < size:
+        raise ConnectionError('stream truncated')
+    return buf
+
+
+def read_header(f:BinaryIO) -> tuple[str, int, float]|None:
+    """读取条目头
+
+    Args:
+        f (BinaryIO): 数据流的缓冲读取器
+
+    Returns:
+        tuple[str, int, float] | None: (名称, 文件大小, 修改时间)，数据流结束时为 None
+    """
+    n, size, mtime = HEADER.unpack(read_exact(f, HEADER.size))
+    if n == 0:
+        return None
+    return (read_exact(f, n).decode(), size, mtime)
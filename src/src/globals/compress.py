@@ -0,0 +1,220 @@
+""" 传输压缩模块
+
+文件传输时的流式压缩，服务端与客户端共用
+
+客户端在 `getFile` / `putFile` 请求中附带自己支持的压缩算法，服务端从中选择一个并在响应中返回，
+双方都支持的算法为空或文件本身已经是压缩格式时不压缩，数据流与不压缩时完全相同
+
+压缩后的数据流由若干帧组成，每帧对应文件中连续的一块数据：
+    标志(1字节) + 原始长度(4字节) + 数据长度(4字节) + 数据
+标志为 0 时数据为原始数据，为 1 时为压缩后的数据。每帧独立压缩，
+压缩效果差的块（抽样压缩比不理想）直接发送原始数据，不浪费CPU
+
+压缩在独立的线程中进行，与网络发送并行
+
+Functions:
+    available: 获取本机支持的压缩算法
+    negotiate: 服务端选择压缩算法
+    iter_frames: 读取文件并生成压缩帧
+    read_frame: 读取一帧并解压
+
+"""
+
+from typing import BinaryIO, Callable, Iterator
+from pathlib import Path
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+import zlib
+
+
+CHUNK_SIZE = 256 * 1024         # 每帧的原始数据大小
+FRAME_MAX = 4 * 1024 * 1024     # 接收时允许的最大帧，防止恶意数据占用内存
+SAMPLE_SIZE = 16 * 1024         # 抽样压缩的大小
+SAMPLE_RATIO = 0.9              # 抽样压缩后大于原大小的该比例时不压缩
+HEAD_SIZE = 9
+
+# 已经是压缩格式的文件，再压缩几乎没有效果
+COMPRESSED_SUFFIXES = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst', '.lz4', '.br',
+    '.jar', '.apk', '.whl', '.docx', '.xlsx', '.pptx',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.m4a', '.aac', '.ogg', '.flac', '.opus',
+    '.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv',
+}
+
+# 名称 -> (压缩函数, 解压函数)，按优先级排列，速度快的算法在前。
+# 解压函数的第二个参数为输出长度的上限，超出时抛出 ValueError，恶意的小帧不会解压出过大的数据
+CODECS:dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes, int], bytes]]] = {}
+
+try:
+    import zstandard
+
+    def _zstd_decompress(b:bytes, limit:int) -> bytes:
+        # 帧头中的原始长度由对方填写，不能使用一次性的 decompress，改为分段读取
+        out = bytearray()
+        with zstandard.ZstdDecompressor().stream_reader(b) as r:
+            while len(out) <= limit:
+                chunk = r.read(limit + 1 - len(out))
+                if not chunk:
+                    break
+                out += chunk
+        if len(out) > limit:
+            raise ValueError('frame exceeds its declared size')
+        return bytes(out)
+
+    CODECS['zstd'] = (zstandard.ZstdCompressor(level=3).compress, _zstd_decompress)
+except ImportError:
+    pass
+
+try:
+    import lz4.frame
+
+    def _lz4_decompress(b:bytes, limit:int) -> bytes:
+        d = lz4.frame.LZ4FrameDecompressor()
+        out = d.decompress(b, max_length=limit)
+        if not d.eof or d.unused_data:
+            raise ValueError('frame exceeds its declared size')
+        return out
+
+    CODECS['lz4'] = (lz4.frame.compress, _lz4_decompress)
+except ImportError:
+    pass
+
+
+def _zlib_decompress(b:bytes, limit:int) -> bytes:
+    d = zlib.decompressobj()
+    out = d.decompress(b, max(1, limit))     # max_length 为 0 时不限制
+    if not d.eof or d.unconsumed_tail or d.unused_data:
+        raise ValueError('frame exceeds its declared size')
+    return out
+
+CODECS['zlib'] = (lambda b: zlib.compress(b, 3), _zlib_decompress)
+
+
+def available() -> list[str]:
+    """获取本机支持的压缩算法
+
+    Returns:
+        list[str]: 算法名称，按优先级排列
+    """
+    return list(CODECS)
+
+
+def negotiate(offered:list[str]|None, path:Path) -> str|None:
+    """服务端选择压缩算法
+
+    Args:
+        offered (list[str] | None): 客户端支持的压缩算法
+        path (Path): 传输的文件
+
+    Returns:
+        str | None: 选择的算法，不压缩时为None
+    """
+    if not offered or path.suffix.lower() in COMPRESSED_SUFFIXES:
+        return None
+    for name in CODECS:
+        if name in offered:
+            return name
+    return None
+
+
+def encode(codec:str, buf:bytes) -> bytes:
+    """将一块数据编码为一帧
+
+    先压缩开头的一小段，压缩比不理想时整块按原始数据发送
+    """
+    compress = CODECS[codec][0]
+    if len(compress(buf[:SAMPLE_SIZE])) < min(len(buf), SAMPLE_SIZE) * SAMPLE_RATIO:
+        data = compress(buf)
+        if len(data) < len(buf):
+            return b'\x01' + len(buf).to_bytes(4, 'big') + len(data).to_bytes(4, 'big') + data
+    return b'\x00' + len(buf).to_bytes(4, 'big') + len(buf).to_bytes(4, 'big') + buf
+
+
+def iter_frames(f:BinaryIO, codec:str, size:int) -> Iterator[tuple[int, bytes]]:
+    """读取文件并生成压缩帧
+
+    读取和压缩在后台线程中进行，调用者发送当前帧的同时下一帧已经在压缩
+
+    Args:
+        f (BinaryIO): 已打开并定位到起始位置的文件
+        codec (str): 压缩算法
+        size (int): 需要读取的字节数
+
+    Yields:
+        Iterator[tuple[int, bytes]]: (原始长度, 帧)
+    """
+    queue = Queue(4)
+    stop = Event()
+
+    def worker():
+        remain = size
+        try:
+            while remain > 0 and not stop.is_set():
+                buf = f.read(min(CHUNK_SIZE, remain))
+                if not buf:
+                    break
+                remain -= len(buf)
+                item = (len(buf), encode(codec, buf))
+                while not stop.is_set():
+                    try:
+                        queue.put(item, timeout=0.5)
+                        break
+                    except Full:
+                        continue
+        except BaseException as e:
+            queue.put(e)
+            return
+        queue.put(None)
+
+    th = Thread(target=worker, name='Th_compress', daemon=True)
+    th.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # 调用者提前结束（暂停、取消或连接断开）时通知后台线程退出
+        stop.set()
+        try:
+            while True:
+                queue.get_nowait()
+        except Empty:
+            pass
+        th.join()
+
+
+def read_frame(read:Callable[[int], bytes], codec:str) -> bytes:
+    """读取一帧并解压
+
+    Args:
+        read (Callable[[int], bytes]): 读取固定字节数的函数
+        codec (str): 压缩算法
+
+    Raises:
+        ConnectionError: 帧格式错误
+
+    Returns:
+        bytes: 原始数据
+    """
+    head = read(HEAD_SIZE)
+    flag = head[0]
+    raw_len = int.from_bytes(head[1:5], 'big')
+    data_len = int.from_bytes(head[5:9], 'big')
+    if raw_len > FRAME_MAX or data_len > FRAME_MAX:
+        raise ConnectionError('frame too large')
+    data = read(data_len)
+    if flag == 1:
+        try:
+            data = CODECS[codec][1](data, raw_len)
+        except Exception:
+            raise ConnectionError('bad frame')
+    elif flag != 0:
+        raise ConnectionError('bad frame')
+    if len(data) != raw_len:
+        raise ConnectionError('bad frame')
+    return data
@@ -0,0 +1,234 @@
+""" 增量传输模块
+
+实现类似 rsync 的增量传输算法，服务端与客户端共用
+
+1. 服务端将已有文件按块计算签名：弱校验（adler32，可滚动计算）+ 强校验（blake2b）
+2. 客户端在新文件上滑动窗口，用弱校验快速查找、强校验确认相同的块，
+   相同的块只发送块编号，其余部分发送原始数据
+3. 服务端用旧文件中的块和收到的原始数据重建新文件
+
+传输的数据量与修改的大小成正比，而不是与文件大小成正比
+
+增量数据流由以下指令组成：
+    b'C' + 起始块号(4字节) + 块数(4字节)      复制旧文件中连续的块
+    b'L' + 长度(4字节) + 数据                 原始数据
+    b'E' + sha256(32字节)                    结束，附带新文件的哈希值用于校验
+
+Functions:
+    block_size_for: 根据文件大小选择块大小
+    signature: 计算文件的块签名
+    make_delta: 生成增量数据流
+    apply_delta: 根据增量数据流重建文件
+
+"""
+
+from typing import BinaryIO, Callable, Iterator
+import math
+import zlib
+import hashlib
+
+
+MOD_ADLER = 65521
+STRONG_SIZE = 16                # 强校验的字节数
+SIG_SIZE = 4 + STRONG_SIZE      # 每个块签名的字节数
+LITERAL_MAX = 1024 * 1024       # 单条原始数据指令的最大长度
+READ_SIZE = 4 * 1024 * 1024     # 生成增量时每次读取的大小
+
+
+def block_size_for(size:int) -> int:
+    """根据文件大小选择块大小
+
+    块大小约为文件大小的平方根，取 2 的幂，范围为 2KiB ~ 128KiB
+
+    Args:
+        size (int): 文件大小
+
+    Returns:
+        int: 块大小
+    """
+    return 1 << max(11, min(17, math.isqrt(size).bit_length()))
+
+
+def strong(b:bytes|memoryview) -> bytes:
+    return hashlib.blake2b(b, digest_size=STRONG_SIZE).digest()
+
+
+def signature(f:BinaryIO, block_size:int) -> Iterator[bytes]:
+    """计算文件的块签名
+
+    Args:
+        f (BinaryIO): 已打开的文件
+        block_size (int): 块大小
+
+    Yields:
+        Iterator[bytes]: 每个块的签名 弱校验(4字节) + 强校验(16字节)
+    """
+    while True:
+        buf = f.read(block_size)
+        if not buf:
+            return
+        yield zlib.adler32(buf).to_bytes(4, 'big') + strong(buf)
+
+
+def parse_signature(b:bytes) -> dict[int, list[tuple[int, bytes]]]:
+    """将签名数据解析为查找表
+
+    Args:
+        b (bytes): 全部块的签名
+
+    Returns:
+        dict[int, list[tuple[int, bytes]]]: 弱校验 -> [(块号, 强校验)]
+    """
+    table = {}
+    for i in range(len(b) // SIG_SIZE):
+        sig = b[i*SIG_SIZE:(i+1)*SIG_SIZE]
+        table.setdefault(int.from_bytes(sig[:4], 'big'), []).append((i, sig[4:]))
+    return table
+
+
+def make_delta(f:BinaryIO,
+               table:dict[int, list[tuple[int, bytes]]],
+               block_size:int,
+               progress:Callable[[int], None]|None = None) -> Iterator[bytes]:
+    """生成增量数据流
+
+    先检查当前位置的整块是否与旧文件中的某个块相同，
+    不同时窗口向后滑动一个字节并滚动更新弱校验。
+    原地修改的文件绝大多数位置都能直接匹配，逐字节滑动只发生在修改过的区域附近
+
+    Args:
+        f (BinaryIO): 新文件
+        table (dict[int, list[tuple[int, bytes]]]): 旧文件签名的查找表
+        block_size (int): 块大小
+        progress (Callable[[int], None] | None, optional): 进度回调，参数为已处理的字节数. Defaults to None.
+
+    Yields:
+        Iterator[bytes]: 增量指令
+    """
+    bs = block_size
+    h = hashlib.sha256()
+    buf = bytearray()
+    base = 0                # buf[0] 在新文件中的偏移
+    pos = 0                 # 窗口起点在 buf 中的位置
+    lit = 0                 # 尚未发送的原始数据在 buf 中的起点
+    eof = False
+    a = b = None            # 当前窗口的 adler32 两个分量，None 表示需要重新计算
+    run_start = run_len = 0 # 尚未发送的连续块
+
+    def flush_run():
+        nonlocal run_len
+        if run_len:
+            yield b'C' + run_start.to_bytes(4, 'big') + run_len.to_bytes(4, 'big')
+            run_len = 0
+
+    def flush_literal(end):
+        nonlocal lit
+        while lit < end:
+            n = min(LITERAL_MAX, end - lit)
+            yield b'L' + n.to_bytes(4, 'big') + bytes(buf[lit:lit+n])
+            lit += n
+
+    while True:
+        # 窗口不完整时读取更多数据，并丢弃已经处理完的部分
+        if len(buf) - pos < bs + 1 and not eof:
+            if lit:
+                del buf[:lit]
+                base += lit
+                pos -= lit
+                lit = 0
+            data = f.read(READ_SIZE)
+            if data:
+                h.update(data)
+                buf += data
+            else:
+                eof = True
+            if progress:
+                progress(base + pos)
+            continue
+        if len(buf) - pos < bs:
+            break
+
+        if a is None:
+            w = zlib.adler32(buf[pos:pos+bs])
+            a, b = w & 0xffff, w >> 16
+        cands = table.get((b << 16) | a)
+        idx = -1
+        if cands:
+            s = strong(memoryview(buf)[pos:pos+bs])
+            for i, sig in cands:
+                if sig == s:
+                    idx = i
+                    break
+        if idx >= 0:
+            if pos > lit:
+                yield from flush_run()
+                yield from flush_literal(pos)
+            if run_len and run_start + run_len == idx:
+                run_len += 1
+            else:
+                yield from flush_run()
+                run_start, run_len = idx, 1
+            pos += bs
+            lit = pos
+            a = None
+            continue
+
+        # 没有匹配，窗口滑动一个字节
+        if pos + bs >= len(buf):
+            pos += 1
+            a = None
+            continue
+        out = buf[pos]
+        a = (a - out + buf[pos+bs]) % MOD_ADLER
+        b = (b - bs*out + a - 1) % MOD_ADLER
+        pos += 1
+        # 原始数据过多时先发送一部分，避免缓冲区无限增长
+        if pos - lit >= LITERAL_MAX:
+            yield from flush_run()
+            yield from flush_literal(pos)
+
+    yield from flush_run()
+    yield from flush_literal(len(buf))
+    if progress:
+        progress(base + len(buf))
+    yield b'E' + h.digest()
+
+
+def apply_delta(read:Callable[[int], bytes], old:BinaryIO, new:BinaryIO, block_size:int) -> bool:
+    """根据增量数据流重建文件
+
+    Args:
+        read (Callable[[int], bytes]): 读取固定字节数的函数
+        old (BinaryIO): 旧文件
+        new (BinaryIO): 写入新文件
+        block_size (int): 块大小
+
+    Returns:
+        bool: 重建的文件与客户端的文件哈希值是否相同
+    """
+    h = hashlib.sha256()
+    while True:
+        op = read(1)
+        if op == b'C':
+            start = int.from_bytes(read(4), 'big')
+            count = int.from_bytes(read(4), 'big')
+            old.seek(start * block_size)
+            remain = count * block_size
+            while remain > 0:
+                data = old.read(min(remain, READ_SIZE))
+                if not data:
+                    return False
+                h.update(data)
+                new.write(data)
+                remain -= len(data)
+        elif op == b'L':
+            n = int.from_bytes(read(4), 'big')
+            if n > LITERAL_MAX:     # 在读取之前检查，错误的长度不会导致分配过大的内存
+                return False
+            data = read(n)
+            h.update(data)
+            new.write(data)
+        elif op == b'E':
+            return read(32) == h.digest()
+        else:
+            return False
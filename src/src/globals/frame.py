@@ -0,0 +1,145 @@
+""" 控制连接的帧模块
+
+控制连接上的每个数据包为一帧：4 字节大端长度 + 数据。这里提供服务端和客户端共用的保护措施：
+
+- 帧长度上限，错误或恶意的长度头不会导致分配过大的内存
+- 按字节数限制的发送队列，对方不读取时不会无限积压
+- 只作用于发送的超时，接收线程仍然可以一直阻塞等待
+- TCP keepalive，对方断电或断网（没有发送 FIN/RST）时，连接在有限时间内被系统关闭
+
+Classes:
+    FrameTooLarge(ValueError): 帧长度超过上限
+    SendQueue(Queue): 按字节数限制的发送队列
+
+Functions:
+    set_send_timeout: 设置socket的发送超时
+    set_keepalive: 开启socket的 TCP keepalive
+
+Attributes:
+    MAX_FRAME (int): 默认的帧长度上限（字节）
+
+"""
+
+from queue import Queue
+import socket
+import struct
+import time
+import sys
+
+
+MAX_FRAME = 64 * 1024 * 1024
+
+
+class FrameTooLarge(ValueError):
+    """帧长度超过上限
+    """
+    def __init__(self, size:int, limit:int) -> None:
+        super().__init__(f'frame of {size} bytes exceeds the limit of {limit} bytes')
+        self.size = size
+        self.limit = limit
+        return
+
+
+def set_send_timeout(s:socket.socket, seconds:float) -> None:
+    """设置socket的发送超时
+
+    使用 `SO_SNDTIMEO`，只影响发送，超时后 `send` 抛出 `BlockingIOError`（`OSError` 的子类）。
+    socket 的 `settimeout` 会同时影响接收，不能用于接收线程一直阻塞的控制连接
+
+    Args:
+        s (socket.socket): socket
+        seconds (float): 超时时间（秒），0 表示不超时
+    """
+    if sys.platform == 'win32':
+        value = struct.pack('I', int(seconds * 1000))
+    else:
+        value = struct.pack('ll', int(seconds), int(seconds % 1 * 1e6))
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, value)
+    return
+
+
+def set_keepalive(s:socket.socket, idle:float, interval:float, count:int) -> None:
+    """开启socket的 TCP keepalive
+
+    连接空闲 `idle` 秒后开始探测，每隔 `interval` 秒探测一次，连续 `count` 次没有回应时系统关闭连接，
+    阻塞在该socket上的 `recv` 抛出 `OSError`。系统不支持的选项忽略，使用系统默认值
+
+    Args:
+        s (socket.socket): socket
+        idle (float): 开始探测前的空闲时间（秒），0 表示不开启
+        interval (float): 探测间隔（秒）
+        count (int): 判定连接失效的探测次数
+    """
+    if not idle:
+        return
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if sys.platform == 'win32':
+        s.ioctl(socket.SIO_KEEPALIVE_VALS, (1, int(idle * 1000), int(interval * 1000)))
+        return
+    options = (
+        ('TCP_KEEPIDLE', idle),
+        ('TCP_KEEPALIVE', idle),        # macOS 上的 TCP_KEEPIDLE
+        ('TCP_KEEPINTVL', interval),
+        ('TCP_KEEPCNT', count),
+        )
+    for name, value in options:
+        opt = getattr(socket, name, None)
+        if opt is None:
+            continue
+        try:
+            s.setsockopt(socket.IPPROTO_TCP, opt, max(1, int(value)))
+        except OSError:
+            continue
+    return
+
+
+class SendQueue(Queue):
+    """按字节数限制的发送队列
+
+    队列中的元素为 `(数据, 附加信息)`，按数据的长度计算占用；`None` 用于通知发送线程退出，不计入占用。
+    `put` 不受限制，`offer` 在超出限制时等待或者返回 False。队列为空时总是可以放入一个元素，
+    超过限制的单个大数据包不会永远无法发送
+
+    Args:
+        limit (int): 字节数上限，0 表示不限制
+    """
+    def __init__(self, limit:int) -> None:
+        super().__init__()
+        self.limit = limit
+        self.nbytes = 0
+        return
+
+    def _put(self, item) -> None:
+        super()._put(item)
+        if item is not None:
+            self.nbytes += len(item[0])
+        return
+
+    def _get(self):
+        item = super()._get()
+        if item is not None:
+            self.nbytes -= len(item[0])
+        return item
+
+    def offer(self, item:tuple, timeout:float = 0) -> bool:
+        """在不超出限制时放入
+
+        Args:
+            item (tuple): `(数据, 附加信息)`
+            timeout (float, optional): 超出限制时最多等待的时间（秒）. Defaults to 0.
+
+        Returns:
+            bool: 是否已放入
+        """
+        size = len(item[0])
+        with self.not_full:
+            end = time.monotonic() + timeout
+            while self.limit and self.nbytes and self.nbytes + size > self.limit:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.not_full.wait(remaining)
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+        return True
@@ -0,0 +1,219 @@
+""" 文件的分块哈希与 Merkle 树
+
+服务端与客户端共用
+
+文件按 `chunk_size_for(文件大小)` 分块，每块的 sha256 为 Merkle 树的叶子，
+相邻两个节点的摘要拼接后再做 sha256 得到上一层，奇数个时最后一个直接升入上一层，最后剩下的一个为根。
+空文件的根为空串的 sha256
+
+传输双方比较根即可确认文件完整；不一致时比较叶子，只重新传输不一致的块
+
+`Hasher` 在单独的线程中计算叶子，传输线程只需把数据放入队列。
+hashlib 处理较大的数据时会释放 GIL，哈希与网络、硬盘 I/O 并行进行
+
+Classes:
+    Hasher(object): 在后台线程中计算文件的叶子
+    HashingReader(object): 读取文件的同时把数据交给 Hasher
+
+Functions:
+    chunk_size_for: 根据文件大小选择块大小
+    chunk_hash: 计算一块数据的哈希值
+    merkle_root: 由叶子计算根
+    file_leaves: 计算文件的全部叶子
+
+"""
+
+from threading import Thread
+from queue import Queue, Full
+import hashlib
+
+
+MIN_CHUNK = 256 * 1024
+MAX_CHUNKS = 4096               # 块数超过该值时增大块大小，限制叶子列表的长度
+QUEUE_SIZE = 64                 # 等待哈希的数据块数上限，哈希较慢时传输线程在此等待
+READ_SIZE = 1024 * 1024
+
+
+def chunk_size_for(size:int) -> int:
+    """根据文件大小选择块大小
+
+    最小 256KiB，取 2 的幂，块数不超过 `MAX_CHUNKS`
+
+    Args:
+        size (int): 文件大小
+
+    Returns:
+        int: 块大小
+    """
+    retval = MIN_CHUNK
+    while retval * MAX_CHUNKS < size:
+        retval <<= 1
+    return retval
+
+
+def chunk_hash(b:bytes|memoryview) -> str:
+    return hashlib.sha256(b).hexdigest()
+
+
+def merkle_root(leaves:list[str]) -> str:
+    """由叶子计算根
+
+    Args:
+        leaves (list[str]): 十六进制的叶子
+
+    Returns:
+        str: 十六进制的根
+    """
+    level = [bytes.fromhex(h) for h in leaves]
+    if not level:
+        return hashlib.sha256(b'').hexdigest()
+    while len(level) > 1:
+        nxt = [hashlib.sha256(level[i] + level[i+1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        level = nxt
+    return level[0].hex()
+
+
+class Hasher:
+    """在后台线程中计算文件的叶子
+
+    按文件顺序调用 `update` 或 `update_file` 提供数据，最后调用 `finish` 取得叶子。
+    传入 `update` 的数据在哈希完成前不能被修改
+
+    哈希只是附带工作时（例如顺便为缓存计算）可以使用非阻塞的 `update`，
+    哈希跟不上传输时放弃计算，不拖慢传输
+
+    哈希线程出错（例如 `update_file` 的文件已被删除）时放弃计算，错误记录在 `error` 中，
+    之后的数据只从队列中取出，不会阻塞 `update`
+    """
+    def __init__(self, chunk:int) -> None:
+        """初始化并启动哈希线程
+
+        Args:
+            chunk (int): 块大小
+        """
+        self.chunk = chunk
+        self.leaves:list[str] = []
+        self.queue = Queue(QUEUE_SIZE)
+        self.cur = hashlib.sha256()
+        self.cur_len = 0
+        self.abandoned = False
+        self.error:Exception|None = None
+        self.thread = Thread(target=self.__run, name='Th_hash', daemon=True)
+        self.thread.start()
+        return
+
+    def update(self, data:bytes|memoryview, block:bool = True) -> None:
+        """提供下一段数据
+
+        Args:
+            data (bytes | memoryview): 数据
+            block (bool, optional): 队列已满时是否等待，不等待时放弃计算. Defaults to True.
+        """
+        if self.abandoned:
+            return
+        try:
+            self.queue.put(data, block)
+        except Full:
+            self.abandoned = True
+        return
+
+    def update_file(self, path, begin:int, end:int) -> None:
+        """由哈希线程从硬盘读取文件的 [begin, end) 范围
+        """
+        self.queue.put((path, begin, end))
+        return
+
+    def finish(self) -> list[str]|None:
+        """等待全部数据哈希完成
+
+        Returns:
+            list[str] | None: 十六进制的叶子，放弃计算或者出错时为 None
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.abandoned:
+            return None
+        if self.cur_len:
+            self.leaves.append(self.cur.hexdigest())
+            self.cur_len = 0
+        return self.leaves
+
+    def __run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.abandoned:      # 只取出剩余的数据，不再计算
+                continue
+            try:
+                if isinstance(item, tuple):
+                    path, begin, end = item
+                    with open(path, 'rb') as f:
+                        f.seek(begin)
+                        while begin < end:
+                            buf = f.read(min(READ_SIZE, end - begin))
+                            if not buf:
+                                break
+                            self.__feed(buf)
+                            begin += len(buf)
+                else:
+                    self.__feed(item)
+            except Exception as e:  # 已计算的叶子不完整，不能作为结果
+                self.error = e
+                self.abandoned = True
+        return
+
+    def __feed(self, data:bytes|memoryview) -> None:
+        mv = memoryview(data)
+        while len(mv):
+            take = min(self.chunk - self.cur_len, len(mv))
+            self.cur.update(mv[:take])
+            self.cur_len += take
+            mv = mv[take:]
+            if self.cur_len == self.chunk:
+                self.leaves.append(self.cur.hexdigest())
+                self.cur = hashlib.sha256()
+                self.cur_len = 0
+        return
+
+
+class HashingReader:
+    """读取文件的同时把数据交给 Hasher
+
+    包装一个二进制文件对象（或 `CachedReader`），只提供 `read`，
+    读到的数据必须是不可变的 bytes
+    """
+    def __init__(self, f, hasher:Hasher, block:bool = True) -> None:
+        self.f = f
+        self.hasher = hasher
+        self.block = block
+        return
+
+    def read(self, n:int = -1) -> bytes:
+        data = self.f.read(n)
+        if data:
+            self.hasher.update(data, self.block)
+        return data
+
+
+def file_leaves(path, size:int) -> list[str]:
+    """计算文件的全部叶子
+
+    Args:
+        path (Path | str): 文件路径
+        size (int): 文件大小，决定块大小
+
+    Raises:
+        OSError: 读取文件失败
+
+    Returns:
+        list[str]: 十六进制的叶子
+    """
+    h = Hasher(chunk_size_for(size))
+    h.update_file(path, 0, size)
+    leaves = h.finish()
+    if leaves is None:
+        raise h.error if isinstance(h.error, OSError) else OSError(f'hashing {path} failed: {h.error}')
+    return leaves
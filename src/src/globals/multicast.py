@@ -0,0 +1,23 @@
+""" 组播分发的数据包格式
+
+服务端与客户端共用
+
+数据包格式：
+    会话ID(4字节) + 类型(1字节) + 序号(4字节) + 数据
+
+- 类型为 0 时为数据包，序号为包号，数据为文件中 `包号 * PACKET_DATA` 处的数据
+- 类型为 1 时为校验包，序号为组号，数据为该组 `FEC_K` 个数据包（不足 PACKET_DATA 的末尾补零）的异或
+- 类型为 2 时为结束包，序号为数据包总数
+
+"""
+
+import struct
+
+
+HEAD = struct.Struct('!IBI')    # 包头
+PACKET_DATA = 1400              # 每个数据包中文件数据的大小，加上包头和 UDP/IP 头不超过以太网的 MTU
+FEC_K = 16                      # 每组数据包数，每组发送一个校验包
+
+T_DATA = 0
+T_PARITY = 1
+T_END = 2
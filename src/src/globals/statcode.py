@@ -31,7 +31,10 @@ class StatCode:
     ERR_FIEL_ALREADY_EXIST  = 302
     ERR_DIR_NOT_EXIST       = 303
     ERR_DIR_ALREADY_EXIST   = 304
+    ERR_INVALID_PATH        = 305
 
     ERR_SERVER_BUSY         = 401
+    ERR_NOT_STARTED         = 402
     ERR_UNDEF_CMD           = 501
+    ERR_INVALID_ARGS        = 502
 
@@ -0,0 +1,24 @@
+""" 群集下载的节点间协议
+
+服务端与客户端共用
+
+文件的分块规则和每块的哈希值见 `src.globals.merkle`，客户端收到的每一块都必须与服务端公布的哈希值一致
+
+节点间协议（TCP，每个节点为一个文件开启一个端口）：
+    连接：群集令牌(16字节)，取自 `swarmJoin` 的返回值，不一致时对方直接断开连接
+    请求：操作(1字节) + 块号(4字节)
+    响应：长度(4字节) + 数据
+
+- 操作为 0 时请求位图，块号忽略，数据为已校验的块的位图（第 i 块对应第 i//8 字节的第 i%8 位）
+- 操作为 1 时请求一块数据，节点没有该块时长度为 0
+
+"""
+
+import struct
+
+
+REQ = struct.Struct('!BI')      # 请求
+LEN = struct.Struct('!I')       # 响应长度
+OP_BITFIELD = 0
+OP_CHUNK = 1
+TOKEN_SIZE = 16                 # 群集令牌的字节数
@@ -0,0 +1,138 @@
+""" 准入控制模块
+
+限制服务端同时进行的文件传输，避免大量并发传输使硬盘和网卡过载后总吞吐量下降
+
+工作者线程开始一个传输前向准入控制器申请许可，传输线程结束时归还。限制取自 `ServerConfig.ADMISSION`：
+
+- 全局和每个用户同时进行的传输数
+- 全局和每个用户尚未传输完成的字节数（MiB）
+- 超过限制的请求进入有界的等待队列，按先后顺序等待许可，最多等待 `queueTimeout` 秒
+
+等待队列已满或等待超时时申请失败，工作者线程向客户端返回 `ERR_SERVER_BUSY` 及建议的重试时间
+
+所有限制为 0 时表示不限制
+
+Classes:
+    Ticket(object): 传输许可
+    AdmissionController(object): 准入控制器
+
+Attributes:
+    admission (AdmissionController): 全局唯一的准入控制器
+
+"""
+
+from threading import Condition
+import time
+
+from .serverconfig import ServerConfig
+from .metrics import registry
+
+
+RETRY_AFTER_MAX = 30        # 建议重试时间的上限（秒）
+
+
+class Ticket:
+    """传输许可
+    """
+    def __init__(self, user:str, size:int) -> None:
+        self.user = user
+        self.size = size
+        return
+
+
+class AdmissionController:
+    """准入控制器
+    """
+    def __init__(self) -> None:
+        self.cond = Condition()
+        self.transfers = 0                      # 正在进行的传输数
+        self.pending = 0                        # 正在进行的传输的总字节数
+        self.users:dict[str, list[int]] = {}    # 用户 -> [传输数, 字节数]
+        self.waiting:list[Ticket] = []          # 等待队列
+        return
+
+    def __fits(self, t:Ticket) -> bool:
+        """判断加入该传输后是否仍在限制之内
+        """
+        cfg = ServerConfig.ADMISSION
+        u = self.users.get(t.user, [0, 0])
+        MiB = 1024 * 1024
+        if cfg['maxTransfers'] and self.transfers >= cfg['maxTransfers']:
+            return False
+        if cfg['maxUserTransfers'] and u[0] >= cfg['maxUserTransfers']:
+            return False
+        # 字节数限制只在已有传输时生效，保证单个超过限制的大文件也能传输
+        if cfg['maxPendingMiB'] and self.transfers and self.pending + t.size > cfg['maxPendingMiB'] * MiB:
+            return False
+        if cfg['maxUserPendingMiB'] and u[0] and u[1] + t.size > cfg['maxUserPendingMiB'] * MiB:
+            return False
+        return True
+
+    def retry_after(self) -> float:
+        """估计客户端应等待的时间，等待的请求越多时间越长
+        """
+        return min(RETRY_AFTER_MAX, 1 + len(self.waiting))
+
+    def admit(self, user:str, size:int) -> Ticket|None:
+        """申请传输许可
+
+        超过限制时在等待队列中等待，队列中先到的请求先获得许可
+
+        Args:
+            user (str): 用户名
+            size (int): 需要传输的字节数
+
+        Returns:
+            Ticket | None: 许可，失败时为None
+        """
+        t = Ticket(user, size)
+        cfg = ServerConfig.ADMISSION
+        with self.cond:
+            if not self.waiting and self.__fits(t):
+                self.__grant(t)
+                return t
+            if len(self.waiting) >= cfg['queueSize']:
+                return None
+            self.waiting.append(t)
+            deadline = time.monotonic() + cfg['queueTimeout']
+            try:
+                while True:
+                    # 同一用户达到限制时不阻塞其他用户，按队列顺序找到第一个可以放行的请求
+                    head = next((i for i in self.waiting if self.__fits(i)), None)
+                    if head is t:
+                        self.__grant(t)
+                        return t
+                    remain = deadline - time.monotonic()
+                    if remain <= 0:
+                        return None
+                    self.cond.wait(remain)
+            finally:
+                self.waiting.remove(t)
+                self.cond.notify_all()
+
+    def release(self, t:Ticket) -> None:
+        """归还传输许可
+        """
+        with self.cond:
+            self.transfers -= 1
+            self.pending -= t.size
+            u = self.users[t.user]
+            u[0] -= 1
+            u[1] -= t.size
+            if u[0] <= 0:
+                del self.users[t.user]
+            self.cond.notify_all()
+        return
+
+    def __grant(self, t:Ticket) -> None:
+        self.transfers += 1
+        self.pending += t.size
+        u = self.users.setdefault(t.user, [0, 0])
+        u[0] += 1
+        u[1] += t.size
+        return
+
+
+admission = AdmissionController()
+
+registry.gauge('fts_admission_waiting', '准入控制等待队列中的请求数', fn=lambda: len(admission.waiting))
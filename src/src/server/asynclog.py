@@ -0,0 +1,285 @@
+""" 异步日志模块
+
+请求路径上的日志调用只把 `LogRecord` 放入队列，格式化、写文件和输出到控制台（或界面）
+都由单独的写入线程完成，请求的延迟不受硬盘和控制台速度的影响：
+
+- 日志调用使用 `%s` 参数而不是 f-string，消息在写入线程中才格式化
+- 写入线程每次取出队列中的全部记录，逐条交给各个 handler 后每个 handler 只 flush 一次，
+  控制台和界面每批只写入一次
+- 日志文件按大小或时间轮转
+- 队列满时丢弃新的记录并计数（`fts_log_dropped_total`），不阻塞请求
+
+Classes:
+    RotatingLogFile(logging.Handler): 按大小和时间轮转的日志文件
+    BatchStreamHandler(logging.StreamHandler): 每批只写入一次的流输出
+    QueueLogHandler(logging.Handler): 把记录放入队列的 handler
+    Th_logWriter(Thread): 写入线程
+    LogPipeline(object): 日志队列和写入线程
+
+Attributes:
+    log_pipeline (LogPipeline): 全局唯一的日志队列
+
+"""
+
+from typing import override
+from threading import Thread, Lock
+from pathlib import Path
+import logging
+import atexit
+import queue
+import time
+import os
+
+from .serverconfig import ServerConfig
+from .metrics import registry
+
+
+QUEUE_SIZE = 65536          # 队列中最多积压的记录数
+BATCH_MAX = 1024            # 每批最多处理的记录数
+
+
+class RotatingLogFile(logging.Handler):
+    """按大小和时间轮转的日志文件
+
+    当前文件为 `path`，轮转后依次改名为 `path.1`、`path.2` ...，超出 `backups` 的删除。
+    写入时不 flush，由写入线程在每批结束后调用 `flush`
+
+    Args:
+        path (str): 日志文件路径
+        max_bytes (int, optional): 文件超过该大小时轮转，0 表示不按大小轮转. Defaults to 0.
+        interval (float, optional): 每隔该时间（秒）轮转，0 表示不按时间轮转. Defaults to 0.
+        backups (int, optional): 保留的旧文件数. Defaults to 7.
+        encoding (str, optional): 编码. Defaults to 'utf-8'.
+    """
+    def __init__(self, path:str, max_bytes:int = 0, interval:float = 0, backups:int = 7, encoding:str = 'utf-8') -> None:
+        super().__init__()
+        self.path = Path(path).absolute()
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backups = backups
+        self.encoding = encoding
+        self.stream = None
+        self.size = 0
+        self.rollover_at = 0.0
+        self.__open()
+        return
+
+    @classmethod
+    def from_config(cls, path:str) -> 'RotatingLogFile':
+        """按 `ServerConfig.LOG_ROTATE` 的设置创建
+        """
+        cfg = ServerConfig.LOG_ROTATE
+        return cls(path, int(cfg['maxMiB'] * 2**20), cfg['intervalHours'] * 3600, cfg['backupCount'])
+
+    def __open(self) -> None:
+        self.stream = open(self.path, 'a', encoding=self.encoding, buffering=1 << 16)
+        self.size = self.stream.tell()
+        self.rollover_at = time.time() + self.interval if self.interval else 0.0
+        return
+
+    def rollover(self) -> None:
+        self.stream.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f'{self.path.name}.{i}')
+            if src.exists():
+                os.replace(src, self.path.with_name(f'{self.path.name}.{i + 1}'))
+        if self.backups > 0:
+            os.replace(self.path, self.path.with_name(f'{self.path.name}.1'))
+        else:
+            self.path.unlink(missing_ok=True)
+        self.__open()
+        return
+
+    @override
+    def emit(self, record:logging.LogRecord) -> None:
+        try:
+            msg = self.format(record) + '\n'
+            n = len(msg.encode(self.encoding))
+            if (self.max_bytes and self.size and self.size + n > self.max_bytes
+                    or self.rollover_at and time.time() >= self.rollover_at):
+                self.rollover()
+            self.stream.write(msg)
+            self.size += n
+        except Exception:
+            self.handleError(record)
+        return
+
+    @override
+    def flush(self) -> None:
+        with self.lock:
+            if self.stream is not None:
+                self.stream.flush()
+        return
+
+    @override
+    def close(self) -> None:
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+        super().close()
+        return
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """每批只写入一次的流输出
+
+    `emit` 只把格式化后的消息暂存，`flush` 时一次写入流中。
+    用于控制台和图形界面，界面每批只刷新一次
+    """
+    @override
+    def __init__(self, stream = None) -> None:
+        super().__init__(stream)
+        self.pending:list[str] = []
+        return
+
+    @override
+    def emit(self, record:logging.LogRecord) -> None:
+        try:
+            self.pending.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+        return
+
+    @override
+    def flush(self) -> None:
+        with self.lock:
+            if not self.pending:
+                return
+            text = ''.join(self.pending)
+            self.pending.clear()
+            try:
+                self.stream.write(text)
+                if hasattr(self.stream, 'flush'):
+                    self.stream.flush()
+            except Exception:
+                pass            # 控制台已关闭等情况，不影响其他 handler
+        return
+
+
+class QueueLogHandler(logging.Handler):
+    """把记录放入队列的 handler
+
+    不格式化消息，级别取 `targets` 中最低的，低于该级别的记录不进入队列
+
+    Args:
+        pipeline (LogPipeline): 日志队列
+        targets (list[logging.Handler]): 写入线程实际调用的 handler
+    """
+    def __init__(self, pipeline:'LogPipeline', targets:list[logging.Handler]) -> None:
+        super().__init__(min((h.level for h in targets), default=logging.NOTSET))
+        self.pipeline = pipeline
+        self.targets = tuple(targets)
+        return
+
+    @override
+    def handle(self, record:logging.LogRecord) -> bool:
+        # 不需要加锁，队列本身是线程安全的
+        if self.filter(record):
+            self.pipeline.put(self.targets, record)
+            return True
+        return False
+
+    @override
+    def emit(self, record:logging.LogRecord) -> None:
+        self.pipeline.put(self.targets, record)
+        return
+
+
+class Th_logWriter(Thread):
+    """写入线程
+    """
+    @override
+    def __init__(self, q:queue.Queue) -> None:
+        super().__init__(None, None, 'Th_logWriter', daemon=True)
+        self.q = q
+        return
+
+    @override
+    def run(self) -> None:
+        while True:
+            batch = [self.q.get()]
+            while len(batch) < BATCH_MAX:
+                try:
+                    batch.append(self.q.get_nowait())
+                except queue.Empty:
+                    break
+            touched:dict[int, logging.Handler] = {}
+            stop = False
+            for item in batch:
+                if item is None:                # 停止
+                    stop = True
+                    continue
+                targets, record = item
+                if record is None:              # 关闭已经移除的 handler
+                    for h in targets:
+                        touched.pop(id(h), None)
+                        h.flush()
+                        h.close()
+                    continue
+                for h in targets:
+                    if record.levelno >= h.level:
+                        h.handle(record)
+                        touched[id(h)] = h
+            for h in touched.values():
+                h.flush()
+            if stop:
+                return
+
+
+class LogPipeline:
+    """日志队列和写入线程
+
+    所有 logger 共用一个队列和一个写入线程，第一次 `attach` 时启动，进程退出时写完队列中的记录
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.q:queue.Queue = queue.Queue(QUEUE_SIZE)
+        self.thread:Th_logWriter|None = None
+        self.dropped = registry.counter('fts_log_dropped_total', '日志队列满时丢弃的记录数')
+        registry.gauge('fts_log_queue_depth', '日志队列中等待写入的记录数', fn=self.q.qsize)
+        return
+
+    def put(self, targets:tuple, record:logging.LogRecord) -> None:
+        try:
+            self.q.put_nowait((targets, record))
+        except queue.Full:
+            self.dropped.inc()
+        return
+
+    def attach(self, logger:logging.Logger, handlers:list[logging.Handler]) -> logging.Logger:
+        """让 logger 通过队列写入 handlers
+
+        logger 原有的 handler 被移除，在写完之前的记录后关闭
+
+        Args:
+            logger (logging.Logger): logger
+            handlers (list[logging.Handler]): 实际写入的 handler
+
+        Returns:
+            logging.Logger: 传入的 logger
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = Th_logWriter(self.q)
+                self.thread.start()
+                atexit.register(self.stop)
+            for h in list(logger.handlers):
+                logger.removeHandler(h)
+                old = h.targets if isinstance(h, QueueLogHandler) else (h,)
+                self.q.put((old, None))
+            logger.addHandler(QueueLogHandler(self, handlers))
+        return logger
+
+    def stop(self, timeout:float = 5) -> None:
+        """写完队列中的记录后停止写入线程
+        """
+        with self.lock:
+            th, self.thread = self.thread, None
+        if th is not None and th.is_alive():
+            self.q.put(None)
+            th.join(timeout)
+        return
+
+
+log_pipeline = LogPipeline()
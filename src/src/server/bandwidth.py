@@ -0,0 +1,180 @@
+""" 带宽调度模块
+
+所有文件传输线程在收发每一块数据前向调度器申请额度，调度器统一控制服务端的数据流量：
+
+- 全局、每个用户、每个传输各有一个令牌桶，速率取自 `ServerConfig.BANDWIDTH`（KiB/s，0 为不限制），
+  修改配置后立即生效
+- 多个传输同时等待全局额度时按加权公平队列（WFQ）的顺序放行：
+  每个请求的虚拟完成时间为 `max(虚拟时间, 该传输上一个请求的完成时间) + 字节数 / 权重`，
+  完成时间最小的请求先获得额度。新加入的小文件传输不需要排在大文件之后，能很快完成
+
+控制连接（请求与响应）不经过调度器，设置全局上限时应为其留出余量
+
+Classes:
+    TokenBucket(object): 令牌桶
+    Flow(object): 一个传输在调度器中的状态
+    Scheduler(object): 带宽调度器
+
+Attributes:
+    scheduler (Scheduler): 全局唯一的调度器
+
+"""
+
+from threading import Condition
+import time
+
+from .serverconfig import ServerConfig
+
+
+BURST_SECONDS = 0.2         # 令牌桶的容量为该时间内的流量
+QUANTUM = 64 * 1024         # 传输线程每次申请的字节数上限
+POLL_INTERVAL = 0.05        # 等待额度时的最长等待时间
+
+
+class TokenBucket:
+    """令牌桶
+
+    令牌数允许变为负数：令牌数为正时即可发送任意大小的一块数据，
+    之后需要等待令牌补足，因此不要求桶容量大于数据块
+    """
+    def __init__(self, key:str) -> None:
+        """初始化
+
+        Args:
+            key (str): 速率在 `ServerConfig.BANDWIDTH` 中的键
+        """
+        self.key = key
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        return
+
+    @property
+    def rate(self) -> float:
+        return ServerConfig.BANDWIDTH.get(self.key, 0) * 1024
+
+    def refill(self, now:float) -> None:
+        rate = self.rate
+        if rate <= 0:
+            self.tokens = 0.0
+        else:
+            self.tokens = min(rate * BURST_SECONDS, self.tokens + (now - self.last) * rate)
+        self.last = now
+        return
+
+    def wait_time(self) -> float:
+        """距离可以发送还需等待的时间，不限速时为0
+        """
+        rate = self.rate
+        if rate <= 0 or self.tokens > 0:
+            return 0.0
+        return (1 - self.tokens) / rate
+
+    def consume(self, n:int) -> None:
+        if self.rate > 0:
+            self.tokens -= n
+        return
+
+
+class Flow:
+    """一个传输在调度器中的状态
+    """
+    def __init__(self, user:str, weight:float) -> None:
+        self.user = user
+        self.weight = weight
+        self.finish = 0.0               # 上一个请求的虚拟完成时间
+        self.bucket = TokenBucket('perTransfer')
+        return
+
+
+class Scheduler:
+    """带宽调度器
+
+    传输开始时调用 `open` 取得 Flow，每次收发数据前调用 `acquire`，结束时调用 `close`
+    """
+    def __init__(self) -> None:
+        self.cond = Condition()
+        self.vtime = 0.0                                # 虚拟时间，为最近放行的请求的完成时间
+        self.seq = 0
+        self.bucket = TokenBucket('global')
+        self.users:dict[str, list] = {}                 # 用户 -> [令牌桶, 传输数]
+        self.waiting:list[list] = []                    # [虚拟完成时间, 序号, Flow, 字节数]
+        return
+
+    def open(self, user:str, weight:float = 1.0) -> Flow:
+        """登记一个传输
+
+        Args:
+            user (str): 用户名
+            weight (float, optional): 权重，权重越大分到的带宽越多. Defaults to 1.0.
+
+        Returns:
+            Flow: 传输的调度状态
+        """
+        with self.cond:
+            u = self.users.setdefault(user, [TokenBucket('perUser'), 0])
+            u[1] += 1
+            flow = Flow(user, weight)
+            flow.finish = self.vtime
+            return flow
+
+    def close(self, flow:Flow) -> None:
+        """注销一个传输
+        """
+        with self.cond:
+            u = self.users.get(flow.user)
+            if u is not None:
+                u[1] -= 1
+                if u[1] <= 0:
+                    del self.users[flow.user]
+        return
+
+    def acquire(self, flow:Flow, n:int) -> None:
+        """申请发送或接收 n 字节，阻塞到允许为止
+
+        Args:
+            flow (Flow): 传输的调度状态
+            n (int): 字节数
+        """
+        bw = ServerConfig.BANDWIDTH
+        if not (bw.get('global') or bw.get('perUser') or bw.get('perTransfer')):
+            return                      # 不限速时不加锁，没有额外开销
+        with self.cond:
+            user_bucket = self.users[flow.user][0]
+            flow.finish = max(self.vtime, flow.finish) + n / flow.weight
+            self.seq += 1
+            req = [flow.finish, self.seq, flow, n]
+            self.waiting.append(req)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.bucket.refill(now)
+                    for u, _ in self.users.values():
+                        u.refill(now)
+                    for r in self.waiting:
+                        r[2].bucket.refill(now)
+
+                    # 自身（用户和传输）的额度已经就绪的请求中，虚拟完成时间最小的请求使用全局额度
+                    own_wait = max(user_bucket.wait_time(), flow.bucket.wait_time())
+                    if own_wait <= 0:
+                        head = min((r for r in self.waiting if self.__ready(r[2])), default=None)
+                        if head is req:
+                            global_wait = self.bucket.wait_time()
+                            if global_wait <= 0:
+                                self.bucket.consume(n)
+                                user_bucket.consume(n)
+                                flow.bucket.consume(n)
+                                self.vtime = max(self.vtime, req[0])
+                                return
+                            self.cond.wait(min(global_wait, POLL_INTERVAL))
+                            continue
+                    self.cond.wait(min(own_wait, POLL_INTERVAL) if own_wait > 0 else POLL_INTERVAL)
+            finally:
+                self.waiting.remove(req)
+                self.cond.notify_all()
+
+    def __ready(self, flow:Flow) -> bool:
+        u = self.users.get(flow.user)
+        return flow.bucket.wait_time() <= 0 and (u is None or u[0].wait_time() <= 0)
+
+
+scheduler = Scheduler()
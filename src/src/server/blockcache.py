@@ -0,0 +1,330 @@
+""" 块缓存模块
+
+服务端读取共享文件时使用的块缓存，所有下载线程共享
+
+很多客户端同时下载同一个文件时，每个块只从硬盘读取一次，其余下载直接从内存发送：
+
+- 文件按固定大小分块，缓存的键为 `(设备, inode, 修改时间, 块号)`，文件被修改后旧的块自然失效。
+  `CachedReader` 打开文件后一直通过同一个文件描述符按位置读取，文件在下载期间被替换时，
+  读到的仍是键所对应的那个版本
+- 同一个块正在被读取时，其他线程等待该次读取的结果，不重复读取硬盘
+- 使用分段 LRU（SLRU）淘汰：新读取的块进入试用段，再次命中后进入保护段。
+  顺序读取一个很大的文件只会替换试用段，不会把热点文件挤出缓存
+- 检测到顺序读取时在后台预读之后的若干块
+- 缓存总大小和预读块数取自 `ServerConfig.CACHE`，大小为 0 时不使用缓存
+
+Classes:
+    BlockCache(object): 块缓存
+    CachedReader(object): 通过块缓存读取一个文件
+
+Attributes:
+    cache (BlockCache): 全局唯一的块缓存
+
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Event
+from pathlib import Path
+import os
+
+from .serverconfig import ServerConfig
+from .metrics import registry
+from .memstat import memory
+
+
+BLOCK_SIZE = 256 * 1024         # 块大小
+PROTECTED_RATIO = 0.8           # 保护段占缓存总大小的比例
+
+
+class BlockCache:
+    """块缓存
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()                                  # 保护以下所有状态
+        self.probation:OrderedDict[tuple, bytes] = OrderedDict()
+        self.protected:OrderedDict[tuple, bytes] = OrderedDict()
+        self.protected_size = 0
+        self.size = 0
+        self.loading:dict[tuple, list] = {}                 # 键 -> [完成事件, 数据]
+        self.pool = ThreadPoolExecutor(2, thread_name_prefix='Th_readahead')
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.disk_reads = 0
+        self.disk_bytes = 0
+        self.readahead = 0
+        self.evictions = 0
+        return
+
+    @property
+    def capacity(self) -> int:
+        return int(ServerConfig.CACHE['sizeMiB'] * 1024 * 1024)
+
+    def open(self, path:Path) -> 'CachedReader':
+        """打开一个文件
+
+        Args:
+            path (Path): 文件路径
+
+        Returns:
+            CachedReader: 读取对象
+        """
+        return CachedReader(self, path)
+
+    def get(self, f:'CachedReader', key:tuple, prefetch:bool = False) -> bytes:
+        """获取一个块
+
+        Args:
+            f (CachedReader): 已打开的文件
+            key (tuple): (设备, inode, 修改时间, 块号)
+            prefetch (bool, optional): 是否为预读. Defaults to False.
+
+        Returns:
+            bytes: 块的数据，文件末尾的块可能不足一个块大小
+        """
+        while True:
+            with self.lock:
+                data = self.__lookup(key)
+                if data is not None:
+                    if not prefetch:
+                        self.hits += 1
+                    return data
+                slot = self.loading.get(key)
+                owner = slot is None
+                if owner:
+                    slot = self.loading[key] = [Event(), None]
+                    if prefetch:
+                        self.readahead += 1
+                    else:
+                        self.misses += 1
+                elif not prefetch:
+                    self.hits += 1          # 等待其他线程的读取结果，同样没有读取硬盘
+            if not owner:
+                slot[0].wait()
+                if slot[1] is not None:
+                    return slot[1]
+                continue                    # 其他线程读取失败，重新尝试
+            try:
+                data = self.read_block(f, key[3])
+                slot[1] = data
+                with self.lock:
+                    self.__insert(key, data)
+                return data
+            finally:
+                with self.lock:
+                    del self.loading[key]
+                slot[0].set()
+
+    def prefetch(self, f:'CachedReader', keys:list[tuple]) -> None:
+        """在后台预读多个块，已缓存或正在读取的块跳过
+
+        每个预读任务持有文件的一个引用，文件在预读完成后才真正关闭
+        """
+        with self.lock:
+            keys = [k for k in keys if k not in self.probation and k not in self.protected and k not in self.loading]
+        for k in keys:
+            if not f.acquire():     # 文件已经关闭
+                break
+            self.pool.submit(self.__prefetch_one, f, k)
+        return
+
+    def stats(self) -> dict:
+        """获取统计数据
+
+        Returns:
+            dict: 命中次数、未命中次数、命中率、硬盘读取次数和字节数、预读次数、淘汰次数、已用大小
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / total if total else 0.0,
+                'diskReads': self.disk_reads,
+                'diskBytes': self.disk_bytes,
+                'readahead': self.readahead,
+                'evictions': self.evictions,
+                'size': self.size,
+                'capacity': self.capacity,
+            }
+
+    def clear(self) -> None:
+        """清空缓存
+        """
+        with self.lock:
+            self.probation.clear()
+            self.protected.clear()
+            self.size = self.protected_size = 0
+        return
+
+    def __prefetch_one(self, f:'CachedReader', key:tuple) -> None:
+        try:
+            self.get(f, key, True)
+        except OSError:
+            pass
+        finally:
+            f.release()
+        return
+
+    def read_block(self, f:'CachedReader', idx:int) -> bytes:
+        """不经过缓存，直接从硬盘读取一个块
+        """
+        data = f.pread(idx * BLOCK_SIZE, BLOCK_SIZE)
+        with self.lock:
+            self.disk_reads += 1
+            self.disk_bytes += len(data)
+        return data
+
+    def __lookup(self, key:tuple) -> bytes|None:
+        """查找一个块并更新淘汰顺序，调用时需要持有锁
+        """
+        data = self.protected.get(key)
+        if data is not None:
+            self.protected.move_to_end(key)
+            return data
+        data = self.probation.pop(key, None)
+        if data is not None:
+            # 再次命中，从试用段升入保护段，保护段超出比例时将最久未使用的块降回试用段
+            self.protected[key] = data
+            self.protected_size += len(data)
+            while self.protected_size > self.capacity * PROTECTED_RATIO and len(self.protected) > 1:
+                k, v = self.protected.popitem(last=False)
+                self.protected_size -= len(v)
+                self.probation[k] = v
+        return data
+
+    def __insert(self, key:tuple, data:bytes) -> None:
+        """插入一个新读取的块，调用时需要持有锁
+        """
+        capacity = self.capacity
+        if len(data) > capacity:
+            return
+        self.probation[key] = data
+        self.size += len(data)
+        while self.size > capacity:
+            if self.probation:
+                _, v = self.probation.popitem(last=False)
+            else:
+                _, v = self.protected.popitem(last=False)
+                self.protected_size -= len(v)
+            self.size -= len(v)
+            self.evictions += 1
+        return
+
+
+class CachedReader:
+    """通过块缓存读取一个文件
+
+    提供与二进制文件对象相同的 `seek` / `read` 接口，每次 `read` 最多返回到当前块的末尾
+
+    文件只打开一次，所有块都通过该文件描述符按位置读取（`os.pread`），不移动文件指针，
+    读取线程与预读线程可以同时使用。描述符按引用计数关闭，见 `acquire` / `release`
+    """
+    def __init__(self, cache:BlockCache, path:Path) -> None:
+        self.fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            st = os.fstat(self.fd)
+        except OSError:
+            os.close(self.fd)
+            raise
+        self.cache = cache
+        self.path = path
+        self.base = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        self.file_size = st.st_size
+        self.pos = 0
+        self.last = -1          # 上一次读取的块号，用于检测顺序读取
+        self.lock = Lock()      # 保护引用计数，不支持 pread 的平台上同时保护文件指针
+        self.refs = 1           # 读取者自己持有一个引用，每个预读任务各持有一个
+        self.closed = False
+        return
+
+    def acquire(self) -> bool:
+        """增加一个引用，文件已经关闭时返回 False
+        """
+        with self.lock:
+            if self.refs == 0:
+                return False
+            self.refs += 1
+            return True
+
+    def release(self) -> None:
+        """减少一个引用，没有引用时关闭文件描述符
+        """
+        with self.lock:
+            self.refs -= 1
+            if self.refs == 0:
+                os.close(self.fd)
+        return
+
+    def pread(self, offset:int, size:int) -> bytes:
+        """从指定位置读取，只在文件末尾返回不足 size 的数据
+        """
+        parts = []
+        while size > 0:
+            if hasattr(os, 'pread'):
+                b = os.pread(self.fd, size, offset)
+            else:               # Windows
+                with self.lock:
+                    os.lseek(self.fd, offset, os.SEEK_SET)
+                    b = os.read(self.fd, size)
+            if not b:
+                break
+            parts.append(b)
+            offset += len(b)
+            size -= len(b)
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def seek(self, pos:int) -> int:
+        self.pos = pos
+        return pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def read(self, n:int = -1) -> bytes:
+        if self.pos >= self.file_size or n == 0:
+            return b''
+        idx, off = divmod(self.pos, BLOCK_SIZE)
+        if self.cache.capacity <= 0:
+            data = self.cache.read_block(self, idx)
+        else:
+            data = self.cache.get(self, self.base + (idx,))
+            if idx != self.last:
+                ahead = ServerConfig.CACHE['readAhead']
+                if ahead and (idx == self.last + 1 or self.last < 0):
+                    last = (self.file_size - 1) // BLOCK_SIZE
+                    self.cache.prefetch(self, [self.base + (i,) for i in range(idx + 1, min(idx + ahead, last) + 1)])
+                self.last = idx
+        end = len(data) if n < 0 else min(len(data), off + n)
+        if off == 0 and end == len(data):
+            retval = data
+        else:
+            retval = data[off:end]
+        self.pos += len(retval)
+        return retval
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.release()
+        return
+
+    def __enter__(self) -> 'CachedReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+        return
+
+
+cache = BlockCache()
+
+# 命中率等统计由块缓存自己维护，采集时读取
+registry.counter('fts_blockcache_requests_total', '块缓存的读取次数', ('result',),
+                 fn=lambda: (lambda s: {('hit',): s['hits'], ('miss',): s['misses']})(cache.stats()))
+registry.gauge('fts_blockcache_hit_ratio', '块缓存的命中率', fn=lambda: cache.stats()['hitRate'])
+registry.counter('fts_blockcache_disk_bytes_total', '块缓存从硬盘读取的字节数', fn=lambda: cache.stats()['diskBytes'])
+registry.counter('fts_blockcache_evictions_total', '块缓存淘汰的块数', fn=lambda: cache.stats()['evictions'])
+registry.gauge('fts_blockcache_bytes', '块缓存已用的大小', fn=lambda: cache.stats()['size'])
+memory.provide('blockcache', lambda: cache.stats()['size'])
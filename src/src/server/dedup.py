@@ -0,0 +1,74 @@
+""" 去重上传模块
+
+客户端上传前先发送文件的 sha256（`putFileByHash`），共享文件夹中已有相同内容的文件时，
+服务端直接由已有的文件生成目标文件，不需要传输数据，一次往返即可完成上传
+
+内容的查找依靠哈希索引 `src.server.hashindex.index`，未启用索引时总是需要完整上传。
+生成目标文件的方式依次尝试：
+
+1. 硬链接：不占用额外空间。服务端的所有写入都是先写临时文件再替换，不会通过一个链接修改另一个文件。
+   客户端要求的修改时间与已有文件不同时不使用硬链接，否则会同时修改已有文件的修改时间
+2. reflink（`src.server.fileops.reflink`）：共享数据块，与文件大小无关
+
+两种方式都不可用时不复制数据，客户端改为完整上传。去重上传在工作者线程中完成，
+不能在这里执行与文件大小成正比的复制，否则大文件会阻塞控制连接，并且客户端超时后改为完整上传时复制仍在进行
+
+Functions:
+    link_content: 由内容相同的已有文件生成目标文件
+
+"""
+
+from pathlib import Path
+import os
+
+from .hashindex import index
+from .hashcache import hashes, stat_key
+from .fileops import reflink
+from .staging import temp_for
+
+
+def link_content(digest:str, size:int, dst:Path, mtime:float|None = None) -> Path|None:
+    """由内容相同的已有文件生成目标文件
+
+    Args:
+        digest (str): 整个文件的 sha256
+        size (int): 文件大小
+        dst (Path): 目标文件路径，已存在时被替换
+        mtime (float | None, optional): 目标文件的修改时间. Defaults to None.
+
+    Returns:
+        Path | None: 使用的已有文件，没有内容相同的文件或者无法链接时为 None
+    """
+    for src, key, leaves in index.find(digest, size):
+        try:
+            st = os.stat(src)
+        except OSError:
+            continue
+        if stat_key(st) != key:     # 记录已过期
+            continue
+        try:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            tmp = temp_for(dst)
+        except OSError:         # 目标的上级路径是文件等，客户端的完整上传会得到同样的错误
+            return None
+        try:
+            linked = False
+            if mtime is None or abs(st.st_mtime - mtime) < 1e-6:
+                tmp.unlink()    # 硬链接需要目标不存在，临时文件名只有该线程使用
+                try:
+                    os.link(src, tmp)
+                    linked = True
+                except OSError:     # 文件系统不支持硬链接，或者跨文件系统
+                    pass
+            if not linked and not reflink(src, tmp):
+                tmp.unlink(missing_ok=True)
+                continue
+            if mtime is not None:
+                os.utime(tmp, (mtime, mtime))
+            os.replace(tmp, dst)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            continue
+        hashes.put(dst, stat_key(dst.stat()), leaves, digest)
+        return src
+    return None
@@ -0,0 +1,341 @@
+""" 文件管理模块
+
+在服务端直接执行复制、移动和删除，数据不经过客户端
+
+- 移动在同一文件系统内只是重命名，与目录大小无关；跨文件系统时改为复制后删除
+- 复制依次尝试 reflink（共享数据块）、`os.copy_file_range`（在内核中复制）和普通复制，保留修改时间
+- 移动后哈希索引中的记录随之改名，复制的文件直接沿用源文件的哈希，不需要重新计算
+- 复制先在目标旁边的临时位置生成完整的文件或目录树，再替换目标；覆盖时原来的目标先改名到旁边，
+  替换成功后才删除，操作中途失败时目标保持不变
+
+每个操作由一个文件操作线程 `Th_fileOp` 执行。工作者线程最多等待 `OP_WAIT` 秒，
+操作已完成时直接返回结果，否则返回操作编号，客户端通过 `fileOpStatus` 查询进度
+
+Classes:
+    Th_fileOp(Thread): 文件操作线程
+    FileOps(object): 文件操作的登记表
+
+Functions:
+    reflink: 用 reflink 复制一个文件，只共享数据块，不复制数据
+    copy_file: 复制一个文件，尽量不在用户态搬运数据
+    discard: 删除一个文件或整个目录
+
+Attributes:
+    ops (FileOps): 全局唯一的文件操作登记表
+
+"""
+
+from typing import override, Literal
+from threading import Thread, Lock, Event
+from pathlib import Path
+import itertools
+import shutil
+import errno
+import os
+
+try:
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+
+from .serverconfig import ServerConfig
+from .hashindex import index
+from .hashcache import stat_key
+from .staging import temp_name, temp_for, temp_dir_for
+
+
+FICLONE = 0x40049409        # linux/fs.h
+COPY_STEP = 64 * 1024 * 1024    # copy_file_range 每次复制的字节数
+OP_WAIT = 1.0               # 工作者线程等待操作完成的时间（秒）
+MAX_FINISHED = 64           # 最多保留的已结束操作数
+
+
+def reflink(src:Path, dst:Path) -> bool:
+    """用 reflink 复制一个文件，与文件大小无关，立即完成
+
+    Args:
+        src (Path): 源文件
+        dst (Path): 目标文件，已存在时被覆盖
+
+    Returns:
+        bool: 是否成功，文件系统不支持时为 False
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+
+
+def copy_file(src:Path, dst:Path) -> None:
+    """复制一个文件，尽量不在用户态搬运数据
+
+    依次尝试 reflink、`os.copy_file_range` 和 `shutil.copyfile`，不复制修改时间
+
+    Args:
+        src (Path): 源文件
+        dst (Path): 目标文件，已存在时被覆盖
+    """
+    if reflink(src, dst):
+        return
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                while os.copy_file_range(s.fileno(), d.fileno(), COPY_STEP):
+                    pass
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    shutil.copyfile(src, dst)
+    return
+
+
+def discard(path:Path) -> None:
+    """删除一个文件或整个目录，不存在时忽略
+
+    Args:
+        path (Path): 文件或目录，符号链接只删除链接本身
+    """
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+    return
+
+
+class Th_fileOp(Thread):
+    """文件操作线程
+
+    执行一个复制、移动或删除操作，记录进度
+    """
+    @override
+    def __init__(self, id:int, op:Literal['copy', 'move', 'delete'], src:Path, dst:Path|None = None, overwrite:bool = False,
+                 user:str = '') -> None:
+        """重写初始化方法
+
+        Args:
+            id (int): 操作编号
+            op (Literal[&#39;copy&#39;, &#39;move&#39;, &#39;delete&#39;]): 操作类型
+            src (Path): 源文件或目录
+            dst (Path | None, optional): 目标路径，删除时为 None. Defaults to None.
+            overwrite (bool, optional): 目标已存在时是否覆盖. Defaults to False.
+            user (str, optional): 请求操作的用户，只有该用户可以查询进度. Defaults to ''.
+        """
+        super().__init__(None, None, f'Th_fileOp-{id}', daemon=True)
+        self.id = id
+        self.op = op
+        self.src = src
+        self.dst = dst
+        self.overwrite = overwrite
+        self.user = user
+        self.finished = Event()
+        self.files_total = self.bytes_total = 0
+        self.files_done = self.bytes_done = 0
+        self.error:str|None = None
+        return
+
+    def status(self) -> list:
+        """操作的进度
+
+        Returns:
+            list: [状态('running'/'done'/'failed'), 已完成文件数, 总文件数, 已完成字节数, 总字节数, 错误信息]
+        """
+        state = 'running' if not self.finished.is_set() else 'failed' if self.error else 'done'
+        return [state, self.files_done, self.files_total, self.bytes_done, self.bytes_total, self.error]
+
+    @override
+    def run(self) -> None:
+        try:
+            if self.op == 'delete':
+                self.count(self.src)
+                self.delete(self.src)
+            elif self.op == 'move':
+                self.move()
+            else:
+                self.count(self.src)
+                self.replace_dst(self.stage(self.src))
+        except OSError as e:
+            self.error = str(e)
+            ServerConfig.log.warning(f'文件操作[{self.id}] {self.op} [{self.src}] 失败 {e}')
+        except Exception as e:
+            self.error = repr(e)
+            ServerConfig.log.exception(f'文件操作[{self.id}] {self.op} [{self.src}] 出现意外错误')
+        finally:
+            self.finished.set()
+        return
+
+    def count(self, path:Path) -> None:
+        if path.is_file():
+            self.files_total, self.bytes_total = 1, path.stat().st_size
+            return
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    self.bytes_total += os.stat(os.path.join(root, name)).st_size
+                    self.files_total += 1
+                except OSError:
+                    pass
+        return
+
+    def replace_dst(self, new:Path) -> None:
+        """用 new 替换目标，哈希索引中 new 的记录随之改名
+
+        已存在的目标先改名到旁边，替换失败时改回；替换成功后才删除原来的目标
+
+        Args:
+            new (Path): 替换目标的文件或目录，与目标在同一文件系统中
+        """
+        old = None
+        if self.overwrite and (self.dst.exists() or self.dst.is_symlink()):
+            old = temp_name(self.dst)
+            os.rename(self.dst, old)
+        try:
+            os.replace(new, self.dst)
+        except OSError:
+            if old is not None:
+                os.rename(old, self.dst)
+            raise
+        index.move(new, self.dst)
+        if old is not None:
+            try:
+                discard(old)
+            except OSError as e:
+                ServerConfig.log.warning(f'文件操作[{self.id}] 删除被覆盖的 [{old}] 失败 {e}')
+        return
+
+    def delete(self, path:Path) -> None:
+        if not path.is_dir() or path.is_symlink():
+            self.bytes_done += path.stat().st_size
+            path.unlink()
+            self.files_done += 1
+        else:
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    p = os.path.join(root, name)
+                    self.bytes_done += os.stat(p).st_size
+                    os.unlink(p)
+                    self.files_done += 1
+                for name in dirs:
+                    os.rmdir(os.path.join(root, name))
+            path.rmdir()
+        index.forget(path)
+        return
+
+    def move(self) -> None:
+        self.files_total = 1
+        self.dst.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.replace_dst(self.src)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # 跨文件系统，改为复制后删除
+            self.files_total = 0
+            self.count(self.src)
+            self.replace_dst(self.stage(self.src))
+            self.delete(self.src)
+            return
+        self.files_done = 1
+        return
+
+    def stage(self, src:Path) -> Path:
+        """把源文件或目录复制到目标旁边的临时位置
+
+        Args:
+            src (Path): 源文件或目录
+
+        Raises:
+            FileNotFoundError: 源文件或目录不存在
+
+        Returns:
+            Path: 临时文件或目录，复制失败时已删除
+        """
+        self.dst.parent.mkdir(parents=True, exist_ok=True)
+        if src.is_file():
+            tmp = temp_for(self.dst)
+        elif src.is_dir():
+            tmp = temp_dir_for(self.dst)
+        else:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(src))
+        try:
+            self.copy(src, tmp)
+        except BaseException:
+            discard(tmp)
+            index.forget(tmp)
+            raise
+        return tmp
+
+    def copy(self, src:Path, dst:Path) -> None:
+        if not src.is_dir():
+            self.copy_one(src, dst)
+            return
+
+        def fail(e:OSError):
+            raise e
+
+        for root, dirs, files in os.walk(src, onerror=fail):
+            rel = Path(root).relative_to(src)
+            dst.joinpath(rel).mkdir(exist_ok=True)
+            for name in files:
+                self.copy_one(Path(root, name), dst.joinpath(rel, name))
+        return
+
+    def copy_one(self, src:Path, dst:Path) -> None:
+        """复制一个文件到临时位置中，并沿用源文件在哈希索引中的记录
+        """
+        st = src.stat()
+        copy_file(src, dst)
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        found = index.lookup(src, stat_key(st))
+        if found is not None:
+            index.put(dst, stat_key(dst.stat()), found[2], found[0])
+        self.files_done += 1
+        self.bytes_done += st.st_size
+        return
+
+
+class FileOps:
+    """文件操作的登记表
+
+    保留最近结束的 `MAX_FINISHED` 个操作供客户端查询结果
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.ids = itertools.count(1)
+        self.ops:dict[int, Th_fileOp] = {}
+        return
+
+    def start(self, op:Literal['copy', 'move', 'delete'], src:Path, dst:Path|None = None, overwrite:bool = False,
+              user:str = '') -> Th_fileOp:
+        """开始一个文件操作
+
+        Args:
+            op (Literal[&#39;copy&#39;, &#39;move&#39;, &#39;delete&#39;]): 操作类型
+            src (Path): 源文件或目录
+            dst (Path | None, optional): 目标路径. Defaults to None.
+            overwrite (bool, optional): 目标已存在时是否覆盖. Defaults to False.
+            user (str, optional): 请求操作的用户. Defaults to ''.
+
+        Returns:
+            Th_fileOp: 已启动的文件操作线程
+        """
+        with self.lock:
+            th = Th_fileOp(next(self.ids), op, src, dst, overwrite, user)
+            self.ops[th.id] = th
+            finished = [i for i, t in self.ops.items() if t.finished.is_set()]
+            for i in finished[:max(0, len(finished) - MAX_FINISHED)]:
+                del self.ops[i]
+        th.start()
+        return th
+
+    def get(self, id:int) -> Th_fileOp|None:
+        with self.lock:
+            return self.ops.get(id)
+
+
+ops = FileOps()
@@ -0,0 +1,171 @@
+""" 文件哈希缓存模块
+
+缓存共享文件的 Merkle 叶子（每块的 sha256），供 `getFileHash` 和群集下载使用
+
+- 键为文件路径，同时记录 `(设备, inode, 修改时间, 大小)`，文件被修改后重新计算
+- 内存中没有时先查询持久的哈希索引 `src.server.hashindex.index`，新计算的结果也写入索引
+- 完整发送或接收一个文件时，文件传输线程顺便计算叶子并放入缓存，之后的查询不需要再读取硬盘
+- 最多缓存 `MAX_ENTRIES` 个文件，超出时淘汰最久未使用的
+- 需要读取文件计算时在单独的线程中进行，工作者线程最多等待指定的时间，不会长时间阻塞控制连接。
+  同一个文件同时只计算一次，同时计算的文件数不超过 `MAX_JOBS`
+
+Classes:
+    Th_hashFile(Thread): 在后台计算一个文件的叶子的线程
+    HashCache(object): 文件哈希缓存
+
+Attributes:
+    hashes (HashCache): 全局唯一的文件哈希缓存
+
+"""
+
+from typing import override
+from collections import OrderedDict
+from threading import Thread, Lock, Event
+from pathlib import Path
+import sys
+import os
+
+from ..globals.merkle import chunk_size_for, file_leaves
+from .hashindex import index
+from .metrics import HASH_LOOKUPS
+from .memstat import memory
+
+
+MAX_ENTRIES = 1024
+MAX_JOBS = 4                # 同时在后台计算的文件数上限
+
+
+def stat_key(st:os.stat_result) -> tuple:
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class Th_hashFile(Thread):
+    """在后台计算一个文件的叶子的线程
+
+    完成后放入缓存并设置 `done`，出错时记录在 `error` 中
+    """
+    @override
+    def __init__(self, cache:'HashCache', path:Path, key:tuple, size:int) -> None:
+        super().__init__(None, None, 'Th_hashFile', daemon=True)
+        self.cache = cache
+        self.path = path
+        self.key = key
+        self.size = size
+        self.leaves:list[str]|None = None
+        self.error:OSError|None = None
+        self.done = Event()
+        return
+
+    @override
+    def run(self) -> None:
+        try:
+            self.leaves = file_leaves(self.path, self.size)
+            self.cache.put(self.path, self.key, self.leaves)
+            HASH_LOOKUPS.inc(1, 'computed')
+        except OSError as e:        # 文件在计算期间被删除等
+            self.error = e
+        finally:
+            self.cache.finished(self)
+            self.done.set()
+        return
+
+
+class HashCache:
+    """文件哈希缓存
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.entries:OrderedDict[Path, tuple[tuple, list[str]]] = OrderedDict()    # 文件 -> (文件标识, 叶子)
+        self.jobs:dict[Path, Th_hashFile] = {}      # 正在后台计算的文件
+        return
+
+    def get(self, path:Path, wait:float|None = None) -> tuple[int, int, list[str]]|None:
+        """获取文件的叶子
+
+        依次查询内存中的缓存和哈希索引，都没有时在后台线程中读取整个文件计算
+
+        Args:
+            path (Path): 文件路径
+            wait (float | None, optional): 需要计算时最多等待的时间（秒），None 表示等待计算完成。
+                超时后计算继续进行，完成后放入缓存. Defaults to None.
+
+        Raises:
+            OSError: 文件不存在或者读取失败
+
+        Returns:
+            tuple[int, int, list[str]] | None: (文件大小, 块大小, 叶子)，等待超时或者后台计算已满时为 None
+        """
+        st = os.stat(path)
+        key = stat_key(st)
+        with self.lock:
+            cached = self.entries.get(path)
+            if cached and cached[0] == key:
+                self.entries.move_to_end(path)
+                HASH_LOOKUPS.inc(1, 'memory')
+                return (st.st_size, chunk_size_for(st.st_size), cached[1])
+        found = index.lookup(path, key)
+        if found is not None:
+            leaves = found[2]
+            self.__remember(path, key, leaves)
+            HASH_LOOKUPS.inc(1, 'index')
+            return (st.st_size, chunk_size_for(st.st_size), leaves)
+        with self.lock:
+            job = self.jobs.get(path)
+            if job is None or job.key != key:
+                if len(self.jobs) >= MAX_JOBS:
+                    return None
+                job = self.jobs[path] = Th_hashFile(self, path, key, st.st_size)
+                job.start()
+        if not job.done.wait(wait):
+            return None
+        if job.error is not None:
+            raise job.error
+        return (st.st_size, chunk_size_for(st.st_size), job.leaves)
+
+    def finished(self, job:Th_hashFile) -> None:
+        """后台计算结束，由计算线程调用
+        """
+        with self.lock:
+            if self.jobs.get(job.path) is job:
+                del self.jobs[job.path]
+        return
+
+    def cached(self, path:Path, key:tuple) -> bool:
+        """缓存中是否有文件当前版本的叶子
+        """
+        with self.lock:
+            cached = self.entries.get(path)
+            return cached is not None and cached[0] == key
+
+    def put(self, path:Path, key:tuple, leaves:list[str], digest:str|None = None) -> None:
+        """放入文件的叶子
+
+        Args:
+            path (Path): 文件路径
+            key (tuple): 计算叶子时文件的 `(设备, inode, 修改时间, 大小)`
+            leaves (list[str]): 叶子
+            digest (str | None, optional): 已知的整个文件的 sha256，未知时由哈希索引稍后计算. Defaults to None.
+        """
+        self.__remember(path, key, leaves)
+        index.put(path, key, leaves, digest)
+        return
+
+    def nbytes(self) -> int:
+        """估计缓存的叶子占用的内存，同一个文件的叶子长度相同，只计算第一个
+        """
+        with self.lock:
+            lists = [leaves for _, leaves in self.entries.values()]
+        return sum(sys.getsizeof(l) + (len(l) * sys.getsizeof(l[0]) if l else 0) for l in lists)
+
+    def __remember(self, path:Path, key:tuple, leaves:list[str]) -> None:
+        with self.lock:
+            self.entries[path] = (key, leaves)
+            self.entries.move_to_end(path)
+            while len(self.entries) > MAX_ENTRIES:
+                self.entries.popitem(last=False)
+        return
+
+
+hashes = HashCache()
+
+memory.provide('hashcache', hashes.nbytes)
@@ -0,0 +1,396 @@
+""" 哈希索引模块
+
+在 sqlite 数据库中持久保存共享文件夹中每个文件的哈希，服务端重启后不需要重新计算：
+
+    路径 -> (设备, inode, 大小, 修改时间, 整个文件的 sha256, 块大小, Merkle 叶子)
+
+- 索引线程 `Th_indexer` 定期遍历 `ServerConfig.SHARE_DIR`，只重新计算新增或改变的文件，删除已不存在的文件
+- 哈希在进程池中计算，子进程降低 CPU 和 I/O 优先级（安装了 psutil 时设置 I/O 优先级），不影响文件传输
+- 文件上传完成后由文件传输线程通知索引，优先处理
+- `lookup` 通过主键查询，文件的 `(设备, inode, 修改时间, 大小)` 与记录不一致时视为没有记录
+- `find` 按 sha256 查找内容相同的文件，供去重上传使用
+- 服务端移动、删除文件时通过 `move` 和 `forget` 同步更新记录
+
+配置取自 `ServerConfig.INDEX`，`enable` 为 False 时不使用索引，所有哈希按需计算
+
+Classes:
+    HashIndex(object): 哈希索引
+
+Functions:
+    hash_file: 计算一个文件的 sha256 和 Merkle 叶子，在子进程中执行
+
+Attributes:
+    index (HashIndex): 全局唯一的哈希索引
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from threading import Thread, Lock, Event
+from pathlib import Path
+import multiprocessing
+import hashlib
+import sqlite3
+import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from ..globals.merkle import chunk_size_for
+from .serverconfig import ServerConfig
+from .staging import is_temp
+
+
+NICE = 10                   # 子进程的 CPU 优先级（nice 值）
+READ_SIZE = 1024 * 1024
+COMMIT_EVERY = 64           # 每写入该数量的记录提交一次
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,
+    digest TEXT, chunk INTEGER, leaves BLOB
+);
+CREATE INDEX IF NOT EXISTS files_digest ON files (digest);
+'''
+
+
+def _lower_priority() -> None:
+    """进程池子进程的初始化函数，降低 CPU 和 I/O 优先级
+    """
+    try:
+        if hasattr(os, 'nice'):
+            os.nice(NICE)
+        if psutil is not None:
+            p = psutil.Process()
+            if hasattr(psutil, 'IOPRIO_CLASS_IDLE'):
+                p.ionice(psutil.IOPRIO_CLASS_IDLE)
+            elif hasattr(psutil, 'IOPRIO_VERYLOW'):
+                p.ionice(psutil.IOPRIO_VERYLOW)
+    except OSError:
+        pass
+    return
+
+
+def hash_file(path:str) -> tuple[tuple, str, int, bytes]|None:
+    """计算一个文件的 sha256 和 Merkle 叶子，在子进程中执行
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        tuple[tuple, str, int, bytes] | None: ((设备, inode, 修改时间, 大小), 十六进制的 sha256, 块大小, 拼接的叶子)，
+            计算期间文件被修改或已被删除时为 None
+    """
+    try:
+        st = os.stat(path)
+        chunk = chunk_size_for(st.st_size)
+        whole = hashlib.sha256()
+        leaves = []
+        leaf = hashlib.sha256()
+        leaf_len = 0
+        with open(path, 'rb') as f:
+            while True:
+                buf = f.read(READ_SIZE)
+                if not buf:
+                    break
+                whole.update(buf)
+                mv = memoryview(buf)
+                while len(mv):
+                    take = min(chunk - leaf_len, len(mv))
+                    leaf.update(mv[:take])
+                    leaf_len += take
+                    mv = mv[take:]
+                    if leaf_len == chunk:
+                        leaves.append(leaf.digest())
+                        leaf = hashlib.sha256()
+                        leaf_len = 0
+        if leaf_len:
+            leaves.append(leaf.digest())
+        st2 = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    if key != (st2.st_dev, st2.st_ino, st2.st_mtime_ns, st2.st_size):
+        return None
+    return (key, whole.hexdigest(), chunk, b''.join(leaves))
+
+
+class HashIndex:
+    """哈希索引
+
+    数据库连接由索引线程和工作者线程共享，所有访问都需要持有锁
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.db:sqlite3.Connection|None = None
+        self.root:Path|None = None
+        self.pool:ProcessPoolExecutor|None = None
+        self.thread:Thread|None = None
+        self.wake = Event()
+        self.pending:set[Path] = set()      # 等待优先处理的文件
+        self.running = False
+        self.pending_writes = 0
+        return
+
+    # ---------------------------- 生命周期 ------------------------------
+
+    def start(self) -> None:
+        """打开数据库并启动索引线程，未启用或已经启动时直接返回
+        """
+        cfg = ServerConfig.INDEX
+        if not cfg['enable'] or self.running:
+            return
+        self.root = ServerConfig.SHARE_DIR
+        db = sqlite3.connect(cfg['path'], check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.executescript(SCHEMA)
+        row = db.execute("SELECT v FROM meta WHERE k='root'").fetchone()
+        if row is None or row[0] != str(self.root):
+            # 共享文件夹改变，旧的记录全部失效
+            db.execute('DELETE FROM files')
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (str(self.root),))
+        db.commit()
+        with self.lock:
+            self.db = db
+        # 使用 spawn 创建子进程，避免在多线程的进程中 fork
+        self.pool = ProcessPoolExecutor(cfg['workers'], multiprocessing.get_context('spawn'), _lower_priority)
+        self.running = True
+        ServerConfig.log.info(f'哈希索引已启动 [{cfg["path"]}]')
+        self.thread = Thread(target=self.__run, name='Th_indexer', daemon=True)
+        self.thread.start()
+        return
+
+    def stop(self) -> None:
+        """停止索引线程并关闭数据库
+        """
+        if not self.running:
+            return
+        self.running = False
+        self.wake.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.thread.join()
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+        return
+
+    # ---------------------------- 查询与更新 ------------------------------
+
+    def rel(self, path:Path) -> str|None:
+        """文件在共享文件夹中的相对路径，不在共享文件夹中时为 None
+        """
+        if self.root is None:
+            return None
+        try:
+            return Path(path).relative_to(self.root).as_posix()
+        except ValueError:
+            return None
+
+    def lookup(self, path:Path, key:tuple) -> tuple[str|None, int, list[str]]|None:
+        """查询文件的哈希
+
+        Args:
+            path (Path): 文件路径
+            key (tuple): 文件当前的 `(设备, inode, 修改时间, 大小)`
+
+        Returns:
+            tuple[str | None, int, list[str]] | None: (sha256, 块大小, 叶子)，没有记录或记录已过期时为 None
+        """
+        rel = self.rel(path)
+        with self.lock:
+            if self.db is None or rel is None:
+                return None
+            row = self.db.execute('SELECT dev, ino, mtime_ns, size, digest, chunk, leaves FROM files WHERE path=?', (rel,)).fetchone()
+        if row is None or tuple(row[:4]) != tuple(key) or row[6] is None:
+            return None
+        leaves = row[6]
+        return (row[4], row[5], [leaves[i:i+32].hex() for i in range(0, len(leaves), 32)])
+
+    def find(self, digest:str, size:int) -> list[tuple[Path, tuple, list[str]]]:
+        """按内容查找文件
+
+        调用者需要用文件当前的 `(设备, inode, 修改时间, 大小)` 与记录比较，确认记录没有过期
+
+        Args:
+            digest (str): 整个文件的 sha256
+            size (int): 文件大小
+
+        Returns:
+            list[tuple[Path, tuple, list[str]]]: [(文件路径, 记录的文件标识, 叶子)]
+        """
+        with self.lock:
+            if self.db is None:
+                return []
+            rows = self.db.execute('SELECT path, dev, ino, mtime_ns, size, leaves FROM files WHERE digest=? AND size=?',
+                                   (digest, size)).fetchall()
+        return [(self.root.joinpath(r[0]), tuple(r[1:5]), [r[5][i:i+32].hex() for i in range(0, len(r[5]), 32)])
+                for r in rows]
+
+    def put(self, path:Path, key:tuple, leaves:list[str], digest:str|None = None) -> None:
+        """写入文件的哈希
+
+        没有整个文件的 sha256 时，通知索引线程稍后补齐
+
+        Args:
+            path (Path): 文件路径
+            key (tuple): 计算哈希时文件的 `(设备, inode, 修改时间, 大小)`
+            leaves (list[str]): 十六进制的叶子
+            digest (str | None, optional): 整个文件的 sha256. Defaults to None.
+        """
+        rel = self.rel(path)
+        if rel is None:
+            return
+        self.__write(rel, key, digest, chunk_size_for(key[3]), b''.join(bytes.fromhex(h) for h in leaves))
+        if digest is None:
+            self.notify(path)
+        return
+
+    def move(self, src:Path, dst:Path) -> None:
+        """文件或目录改名后，把其中全部文件的记录随之改名
+
+        改名不改变 inode 和修改时间，记录仍然有效
+        """
+        old, new = self.rel(src), self.rel(dst)
+        if old is None or new is None:
+            return
+        with self.lock:
+            if self.db is None:
+                return
+            self.db.execute('DELETE FROM files WHERE path=? OR substr(path, 1, ?)=?', (new, len(new) + 1, new + '/'))
+            self.db.execute('UPDATE files SET path=? || substr(path, ?) WHERE path=? OR substr(path, 1, ?)=?',
+                            (new, len(old) + 1, old, len(old) + 1, old + '/'))
+            self.db.commit()
+        return
+
+    def forget(self, path:Path) -> None:
+        """删除文件或目录中全部文件的记录
+        """
+        rel = self.rel(path)
+        if rel is None:
+            return
+        with self.lock:
+            if self.db is None:
+                return
+            if rel == '.':
+                self.db.execute('DELETE FROM files')
+            else:
+                self.db.execute('DELETE FROM files WHERE path=? OR substr(path, 1, ?)=?', (rel, len(rel) + 1, rel + '/'))
+            self.db.commit()
+        return
+
+    def notify(self, path:Path) -> None:
+        """通知索引线程优先处理一个文件
+        """
+        if self.running:
+            with self.lock:
+                self.pending.add(Path(path))
+            self.wake.set()
+        return
+
+    def __write(self, rel:str, key:tuple, digest:str|None, chunk:int, leaves:bytes) -> None:
+        with self.lock:
+            if self.db is None:
+                return
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (rel, key[0], key[1], key[3], key[2], digest, chunk, leaves))
+            self.pending_writes += 1
+            if self.pending_writes >= COMMIT_EVERY:
+                self.db.commit()
+                self.pending_writes = 0
+        return
+
+    # ---------------------------- 索引线程 ------------------------------
+
+    def __run(self) -> None:
+        while self.running:
+            with self.lock:
+                pending, self.pending = self.pending, set()
+            if pending:
+                self.__update(pending)
+            else:
+                self.__scan()
+            with self.lock:
+                if self.db is not None:
+                    self.db.commit()
+                    self.pending_writes = 0
+            if not self.pending:
+                self.wake.wait(ServerConfig.INDEX['scanInterval'])
+            self.wake.clear()
+        return
+
+    def __scan(self) -> None:
+        """遍历共享文件夹，更新改变的文件，删除已不存在的文件
+        """
+        with self.lock:
+            if self.db is None:
+                return
+            known = {r[0]: (r[1], r[2], r[4], r[3], r[5]) for r in
+                     self.db.execute('SELECT path, dev, ino, size, mtime_ns, digest FROM files')}
+        changed = []
+        stack = ['']
+        while stack and self.running:
+            rel = stack.pop()
+            try:
+                it = os.scandir(self.root.joinpath(rel))
+            except OSError:
+                continue
+            with it:
+                for e in it:
+                    if is_temp(e.name):     # 正在写入的临时文件
+                        continue
+                    rpath = rel + e.name
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(rpath + '/')
+                    elif e.is_file():
+                        try:
+                            st = os.stat(e.path)
+                        except OSError:
+                            continue
+                        old = known.pop(rpath, None)
+                        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+                        if old is None or old[:4] != key or old[4] is None:
+                            changed.append(Path(e.path))
+        if not self.running:
+            return
+        with self.lock:
+            if self.db is not None and known:
+                self.db.executemany('DELETE FROM files WHERE path=?', [(p,) for p in known])
+        if changed:
+            ServerConfig.log.info(f'哈希索引：需要更新[{len(changed)}]个文件，已删除[{len(known)}]个记录')
+        self.__update(changed)
+        return
+
+    def __update(self, paths) -> None:
+        """在进程池中计算多个文件的哈希，同时进行的任务数不超过子进程数的两倍
+        """
+        limit = ServerConfig.INDEX['workers'] * 2
+        running:dict[Future, Path] = {}
+        paths = list(paths)
+        while (paths or running) and self.running:
+            while paths and len(running) < limit:
+                p = paths.pop()
+                try:
+                    running[self.pool.submit(hash_file, str(p))] = p
+                except RuntimeError:        # 进程池已关闭
+                    return
+            done, _ = wait(running, timeout=1, return_when=FIRST_COMPLETED)
+            for fut in done:
+                p = running.pop(fut)
+                try:
+                    r = fut.result()
+                except Exception as e:
+                    ServerConfig.log.warning(f'哈希索引：计算失败 [{p}] {e}')
+                    continue
+                rel = self.rel(p)
+                if r is not None and rel is not None:
+                    key, digest, chunk, leaves = r
+                    self.__write(rel, key, digest, chunk, leaves)
+        return
+
+
+index = HashIndex()
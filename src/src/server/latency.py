@@ -0,0 +1,209 @@
+""" 请求延迟模块
+
+记录每个命令从接收线程收到请求到发送线程发出响应的时间，分为三段：
+
+- queue: 在接收队列中等待工作者线程处理
+- handler: 工作者线程处理（包括询问 Master）
+- send: 在发送队列中等待并发送
+
+每个命令的每一段以及总时间分别记录到 HDR 风格的直方图中，相对误差不超过 1/`SUB_BUCKETS`，
+分位数通过运行指标的 `fts_request_latency_seconds` 提供。
+总时间超过 `ServerConfig.SLOW_LOG['thresholdMs']` 的请求以一行 json 写入慢请求日志
+
+Classes:
+    LatencyHistogram(object): HDR 风格的直方图
+    RequestLatency(object): 每个命令的延迟统计和慢请求日志
+
+Functions:
+    summarize_args: 请求参数的摘要
+
+Attributes:
+    latency (RequestLatency): 全局唯一的延迟统计
+
+"""
+
+from threading import Lock
+import logging
+import json
+import time
+
+from .serverconfig import ServerConfig
+from .metrics import registry
+from .asynclog import log_pipeline, RotatingLogFile
+
+
+SUB_BITS = 5
+SUB_BUCKETS = 1 << SUB_BITS     # 每个 2 的幂区间内的线性桶数
+UNIT = 1e-6                     # 记录的最小单位（秒）
+PHASES = ('queue', 'handler', 'send', 'total')
+QUANTILES = (50, 90, 99, 99.9)
+ARG_MAX = 64                    # 摘要中每个字符串参数保留的长度
+
+
+class LatencyHistogram:
+    """HDR 风格的直方图
+
+    值以 `UNIT` 为单位取整，小于 2*`SUB_BUCKETS` 的值精确记录，
+    更大的值按 2 的幂分段，每段等分为 `SUB_BUCKETS` 个桶。桶数随最大值按对数增长，1 小时约 900 个
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.counts:list[int] = []
+        self.total = 0
+        self.max = 0.0
+        return
+
+    @staticmethod
+    def index(t:int) -> int:
+        if t < 2 * SUB_BUCKETS:
+            return t
+        e = t.bit_length() - SUB_BITS - 1
+        return (e + 1) * SUB_BUCKETS + (t >> e) - SUB_BUCKETS
+
+    @staticmethod
+    def lower(i:int) -> int:
+        """桶的下界（单位数）
+        """
+        if i < 2 * SUB_BUCKETS:
+            return i
+        e = i // SUB_BUCKETS - 1
+        return (i % SUB_BUCKETS + SUB_BUCKETS) << e
+
+    def record(self, seconds:float) -> None:
+        i = self.index(max(0, int(seconds / UNIT)))
+        with self.lock:
+            if i >= len(self.counts):
+                self.counts.extend([0] * (i + 1 - len(self.counts)))
+            self.counts[i] += 1
+            self.total += 1
+            if seconds > self.max:
+                self.max = seconds
+        return
+
+    def percentile(self, p:float) -> float:
+        """分位数（秒），取所在桶的上界，没有样本时为 0
+        """
+        with self.lock:
+            if not self.total:
+                return 0.0
+            rank = max(1, round(p / 100 * self.total))
+            seen = 0
+            for i, c in enumerate(self.counts):
+                seen += c
+                if seen >= rank:
+                    return min(self.max, self.lower(i + 1) * UNIT)
+        return self.max
+
+
+def summarize_args(args) -> str:
+    """请求参数的摘要，长字符串截断，长列表只保留长度
+    """
+    def short(a):
+        if isinstance(a, str):
+            return a if len(a) <= ARG_MAX else a[:ARG_MAX] + f'...({len(a)})'
+        if isinstance(a, (list, tuple)):
+            return [short(x) for x in a] if len(a) <= 8 else f'[{len(a)} items]'
+        return a
+    try:
+        return json.dumps(short(args), ensure_ascii=False)
+    except (TypeError, ValueError):
+        return repr(args)[:ARG_MAX * 4]
+
+
+class RequestLatency:
+    """每个命令的延迟统计和慢请求日志
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.hists:dict[tuple[str, str], LatencyHistogram] = {}     # (命令, 阶段) -> 直方图
+        self.slow_log:logging.Logger|None = None
+        self.slow_path:str|None = None
+        return
+
+    def __hist(self, cmd:str, phase:str) -> LatencyHistogram:
+        h = self.hists.get((cmd, phase))
+        if h is None:
+            with self.lock:
+                h = self.hists.setdefault((cmd, phase), LatencyHistogram())
+        return h
+
+    def record(self, cmd:str, user:str, addr:tuple, args, code:int,
+               t_recv:float, t_start:float, t_ret:float, t_sent:float) -> None:
+        """记录一个请求
+
+        Args:
+            cmd (str): 命令
+            user (str): 用户，未登录时为空
+            addr (tuple): 客户端地址
+            args: 请求参数，只在写入慢请求日志时使用
+            code (int): 状态码
+            t_recv (float): 接收线程收到请求的时间（`time.perf_counter`）
+            t_start (float): 工作者线程开始处理的时间
+            t_ret (float): 工作者线程放入发送队列的时间
+            t_sent (float): 发送线程发送完成的时间
+        """
+        phases = (t_start - t_recv, t_ret - t_start, t_sent - t_ret, t_sent - t_recv)
+        for phase, v in zip(PHASES, phases):
+            self.__hist(cmd, phase).record(v)
+        threshold = ServerConfig.SLOW_LOG['thresholdMs']
+        if threshold and phases[3] * 1000 >= threshold:
+            self.__write_slow({
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'user': user,
+                'addr': f'{addr[0]}:{addr[1]}',
+                'cmd': cmd,
+                'args': summarize_args(args[:1] if cmd == 'login' else args),     # 不记录密码
+                'code': code,
+                **{f'{p}_ms': round(v * 1000, 3) for p, v in zip(PHASES, phases)},
+                })
+        return
+
+    def __write_slow(self, entry:dict) -> None:
+        path = ServerConfig.SLOW_LOG['path']
+        if path != self.slow_path:          # 第一次写入或者路径被修改
+            with self.lock:
+                if path != self.slow_path:
+                    self.slow_log = self.__open(path)
+                    self.slow_path = path
+        line = json.dumps(entry, ensure_ascii=False)
+        if self.slow_log is not None:
+            self.slow_log.info(line)
+        else:
+            ServerConfig.log.warning(f'慢请求 {line}')
+        return
+
+    @staticmethod
+    def __open(path:str) -> logging.Logger|None:
+        """打开慢请求日志，路径为空时写入服务端日志
+        """
+        if not path:
+            return None
+        logger = logging.getLogger('fts.slow')
+        handler = RotatingLogFile.from_config(path)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        return log_pipeline.attach(logger, [handler])
+
+    def quantiles(self) -> dict[tuple, float]:
+        """各命令各阶段的分位数和最大值 {(命令, 阶段, 分位): 秒}
+        """
+        with self.lock:
+            items = list(self.hists.items())
+        retval = {}
+        for (cmd, phase), h in items:
+            for q in QUANTILES:
+                retval[(cmd, phase, f'{q / 100:g}')] = h.percentile(q)
+            retval[(cmd, phase, '1.0')] = h.max
+        return retval
+
+    def counts(self) -> dict[tuple, int]:
+        with self.lock:
+            return {(cmd,): h.total for (cmd, phase), h in self.hists.items() if phase == 'total'}
+
+
+latency = RequestLatency()
+
+registry.gauge('fts_request_latency_seconds', '请求各阶段延迟的分位数，quantile 为 1.0 时是最大值',
+               ('cmd', 'phase', 'quantile'), fn=latency.quantiles)
+registry.counter('fts_request_latency_count', '记录了延迟的请求数', ('cmd',), fn=latency.counts)
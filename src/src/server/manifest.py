@@ -0,0 +1,77 @@
+""" 文件清单模块
+
+生成共享文件夹中一个子目录的文件清单，用于客户端与服务端的目录同步
+
+清单中每一项为 `(相对路径, 文件大小, 修改时间, 哈希值)`，相对路径使用 / 分隔
+
+哈希值为整个文件的 sha256，只取自哈希索引，生成清单时不读取文件内容：
+索引中没有当前版本的记录时哈希值为 None，并通知索引线程优先计算，之后再次请求即可得到。
+客户端对哈希值为 None 的文件按大小和修改时间比较
+
+Functions:
+    build_manifest: 生成文件清单
+    digest: 从哈希索引中获取文件的哈希值
+
+"""
+
+import os
+from   pathlib import Path
+
+from   .hashindex import index
+from   .staging import is_temp
+
+
+def digest(path:str) -> str|None:
+    """从哈希索引中获取文件的 sha256 哈希值
+
+    没有记录时通知索引线程计算，不在调用线程中读取文件
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        str | None: 十六进制的哈希值，索引中没有当前版本的记录时为 None
+    """
+    st = os.stat(path)
+    found = index.lookup(Path(path), (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size))
+    if found is not None and found[0] is not None:
+        return found[0]
+    index.notify(Path(path))
+    return None
+
+
+def build_manifest(root:Path, with_hash:bool = False) -> list[tuple[str, int, float, str|None]]:
+    """生成文件清单
+
+    使用 os.scandir 遍历目录，文件的大小和修改时间直接取自目录项，不需要对每个文件单独 stat
+
+    Args:
+        root (Path): 需要生成清单的目录
+        with_hash (bool, optional): 是否附带文件的哈希值. Defaults to False.
+
+    Returns:
+        list[tuple[str, int, float, str | None]]: 文件清单
+    """
+    retval = []
+    stack = ['']
+    while stack:
+        rel = stack.pop()
+        try:
+            it = os.scandir(root.joinpath(rel))
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if is_temp(e.name):     # 正在写入的临时文件
+                    continue
+                rpath = rel + e.name
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(rpath + '/')
+                elif e.is_file():
+                    try:
+                        st = e.stat()
+                        h = digest(e.path) if with_hash else None
+                    except OSError:     # 遍历期间被删除或无法读取的文件不列出
+                        continue
+                    retval.append((rpath, st.st_size, st.st_mtime, h))
+    return retval
@@ -14,15 +14,21 @@ from typing import override, Dict, List, Tuple
 import time
 import logging
 from socket import socket
-from queue import Queue
-from threading import Thread, Event
+from queue import Queue, Full, Empty
+from threading import Thread, Event, active_count
 
 from ..globals import StatCode
 from .userinfo import UserInfo
 from .worker import Worker
 from .serverconfig import ServerConfig
+from .hashindex import index
+from .metrics import registry, metrics_server, CONNECTIONS, LOGINS, MASTER_LAG, CONTROL_EVENTS, REAPED
+from .memstat import memory, deep_size
 
 
+LOOP_SLEEP = 0.01           # Master 每次循环的休眠时间（秒）
+REAP_INTERVAL = 1           # 检查空闲连接的间隔（秒）
+
 
 class Th_listen(Thread):
     '''
@@ -83,7 +89,7 @@ class Master(Thread):
         self.__init_user_map(user_list)
 
         # 开始监听
-        ServerConfig.log.info(f'开始监听{bind_addr}')
+        ServerConfig.log.info('开始监听%s', bind_addr)
         self.addr = bind_addr
         self.s = socket()
         self.s.bind(self.addr)
@@ -95,6 +101,11 @@ class Master(Thread):
         
         self.msgBufs = Queue()
         self.msgBufr = Queue()
+
+        # 启动哈希索引
+        index.start()
+        self.__init_metrics()
+        metrics_server.start()
         ServerConfig.log.info(f'{"服务器初始化结束":^30}'.replace(' ', '-'))
         return
     
@@ -107,8 +118,14 @@ class Master(Thread):
         - 消息分发
         - 请求登录（防止多个账号同时登录）
         - 连接中断，请求资源清理
+        - 回收空闲和长时间不登录的连接
         '''
+        last = time.perf_counter()
+        next_reap = last + REAP_INTERVAL
         while self.running:
+            now = time.perf_counter()
+            MASTER_LAG.observe(max(0.0, now - last - LOOP_SLEEP))
+            last = now
             msg_list = []
             # 初始化服务器端消息
             while not self.msgBufs.empty():
@@ -119,7 +136,8 @@ class Master(Thread):
                 w = Worker(s)
                 w.start()
                 self.worker_map[addr] = w
-                ServerConfig.log.info(f'{addr} 已连接到服务器')
+                CONNECTIONS.inc()
+                ServerConfig.log.info('%s 已连接到服务器', addr)
             # 处理Worker的请求
             for addr,worker in self.worker_map.items():
                 while not worker.queue.empty():
@@ -130,22 +148,24 @@ class Master(Thread):
                     retval:list
                     if cmd == 'user':
                         if not args[0] in self.user_map.keys():
+                            LOGINS.inc(1, StatCode.ERR_USER_UNDEFINED)
                             retval.extend([StatCode.ERR_USER_UNDEFINED, None])
                             event.set()
-                            ServerConfig.log.warning(f'{worker.socket.getpeername()} 尝试登录到{args[0]}，已拒绝[无效用户名]')
+                            ServerConfig.log.warning('%s 尝试登录到%s，已拒绝[无效用户名]', worker.addr, args[0])
                             continue
                         user_info, w = self.user_map[args[0]]
                         if user_info.passwd != args[1]:
+                            LOGINS.inc(1, StatCode.ERR_PSWD_UNMATCH)
                             retval.extend([StatCode.ERR_PSWD_UNMATCH, None])
                             event.set()
-                            ServerConfig.log.warning(f'{worker.socket.getpeername()} 尝试登录到{args[0]}，已拒绝[密码错误]')
+                            ServerConfig.log.warning('%s 尝试登录到%s，已拒绝[密码错误]', worker.addr, args[0])
                             continue
-                        ServerConfig.log.info(f'{worker.socket.getpeername()} 已登录至 {args[0]}')
+                        ServerConfig.log.info('%s 已登录至 %s', worker.addr, args[0])
                         if w is not None and w.logined == True:
-                            ServerConfig.log.info(f'{w.socket.getpeername()} 已下线，由于{worker.socket.getpeername()}使用该用户{args[0]}登录')
+                            ServerConfig.log.info('%s 已下线，由于%s使用该用户%s登录', w.addr, worker.addr, args[0])
                             w.stop()
-                            continue
                         self.user_map[args[0]][1] = worker
+                        LOGINS.inc(1, StatCode.SUCCESS)
                         retval.extend([StatCode.SUCCESS, user_info])
                         event.set()
                         continue
@@ -158,6 +178,10 @@ class Master(Thread):
                         retval.extend([StatCode.ERR_NO_PERMISSION, None])
                         event.set()
                         continue
+            # 断开空闲的连接，线程在下面清理
+            if now >= next_reap:
+                next_reap = now + REAP_INTERVAL
+                self.__reap()
             # 给已登录的Worker分发消息，清理已停止的线程
             dead_workers = []
             for key, pare in self.user_map.items():
@@ -169,14 +193,14 @@ class Master(Thread):
                     continue
                 for i in msg_list:
                     if ServerConfig.PERMISSION['distributeMessage'] or i[0] == worker.userinfo.id or i[0] == 'SERVER':
-                        worker.msgbuf.put(i)
+                        self.__deliver(worker, i)
             self.worker_map = dict(filter(lambda k: k[1].is_alive(), list(self.worker_map.items())))
             for i in dead_workers:
                 self.user_map[i][1] = None
             for i in msg_list:
                 self.msgBufr.put(i)
             # 继续下一循环
-            time.sleep(0.01)
+            time.sleep(LOOP_SLEEP)
             continue
 
 
@@ -202,7 +226,9 @@ class Master(Thread):
         '''
         self.running = False
         self.s.close()
-        for i in self.worker_map.values():
+        index.stop()
+        metrics_server.stop()
+        for i in list(self.worker_map.values()):
             i.stop()
         while not self.accepted_socket.empty():
             t:tuple[socket, tuple] = self.accepted_socket.get()
@@ -211,6 +237,76 @@ class Master(Thread):
         return
     
 
+    def __init_metrics(self) -> None:
+        '''
+        内部方法，注册由 Master 维护的数值的指标，采集时读取
+        '''
+        def depths() -> dict[tuple, int]:
+            workers = list(self.worker_map.values())
+            return {
+                ('master',): sum(w.queue.qsize() for w in workers),
+                ('msgbuf',): sum(w.msgbuf.qsize() for w in workers),
+                ('rbuf',): sum(w.rbuf.qsize() for w in workers),
+                ('sbuf',): sum(w.sbuf.qsize() for w in workers),
+                }
+        registry.gauge('fts_connections', '当前的控制连接数', fn=lambda: len(self.worker_map))
+        registry.gauge('fts_users_online', '当前已登录的用户数',
+                       fn=lambda: sum(1 for _, w in list(self.user_map.values()) if w is not None and w.logined))
+        registry.gauge('fts_queue_depth', '所有工作者线程的队列中等待处理的数量之和', ('queue',), fn=depths)
+        registry.gauge('fts_threads', '进程中的线程数', fn=active_count)
+
+        def queued(name:str) -> int:
+            total = 0
+            for w in list(self.worker_map.values()):
+                q:Queue = getattr(w, name)
+                with q.mutex:
+                    items = list(q.queue)
+                total += deep_size(items)
+            return total
+        memory.provide('msgbuf', lambda: queued('msgbuf'))
+        memory.provide('rbuf', lambda: queued('rbuf'))
+        memory.provide('sbuf', lambda: sum(w.sbuf.nbytes for w in list(self.worker_map.values())))
+        return
+
+    def __reap(self) -> None:
+        '''
+        内部方法，断开超过 `ServerConfig.KEEPALIVE` 时限的连接：连接后长时间没有登录的，和长时间没有收到任何数据包的。
+        客户端在空闲时定期发送 `ping`，对方已经不在时连接会被这里回收
+        '''
+        login_timeout = ServerConfig.KEEPALIVE['loginTimeout']
+        idle_timeout = ServerConfig.KEEPALIVE['idleTimeout']
+        now = time.monotonic()
+        for worker in list(self.worker_map.values()):
+            if not worker.running:
+                continue
+            if login_timeout and not worker.logined and now - worker.t_connected > login_timeout:
+                REAPED.inc(1, 'nologin')
+                ServerConfig.log.info('%s 连接后[%s]秒没有登录，回收连接', worker.addr, login_timeout)
+            elif idle_timeout and worker.idle() > idle_timeout:
+                REAPED.inc(1, 'idle')
+                ServerConfig.log.info('%s 超过[%s]秒没有收到数据包，回收连接', worker.addr, idle_timeout)
+            else:
+                continue
+            worker.stop()
+        return
+
+    def __deliver(self, worker:Worker, msg:tuple) -> None:
+        '''
+        内部方法，把消息放入Worker的消息队列，队列已满（客户端长时间没有获取消息）时丢弃最早的消息
+        '''
+        try:
+            worker.msgbuf.put_nowait(msg)
+            return
+        except Full:
+            pass
+        try:
+            worker.msgbuf.get_nowait()
+        except Empty:           # 刚好被取走
+            pass
+        worker.msgbuf.put_nowait(msg)      # 只有 Master 放入消息，这里一定有空位
+        CONTROL_EVENTS.inc(1, 'message_dropped')
+        return
+
     def __init_user_map(self, user_list:List[UserInfo]) -> None:
         '''
         内部方法，使用user_list构造user_map初始值
@@ -0,0 +1,249 @@
+""" 内存诊断模块
+
+分两部分：
+
+- 按子系统统计的内存占用，通过运行指标的 `fts_memory_bytes{subsystem}` 提供：
+  上传缓冲区（`transfer`）由传输线程增减，消息队列（`msgbuf`）和收到的请求（`rbuf`）在采集时估计，
+  等待发送的数据包（`sbuf`）、块缓存（`blockcache`）和哈希缓存（`hashcache`）读取各自维护的数值
+- 按需开启的 tracemalloc，可以保存快照、比较两个快照、列出分配内存最多的代码位置，
+  通过管理员的 `memory` 命令使用，不需要重启服务器。tracemalloc 开启后分配内存会明显变慢，用完应及时关闭
+
+Classes:
+    MemoryDiagnostics(object): 内存诊断
+
+Functions:
+    deep_size: 估计对象及其包含的对象占用的内存
+
+Attributes:
+    memory (MemoryDiagnostics): 全局唯一的内存诊断
+
+"""
+
+from threading import Lock
+from collections import deque
+from typing import Callable
+import tracemalloc
+import sys
+import os
+
+from .metrics import registry
+
+
+MAX_SNAPSHOTS = 4           # 最多保存的快照数，超出时丢弃最早的
+MAX_FRAMES = 25             # tracemalloc 每次分配最多记录的调用栈层数
+DEEP_SIZE_LIMIT = 100000    # deep_size 最多遍历的对象数
+
+# 不统计 tracemalloc 自身和导入系统的分配
+FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+    )
+
+
+def deep_size(obj, limit:int = DEEP_SIZE_LIMIT) -> int:
+    """估计对象及其包含的对象占用的内存
+
+    遍历容器和对象的 `__dict__`，同一个对象只计算一次，遍历的对象数超过 `limit` 时停止
+
+    Args:
+        obj: 对象
+        limit (int, optional): 最多遍历的对象数. Defaults to DEEP_SIZE_LIMIT.
+
+    Returns:
+        int: 字节数
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < limit:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, (str, bytes, bytearray, int, float, bool)) or o is None:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        elif hasattr(o, '__dict__'):
+            stack.append(o.__dict__)
+    return total
+
+
+def rss() -> int:
+    """进程的常驻内存（字节），无法获取时为 0
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return 0
+    return psutil.Process().memory_info().rss
+
+
+class MemoryDiagnostics:
+    """内存诊断
+
+    子系统的内存占用分为两类：由使用者调用 `add` 增减的计数，和通过 `provide` 注册、采集时调用的估计函数
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.counted:dict[str, int] = {}                    # 子系统 -> 字节数
+        self.providers:dict[str, Callable[[], int]] = {}    # 子系统 -> 估计函数
+        self.snapshots:dict[int, tracemalloc.Snapshot] = {}
+        self.next_id = 1
+        return
+
+    # ---------------------------- 子系统统计 ------------------------------
+
+    def add(self, subsystem:str, n:int) -> None:
+        """增加（n 为负数时减少）子系统占用的字节数
+        """
+        with self.lock:
+            self.counted[subsystem] = self.counted.get(subsystem, 0) + n
+        return
+
+    def provide(self, subsystem:str, fn:Callable[[], int]) -> None:
+        """注册子系统占用的估计函数，同名的以最后一次注册的为准
+        """
+        with self.lock:
+            self.providers[subsystem] = fn
+        return
+
+    def usage(self) -> dict[tuple, int]:
+        """各子系统占用的字节数 {(子系统,): 字节数}
+        """
+        with self.lock:
+            retval = {(k,): v for k, v in self.counted.items()}
+            providers = list(self.providers.items())
+        for k, fn in providers:
+            try:
+                retval[(k,)] = fn()
+            except Exception:       # 估计失败不影响其他子系统
+                continue
+        return retval
+
+    # ---------------------------- tracemalloc ------------------------------
+
+    def status(self) -> dict:
+        """当前的内存情况
+
+        Returns:
+            dict: 'rss' 进程常驻内存，'subsystems' 各子系统的占用，'tracing' 是否开启了 tracemalloc，
+                开启时 'traced' 和 'peak' 为 tracemalloc 统计的当前和峰值，'snapshots' 为已保存的快照编号
+        """
+        retval = {
+            'rss': rss(),
+            'subsystems': {k[0]: v for k, v in self.usage().items()},
+            'tracing': tracemalloc.is_tracing(),
+            'snapshots': sorted(self.snapshots),
+            }
+        if retval['tracing']:
+            retval['traced'], retval['peak'] = tracemalloc.get_traced_memory()
+        return retval
+
+    def start(self, frames:int = 10) -> bool:
+        """开启 tracemalloc
+
+        Args:
+            frames (int, optional): 每次分配记录的调用栈层数. Defaults to 10.
+
+        Returns:
+            bool: 是否新开启，已经开启时为 False
+        """
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(min(MAX_FRAMES, max(1, int(frames))))
+        return True
+
+    def stop(self) -> None:
+        """关闭 tracemalloc 并丢弃已保存的快照
+        """
+        tracemalloc.stop()
+        with self.lock:
+            self.snapshots.clear()
+        return
+
+    def snapshot(self) -> int|None:
+        """保存一个快照
+
+        Returns:
+            int | None: 快照编号，没有开启 tracemalloc 时为 None
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        snap = tracemalloc.take_snapshot().filter_traces(FILTERS)
+        with self.lock:
+            sid = self.next_id
+            self.next_id += 1
+            self.snapshots[sid] = snap
+            while len(self.snapshots) > MAX_SNAPSHOTS:
+                del self.snapshots[min(self.snapshots)]
+        return sid
+
+    def top(self, limit:int = 20, group:str = 'lineno') -> list[dict]|None:
+        """分配内存最多的代码位置，使用新的快照，不保存
+
+        Args:
+            limit (int, optional): 返回的条数. Defaults to 20.
+            group (str, optional): 分组方式 'lineno'、'filename' 或 'traceback'. Defaults to 'lineno'.
+
+        Returns:
+            list[dict] | None: [{'site', 'size', 'count'}]，没有开启 tracemalloc 时为 None
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        snap = tracemalloc.take_snapshot().filter_traces(FILTERS)
+        return [self.__row(s, group) for s in snap.statistics(group)[:limit]]
+
+    def diff(self, old:int, new:int|None = None, limit:int = 20, group:str = 'lineno') -> list[dict]|None:
+        """比较两个快照
+
+        Args:
+            old (int): 较早的快照编号
+            new (int | None, optional): 较晚的快照编号，为 None 时使用新的快照. Defaults to None.
+            limit (int, optional): 返回的条数. Defaults to 20.
+            group (str, optional): 分组方式. Defaults to 'lineno'.
+
+        Returns:
+            list[dict] | None: 按增长量排序的 [{'site', 'size', 'count', 'size_diff', 'count_diff'}]，
+                快照不存在或者没有开启 tracemalloc 时为 None
+        """
+        with self.lock:
+            a = self.snapshots.get(old)
+            b = self.snapshots.get(new) if new is not None else None
+        if a is None or (new is not None and b is None):
+            return None
+        if b is None:
+            if not tracemalloc.is_tracing():
+                return None
+            b = tracemalloc.take_snapshot().filter_traces(FILTERS)
+        return [self.__row(s, group) for s in b.compare_to(a, group)[:limit]]
+
+    @staticmethod
+    def __row(stat:tracemalloc.Statistic|tracemalloc.StatisticDiff, group:str) -> dict:
+        frames = stat.traceback if group == 'traceback' else stat.traceback[:1]
+        retval = {
+            'site': [f'{f.filename}:{f.lineno}' for f in frames],
+            'size': stat.size,
+            'count': stat.count,
+            }
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            retval['size_diff'] = stat.size_diff
+            retval['count_diff'] = stat.count_diff
+        return retval
+
+
+memory = MemoryDiagnostics()
+
+registry.gauge('fts_memory_bytes', '各子系统估计的内存占用', ('subsystem',), fn=memory.usage)
+registry.gauge('fts_process_rss_bytes', '进程的常驻内存', fn=rss)
@@ -0,0 +1,291 @@
+""" 运行指标模块
+
+轻量的指标库，记录服务端的运行状态，可以通过管理员的 `stats` 命令获取，
+或者在 `ServerConfig.METRICS['port']` 不为 0 时通过本地 HTTP 端口以 Prometheus 文本格式抓取
+
+- Counter: 只增不减的计数
+- Gauge: 可增可减的数值
+- Histogram: 固定分桶的分布
+
+记录一次只需要一次加锁和几次加法，可以在生产环境中一直开启。
+队列长度、缓存命中率等已经由其他模块维护的数值不重复记录，在采集时通过回调函数读取
+
+Classes:
+    Metric(object): 指标基类
+    Counter(Metric): 计数器
+    Gauge(Metric): 测量值
+    Histogram(Metric): 直方图
+    Registry(object): 指标注册表
+    MetricsServer(object): Prometheus 抓取端口
+
+Attributes:
+    registry (Registry): 全局唯一的指标注册表
+    metrics_server (MetricsServer): 全局唯一的抓取端口
+    CONNECTIONS, LOGINS, REQUESTS, BYTES, TRANSFERS, TRANSFERS_ACTIVE, MASTER_LAG, HASH_LOOKUPS, CONTROL_EVENTS, REAPED: 服务端的指标
+
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+from typing import Callable
+import bisect
+import math
+
+from .serverconfig import ServerConfig
+
+
+# 延迟类直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape(v:str) -> str:
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def fmt(v:float) -> str:
+    if v == math.inf:
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Metric:
+    """指标基类
+
+    带标签的指标按标签值的元组分别记录，标签值的个数必须与 `labels` 相同
+
+    Args:
+        name (str): 指标名
+        help (str): 说明
+        labels (tuple[str, ...], optional): 标签名. Defaults to ().
+        fn (Callable | None, optional): 采集时调用的回调函数，返回数值或 {标签值元组: 数值}，
+            设置后指标的值只来自回调函数. Defaults to None.
+    """
+    type = 'untyped'
+
+    def __init__(self, name:str, help:str, labels:tuple[str, ...] = (), fn:Callable|None = None) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.fn = fn
+        self.lock = Lock()
+        self.values:dict[tuple, float] = {}
+        return
+
+    def label_str(self, values:tuple, extra:str = '') -> str:
+        pairs = [f'{k}="{escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def current(self) -> dict[tuple, float]:
+        """当前的值 {标签值元组: 数值}
+        """
+        if self.fn is not None:
+            try:
+                v = self.fn()
+            except Exception:       # 回调函数的错误不能影响其他指标
+                return {}
+            return v if isinstance(v, dict) else {(): v}
+        with self.lock:
+            return dict(self.values)
+
+    def samples(self) -> list[tuple[str, float]]:
+        """全部样本 [(带标签的序列名, 数值)]
+        """
+        return [(self.name + self.label_str(k), v) for k, v in sorted(self.current().items())]
+
+
+class Counter(Metric):
+    """计数器
+    """
+    type = 'counter'
+
+    def inc(self, n:float = 1, *labels) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+        return
+
+
+class Gauge(Metric):
+    """测量值
+    """
+    type = 'gauge'
+
+    def set(self, v:float, *labels) -> None:
+        with self.lock:
+            self.values[labels] = v
+        return
+
+    def inc(self, n:float = 1, *labels) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+        return
+
+    def dec(self, n:float = 1, *labels) -> None:
+        self.inc(-n, *labels)
+        return
+
+
+class Histogram(Metric):
+    """直方图
+
+    Args:
+        buckets (tuple[float, ...], optional): 各个桶的上界，递增. Defaults to LATENCY_BUCKETS.
+    """
+    type = 'histogram'
+
+    def __init__(self, name:str, help:str, labels:tuple[str, ...] = (), buckets:tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.series:dict[tuple, list] = {}      # 标签值元组 -> [各桶计数..., 总和]
+        return
+
+    def observe(self, v:float, *labels) -> None:
+        i = bisect.bisect_left(self.buckets, v)
+        with self.lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [0] * (len(self.buckets) + 2)
+            s[i] += 1
+            s[-1] += v
+        return
+
+    def current(self) -> dict[tuple, tuple[list[int], float]]:
+        """当前的值 {标签值元组: (各桶的累计计数（最后一个为总数）, 总和)}
+        """
+        with self.lock:
+            series = {k: list(s) for k, s in self.series.items()}
+        retval = {}
+        for k, s in series.items():
+            cum, total = [], 0
+            for c in s[:-1]:
+                total += c
+                cum.append(total)
+            retval[k] = (cum, s[-1])
+        return retval
+
+    def samples(self) -> list[tuple[str, float]]:
+        retval = []
+        for k, (cum, total) in sorted(self.current().items()):
+            for le, c in zip(self.buckets + (math.inf,), cum):
+                retval.append((self.name + '_bucket' + self.label_str(k, f'le="{fmt(le)}"'), c))
+            retval.append((self.name + '_sum' + self.label_str(k), total))
+            retval.append((self.name + '_count' + self.label_str(k), cum[-1]))
+        return retval
+
+
+class Registry:
+    """指标注册表
+
+    同名的指标只创建一次，再次获取时返回已有的指标；回调函数以最后一次设置的为准，
+    例如重新创建 `Master` 时更新读取队列长度的回调函数
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.metrics:dict[str, Metric] = {}
+        return
+
+    def __get(self, cls:type, name:str, help:str, labels:tuple, **kwargs) -> Metric:
+        with self.lock:
+            m = self.metrics.get(name)
+            if m is None:
+                m = self.metrics[name] = cls(name, help, labels, **kwargs)
+            elif kwargs.get('fn') is not None:
+                m.fn = kwargs['fn']
+            return m
+
+    def counter(self, name:str, help:str, labels:tuple[str, ...] = (), fn:Callable|None = None) -> Counter:
+        return self.__get(Counter, name, help, labels, fn=fn)
+
+    def gauge(self, name:str, help:str, labels:tuple[str, ...] = (), fn:Callable|None = None) -> Gauge:
+        return self.__get(Gauge, name, help, labels, fn=fn)
+
+    def histogram(self, name:str, help:str, labels:tuple[str, ...] = (), buckets:tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.__get(Histogram, name, help, labels, buckets=buckets)
+
+    def snapshot(self) -> dict[str, float]:
+        """全部样本 {带标签的序列名: 数值}，用于 `stats` 命令
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {k: v for m in metrics for k, v in m.samples()}
+
+    def render(self) -> str:
+        """Prometheus 文本格式
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for m in metrics:
+            lines.append(f'# HELP {m.name} {m.help}')
+            lines.append(f'# TYPE {m.name} {m.type}')
+            lines.extend(f'{k} {fmt(v)}' for k, v in m.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """响应 `GET /metrics`
+    """
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, format:str, *args) -> None:
+        return                  # 抓取很频繁，不写入日志
+
+
+class MetricsServer:
+    """Prometheus 抓取端口
+
+    配置取自 `ServerConfig.METRICS`，`port` 为 0 时不开启。默认只监听本机地址
+    """
+    def __init__(self) -> None:
+        self.httpd:ThreadingHTTPServer|None = None
+        return
+
+    def start(self) -> None:
+        cfg = ServerConfig.METRICS
+        if not cfg['port'] or self.httpd is not None:
+            return
+        try:
+            self.httpd = ThreadingHTTPServer((cfg['host'], int(cfg['port'])), MetricsHandler)
+        except OSError as e:
+            ServerConfig.log.error(f'指标端口开启失败 {cfg["host"]}:{cfg["port"]} {e}')
+            return
+        self.httpd.daemon_threads = True
+        ServerConfig.log.info(f'指标端口已开启 http://{cfg["host"]}:{self.httpd.server_address[1]}/metrics')
+        Thread(target=self.httpd.serve_forever, name='MetricsServer', daemon=True).start()
+        return
+
+    def stop(self) -> None:
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        return
+
+
+registry = Registry()
+metrics_server = MetricsServer()
+
+
+# ---------------------------- 服务端的指标 ------------------------------
+
+CONNECTIONS = registry.counter('fts_connections_total', '建立的控制连接数')
+LOGINS = registry.counter('fts_logins_total', '登录请求数', ('code',))
+REQUESTS = registry.counter('fts_requests_total', '按命令和状态码统计的请求数', ('cmd', 'code'))
+BYTES = registry.counter('fts_bytes_total', '收发的字节数', ('channel', 'direction'))
+TRANSFERS = registry.counter('fts_transfers_total', '开始的文件传输数', ('type',))
+TRANSFERS_ACTIVE = registry.gauge('fts_transfers_active', '正在进行的文件传输数')
+MASTER_LAG = registry.histogram('fts_master_loop_lag_seconds', 'Master 每次循环超出休眠时间的部分')
+HASH_LOOKUPS = registry.counter('fts_hashcache_lookups_total', '文件哈希的查询，按结果来源统计', ('source',))
+CONTROL_EVENTS = registry.counter('fts_control_events_total', '控制连接的保护措施触发的次数', ('event',))
+REAPED = registry.counter('fts_reaped_total', '因空闲、未登录或传输停滞而断开的连接数', ('reason',))
@@ -0,0 +1,175 @@
+""" 组播分发模块
+
+很多客户端同时下载同一个文件时，服务端通过 UDP 组播只发送一次文件
+
+1. 客户端通过控制连接发送 `multicastJoin` 请求，服务端为该文件创建会话（已有会话时加入该会话），
+   返回组播地址、端口和开始前的等待时间
+2. 等待时间结束后，会话线程按 `ServerConfig.MULTICAST['rateKiB']` 的速率发送全部数据包，
+   每 `FEC_K` 个数据包后发送一个异或校验包，每组丢失一个包时客户端可以自行恢复
+3. 发送完成后发送几次结束包，会话结束
+4. 客户端对仍然缺失的部分通过 `getFile` 的范围下载（单播）补齐
+
+数据包的格式见 `src.globals.multicast`
+
+Classes:
+    MulticastSession(Thread): 组播会话线程
+    MulticastManager(object): 组播会话管理
+
+Attributes:
+    multicast (MulticastManager): 全局唯一的组播会话管理
+
+"""
+
+from typing import override
+from threading import Thread, Lock
+from pathlib import Path
+import socket
+import time
+
+from ..globals.multicast import HEAD, PACKET_DATA, FEC_K, T_DATA, T_PARITY, T_END
+from .serverconfig import ServerConfig
+from .blockcache import cache
+
+
+class MulticastSession(Thread):
+    """组播会话线程
+
+    等待客户端加入，然后将文件按固定速率组播一次
+    """
+    @override
+    def __init__(self, manager:'MulticastManager', sid:int, path:Path, iface:str) -> None:
+        """重写初始化方法
+
+        Args:
+            manager (MulticastManager): 所属的会话管理
+            sid (int): 会话ID
+            path (Path): 需要分发的文件
+            iface (str): 发送组播使用的本地网卡地址
+        """
+        super().__init__(None, None, f'Th_multicast-{sid}', daemon=True)
+        cfg = ServerConfig.MULTICAST
+        self.manager = manager
+        self.sid = sid
+        self.path = path
+        self.iface = iface
+        self.size = path.stat().st_size
+        self.group = cfg['group']
+        self.port = cfg['port'] + sid % 1000
+        self.start_at = time.monotonic() + cfg['startDelay']
+        self.receivers = 0
+        self.sent_bytes = 0
+        return
+
+    def info(self) -> list:
+        """返回给客户端的会话信息
+
+        Returns:
+            list: [会话ID, 组播地址, 端口, 文件大小, 数据包大小, 每组数据包数, 开始前的等待时间]
+        """
+        return [self.sid, self.group, self.port, self.size, PACKET_DATA, FEC_K, max(0.0, self.start_at - time.monotonic())]
+
+    @override
+    def run(self) -> None:
+        time.sleep(max(0.0, self.start_at - time.monotonic()))
+        cfg = ServerConfig.MULTICAST
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if self.iface and self.iface != '0.0.0.0':
+                s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.iface))
+            s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, cfg['ttl'])
+            s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            self.send_file(s, cfg['rateKiB'] * 1024)
+        except OSError as e:
+            ServerConfig.log.warning(f'组播会话[{self.sid}]发送失败 [{self.path}] {e}')
+        finally:
+            s.close()
+            self.manager._on_finished(self)
+        ServerConfig.log.info(f'组播会话[{self.sid}]结束 [{self.path}]，接收者[{self.receivers}]，'
+                              f'文件大小[{self.size}]字节，发送[{self.sent_bytes}]字节')
+        return
+
+    def send_file(self, s:socket.socket, rate:float) -> None:
+        """按固定速率发送全部数据包、校验包和结束包
+
+        Args:
+            s (socket.socket): UDP socket
+            rate (float): 速率（字节/秒）
+        """
+        dest = (self.group, self.port)
+        t0 = time.monotonic()
+        parity = 0
+        idx = 0
+        with cache.open(self.path) as f:
+            while True:
+                buf = b''
+                while len(buf) < PACKET_DATA:
+                    r = f.read(PACKET_DATA - len(buf))
+                    if not r:
+                        break
+                    buf += r
+                if not buf:
+                    break
+                self.send(s, dest, T_DATA, idx, buf)
+                parity ^= int.from_bytes(buf, 'little')
+                idx += 1
+                if idx % FEC_K == 0:
+                    self.send(s, dest, T_PARITY, idx // FEC_K - 1, parity.to_bytes(PACKET_DATA, 'little'))
+                    parity = 0
+                # 控制速率，领先预定时间时等待
+                ahead = t0 + self.sent_bytes / rate - time.monotonic()
+                if ahead > 0.002:
+                    time.sleep(ahead)
+        if idx % FEC_K:             # 最后一个不完整的组
+            self.send(s, dest, T_PARITY, idx // FEC_K, parity.to_bytes(PACKET_DATA, 'little'))
+        for _ in range(3):
+            self.send(s, dest, T_END, idx, b'')
+            time.sleep(0.05)
+        return
+
+    def send(self, s:socket.socket, dest:tuple, type:int, seq:int, data:bytes) -> None:
+        pkt = HEAD.pack(self.sid, type, seq) + data
+        s.sendto(pkt, dest)
+        self.sent_bytes += len(pkt)
+        return
+
+
+class MulticastManager:
+    """组播会话管理
+
+    每个文件同时最多有一个会话，会话开始发送后仍然可以加入，缺少的部分由客户端单播补齐
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.sessions:dict[Path, MulticastSession] = {}
+        self.next_id = 1
+        return
+
+    def join(self, path:Path, iface:str) -> MulticastSession:
+        """加入或创建文件的组播会话
+
+        Args:
+            path (Path): 需要分发的文件
+            iface (str): 发送组播使用的本地网卡地址，创建会话时使用
+
+        Returns:
+            MulticastSession: 会话
+        """
+        with self.lock:
+            session = self.sessions.get(path)
+            if session is None:
+                session = MulticastSession(self, self.next_id, path, iface)
+                self.next_id += 1
+                self.sessions[path] = session
+                session.start()
+                ServerConfig.log.info(f'创建组播会话[{session.sid}] [{path}]，组播地址[{session.group}:{session.port}]')
+            session.receivers += 1
+            return session
+
+    def _on_finished(self, session:MulticastSession) -> None:
+        with self.lock:
+            if self.sessions.get(session.path) is session:
+                del self.sessions[session.path]
+        return
+
+
+multicast = MulticastManager()
@@ -0,0 +1,162 @@
+""" 采样性能分析模块
+
+在服务端运行时临时开启，不需要重启服务器：采样线程按 `rate` 次/秒读取 `sys._current_frames()`，
+记录每个线程当前的调用栈，持续 `seconds` 秒后以火焰图工具（flamegraph.pl、speedscope 等）
+可以读取的折叠栈格式写入文件，每行为 `线程名;外层函数;...;内层函数 次数`
+
+调用栈的根为线程名（`Master`、`Worker-<IP>`、`Th_fileTrans-<IP>` 等），可以按线程区分热点。
+没有采样时不启动任何线程，对服务端没有影响
+
+可以通过管理员的 `profile` 命令、服务端控制台的 `profile` 命令或图形界面开启
+
+Classes:
+    Th_profiler(Thread): 采样线程
+    SamplingProfiler(object): 采样性能分析器
+
+Attributes:
+    profiler (SamplingProfiler): 全局唯一的采样性能分析器
+
+"""
+
+from typing import override
+from collections import Counter
+from threading import Thread, Event, Lock
+import threading
+from pathlib import Path
+import time
+import sys
+import os
+
+from .serverconfig import ServerConfig
+
+
+MAX_SECONDS = 600           # 单次采样的最长时间（秒）
+MAX_RATE = 1000             # 最高采样频率（次/秒）
+MAX_DEPTH = 128             # 每个调用栈最多记录的层数
+
+
+def frame_label(code) -> str:
+    # 折叠栈格式以分号分隔各层，以最后一个空格分隔次数
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class Th_profiler(Thread):
+    """采样线程
+    """
+    @override
+    def __init__(self, seconds:float, rate:float, path:Path) -> None:
+        """重写初始化方法
+
+        Args:
+            seconds (float): 采样时间（秒）
+            rate (float): 采样频率（次/秒）
+            path (Path): 结果文件路径
+        """
+        super().__init__(None, None, 'Th_profiler', daemon=True)
+        self.seconds = seconds
+        self.rate = rate
+        self.path = path
+        self.stopEvent = Event()
+        self.stacks:Counter[str] = Counter()
+        self.samples = 0
+        self.end = 0.0
+        return
+
+    @override
+    def run(self) -> None:
+        interval = 1 / self.rate
+        self.end = time.monotonic() + self.seconds
+        labels:dict = {}            # 代码对象 -> 标签，同一个函数只格式化一次
+        names:dict[int, str] = {}   # 线程 id -> 线程名
+        me = threading.get_ident()
+        while not self.stopEvent.is_set() and time.monotonic() < self.end:
+            t = time.monotonic()
+            frames = sys._current_frames()
+            if frames.keys() - names.keys():    # 有新线程时更新线程名
+                names = {th.ident: th.name for th in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, f'thread-{ident}').replace(';', ':').replace(' ', '_'))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            del frames, frame
+            self.stopEvent.wait(max(0, interval - (time.monotonic() - t)))
+        self.write()
+        return
+
+    def write(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                for stack, n in self.stacks.most_common():
+                    f.write(f'{stack} {n}\n')
+        except OSError as e:
+            ServerConfig.log.error(f'性能采样结果写入失败 [{self.path}] {e}')
+            return
+        ServerConfig.log.info(f'性能采样结束，共采样[{self.samples}]次，已写入 [{self.path}]')
+        return
+
+
+class SamplingProfiler:
+    """采样性能分析器
+
+    同一时间只能进行一次采样
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.thread:Th_profiler|None = None
+        return
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def remaining(self) -> float:
+        """正在进行的采样剩余的时间（秒），没有采样时为 0
+        """
+        th = self.thread
+        if th is None or not th.is_alive():
+            return 0.0
+        return max(0.0, th.end - time.monotonic())
+
+    def start(self, seconds:float = 30, rate:float|None = None) -> Path|None:
+        """开始采样
+
+        Args:
+            seconds (float, optional): 采样时间（秒），不超过 `MAX_SECONDS`. Defaults to 30.
+            rate (float | None, optional): 采样频率（次/秒），为 None 时取自 `ServerConfig.PROFILER`. Defaults to None.
+
+        Returns:
+            Path | None: 结果文件路径，已经在采样时为 None
+        """
+        seconds = min(MAX_SECONDS, max(0.1, float(seconds)))
+        rate = min(MAX_RATE, max(1.0, float(rate or ServerConfig.PROFILER['rate'])))
+        with self.lock:
+            if self.running:
+                return None
+            name = time.strftime('profile-%Y%m%d-%H%M%S.folded')
+            path = Path(ServerConfig.PROFILER['dir']).absolute().joinpath(name)
+            self.thread = Th_profiler(seconds, rate, path)
+            self.thread.start()
+        ServerConfig.log.info(f'开始性能采样，{seconds:g}秒，{rate:g}次/秒')
+        return path
+
+    def stop(self) -> None:
+        """提前结束正在进行的采样，已采集的结果照常写入文件
+        """
+        th = self.thread
+        if th is not None:
+            th.stopEvent.set()
+        return
+
+
+profiler = SamplingProfiler()
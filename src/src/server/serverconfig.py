@@ -19,5 +19,80 @@ class ServerConfig:
         'allUserDownloadFile': True, 
         'allUserUploadFile': False
         }
+    # 带宽限制，单位 KiB/s，0 表示不限制
+    BANDWIDTH = {
+        'global': 0,
+        'perUser': 0,
+        'perTransfer': 0
+        }
+    # 准入控制，0 表示不限制
+    ADMISSION = {
+        'maxTransfers': 64,         # 同时进行的传输数
+        'maxUserTransfers': 8,      # 每个用户同时进行的传输数
+        'maxPendingMiB': 0,         # 正在传输的总数据量
+        'maxUserPendingMiB': 0,     # 每个用户正在传输的数据量
+        'queueSize': 32,            # 等待队列长度
+        'queueTimeout': 1.0         # 在等待队列中最多等待的时间（秒）
+        }
+    # 块缓存
+    CACHE = {
+        'sizeMiB': 256,             # 缓存总大小，0 表示不使用缓存
+        'readAhead': 4              # 顺序读取时预读的块数
+        }
+    # 组播分发
+    MULTICAST = {
+        'group': '239.255.17.1',    # 组播地址
+        'port': 17000,              # 起始端口，每个会话使用不同的端口
+        'rateKiB': 8192,            # 发送速率 KiB/s
+        'ttl': 1,                   # 组播的 TTL，1 表示不跨越路由器
+        'startDelay': 2.0           # 创建会话后等待其他客户端加入的时间（秒）
+        }
+    # 哈希索引
+    INDEX = {
+        'enable': True,             # 是否在后台为共享文件夹建立哈希索引
+        'path': './hashindex.db',   # 索引数据库文件路径
+        'workers': 2,               # 计算哈希的进程数
+        'scanInterval': 300         # 遍历共享文件夹检查改变的间隔（秒）
+        }
+    # 运行指标的抓取端口
+    METRICS = {
+        'host': '127.0.0.1',        # 监听地址，默认只允许本机抓取
+        'port': 0                   # 端口，0 表示不开启
+        }
+    # 慢请求日志
+    SLOW_LOG = {
+        'thresholdMs': 1000,        # 从收到请求到发出响应超过该时间的请求写入日志，0 表示不记录
+        'path': './slow.log'        # 日志文件路径，每行一个 json 对象，为空时写入服务端日志
+        }
+    # 采样性能分析
+    PROFILER = {
+        'rate': 100,                # 采样频率（次/秒）
+        'dir': './profiles'         # 结果文件的目录
+        }
+    # 控制连接的保护
+    CONTROL = {
+        'maxFrameMiB': 64,          # 数据包长度的上限（MiB），超过时断开连接
+        'sendQueueKiB': 4096,       # 每个连接等待发送的数据上限（KiB），0 表示不限制
+        'sendTimeout': 30,          # 发送超时（秒），客户端长时间不读取时断开连接，0 表示不超时
+        'msgbufSize': 1000,         # 每个连接最多保留的未读消息数，超过时丢弃最早的消息
+        'slowConsumer': 'shed'      # 发送队列已满时的处理：'shed' 响应改为服务器忙，'disconnect' 断开连接
+        }
+    # 空闲连接的回收
+    KEEPALIVE = {
+        'idleTimeout': 120,         # 控制连接超过该时间（秒）没有收到任何数据包时断开，0 表示不断开
+        'loginTimeout': 30,         # 连接后超过该时间（秒）没有登录时断开，0 表示不断开
+        'transferTimeout': 60,      # 文件传输超过该时间（秒）没有进展时断开，0 表示不断开
+        'tcpIdle': 60,              # TCP keepalive 开始探测前的空闲时间（秒），0 表示不开启
+        'tcpInterval': 10,          # TCP keepalive 的探测间隔（秒）
+        'tcpCount': 6               # TCP keepalive 判定连接失效的探测次数
+        }
+    # 日志轮转
+    LOG_ROTATE = {
+        'maxMiB': 64,               # 日志文件超过该大小（MiB）时轮转，0 表示不按大小轮转
+        'intervalHours': 24,        # 每隔该时间（小时）轮转，0 表示不按时间轮转
+        'backupCount': 7            # 保留的旧日志文件数
+        }
+    # 管理员用户，可以使用 stats 等管理命令
+    ADMIN_USERS:list[str] = []
     # 全局 logger
     log:logging.Logger = None
@@ -0,0 +1,81 @@
+""" 临时文件模块
+
+服务端的所有写入（上传、增量上传、批量上传、去重上传、复制）都先写入目标旁边的临时文件，
+完成后再原子地替换目标文件
+
+临时文件名为 `.<目标文件名>.<随机串>.uploading`：
+
+- 每个写入者使用不同的临时文件，同时写入同一目标时不会截断或替换对方正在写入的文件
+- 以 . 开头并以 `TEMP_SUFFIX` 结尾，文件列表、文件清单和哈希索引通过 `is_temp` 跳过，
+  客户端不会看到写了一半的文件
+
+服务端复制目录时同样先在目标旁边的临时目录中生成整个目录树，覆盖时把原来的目标改名到旁边的临时名称，
+替换成功后才删除，中途失败不会破坏原来的目标
+
+Functions:
+    temp_name: 生成目标旁边的临时名称，不创建文件
+    temp_for: 在目标文件旁边创建一个新的临时文件
+    temp_dir_for: 在目标旁边创建一个新的临时目录
+    is_temp: 文件名是否为临时文件
+
+"""
+
+from pathlib import Path
+import secrets
+import os
+
+
+TEMP_SUFFIX = '.uploading'
+
+
+def temp_name(dst:Path) -> Path:
+    """生成目标旁边的临时名称，不创建文件
+
+    用于把已有的目标改名到旁边，名称中的随机串使其与其他临时文件不同
+    """
+    return dst.with_name(f'.{dst.name}.{secrets.token_hex(4)}{TEMP_SUFFIX}')
+
+
+def temp_for(dst:Path) -> Path:
+    """在目标文件旁边创建一个新的空临时文件
+
+    权限与直接创建的文件相同（受 umask 控制）
+
+    Args:
+        dst (Path): 目标文件
+
+    Returns:
+        Path: 已创建的临时文件
+    """
+    while True:
+        tmp = temp_name(dst)
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return tmp
+
+
+def temp_dir_for(dst:Path) -> Path:
+    """在目标旁边创建一个新的空临时目录
+
+    Args:
+        dst (Path): 目标路径
+
+    Returns:
+        Path: 已创建的临时目录
+    """
+    while True:
+        tmp = temp_name(dst)
+        try:
+            tmp.mkdir()
+        except FileExistsError:
+            continue
+        return tmp
+
+
+def is_temp(name:str) -> bool:
+    """文件名是否为 `temp_for` 创建的临时文件
+    """
+    return name.startswith('.') and name.endswith(TEMP_SUFFIX)
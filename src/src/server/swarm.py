@@ -0,0 +1,98 @@
+""" 群集下载的追踪模块
+
+很多客户端同时下载同一个大文件时，客户端之间互相传输已经下载的块，减少服务端的上行流量
+
+服务端在群集中有两个角色：
+
+- 追踪者：记录每个文件正在下载或做种的客户端（节点），通过控制连接的 `swarmJoin` / `swarmPeers` / `swarmLeave` 交换节点列表
+- 种子：公布文件每块的哈希值，节点都没有的块由客户端通过 `getFile` 的范围下载从服务端获取
+
+哈希列表取自文件哈希缓存 `src.server.hashcache.hashes`
+
+每个群集有一个随机的令牌，只通过 `swarmJoin` 发给已经通过权限检查的节点，
+节点之间连接时必须先出示令牌，没有下载权限的主机无法从节点获取数据。群集中没有节点时令牌作废
+
+Classes:
+    Tracker(object): 追踪者
+
+Attributes:
+    tracker (Tracker): 全局唯一的追踪者
+
+"""
+
+from threading import Lock
+from pathlib import Path
+import secrets
+
+from ..globals.swarm import TOKEN_SIZE
+from .hashcache import hashes
+
+
+class Tracker:
+    """追踪者
+
+    节点以所属的工作者线程为键登记，连接断开时由工作者线程调用 `leave_all` 注销
+    """
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.swarms:dict[Path, dict[object, tuple[str, int]]] = {}     # 文件 -> {工作者线程: (IP, 端口)}
+        self.tokens:dict[Path, bytes] = {}                              # 文件 -> 群集令牌
+        return
+
+    def join(self, path:Path, worker:object, addr:tuple[str, int], wait:float|None = None) -> list|None:
+        """加入文件的群集
+
+        Args:
+            path (Path): 文件路径
+            worker (object): 节点所属的工作者线程
+            addr (tuple[str, int]): 节点的地址
+            wait (float | None, optional): 需要计算哈希时最多等待的时间（秒），见 `HashCache.get`. Defaults to None.
+
+        Raises:
+            OSError: 文件不存在或者读取失败
+
+        Returns:
+            list | None: [文件大小, 块大小, 哈希列表, 其他节点的地址列表, 群集令牌(十六进制)]，哈希仍在计算时为 None，不加入群集
+        """
+        found = hashes.get(path, wait)
+        if found is None:
+            return None
+        size, chunk, leaves = found
+        with self.lock:
+            swarm = self.swarms.setdefault(path, {})
+            swarm[worker] = tuple(addr)
+            token = self.tokens.setdefault(path, secrets.token_bytes(TOKEN_SIZE))
+            return [size, chunk, leaves, [a for w, a in swarm.items() if w is not worker], token.hex()]
+
+    def peers(self, path:Path, worker:object) -> list[tuple[str, int]]:
+        """获取文件群集中其他节点的地址
+        """
+        with self.lock:
+            swarm = self.swarms.get(path, {})
+            return [a for w, a in swarm.items() if w is not worker]
+
+    def leave(self, path:Path, worker:object) -> None:
+        """离开文件的群集
+        """
+        with self.lock:
+            swarm = self.swarms.get(path)
+            if swarm is not None:
+                swarm.pop(worker, None)
+                if not swarm:
+                    del self.swarms[path]
+                    del self.tokens[path]
+        return
+
+    def leave_all(self, worker:object) -> None:
+        """工作者线程断开时离开所有群集
+        """
+        with self.lock:
+            for path in [p for p, s in self.swarms.items() if worker in s]:
+                del self.swarms[path][worker]
+                if not self.swarms[path]:
+                    del self.swarms[path]
+                    del self.tokens[path]
+        return
+
+
+tracker = Tracker()
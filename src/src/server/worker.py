@@ -5,6 +5,9 @@
 Classes:
     Recver(Thread): 接收线程
     Sender(Thread): 发送线程
+    Th_fileTrans(Thread): 文件传输线程
+    Th_deltaTrans(Th_fileTrans): 增量上传线程
+    Th_batchTrans(Th_fileTrans): 批量传输线程
     Worker(Thread): 工作者线程
 
 """
@@ -14,31 +17,62 @@ from typing import Any, List, override, Literal
 import os
 from pathlib import Path
 import time
-from socket import socket
+from socket import socket, SHUT_RDWR
 from queue import Queue
 from threading import Thread, Event
 
 from ..globals import Package, StatCode
+from ..globals.delta import block_size_for, signature, apply_delta
+from ..globals.compress import negotiate, iter_frames, read_frame
+from ..globals.batch import BUF_SIZE, END, collect, check_name, pack_header, read_exact, read_header
+from ..globals.merkle import Hasher, HashingReader, chunk_size_for, file_leaves, merkle_root
+from ..globals.frame import FrameTooLarge, SendQueue, set_send_timeout, set_keepalive
 from .userinfo import UserInfo
 from .serverconfig import ServerConfig
+from .manifest import build_manifest
+from .bandwidth import scheduler, QUANTUM
+from .admission import admission, Ticket
+from .blockcache import cache, CachedReader
+from .hashcache import hashes, stat_key
+from .hashindex import index
+from .multicast import multicast
+from .swarm import tracker
+from .dedup import link_content
+from .fileops import ops, OP_WAIT
+from .staging import temp_for, is_temp
+from .metrics import registry, REQUESTS, BYTES, TRANSFERS, TRANSFERS_ACTIVE, CONTROL_EVENTS, REAPED
+from .latency import latency
+from .profiler import profiler
+from .memstat import memory
 
 
-def readSocketSize(s:socket, size:int) -> bytes:
+HASH_STEP = 1024 * 1024     # 接收文件时每接收该字节数交给哈希线程一次
+SHED_RETRY = 1              # 发送队列已满时建议客户端重试的时间（秒）
+HASH_WAIT = 1.0             # 需要读取文件计算哈希时工作者线程最多等待的时间（秒），超过时返回服务器忙
+HASH_RETRY = 2              # 哈希仍在计算时建议客户端重试的时间（秒）
+
+
+def readSocketSize(s:socket, size:int, limit:int = 0) -> bytes:
     """从socket读取固定字节数的函数
 
     Args:
         s (socket): 要读取的socket
         size (int): 读取的数量
+        limit (int, optional): 读取数量的上限，超过时抛出 `FrameTooLarge`，0 表示不限制. Defaults to 0.
 
     Returns:
         bytes: 结果
     """
+    if limit and size > limit:      # 在分配内存之前检查
+        raise FrameTooLarge(size, limit)
     readed = 0
     retval = bytearray(size)
     mv = memoryview(retval)
     while readed < size:
         rbuf = s.recv(min(4096, size - readed))
         rlen = len(rbuf)
+        if rlen == 0:       # 对方已关闭连接
+            raise ConnectionError('connection closed')
         mv[readed:readed+rlen] = rbuf
         readed += rlen
     return bytes(retval)
@@ -53,6 +87,9 @@ class Recver(Thread):
         super().__init__(None, None, f'Worker-{socket.getpeername()[0]}-Recver')
         self.queue = queue
         self.s = socket
+        self.addr = socket.getpeername()
+        self.max_frame = int(ServerConfig.CONTROL['maxFrameMiB'] * 2**20)
+        self.last_seen = time.monotonic()       # 最近一次收到数据包的时间，用于回收空闲连接
         self.running = True
         return
     
@@ -61,9 +98,17 @@ class Recver(Thread):
         while self.running:
             try:
                 plen = int.from_bytes(readSocketSize(self.s, 4), 'big') # 读取头部4字节，确定包大小
-                pkg_b = readSocketSize(self.s, plen)        # 读取完整数据包
+                pkg_b = readSocketSize(self.s, plen, self.max_frame)    # 读取完整数据包
+                BYTES.inc(4 + plen, 'control', 'received')
                 pkg = Package.from_bytes(pkg_b)             # 解析数据包
+                pkg.t_recv = time.perf_counter()            # 用于统计请求的延迟
+                self.last_seen = time.monotonic()
                 self.queue.put(pkg)                         # 将数据包放入队列
+            except FrameTooLarge as e:
+                CONTROL_EVENTS.inc(1, 'frame_rejected')
+                ServerConfig.log.warning('%s 数据包长度[%s]超过上限[%s]，断开连接', self.addr, e.size, e.limit)
+                self.queue.put(None)
+                return
             except:
                 # 当发生异常时，线程退出，并向队列里放入一个 None
                 self.queue.put(None)
@@ -75,7 +120,10 @@ class Recver(Thread):
         将运行状态改为停止，并将socket超时设定为0，立即超时返回
         """
         self.running = False
-        self.s.settimeout(0)
+        try:
+            self.s.settimeout(0)
+        except OSError:         # socket 已经关闭
+            pass
         return
     
 class Sender(Thread):
@@ -83,19 +131,38 @@ class Sender(Thread):
     向客户端发送响应的线程
     """
     @override
-    def __init__(self, queue:Queue, socket:socket) -> None:
+    def __init__(self, queue:SendQueue, socket:socket) -> None:
         super().__init__(None, None, f'Worker-{socket.getpeername()[0]}-Sender')
         self.queue = queue
         self.s = socket
+        self.addr = socket.getpeername()
         self.running = True
         return
     
     @override
     def run(self):
         while self.running:
-            pkg:Package = self.queue.get()
-            if pkg:
-                self.s.sendall(pkg.to_bytes())
+            item = self.queue.get()         # (编码后的数据包, 延迟统计信息)
+            if item is None:
+                continue
+            b, timing = item
+            try:
+                self.s.sendall(b)
+            except OSError as e:
+                # 发送超时说明客户端长时间没有读取，关闭连接，接收线程随之退出，工作者线程停止
+                if isinstance(e, (BlockingIOError, TimeoutError)) and self.running:
+                    CONTROL_EVENTS.inc(1, 'send_timeout')
+                    ServerConfig.log.warning('%s 发送超时，断开连接', self.addr)
+                try:
+                    self.s.shutdown(SHUT_RDWR)
+                except OSError:
+                    pass
+                return
+            BYTES.inc(len(b), 'control', 'sent')
+            if timing is not None:          # 响应请求的数据包，记录请求的延迟
+                req, code, user, t_ret = timing
+                latency.record(req.cmd, user, self.addr, req.args, code,
+                               req.t_recv, req.t_start, t_ret, time.perf_counter())
     
     def stop(self):
         """通知线程通知运行
@@ -111,6 +178,9 @@ class Th_fileTrans(Thread):
     """文件传输线程
 
     该线程控制文件上传与下载，下载完成后自动写入硬盘
+
+    完整发送或接收文件时在后台计算文件的 Merkle 叶子并放入哈希缓存；
+    接收完成后向客户端发送 32 字节的 Merkle 根，客户端据此校验上传结果
     """
 
     @override
@@ -121,7 +191,11 @@ class Th_fileTrans(Thread):
         file_path:Path, 
         file_size:int,
         file_start_point:int,
-        peer_ip:str
+        peer_ip:str,
+        mtime:float|None = None,
+        codec:str|None = None,
+        user:str = '',
+        ticket:Ticket|None = None
         ) -> None:
         """重写初始化方法
 
@@ -129,72 +203,437 @@ class Th_fileTrans(Thread):
             type (Literal[&#39;s&#39;, &#39;r&#39;]): 线程的类型：发生/接收
             socket (socket): 正在监听等待连接的socket
             file_path (Path): 本地文件路径
-            file_size (int): 文件大小
+            file_size (int): 文件大小，发送时为发送范围的结束位置
             file_start_point (int): 文件起始点
             peer_ip (str): 待传输客户端的IP地址
+            mtime (float | None, optional): 接收完成后设置的文件修改时间. Defaults to None.
+            codec (str | None, optional): 协商的压缩算法，None表示不压缩. Defaults to None.
+            user (str, optional): 请求传输的用户，用于带宽调度. Defaults to ''.
+            ticket (Ticket | None, optional): 准入控制的许可，线程结束时归还. Defaults to None.
         """
-        super().__init__(None, None, None, None)
+        super().__init__(None, None, f'{self.__class__.__name__}-{peer_ip}', None)     # 线程名用于性能采样
         self.type = type
         self.s = socket
         self.file_path = file_path
         self.file_size = file_size
         self.start_point = file_start_point
         self.peer_ip = peer_ip
+        self.mtime = mtime
+        self.codec = codec
+        self.user = user
+        self.ticket = ticket
+        self.flow = None
+        self.buffered = 0           # 接收缓冲区的大小，计入内存统计
         return
+
+    @property
+    def kind(self) -> str:
+        """传输的种类，用于统计
+        """
+        return 'download' if self.type == 's' else 'upload'
     
-    @override
-    def run(self):
-        self.s.listen(5)
+    def accept(self) -> tuple[socket, tuple]|tuple[None, None]:
+        """等待客户端连接到传输端口
+
+        只接受来自请求者IP的连接，3秒内没有连接则超时。
+        连接后的读写超时为 `ServerConfig.KEEPALIVE['transferTimeout']`
+
+        Returns:
+            tuple[socket, tuple]|tuple[None, None]: 已连接的socket和对方地址，超时返回 (None, None)
+        """
         self.s.settimeout(3)
         while True:
             try:
                 c, addr = self.s.accept()
             except TimeoutError:
-                ServerConfig.log.info(f'文件传输等待超时. 文件[{self.file_path}]. 等待对方IP[{self.peer_ip}]')
+                ServerConfig.log.info('文件传输等待超时. 文件[%s]. 等待对方IP[%s]', self.file_path, self.peer_ip)
                 self.s.close()
-                return
+                return None, None
             if addr[0] != self.peer_ip:
                 c.close()
             else:
-                break
+                self.s.close()
+                # 客户端停止读写（暂停、断网）超过该时间时传输中断，不会一直占用线程和缓冲区
+                c.settimeout(ServerConfig.KEEPALIVE['transferTimeout'] or None)
+                set_keepalive(c, ServerConfig.KEEPALIVE['tcpIdle'],
+                              ServerConfig.KEEPALIVE['tcpInterval'], ServerConfig.KEEPALIVE['tcpCount'])
+                return c, addr
+
+    def send(self, c:socket, data:bytes|memoryview) -> None:
+        """经过带宽调度发送数据
+        """
+        mv = memoryview(data)
+        for i in range(0, len(mv), QUANTUM):
+            scheduler.acquire(self.flow, min(QUANTUM, len(mv) - i))
+            c.sendall(mv[i:i+QUANTUM])
+        BYTES.inc(len(mv), 'transfer', 'sent')
+        return
+
+    def recv(self, c:socket, size:int) -> bytes:
+        """经过带宽调度接收固定字节数的数据
+        """
+        scheduler.acquire(self.flow, size)
+        b = readSocketSize(c, size)
+        BYTES.inc(size, 'transfer', 'received')
+        return b
+
+    def stalled(self, e:BaseException, addr:tuple) -> None:
+        """传输因为超时中断时计数并记录，其他原因的中断不处理
+        """
+        if isinstance(e, TimeoutError):
+            REAPED.inc(1, 'transfer')
+            ServerConfig.log.info('%s 文件传输超过[%s]秒没有进展，断开连接', addr, ServerConfig.KEEPALIVE['transferTimeout'])
+        return
 
+    def hashing(self, f:CachedReader) -> tuple[CachedReader|HashingReader, Hasher|None]:
+        """完整发送文件且哈希缓存中没有该文件时，在发送的同时计算叶子
+
+        哈希只是顺便计算，跟不上发送时放弃，不影响发送速度
+
+        Returns:
+            tuple[CachedReader | HashingReader, Hasher | None]: 用于读取的对象和哈希计算器
+        """
+        key = f.base + (f.file_size,)
+        if self.start_point != 0 or self.file_size != f.file_size or hashes.cached(self.file_path, key):
+            return (f, None)
+        hasher = Hasher(chunk_size_for(f.file_size))
+        return (HashingReader(f, hasher, False), hasher)
+
+    @override
+    def run(self):
+        try:
+            c, addr = self.accept()
+            if c is None:
+                return
+            self.flow = scheduler.open(self.user)
+            TRANSFERS.inc(1, self.kind)
+            TRANSFERS_ACTIVE.inc()
+            try:
+                self.transfer(c, addr)
+            finally:
+                TRANSFERS_ACTIVE.dec()
+                scheduler.close(self.flow)
+                if self.buffered:
+                    memory.add('transfer', -self.buffered)
+        finally:
+            if self.ticket is not None:
+                admission.release(self.ticket)
+        return
+
+    def transfer(self, c:socket, addr:tuple) -> None:
+        """在已连接的socket上传输文件
+
+        Args:
+            c (socket): 已连接的socket
+            addr (tuple): 对方地址
+        """
         # 发送文件
-        # 1. 从硬盘读取文件
-        # 2. 构建 memoryview 提升性能
-        # 3. 发送全部数据
-        # 4. 关闭socket
+        # 1. 通过块缓存逐块读取文件，多个线程同时下载同一文件时只读取一次硬盘
+        # 2. 逐块发送数据
+        # 3. 关闭socket
+        # 使用压缩时改为边读取边压缩边发送
         if self.type == 's':
-            with open(self.file_path, 'rb') as f:
-                buf = f.read()
-            cursor = self.start_point
-            mv = memoryview(buf)
-            c.sendall(mv[cursor:])
-            c.recv(1)
-            ServerConfig.log.info(f'{c.getpeername()} 已下载文件 [{self.file_path}]')
-            c.close()
+            hasher = None
+            try:
+                with cache.open(self.file_path) as f:
+                    f.seek(self.start_point)
+                    src, hasher = self.hashing(f)
+                    if self.codec:
+                        for _, frame in iter_frames(src, self.codec, self.file_size - self.start_point):
+                            self.send(c, frame)
+                    else:
+                        remain = self.file_size - self.start_point
+                        while remain > 0:
+                            buf = src.read(remain)
+                            if not buf:
+                                break
+                            self.send(c, buf)
+                            remain -= len(buf)
+                c.recv(1)
+            except OSError as e:    # 客户端暂停或取消了下载
+                self.stalled(e, addr)
+                ServerConfig.log.info('%s 下载文件中断 [%s]', addr, self.file_path)
+                return
+            finally:
+                c.close()
+                leaves = hasher.finish() if hasher else None
+            if leaves is not None:
+                hashes.put(self.file_path, f.base + (f.file_size,), leaves)
+            ServerConfig.log.info(f'{addr} 已下载文件 [{self.file_path}]' + (f' 压缩[{self.codec}]' if self.codec else ''))
             return
         # 接收文件
         # 1. 开辟一片内存缓冲区
         # 2. 构建 memoryview 提升性能
         # 3. 开始接收
-        # 4. 接收完成后关闭socket，将数据写入硬盘
+        # 4. 接收的同时在后台计算叶子
+        # 5. 接收完成后将数据写入临时文件，再替换目标文件，最后向客户端发送 Merkle 根并关闭socket
         else:
             buf = bytearray(self.file_size)
+            self.buffered = self.file_size
+            memory.add('transfer', self.buffered)
             mv = memoryview(buf)
             cursor = 0
+            hashed = 0
             size = self.file_size
+            hasher = Hasher(chunk_size_for(size))
             while cursor < size:
-                rbuf = c.recv(min(8192, size - cursor))
+                if self.codec:
+                    try:
+                        rbuf = read_frame(lambda n: self.recv(c, n), self.codec)
+                    except OSError as e:
+                        self.stalled(e, addr)
+                        break
+                else:
+                    scheduler.acquire(self.flow, min(8192, size - cursor))
+                    try:
+                        rbuf = c.recv(min(8192, size - cursor))
+                    except OSError as e:
+                        self.stalled(e, addr)
+                        break
                 rl = len(rbuf)
+                if rl == 0 or cursor + rl > size:   # 客户端取消了上传，连接提前关闭
+                    break
                 buf[cursor:cursor+rl] = rbuf
                 cursor += rl
+                if cursor - hashed >= HASH_STEP:    # 已接收的部分不会再被修改，可以交给哈希线程
+                    hasher.update(mv[hashed:cursor])
+                    hashed = cursor
+            hasher.update(mv[hashed:cursor])
+            leaves = hasher.finish()
+            if not self.codec:          # 压缩时已经在 recv 中统计
+                BYTES.inc(cursor, 'transfer', 'received')
+            if cursor < size:
+                c.close()
+                ServerConfig.log.info('%s 上传文件中断，已丢弃 [%s]', addr, self.file_path)
+                return
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = temp_for(self.file_path)
+            try:
+                with open(tmp, 'wb') as f:
+                    f.write(buf)
+                if self.mtime is not None:
+                    os.utime(tmp, (self.mtime, self.mtime))
+                os.replace(tmp, self.file_path)
+            finally:
+                tmp.unlink(missing_ok=True)
+            hashes.put(self.file_path, stat_key(self.file_path.stat()), leaves)
+            try:
+                c.sendall(bytes.fromhex(merkle_root(leaves)))
+            except OSError:
+                pass
             c.close()
-            with open(self.file_path, 'wb') as f:
-                f.write(buf)
-            ServerConfig.log.info(f'{c.getpeername()} 已上传文件 [{self.file_path}]')
+            ServerConfig.log.info('%s 已上传文件 [%s]', addr, self.file_path)
             return
 
 
+class Th_deltaTrans(Th_fileTrans):
+    """增量上传线程
+
+    用于覆盖服务端已有的文件：先向客户端发送已有文件的块签名，
+    再接收客户端的增量数据，在临时文件中重建新文件，校验通过后原子地替换原文件
+
+    传输结束时向客户端发送 1 字节的结果，0 为成功，成功时之后再发送 32 字节的 Merkle 根
+    """
+    @override
+    def __init__(self,
+                 socket:socket,
+                 file_path:Path,
+                 file_size:int,
+                 peer_ip:str,
+                 mtime:float|None = None,
+                 user:str = '',
+                 ticket:Ticket|None = None) -> None:
+        """重写初始化方法
+
+        Args:
+            socket (socket): 正在监听等待连接的socket
+            file_path (Path): 需要覆盖的本地文件路径
+            file_size (int): 新文件的大小
+            peer_ip (str): 待传输客户端的IP地址
+            mtime (float | None, optional): 重建完成后设置的文件修改时间. Defaults to None.
+            user (str, optional): 请求传输的用户，用于带宽调度. Defaults to ''.
+            ticket (Ticket | None, optional): 准入控制的许可，线程结束时归还. Defaults to None.
+        """
+        super().__init__('r', socket, file_path, file_size, 0, peer_ip, mtime, user=user, ticket=ticket)
+        self.block_size = block_size_for(file_path.stat().st_size)
+        return
+
+    @property
+    @override
+    def kind(self) -> str:
+        return 'delta'
+
+    @override
+    def transfer(self, c:socket, addr:tuple) -> None:
+        tmp = None
+        try:
+            tmp = temp_for(self.file_path)
+            with open(self.file_path, 'rb') as old:
+                sig = b''.join(signature(old, self.block_size))
+                self.send(c, len(sig).to_bytes(4, 'big') + sig)
+                with open(tmp, 'wb') as new:
+                    ok = apply_delta(lambda n: self.recv(c, n), old, new, self.block_size)
+                    ok = ok and new.tell() == self.file_size
+            if ok:
+                leaves = file_leaves(tmp, self.file_size)
+                if self.mtime is not None:
+                    os.utime(tmp, (self.mtime, self.mtime))
+                os.replace(tmp, self.file_path)
+                hashes.put(self.file_path, stat_key(self.file_path.stat()), leaves)
+                c.sendall(b'\x00' + bytes.fromhex(merkle_root(leaves)))
+            else:
+                c.sendall(b'\x01')
+        except OSError as e:    # 包括客户端中途断开连接
+            self.stalled(e, addr)
+            ok = False
+        finally:
+            c.close()
+            if tmp is not None:
+                tmp.unlink(missing_ok=True)
+        if ok:
+            ServerConfig.log.info('%s 已增量上传文件 [%s]', addr, self.file_path)
+        else:
+            ServerConfig.log.info('%s 增量上传文件失败，已丢弃 [%s]', addr, self.file_path)
+        return
+
+
+class Th_batchTrans(Th_fileTrans):
+    """批量传输线程
+
+    在一个连接上连续传输多个文件，数据流格式见 `src.globals.batch`
+
+    - 发送时依次读取每个文件，条目头和数据合并到缓冲区中发送
+    - 接收时逐个条目写入临时文件再替换目标文件，不缓存整个数据流。
+      目标文件已存在且不覆盖时丢弃该条目的数据。结束时向客户端发送写入和跳过的文件数（各 4 字节）
+    """
+    @override
+    def __init__(self,
+                 type:Literal['s', 'r'],
+                 socket:socket,
+                 base:Path,
+                 size:int,
+                 peer_ip:str,
+                 entries:list[tuple[Path, str]]|None = None,
+                 overwrite:bool = False,
+                 user:str = '',
+                 ticket:Ticket|None = None) -> None:
+        """重写初始化方法
+
+        Args:
+            type (Literal[&#39;s&#39;, &#39;r&#39;]): 线程的类型：发送/接收
+            socket (socket): 正在监听等待连接的socket
+            base (Path): 发送时为请求的第一个路径（用于日志），接收时为目标目录
+            size (int): 全部文件的总大小
+            peer_ip (str): 待传输客户端的IP地址
+            entries (list[tuple[Path, str]] | None, optional): 发送的条目 [(文件路径, 条目名称)]. Defaults to None.
+            overwrite (bool, optional): 接收时目标文件已存在是否覆盖. Defaults to False.
+            user (str, optional): 请求传输的用户，用于带宽调度. Defaults to ''.
+            ticket (Ticket | None, optional): 准入控制的许可，线程结束时归还. Defaults to None.
+        """
+        super().__init__(type, socket, base, size, 0, peer_ip, user=user, ticket=ticket)
+        self.entries = entries or []
+        self.overwrite = overwrite
+        return
+
+    @property
+    @override
+    def kind(self) -> str:
+        return 'batch_' + super().kind
+
+    @override
+    def transfer(self, c:socket, addr:tuple) -> None:
+        if self.type == 's':
+            self.send_batch(c, addr)
+        else:
+            self.recv_batch(c, addr)
+        return
+
+    def send_batch(self, c:socket, addr:tuple) -> None:
+        out = bytearray()
+        sent = 0
+        try:
+            for path, name in self.entries:
+                try:
+                    f = open(path, 'rb')
+                except OSError:     # 列出文件后被删除
+                    continue
+                with f:
+                    st = os.fstat(f.fileno())
+                    out += pack_header(name, st.st_size, st.st_mtime)
+                    remain = st.st_size
+                    while remain > 0:
+                        buf = f.read(min(BUF_SIZE, remain))
+                        if not buf:     # 文件在发送期间变短，数据流已无法继续
+                            raise ConnectionError('file truncated')
+                        out += buf
+                        remain -= len(buf)
+                        if len(out) >= BUF_SIZE:
+                            self.send(c, out)
+                            out.clear()
+                sent += 1
+            out += END
+            self.send(c, out)
+            c.recv(1)
+        except OSError as e:
+            self.stalled(e, addr)
+            ServerConfig.log.info('%s 批量下载中断，已发送[%s]个文件', addr, sent)
+            return
+        finally:
+            c.close()
+        ServerConfig.log.info('%s 已批量下载[%s]个文件，共[%s]字节', addr, sent, self.file_size)
+        return
+
+    def recv_batch(self, c:socket, addr:tuple) -> None:
+        written = skipped = 0
+        r = c.makefile('rb', buffering=BUF_SIZE)
+        try:
+            while True:
+                head = read_header(r)
+                if head is None:
+                    break
+                name, size, mtime = head
+                if not check_name(name):
+                    raise ConnectionError(f'invalid name {name!r}')
+                dst = self.file_path.joinpath(name)
+                keep = not dst.is_dir() and (self.overwrite or not dst.exists())
+                if keep:
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = temp_for(dst)
+                    f = open(tmp, 'wb')
+                remain = size
+                try:
+                    while remain > 0:
+                        n = min(BUF_SIZE, remain)
+                        scheduler.acquire(self.flow, n)
+                        buf = read_exact(r, n)
+                        BYTES.inc(n, 'transfer', 'received')
+                        if keep:
+                            f.write(buf)
+                        remain -= n
+                finally:
+                    if keep:
+                        f.close()
+                        if remain:
+                            tmp.unlink(missing_ok=True)
+                if keep:
+                    os.utime(tmp, (mtime, mtime))
+                    os.replace(tmp, dst)
+                    index.notify(dst)
+                    written += 1
+                else:
+                    skipped += 1
+            c.sendall(written.to_bytes(4, 'big') + skipped.to_bytes(4, 'big'))
+        except (OSError, UnicodeDecodeError) as e:
+            self.stalled(e, addr)
+            ServerConfig.log.info('%s 批量上传中断，已写入[%s]个文件 %s', addr, written, e)
+            return
+        finally:
+            r.close()
+            c.close()
+        ServerConfig.log.info('%s 已批量上传[%s]个文件到[%s]，跳过[%s]个已存在的文件', addr, written, self.file_path, skipped)
+        return
+
+
 class Worker(Thread):
     '''
     处理客户端请求的线程
@@ -212,8 +651,10 @@ class Worker(Thread):
         """
         super().__init__(None, None, f'Worker-{socket.getpeername()[0]}')
         self.queue = Queue()        # 请求队列
-        self.msgbuf = Queue()       # 消息队列
+        self.msgbuf = Queue(ServerConfig.CONTROL['msgbufSize'])     # 消息队列，满时由 Master 丢弃最早的消息
         self.socket = socket        
+        self.addr = socket.getpeername()    # 连接关闭后无法再获取对方地址，这里提前保存
+        self.t_connected = time.monotonic() # 用于回收长时间不登录的连接
         self.running = True
 
         self.userinfo:UserInfo = None   # 对应客户端登录用户的信息，登陆后才有效
@@ -222,8 +663,11 @@ class Worker(Thread):
         # 发送和接收线程相关
         self.rbuf = Queue()
         self.recver = Recver(self.rbuf, socket)
-        self.sbuf = Queue()
+        self.sbuf = SendQueue(int(ServerConfig.CONTROL['sendQueueKiB'] * 1024))
         self.sender = Sender(self.sbuf, socket)
+        set_send_timeout(socket, ServerConfig.CONTROL['sendTimeout'])
+        set_keepalive(socket, ServerConfig.KEEPALIVE['tcpIdle'],
+                      ServerConfig.KEEPALIVE['tcpInterval'], ServerConfig.KEEPALIVE['tcpCount'])
         self.recver.start()
         self.sender.start()
         return
@@ -233,16 +677,23 @@ class Worker(Thread):
         while self.running:
             pkg = self.getPkg()
         
-            if pkg is None:         # 断开连接时接收线程会向队列中放入一个None
+            # 断开连接时接收线程会向队列中放入一个None；发送线程因为超时退出时，不再处理已经收到的请求
+            if pkg is None or not self.sender.is_alive():
                 self.logined = False
-                ServerConfig.log.info(f'{self.socket.getpeername()} 已断开连接')
-                self.stop()
+                ServerConfig.log.info('%s 已断开连接', self.addr)
+                if self.running:    # 被服务器主动断开时已经停止过
+                    self.stop()
                 break
+            pkg.t_start = time.perf_counter()
+
+            if pkg.cmd == 'ping':   # 心跳，只用于保持连接，未登录时也可以使用
+                self.ret(pkg, StatCode.SUCCESS, [time.time()])
+                continue
 
             if not self.logined:    # 进行登录检验
                 if pkg.cmd != 'login':
                     self.ret(pkg, StatCode.ERR_NO_LOGIN)
-                    ServerConfig.log.warning(f'{self.socket.getpeername()} 尝试访问资源，已拒绝[未登录]')
+                    ServerConfig.log.warning('%s 尝试访问资源，已拒绝[未登录]', self.addr)
                     continue
                 # 请求登录的处理
                 user_id = pkg.args[0]
@@ -259,7 +710,7 @@ class Worker(Thread):
             if cmd == 'getFileList':
                 if not ServerConfig.PERMISSION['allUserGetFilelist']:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.info(f'{self.socket.getpeername()} 尝试访问文件列表，已拒绝[无全局权限]')
+                    ServerConfig.log.info('%s 尝试访问文件列表，已拒绝[无全局权限]', self.addr)
                     continue
                 dir_path = Path('.'+pkg.args[0])
                 root_path = ServerConfig.SHARE_DIR
@@ -269,6 +720,8 @@ class Worker(Thread):
                     file_list = []
                     dir_list = []
                     for i in l:
+                        if is_temp(i):     # 正在写入的临时文件
+                            continue
                         if path.joinpath(i).is_dir():
                             dir_list.append(i)
                         else:
@@ -283,11 +736,11 @@ class Worker(Thread):
             elif cmd == 'getMessage':
                 if not ServerConfig.PERMISSION['allUserGetMessage']:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.info(f'{self.socket.getpeername()} 尝试获取消息，已拒绝[无全局权限]')
+                    ServerConfig.log.info('%s 尝试获取消息，已拒绝[无全局权限]', self.addr)
                     continue
                 if not self.userinfo.per_msg_d:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.warning(f'{self.socket.getpeername()} 尝试获取消息，已拒绝[无用户权限]')
+                    ServerConfig.log.warning('%s 尝试获取消息，已拒绝[无用户权限]', self.addr)
                     while not self.msgbuf.empty():
                         self.msgbuf.get()
                     continue
@@ -300,11 +753,11 @@ class Worker(Thread):
             elif cmd == 'putMessage':
                 if not ServerConfig.PERMISSION['allUserPutMessage']:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.info(f'{self.socket.getpeername()} 尝试推送消息，已拒绝[无全局权限]')
+                    ServerConfig.log.info('%s 尝试推送消息，已拒绝[无全局权限]', self.addr)
                     continue
                 if not self.userinfo.per_msg_u:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.warning(f'{self.socket.getpeername()} 尝试推送消息，已拒绝[无用户权限]')
+                    ServerConfig.log.warning('%s 尝试推送消息，已拒绝[无用户权限]', self.addr)
                     continue
                 msg = (self.userinfo.id, time.localtime(), pkg.args[0])
                 code = self.__askMaster('msg', [msg])
@@ -314,63 +767,469 @@ class Worker(Thread):
             elif cmd == 'getFile':
                 if not ServerConfig.PERMISSION['allUserDownloadFile']:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.info(f'{self.socket.getpeername()} 尝试下载文件，已拒绝[无全局权限]')
+                    ServerConfig.log.info('%s 尝试下载文件，已拒绝[无全局权限]', self.addr)
                     continue
                 if not self.userinfo.per_file_d:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.warning(f'{self.socket.getpeername()} 尝试下载文件，已拒绝[无用户权限]')
+                    ServerConfig.log.warning('%s 尝试下载文件，已拒绝[无用户权限]', self.addr)
                     continue
-                rfp = pkg.args[0][1:]
                 bp = pkg.args[1]
-                afp = ServerConfig.SHARE_DIR.joinpath(rfp)
+                afp = self.__share_path(pkg.args[0])
+                if afp is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
                 if not afp.exists() or afp.is_dir():
                     self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
-                    ServerConfig.log.info(f'{self.socket.getpeername()} 尝试下载文件，失败[无目标文件]')
+                    ServerConfig.log.info('%s 尝试下载文件，失败[无目标文件]', self.addr)
                     continue
-                s = self.__get_sock()
-                port = s.getsockname()[1]
                 size = afp.stat().st_size
-                ServerConfig.log.info(f'{self.socket.getpeername()} 下载文件[{afp}]，大小[{size}]字节, 端口[{port}]')
-                self.ret(pkg, StatCode.SUCCESS, [port, size])
-                Th_fileTrans('s', s, afp, size, bp, self.socket.getpeername()[0]).start()
+                # 指定长度时只发送 [bp, bp+length) 范围内的数据
+                length = pkg.args[3] if len(pkg.args) > 3 else None
+                end = size if length is None else min(size, bp + length)
+                ticket = self.__admit(pkg, max(0, end - bp))
+                if ticket is None:
+                    continue
+                try:        # 传输线程启动前出错时归还许可，之后由传输线程归还
+                    codec = negotiate(pkg.args[2] if len(pkg.args) > 2 else None, afp)
+                    s = self.__get_sock()
+                    port = s.getsockname()[1]
+                    ServerConfig.log.info('%s 下载文件[%s]，大小[%s]字节, 端口[%s]', self.addr, afp, size, port)
+                    self.ret(pkg, StatCode.SUCCESS, [port, size, codec])
+                    Th_fileTrans('s', s, afp, end, bp, self.addr[0], codec=codec, user=self.userinfo.id, ticket=ticket).start()
+                except BaseException:
+                    admission.release(ticket)
+                    raise
+                continue
+
+            elif cmd == 'multicastJoin':
+                if not ServerConfig.PERMISSION['allUserDownloadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试加入组播，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_d:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试加入组播，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                if not afp.is_file():
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                # 使用该客户端连接到的本地地址发送组播，回环地址上也可以测试
+                session = multicast.join(afp, self.socket.getsockname()[0])
+                ServerConfig.log.info('%s 加入组播会话[%s] [%s]', self.addr, session.sid, afp)
+                self.ret(pkg, StatCode.SUCCESS, session.info())
+                continue
+
+            elif cmd == 'getFileHash':
+                if not ServerConfig.PERMISSION['allUserDownloadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试获取文件哈希，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_d:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试获取文件哈希，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                if not afp.is_file():
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                # 没有缓存时哈希在后台计算，计算完成前返回服务器忙，不阻塞控制连接
+                try:
+                    found = hashes.get(afp, HASH_WAIT)
+                except OSError:
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                if found is None:
+                    self.ret(pkg, StatCode.ERR_SERVER_BUSY, [HASH_RETRY])
+                    continue
+                size, chunk, leaves = found
+                self.ret(pkg, StatCode.SUCCESS, [size, chunk, leaves, merkle_root(leaves)])
+                continue
+
+            elif cmd == 'swarmJoin':
+                if not ServerConfig.PERMISSION['allUserDownloadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试加入群集，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_d:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试加入群集，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                if not afp.is_file():
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                # 节点的地址为该客户端的IP和客户端为群集开启的端口
+                try:
+                    info = tracker.join(afp, self, (self.addr[0], pkg.args[1]), HASH_WAIT)
+                except OSError:
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                if info is None:    # 哈希仍在计算
+                    self.ret(pkg, StatCode.ERR_SERVER_BUSY, [HASH_RETRY])
+                    continue
+                ServerConfig.log.info('%s 加入群集[%s]，节点端口[%s]，其他节点[%s]', self.addr, afp, pkg.args[1], len(info[3]))
+                self.ret(pkg, StatCode.SUCCESS, info)
+                continue
+
+            elif cmd == 'swarmPeers':
+                if not ServerConfig.PERMISSION['allUserDownloadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试获取群集节点，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_d:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试获取群集节点，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                self.ret(pkg, StatCode.SUCCESS, tracker.peers(afp, self))
+                continue
+
+            elif cmd == 'swarmLeave':
+                if not ServerConfig.PERMISSION['allUserDownloadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试离开群集，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_d:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试离开群集，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                tracker.leave(afp, self)
+                self.ret(pkg, StatCode.SUCCESS)
                 continue
 
             elif cmd == 'putFile':
                 if not ServerConfig.PERMISSION['allUserUploadFile']:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.info(f'{self.socket.getpeername()} 尝试上传文件，已拒绝[无全局权限]')
+                    ServerConfig.log.info('%s 尝试上传文件，已拒绝[无全局权限]', self.addr)
                     continue
                 if not self.userinfo.per_file_u:
                     self.ret(pkg, StatCode.ERR_NO_PERMISSION)
-                    ServerConfig.log.warning(f'{self.socket.getpeername()} 尝试上传文件，已拒绝[无用户权限]')
+                    ServerConfig.log.warning('%s 尝试上传文件，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None or afp == ServerConfig.SHARE_DIR:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
                     continue
-                rfp = '.'+pkg.args[0]
-                afp = ServerConfig.SHARE_DIR.joinpath(rfp)
-                if afp.exists() :
+                overwrite = len(pkg.args) > 2 and pkg.args[2]
+                mtime = pkg.args[3] if len(pkg.args) > 3 else None
+                if afp.is_dir() or (afp.exists() and not overwrite):
                     self.ret(pkg, StatCode.ERR_FIEL_ALREADY_EXIST)
-                    ServerConfig.log.info(f'{self.socket.getpeername()} 尝试上传文件，失败[目标文件已存在]')
+                    ServerConfig.log.info('%s 尝试上传文件，失败[目标文件已存在]', self.addr)
                     continue
                 size = pkg.args[1]
-                s = self.__get_sock()
-                port = s.getsockname()[1]
-                ServerConfig.log.info(f'{self.socket.getpeername()} 上传文件[{afp}]，大小[{size}]字节, 端口[{port}]')
-                Th_fileTrans('r', s, afp, size, 0, self.socket.getpeername()[0]).start()
+                ticket = self.__admit(pkg, size)
+                if ticket is None:
+                    continue
+                try:        # 传输线程启动前出错时归还许可，之后由传输线程归还
+                    codec = negotiate(pkg.args[4] if len(pkg.args) > 4 else None, afp)
+                    s = self.__get_sock()
+                    port = s.getsockname()[1]
+                    ServerConfig.log.info('%s 上传文件[%s]，大小[%s]字节, 端口[%s]', self.addr, afp, size, port)
+                    Th_fileTrans('r', s, afp, size, 0, self.addr[0], mtime, codec, self.userinfo.id, ticket).start()
+                except BaseException:
+                    admission.release(ticket)
+                    raise
+                self.ret(pkg, StatCode.SUCCESS, [port, codec])
+                continue
+
+            elif cmd == 'putFileByHash':
+                if not ServerConfig.PERMISSION['allUserUploadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试上传文件，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_u:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试上传文件，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None or afp == ServerConfig.SHARE_DIR:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                size, digest = pkg.args[1], pkg.args[2]
+                overwrite = len(pkg.args) > 3 and pkg.args[3]
+                mtime = pkg.args[4] if len(pkg.args) > 4 else None
+                if afp.is_dir() or (afp.exists() and not overwrite):
+                    self.ret(pkg, StatCode.ERR_FIEL_ALREADY_EXIST)
+                    ServerConfig.log.info('%s 尝试上传文件，失败[目标文件已存在]', self.addr)
+                    continue
+                src = link_content(digest, size, afp, mtime)
+                if src is None:     # 没有相同内容的文件，客户端应改用完整上传
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                ServerConfig.log.info('%s 去重上传文件[%s]，内容与[%s]相同，大小[%s]字节', self.addr, afp, src, size)
+                self.ret(pkg, StatCode.SUCCESS)
+                continue
+
+            elif cmd == 'getBatch':
+                if not ServerConfig.PERMISSION['allUserDownloadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试批量下载，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_d:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试批量下载，已拒绝[无用户权限]', self.addr)
+                    continue
+                paths = [self.__share_path(p) for p in pkg.args[0]]
+                if None in paths:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                if not paths or not all(p.exists() for p in paths):
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                # 请求整个共享文件夹时条目名称不包含共享文件夹的名称
+                targets = []
+                for p in paths:
+                    targets.extend(p.iterdir() if p == ServerConfig.SHARE_DIR else [p])
+                entries = [e for e in collect(targets) if not is_temp(e[0].name)]
+                size = 0
+                for p, _ in entries:
+                    try:
+                        size += p.stat().st_size
+                    except OSError:
+                        pass
+                ticket = self.__admit(pkg, size)
+                if ticket is None:
+                    continue
+                try:        # 传输线程启动前出错时归还许可，之后由传输线程归还
+                    s = self.__get_sock()
+                    port = s.getsockname()[1]
+                    ServerConfig.log.info('%s 批量下载[%s]个文件，大小[%s]字节, 端口[%s]', self.addr, len(entries), size, port)
+                    Th_batchTrans('s', s, paths[0], size, self.addr[0], entries, user=self.userinfo.id, ticket=ticket).start()
+                except BaseException:
+                    admission.release(ticket)
+                    raise
+                self.ret(pkg, StatCode.SUCCESS, [port, len(entries), size])
+                continue
+
+            elif cmd == 'putBatch':
+                if not ServerConfig.PERMISSION['allUserUploadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试批量上传，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_u:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试批量上传，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                size = pkg.args[1]
+                overwrite = len(pkg.args) > 2 and pkg.args[2]
+                if afp.is_file():
+                    self.ret(pkg, StatCode.ERR_FIEL_ALREADY_EXIST)
+                    continue
+                ticket = self.__admit(pkg, size)
+                if ticket is None:
+                    continue
+                try:        # 传输线程启动前出错时归还许可，之后由传输线程归还
+                    s = self.__get_sock()
+                    port = s.getsockname()[1]
+                    ServerConfig.log.info('%s 批量上传到[%s]，大小[%s]字节, 端口[%s]', self.addr, afp, size, port)
+                    Th_batchTrans('r', s, afp, size, self.addr[0], overwrite=overwrite, user=self.userinfo.id, ticket=ticket).start()
+                except BaseException:
+                    admission.release(ticket)
+                    raise
                 self.ret(pkg, StatCode.SUCCESS, [port])
                 continue
-                
+
+            elif cmd == 'putDelta':
+                if not ServerConfig.PERMISSION['allUserUploadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试上传文件，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_u:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试上传文件，已拒绝[无用户权限]', self.addr)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                if not afp.is_file():   # 没有可以比较的旧文件，客户端应改用完整上传
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                size = pkg.args[1]
+                mtime = pkg.args[2] if len(pkg.args) > 2 else None
+                ticket = self.__admit(pkg, size)
+                if ticket is None:
+                    continue
+                try:        # 传输线程启动前出错时归还许可，之后由传输线程归还
+                    s = self.__get_sock()
+                    port = s.getsockname()[1]
+                    th = Th_deltaTrans(s, afp, size, self.addr[0], mtime, self.userinfo.id, ticket)
+                    ServerConfig.log.info('%s 增量上传文件[%s]，大小[%s]字节, 端口[%s]', self.addr, afp, size, port)
+                    th.start()
+                except BaseException:
+                    admission.release(ticket)
+                    raise
+                self.ret(pkg, StatCode.SUCCESS, [port, th.block_size])
+                continue
+
+            elif cmd == 'getManifest':
+                if not ServerConfig.PERMISSION['allUserGetFilelist']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试获取文件清单，已拒绝[无全局权限]', self.addr)
+                    continue
+                path = self.__share_path(pkg.args[0])
+                if path is None:
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                with_hash = len(pkg.args) > 1 and pkg.args[1]
+                if not path.is_dir():
+                    self.ret(pkg, StatCode.ERR_DIR_NOT_EXIST)
+                    continue
+                try:
+                    manifest = build_manifest(path, with_hash)
+                except OSError as e:
+                    ServerConfig.log.warning('%s 生成文件清单[%s]失败 %s', self.addr, path, e)
+                    self.ret(pkg, StatCode.ERR_DIR_NOT_EXIST)
+                    continue
+                self.ret(pkg, StatCode.SUCCESS, manifest)
+                continue
+
+            elif cmd in ('copy', 'move', 'delete', 'mkdir'):
+                if not ServerConfig.PERMISSION['allUserUploadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试%s，已拒绝[无全局权限]', self.addr, cmd)
+                    continue
+                if not self.userinfo.per_file_u:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试%s，已拒绝[无用户权限]', self.addr, cmd)
+                    continue
+                afp = self.__share_path(pkg.args[0])
+                if afp is None or afp == ServerConfig.SHARE_DIR:    # 不能操作共享文件夹本身
+                    self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                    continue
+                if cmd == 'mkdir':
+                    if afp.exists():
+                        self.ret(pkg, StatCode.ERR_DIR_ALREADY_EXIST if afp.is_dir() else StatCode.ERR_FIEL_ALREADY_EXIST)
+                        continue
+                    try:
+                        afp.mkdir(parents=True)
+                    except FileExistsError:     # 同时被其他请求创建
+                        self.ret(pkg, StatCode.ERR_DIR_ALREADY_EXIST if afp.is_dir() else StatCode.ERR_FIEL_ALREADY_EXIST)
+                        continue
+                    except OSError as e:        # 上级路径是文件等
+                        self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                        ServerConfig.log.info('%s 创建目录[%s]失败 %s', self.addr, afp, e)
+                        continue
+                    ServerConfig.log.info('%s 创建目录[%s]', self.addr, afp)
+                    self.ret(pkg, StatCode.SUCCESS)
+                    continue
+                if not afp.exists():
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                dst = None
+                overwrite = False
+                if cmd != 'delete':
+                    dst = self.__share_path(pkg.args[1])
+                    overwrite = len(pkg.args) > 2 and pkg.args[2]
+                    # 目标不能是源本身、源目录中的路径或包含源的目录（覆盖时会删除源）
+                    if dst is None or dst == ServerConfig.SHARE_DIR or dst.is_relative_to(afp) or afp.is_relative_to(dst):
+                        self.ret(pkg, StatCode.ERR_INVALID_PATH)
+                        continue
+                    if dst.exists() and not overwrite:
+                        self.ret(pkg, StatCode.ERR_FIEL_ALREADY_EXIST)
+                        continue
+                op = ops.start(cmd, afp, dst, overwrite, self.userinfo.id)
+                ServerConfig.log.info(f'{self.addr} 文件操作[{op.id}] {cmd} [{afp}]' + (f' -> [{dst}]' if dst else ''))
+                op.finished.wait(OP_WAIT)
+                self.ret(pkg, StatCode.SUCCESS, [op.id, op.status()])
+                continue
+
+            elif cmd == 'fileOpStatus':
+                if not ServerConfig.PERMISSION['allUserUploadFile']:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.info('%s 尝试查询文件操作，已拒绝[无全局权限]', self.addr)
+                    continue
+                if not self.userinfo.per_file_u:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试查询文件操作，已拒绝[无用户权限]', self.addr)
+                    continue
+                op = ops.get(pkg.args[0])
+                # 其他用户的操作与不存在的操作相同，不泄露其他用户的路径和进度
+                if op is None or op.user != self.userinfo.id:
+                    self.ret(pkg, StatCode.ERR_FILE_NOT_EXIST)
+                    continue
+                self.ret(pkg, StatCode.SUCCESS, op.status())
+                continue
+
+            elif cmd == 'stats':
+                if self.userinfo.id not in ServerConfig.ADMIN_USERS:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试获取运行指标，已拒绝[不是管理员]', self.addr)
+                    continue
+                self.ret(pkg, StatCode.SUCCESS, registry.snapshot())
+                continue
+
+            elif cmd == 'profile':
+                if self.userinfo.id not in ServerConfig.ADMIN_USERS:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试开启性能采样，已拒绝[不是管理员]', self.addr)
+                    continue
+                seconds = pkg.args[0] if len(pkg.args) > 0 and pkg.args[0] else 30
+                rate = pkg.args[1] if len(pkg.args) > 1 else None
+                try:
+                    path = profiler.start(seconds, rate)
+                except (TypeError, ValueError):     # 采样时间或频率不是数字
+                    self.ret(pkg, StatCode.ERR_INVALID_ARGS)
+                    continue
+                if path is None:
+                    self.ret(pkg, StatCode.ERR_SERVER_BUSY, [profiler.remaining()])
+                    continue
+                self.ret(pkg, StatCode.SUCCESS, [str(path)])
+                continue
+
+            elif cmd == 'memory':
+                if self.userinfo.id not in ServerConfig.ADMIN_USERS:
+                    self.ret(pkg, StatCode.ERR_NO_PERMISSION)
+                    ServerConfig.log.warning('%s 尝试内存诊断，已拒绝[不是管理员]', self.addr)
+                    continue
+                self.memory_cmd(pkg)
+                continue
+
             else:
+                REQUESTS.inc(1, '<unknown>', StatCode.ERR_UNDEF_CMD)
                 continue
 
 
+    def idle(self) -> float:
+        """距离最近一次收到数据包的时间（秒）
+        """
+        return time.monotonic() - self.recver.last_seen
+
     def stop(self) -> None:
         """停止该工作者线程
 
         停止该工作者线程，停止发送和接收线程，关闭socket
         """
-        ServerConfig.log.info(f'{self.socket.getpeername()} 由服务器端主动断开')
+        ServerConfig.log.info('%s 由服务器端主动断开', self.addr)
         self.running = False
+        tracker.leave_all(self)
         self.recver.stop()
         self.sender.stop()
+        try:
+            self.socket.shutdown(SHUT_RDWR)     # 唤醒阻塞在 recv 上的接收线程，只 close 不会唤醒
+        except OSError:         # 连接已经断开
+            pass
         self.socket.close()
         return
 
@@ -378,7 +1237,23 @@ class Worker(Thread):
     def getPkg(self) -> Package:
         return self.rbuf.get()
     def putPkg(self, pkg:Package):
-        self.sbuf.put(pkg)
+        """把数据包放入发送队列
+
+        发送队列超出 `ServerConfig.CONTROL['sendQueueKiB']` 时说明客户端读取得太慢，
+        按 `slowConsumer` 的设置把响应换成 `ERR_SERVER_BUSY`，或者断开连接
+        """
+        b = pkg.to_bytes()
+        if self.sbuf.offer((b, getattr(pkg, 'timing', None))):
+            return
+        if ServerConfig.CONTROL['slowConsumer'] == 'shed' and pkg.cmd == 'return':
+            CONTROL_EVENTS.inc(1, 'reply_shed')
+            busy = Package(pkg.id, 'return', [StatCode.ERR_SERVER_BUSY, [SHED_RETRY]])
+            self.sbuf.put((busy.to_bytes(), getattr(pkg, 'timing', None)))
+            return
+        if self.running:
+            CONTROL_EVENTS.inc(1, 'slow_disconnect')
+            ServerConfig.log.warning('%s 发送队列已满[%s]字节，断开连接', self.addr, self.sbuf.nbytes)
+            self.stop()
         return
     
 
@@ -401,18 +1276,102 @@ class Worker(Thread):
         event.wait()        # 等待管理者线程回答
         return retval       # 返回需要的返回值
     
+    def __admit(self, pkg:Package, size:int) -> Ticket|None:
+        """向准入控制器申请传输许可
+
+        申请失败时直接向客户端返回 `ERR_SERVER_BUSY` 及建议的重试时间（秒）
+
+        Args:
+            pkg (Package): 客户端发送来的数据包
+            size (int): 需要传输的字节数
+
+        Returns:
+            Ticket | None: 许可，失败时为None
+        """
+        ticket = admission.admit(self.userinfo.id, size)
+        if ticket is None:
+            retry_after = admission.retry_after()
+            self.ret(pkg, StatCode.ERR_SERVER_BUSY, [retry_after])
+            ServerConfig.log.info('%s 请求%s，已拒绝[服务器忙]，建议%s秒后重试', self.addr, pkg.cmd, retry_after)
+        return ticket
+
+    def __share_path(self, path:str) -> Path|None:
+        """将客户端的路径转换为共享文件夹中的绝对路径
+
+        Args:
+            path (str): 客户端发送的路径
+
+        Returns:
+            Path | None: 绝对路径，路径不在共享文件夹中时为None
+        """
+        afp = Path(os.path.normpath(ServerConfig.SHARE_DIR.joinpath('.'+path)))
+        root = Path(os.path.normpath(ServerConfig.SHARE_DIR))
+        return afp if afp.is_relative_to(root) else None
+
     def __get_sock(self) -> socket:
         """获取一个可用的socket
 
         工具方法
 
         Returns:
-            socket: 已绑定到空闲端口的socket
+            socket: 已绑定到空闲端口并开始监听的socket
         """
         s = socket()
         s.bind(('0.0.0.0', 0))
+        s.listen(5)         # 在回复客户端之前开始监听，避免客户端连接时端口尚未监听
         return s
     
+    def memory_cmd(self, pkg:Package) -> None:
+        """处理 `memory` 命令
+
+        参数的第一项为操作，见 `doc/design.md`
+        """
+        action = pkg.args[0] if pkg.args else 'status'
+        args = pkg.args[1:]
+        try:
+            if action == 'status':
+                self.ret(pkg, StatCode.SUCCESS, memory.status())
+            elif action == 'start':
+                if memory.start(args[0] if args and args[0] else 10):
+                    ServerConfig.log.info('%s 开启了 tracemalloc', self.addr)
+                self.ret(pkg, StatCode.SUCCESS, memory.status())
+            elif action == 'stop':
+                memory.stop()
+                ServerConfig.log.info('%s 关闭了 tracemalloc', self.addr)
+                self.ret(pkg, StatCode.SUCCESS, memory.status())
+            elif action == 'snapshot':
+                sid = memory.snapshot()
+                if sid is None:
+                    self.ret(pkg, StatCode.ERR_NOT_STARTED)
+                else:
+                    self.ret(pkg, StatCode.SUCCESS, [sid])
+            elif action == 'top':         # ['top', 条数, 分组方式]
+                limit, group = self.__memory_range(args[0:2])
+                rows = memory.top(limit, group)
+                self.ret(pkg, StatCode.ERR_NOT_STARTED if rows is None else StatCode.SUCCESS, rows)
+            elif action == 'diff':        # ['diff', 较早的快照, 较晚的快照, 条数, 分组方式]
+                old, new = int(args[0]), (int(args[1]) if len(args) > 1 and args[1] is not None else None)
+                if old not in memory.snapshots or new is not None and new not in memory.snapshots:
+                    raise ValueError(old, new)
+                limit, group = self.__memory_range(args[2:4])
+                rows = memory.diff(old, new, limit, group)
+                self.ret(pkg, StatCode.ERR_NOT_STARTED if rows is None else StatCode.SUCCESS, rows)
+            else:
+                self.ret(pkg, StatCode.ERR_INVALID_ARGS)
+        except (ValueError, TypeError, IndexError):
+            self.ret(pkg, StatCode.ERR_INVALID_ARGS)
+        return
+
+    @staticmethod
+    def __memory_range(args:list) -> tuple[int, str]:
+        """`memory` 命令的条数和分组方式，非法时抛出 ValueError
+        """
+        limit = int(args[0]) if len(args) > 0 and args[0] else 20
+        group = args[1] if len(args) > 1 and args[1] else 'lineno'
+        if not 0 < limit <= 1000 or group not in ('lineno', 'filename', 'traceback'):
+            raise ValueError(limit, group)
+        return limit, group
+
     def ret(self, pkg:Package, code:StatCode, addon:Any = None):
         """向客户端返回数据包
 
@@ -423,9 +1382,13 @@ class Worker(Thread):
             code (StatCode): 本次操作的状态码
             addon (Any, optional): 附加数据. Defaults to None.
         """
+        # 未登录时的命令名来自客户端，不作为标签，避免序列数量不受控制
+        REQUESTS.inc(1, pkg.cmd if self.logined or pkg.cmd == 'login' else '<nologin>', code)
         id = pkg.id
         cmd = 'return'
         args = [code, addon]
         new_pkg = Package(id, cmd, args)
+        if self.logined or pkg.cmd == 'login':
+            new_pkg.timing = (pkg, code, self.userinfo.id if self.userinfo else '', time.perf_counter())
         self.putPkg(new_pkg)
         return
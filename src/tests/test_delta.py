@@ -0,0 +1,146 @@
+""" 增量传输算法的测试
+
+对随机修改的文件生成增量数据流再重建，结果必须与新文件逐字节相同
+
+"""
+
+import unittest
+import random
+import io
+
+from src.globals.delta import LITERAL_MAX, block_size_for, signature, parse_signature, make_delta, apply_delta
+
+
+def roundtrip(old:bytes, new:bytes, bs:int) -> tuple[bool, bytes, bytes]:
+    """由旧文件的签名和新文件生成增量数据流，再用旧文件重建
+
+    Returns:
+        tuple[bool, bytes, bytes]: apply_delta 的结果、重建的文件、增量数据流
+    """
+    table = parse_signature(b''.join(signature(io.BytesIO(old), bs)))
+    stream = b''.join(make_delta(io.BytesIO(new), table, bs))
+    out = io.BytesIO()
+    ok = apply_delta(io.BytesIO(stream).read, io.BytesIO(old), out, bs)
+    return ok, out.getvalue(), stream
+
+
+def ops(stream:bytes) -> list[tuple[bytes, int, int]]:
+    """解析增量数据流，返回指令列表 [(指令, 参数1, 参数2)]
+    """
+    retval = []
+    i = 0
+    while i < len(stream):
+        op = stream[i:i+1]
+        if op == b'C':
+            retval.append((op, int.from_bytes(stream[i+1:i+5], 'big'), int.from_bytes(stream[i+5:i+9], 'big')))
+            i += 9
+        elif op == b'L':
+            n = int.from_bytes(stream[i+1:i+5], 'big')
+            retval.append((op, n, 0))
+            i += 5 + n
+        else:
+            retval.append((op, 0, 0))
+            i += 33
+    return retval
+
+
+def mutate(rng:random.Random, data:bytes, edits:int) -> bytes:
+    """对数据做随机的插入、删除和修改
+    """
+    b = bytearray(data)
+    for _ in range(edits):
+        pos = rng.randrange(len(b) + 1)
+        n = rng.randrange(1, 300)
+        kind = rng.choice(('insert', 'delete', 'modify'))
+        if kind == 'insert':
+            b[pos:pos] = rng.randbytes(n)
+        elif kind == 'delete':
+            del b[pos:pos+n]
+        else:
+            b[pos:pos+n] = rng.randbytes(len(b[pos:pos+n]))
+    return bytes(b)
+
+
+class TestDelta(unittest.TestCase):
+
+    def test_random_edits(self):
+        rng = random.Random(1)
+        for bs in (64, 700, 2048):
+            for _ in range(10):
+                old = rng.randbytes(rng.randrange(0, 64 * 1024))
+                new = mutate(rng, old, rng.randrange(0, 8))
+                with self.subTest(bs=bs, old=len(old), new=len(new)):
+                    ok, out, _ = roundtrip(old, new, bs)
+                    self.assertTrue(ok)
+                    self.assertEqual(out, new)
+
+    def test_repetitive_data(self):
+        # 大量相同的块使弱校验和强校验都有多个候选
+        rng = random.Random(2)
+        old = b'abcd' * 10000 + rng.randbytes(1000) + b'\x00' * 20000
+        new = mutate(rng, old, 5)
+        ok, out, _ = roundtrip(old, new, 128)
+        self.assertTrue(ok)
+        self.assertEqual(out, new)
+
+    def test_empty_files(self):
+        data = random.Random(3).randbytes(5000)
+        for old, new in ((b'', b''), (b'', data), (data, b'')):
+            ok, out, _ = roundtrip(old, new, 256)
+            self.assertTrue(ok)
+            self.assertEqual(out, new)
+
+    def test_identical_file_sends_no_literal(self):
+        old = random.Random(4).randbytes(100 * 1024)
+        ok, out, stream = roundtrip(old, old, 1024)
+        self.assertTrue(ok)
+        self.assertEqual(out, old)
+        self.assertEqual(ops(stream), [(b'C', 0, 100), (b'E', 0, 0)])
+
+    def test_shifted_blocks_are_found_by_rolling_checksum(self):
+        # 在开头插入 1 字节后所有块都不再对齐，只有滚动计算的弱校验正确时才能找到它们
+        rng = random.Random(5)
+        bs = 512
+        old = rng.randbytes(bs * 40)
+        new = b'!' + old
+        ok, out, stream = roundtrip(old, new, bs)
+        self.assertTrue(ok)
+        self.assertEqual(out, new)
+        self.assertEqual(ops(stream), [(b'L', 1, 0), (b'C', 0, 40), (b'E', 0, 0)])
+
+    def test_literal_is_split(self):
+        new = random.Random(6).randbytes(LITERAL_MAX + 1000)
+        ok, out, stream = roundtrip(b'', new, 2048)
+        self.assertTrue(ok)
+        self.assertEqual(out, new)
+        literals = [n for op, n, _ in ops(stream) if op == b'L']
+        self.assertEqual(sum(literals), len(new))
+        self.assertTrue(all(n <= LITERAL_MAX for n in literals))
+
+    def test_corrupted_stream_is_rejected(self):
+        rng = random.Random(7)
+        old = rng.randbytes(20000)
+        new = mutate(rng, old, 3)
+        table = parse_signature(b''.join(signature(io.BytesIO(old), 256)))
+        stream = bytearray(b''.join(make_delta(io.BytesIO(new), table, 256)))
+        stream[-1] ^= 0xff      # 结束指令中的哈希值
+        self.assertFalse(apply_delta(io.BytesIO(bytes(stream)).read, io.BytesIO(old), io.BytesIO(), 256))
+
+    def test_oversized_literal_is_rejected(self):
+        stream = b'L' + (LITERAL_MAX + 1).to_bytes(4, 'big')
+        self.assertFalse(apply_delta(io.BytesIO(stream).read, io.BytesIO(b''), io.BytesIO(), 256))
+
+    def test_copy_past_end_is_rejected(self):
+        stream = b'C' + (10).to_bytes(4, 'big') + (1).to_bytes(4, 'big')
+        self.assertFalse(apply_delta(io.BytesIO(stream).read, io.BytesIO(b'x' * 256), io.BytesIO(), 256))
+
+    def test_block_size_for(self):
+        self.assertEqual(block_size_for(0), 2048)
+        self.assertEqual(block_size_for(2**40), 128 * 1024)
+        for size in (1, 10**6, 10**8, 10**10):
+            bs = block_size_for(size)
+            self.assertEqual(bs & (bs - 1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+""" 目录同步的动作计算测试
+
+按 (本地, 服务端, 上次同步) 三个清单项的组合检查 `plan` 生成的动作
+
+"""
+
+import unittest
+
+from src.client.core.sync import plan, same
+
+
+X = (10, 1000.0)
+Y = (20, 2000.0)
+Z = (30, 3000.0)
+
+# (本地, 服务端, 上次同步) -> 默认参数下的动作，None 表示不需要处理
+# 默认参数：双向同步，新的一侧为准，不同步删除
+CASES = [
+    (X,    X,    None, None),           # 两侧新增了相同的文件
+    (X,    X,    Y,    None),           # 两侧修改的结果相同
+    (X,    None, None, 'put'),          # 本地新增
+    (None, X,    None, 'get'),          # 服务端新增
+    (Y,    X,    X,    'put'),          # 本地修改
+    (X,    Y,    X,    'get'),          # 服务端修改
+    (X,    None, X,    None),           # 服务端删除，不同步删除
+    (None, X,    X,    None),           # 本地删除，不同步删除
+    (Y,    Z,    X,    'get'),          # 两侧都修改，服务端较新
+    (Z,    Y,    X,    'put'),          # 两侧都修改，本地较新
+    (X,    Y,    None, 'get'),          # 两侧新增了不同的文件
+    (Y,    None, X,    'put'),          # 本地修改，服务端删除
+    (None, Y,    X,    'get'),          # 本地删除，服务端修改
+]
+
+
+def one(L, R, B, **kw) -> str|None:
+    """对单个文件计算动作，返回动作类型，没有动作时为 None
+    """
+    local = {} if L is None else {'f': L}
+    remote = {} if R is None else {'f': R}
+    base = {} if B is None else {'f': B}
+    actions = plan(local, remote, base, **kw)
+    if not actions:
+        return None
+    assert len(actions) == 1 and actions[0].path == 'f'
+    return actions[0].op
+
+
+class TestPlan(unittest.TestCase):
+
+    def test_truth_table(self):
+        for L, R, B, expected in CASES:
+            with self.subTest(local=L, remote=R, base=B):
+                self.assertEqual(one(L, R, B), expected)
+
+    def test_delete(self):
+        self.assertEqual(one(X, None, X, delete=True), 'del_local')
+        self.assertEqual(one(None, X, X, delete=True), 'del_remote')
+        self.assertEqual(one(None, None, X, delete=True), None)
+
+    def test_conflict_policy(self):
+        self.assertEqual(one(Y, Z, X, conflict='skip'), 'conflict')
+        self.assertEqual(one(Y, None, X, conflict='skip'), 'conflict')
+        self.assertEqual(one(X, Y, None, conflict='skip'), 'conflict')
+        self.assertEqual(one(Y, Z, X, conflict='local'), 'put')
+        self.assertEqual(one(Z, Y, X, conflict='remote'), 'get')
+        self.assertEqual(one(None, Y, X, conflict='local', delete=True), 'del_remote')
+        self.assertEqual(one(None, Y, X, conflict='local'), None)
+        self.assertEqual(one(Y, None, X, conflict='remote', delete=True), 'del_local')
+        # 只有一侧改变时不是冲突，与策略无关
+        for conflict in ('newer', 'local', 'remote', 'skip'):
+            self.assertEqual(one(Y, X, X, conflict=conflict), 'put')
+            self.assertEqual(one(X, Y, X, conflict=conflict), 'get')
+
+    def test_direction(self):
+        self.assertEqual(one(Y, X, X, direction='pull'), None)
+        self.assertEqual(one(X, Y, X, direction='pull'), 'get')
+        self.assertEqual(one(X, Y, X, direction='push'), None)
+        self.assertEqual(one(Y, X, X, direction='push'), 'put')
+        self.assertEqual(one(None, X, X, direction='pull', delete=True), None)
+        self.assertEqual(one(X, None, X, direction='pull', delete=True), 'del_local')
+
+    def test_mtime_resolution(self):
+        # 修改时间精确到秒，文件系统的精度不同不会被当作修改
+        self.assertTrue(same((10, 1000.9), (10, 1000.0)))
+        self.assertFalse(same((10, 1001.0), (10, 1000.0)))
+        self.assertFalse(same((11, 1000.0), (10, 1000.0)))
+        self.assertEqual(one((10, 1000.4), X, X), None)
+
+    def test_entries_and_order(self):
+        local = {'b': Y, 'a': X}
+        remote = {'c': Z}
+        actions = plan(local, remote, {})
+        self.assertEqual([(a.op, a.path, a.entry) for a in actions], [('put', 'a', X), ('put', 'b', Y), ('get', 'c', Z)])
+
+
+if __name__ == '__main__':
+    unittest.main()